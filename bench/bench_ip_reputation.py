@@ -0,0 +1,86 @@
+"""
+Benchmark: PEP IP reputation index (ip_reputation.py).
+
+Builds an index from a synthetic feed of random IPv4/IPv6 prefixes, then
+measures:
+  * build time and index file size
+  * lookup latency (hits and misses, address parsing included)
+  * resident memory added by mmap-ing and querying the index
+
+Usage:
+  python bench/bench_ip_reputation.py [--prefixes 1000000] [--lookups 200000]
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "ztxb-aws-lab", "app", "lambdas", "pep_authorizer"))
+
+import ip_reputation  # noqa: E402
+
+
+def synthetic_feed(n, rng):
+    for _ in range(n):
+        if rng.random() < 0.9:
+            plen = rng.choice((16, 20, 24, 24, 24, 28, 32, 32))
+            addr = rng.getrandbits(32) & ~((1 << (32 - plen)) - 1)
+            yield f"{addr >> 24}.{addr >> 16 & 255}.{addr >> 8 & 255}.{addr & 255}/{plen},{rng.randint(1, 100)}"
+        else:
+            plen = rng.choice((32, 48, 56, 64))
+            hi = rng.getrandbits(64) & ~((1 << (64 - plen)) - 1)
+            groups = ":".join(f"{hi >> s & 0xFFFF:x}" for s in (48, 32, 16, 0))
+            yield f"{groups}::/{plen},{rng.randint(1, 100)}"
+
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS"):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--prefixes", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args()
+    rng = random.Random(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rep.bin")
+        started = time.perf_counter()
+        n4, n6 = ip_reputation.build(synthetic_feed(args.prefixes, rng), path)
+        build_s = time.perf_counter() - started
+        size = os.path.getsize(path)
+        print(f"build: {args.prefixes:,} prefixes -> {n4:,} v4 / {n6:,} v6 intervals "
+              f"in {build_s:.1f}s, {size / 1e6:.1f} MB")
+
+        before = rss_kb()
+        index = ip_reputation.ReputationIndex(path)
+        v4 = [f"{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+              for _ in range(args.lookups)]
+        v6 = [f"{rng.getrandbits(16):x}:{rng.getrandbits(16):x}::1" for _ in range(args.lookups // 10)]
+        score = index.score
+
+        for name, ips in (("ipv4", v4), ("ipv6", v6)):
+            started = time.perf_counter()
+            hits = sum(1 for ip in ips if score(ip))
+            elapsed = time.perf_counter() - started
+            print(f"lookup {name}: {elapsed / len(ips) * 1e9:,.0f} ns/lookup ({hits / len(ips):.0%} listed)")
+
+        parse_only = time.perf_counter()
+        for ip in v4:
+            ip_reputation._to_int(ip)
+        parse_only = time.perf_counter() - parse_only
+        print(f"  of which address parsing: {parse_only / len(v4) * 1e9:,.0f} ns")
+        print(f"rss added by index + lookups: {(rss_kb() - before) / 1024:.1f} MB (lookup lists included)")
+
+
+if __name__ == "__main__":
+    main()
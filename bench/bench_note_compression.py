@@ -0,0 +1,82 @@
+"""
+Benchmark: Notes API note body compression (note_codec.py).
+
+For a range of note sizes, compares plain vs compressed storage:
+  * item size as DynamoDB bills it (attribute names + UTF-8/binary values)
+  * WCU per write (1 KB units) and RCU per strongly consistent read (4 KB units)
+  * CPU cost of pack_content() on write and public_view() on read
+
+The text is synthetic prose drawn from a fixed vocabulary with a fixed
+seed. Real notes usually compress better because they repeat more.
+
+Usage:
+  python bench/bench_note_compression.py [--number 200]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "ztxb-aws-lab", "app", "lambdas", "notes_api"))
+
+import note_codec  # noqa: E402
+
+SIZES = (256, 1024, 4096, 16384, 65536, 262144)
+WORDS = (
+    "the team agreed to review budget roadmap quarterly meeting action item owner deadline "
+    "customer feedback release notes deploy staging production incident follow up draft "
+    "proposal design document api latency cache policy device trust broker signature"
+).split()
+
+
+def make_text(size, rng):
+    out, n = [], 0
+    while n < size:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))).capitalize() + ". "
+        if rng.random() < 0.15:
+            sentence += "\n- " + rng.choice(WORDS) + f" #{rng.randint(1, 999)}\n"
+        out.append(sentence)
+        n += len(sentence)
+    return "".join(out)[:size]
+
+
+def item_size(item):
+    """DynamoDB item size: sum of attribute name lengths + value sizes."""
+    total = 0
+    for name, value in item.items():
+        total += len(name.encode())
+        total += len(value) if isinstance(value, bytes) else len(str(value).encode("utf-8"))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    base = {"user_id": "user:6f1c2a4e-0c1d-4b8e-9a55-3d2f0c1e7b90", "note_id": "2b7e1516-28ae-d2a6-abf7-158809cf4f3c",
+            "title": "Weekly sync", "created_at": "2025-01-01T00:00:00Z", "updated_at": "2025-01-01T00:00:00Z"}
+
+    print(f"threshold={note_codec.COMPRESS_MIN_BYTES} B  level={note_codec.COMPRESS_LEVEL}")
+    print(f"{'size':>8} {'plain B':>9} {'stored B':>9} {'WCU':>9} {'RCU':>9} {'pack us':>9} {'read us':>9}")
+    for size in SIZES:
+        text = make_text(size, rng)
+        plain = {**base, "content": text}
+        stored = {**base, **note_codec.pack_content(text)}
+        p_size, s_size = item_size(plain), item_size(stored)
+
+        pack = min(timeit.repeat(lambda: note_codec.pack_content(text), number=args.number, repeat=3))
+        read = min(timeit.repeat(lambda: note_codec.public_view(stored), number=args.number, repeat=3))
+
+        wcu = f"{math.ceil(p_size / 1024)}->{math.ceil(s_size / 1024)}"
+        rcu = f"{math.ceil(p_size / 4096)}->{math.ceil(s_size / 4096)}"
+        print(f"{size:>8} {p_size:>9} {s_size:>9} {wcu:>9} {rcu:>9} "
+              f"{pack / args.number * 1e6:>9.1f} {read / args.number * 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
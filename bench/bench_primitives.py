@@ -0,0 +1,294 @@
+"""
+Microbenchmark regression suite: TAM signing, verification and mapping primitives.
+
+Times the functions every request goes through, on small, typical and
+huge TAMs (the huge case has 1000 groups and a posture block nested 8
+levels deep):
+  * reference toolkit: canonical_json, sign_message, verify_message,
+    validate_structure, evaluate_policy (built-in and policy.yaml rules)
+  * PEP Lambda:        build_tam, _decode_jwt_claims
+  * Broker Lambda:     verify_timestamp, opa_input (call_pdp's mapping)
+
+Each benchmark is warmed up, then timed in --samples short runs, each
+right after a run of a fixed pure-Python calibration loop. A sample's
+score is its time relative to the calibration run next to it, so a
+shared host slowing down (CPU steal, frequency scaling) moves both sides
+of the ratio together. The median score is kept, and it is what is
+compared. The ns per call shown is the median too. A baseline recorded on
+one machine stays meaningful on a faster or slower one. Crypto runs in
+the cryptography package, not Python, so on a very different CPU record
+a fresh baseline with --save (median over --rounds passes).
+
+A run fails (exit 1) when a score is still more than --tolerance above
+its baseline after --rounds re-measurements of the suspects. On the
+shared 1-CPU host the committed baseline comes from, repeated runs of an
+unchanged tree stay within about ±20% per benchmark. The default
+tolerance of 0.5 sits above that noise. Pass a tighter --tolerance only
+on a quiet machine.
+
+Usage:
+  python bench/bench_primitives.py                 # compare with bench/baselines/primitives.json
+  python bench/bench_primitives.py --save          # record a new baseline
+  python bench/bench_primitives.py --only huge --tolerance 0.1
+"""
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDAS = os.path.join(ROOT, "ztxb-aws-lab", "app", "lambdas")
+DEFAULT_BASELINE = os.path.join(ROOT, "bench", "baselines", "primitives.json")
+
+sys.path.insert(0, os.path.join(ROOT, "reference"))
+sys.path.insert(0, os.path.join(LAMBDAS, "pep_authorizer"))
+sys.path.insert(0, os.path.join(LAMBDAS, "ztxp_broker"))
+
+from cryptography.hazmat.primitives.asymmetric import ed25519  # noqa: E402
+
+
+def load(name, path, env=None):
+    with patch.dict(os.environ, env or {}), patch("boto3.client"):
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+toolkit = load("ztxp_toolkit", os.path.join(ROOT, "reference", "ztxpv0.2.py"))
+pep = load("pep_handler", os.path.join(LAMBDAS, "pep_authorizer", "handler.py"),
+           {"KMS_KEY_ARN": "arn:aws:kms:bench", "BROKER_URL": "http://broker"})
+broker = load("broker_handler", os.path.join(LAMBDAS, "ztxp_broker", "handler.py"),
+              {"PDP_URL": "pdp.internal", "KMS_KEY_ARN": "arn:aws:kms:bench"})
+
+# Ephemeral key; nothing is written to ~/.ztxp
+KEY = ed25519.Ed25519PrivateKey.generate()
+toolkit._KEYS.update(private=KEY, public=KEY.public_key())
+
+
+# ---------------------------------------------------------------------------
+# Inputs
+# ---------------------------------------------------------------------------
+
+def deep_posture(depth, width):
+    node = {"compliant": True}
+    for level in range(depth):
+        node = {**{f"check_{level}_{i}": {"status": "pass", "age_days": i} for i in range(width)},
+                "compliant": True, "nested": node}
+    return node
+
+
+SIZES = {
+    # groups, posture depth, posture width
+    "small": (0, 0, 0),
+    "typical": (3, 1, 4),
+    "huge": (1000, 8, 12),
+}
+
+
+def reference_tam(size):
+    n_groups, depth, width = SIZES[size]
+    return {
+        "ztxp_version": "0.2",
+        "message_id": "4d1f3c5e-8a9b-4c2d-9e1f-0a2b3c4d5e6f",
+        "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "subject": {"id": "user:6f1c2a4e-0c1d-4b8e-9a55-3d2f0c1e7b90", "role": "authenticated",
+                    "groups": [f"group-{i:04d}" for i in range(n_groups)]},
+        "source_device": {"id": "device:9d8c7b6a-5f4e-3d2c-1b0a-0f1e2d3c4b5a", "platform": "macOS 14.5",
+                          "posture": deep_posture(depth, width)},
+        "resource": {"id": "app://notes/api/notes", "action": "notes:Read"},
+        "context": {"risk_score": 12, "device_trust": "low-risk", "source_ip": "198.51.100.23"},
+    }
+
+
+def pep_event(size):
+    n_groups, _, _ = SIZES[size]
+    claims = {"sub": "6f1c2a4e-0c1d-4b8e-9a55-3d2f0c1e7b90",
+              "cognito:groups": [f"group-{i:04d}" for i in range(n_groups)]}
+    payload = base64.b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+    return {
+        "requestContext": {
+            "http": {"method": "PUT", "path": "/notes/2b7e1516-28ae-d2a6", "sourceIp": "203.0.113.7"},
+            "requestId": "Zx1bXjJ2IAMEbXg=",
+        },
+        "headers": {
+            "authorization": f"Bearer eyJhbGciOiJSUzI1NiJ9.{payload}.sig",
+            "x-device-id": "laptop-42",
+            "x-device-compliant": "true",
+            "x-device-trust": "low-risk",
+        },
+    }
+
+
+def broker_tam(size):
+    """The TAM as the Broker sees it: PEP-built, with the reference posture block."""
+    _, depth, width = SIZES[size]
+    tam = dict(pep.build_tam(pep_event(size)))
+    tam["device"] = {**tam["device"], "posture": deep_posture(depth, width)}
+    return tam
+
+
+def collect():
+    """``[(name, fn)]`` for every primitive x size."""
+    from ztxp_rules import RuleEngine
+
+    engine = RuleEngine(os.path.join(ROOT, "reference", "policy.yaml"))
+    benchmarks = []
+    for size in SIZES:
+        tam = reference_tam(size)
+        signed = toolkit.sign_message(tam)
+        event = pep_event(size)
+        auth = event["headers"]["authorization"]
+        lambda_tam = broker_tam(size)
+        benchmarks += [
+            (f"canonical_json/{size}", lambda tam=tam: toolkit.canonical_json(tam)),
+            (f"sign_message/{size}", lambda tam=tam: toolkit.sign_message(tam)),
+            (f"verify_message/{size}", lambda signed=signed: toolkit.verify_message(signed)),
+            (f"validate_structure/{size}", lambda signed=signed: toolkit.validate_structure(signed)),
+            (f"evaluate_policy/{size}", lambda signed=signed: toolkit.evaluate_policy(signed)),
+            (f"evaluate_policy_rules/{size}", lambda signed=signed: toolkit.evaluate_policy(signed, engine)),
+            (f"build_tam/{size}", lambda event=event: pep.build_tam(event)),
+            (f"decode_jwt_claims/{size}", lambda auth=auth: pep._decode_jwt_claims(auth)),
+            (f"verify_timestamp/{size}", lambda t=lambda_tam: broker.verify_timestamp(t)),
+            (f"opa_input/{size}", lambda t=lambda_tam: broker.opa_input(t)),
+        ]
+    return benchmarks
+
+
+# ---------------------------------------------------------------------------
+# Timing
+# ---------------------------------------------------------------------------
+
+_CALIBRATION_DOC = {"k": list(range(32)), "s": "calibration", "n": {"a": 1, "b": [True, None]}}
+
+
+def calibration():
+    """Fixed pure-Python work (dict/list churn + json) that scores are relative to."""
+    total = 0
+    for i in range(200):
+        total += len(json.dumps(_CALIBRATION_DOC, sort_keys=True)) + sum({i: i}.values())
+    return total
+
+
+def _sized(fn, min_time):
+    """A timer for ``fn`` and the call count that takes about ``min_time``; warms it up."""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    timer.timeit(number)  # warm-up at full size (caches, allocator, lazy imports)
+    return timer, number
+
+
+def measure(fn, samples, min_time):
+    """Median ns per call and median score of ``samples`` calibration-paired runs."""
+    timer, number = _sized(fn, min_time)
+    cal_timer, cal_number = _sized(calibration, min_time / 2)
+    ns, scores = [], []
+    for _ in range(samples):
+        cal = cal_timer.timeit(cal_number) / cal_number
+        t = timer.timeit(number) / number
+        ns.append(t * 1e9)
+        scores.append(t / cal)
+    return statistics.median(ns), statistics.median(scores)
+
+
+def run(benchmarks, samples, min_time):
+    """Time ``benchmarks`` once: {name: {"ns", "score"}}."""
+    results = {}
+    for name, fn in benchmarks:
+        ns, score = measure(fn, samples, min_time)
+        results[name] = {"ns": round(ns, 1), "score": round(score, 6)}
+    return results
+
+
+def median_of(passes):
+    """Per benchmark, the pass with the median score (for baselines)."""
+    merged = {}
+    for name in passes[0]:
+        ranked = sorted((p[name] for p in passes if name in p), key=lambda r: r["score"])
+        merged[name] = ranked[(len(ranked) - 1) // 2]
+    return merged
+
+
+def regressions(results, baseline, tolerance):
+    return [name for name, now in results.items()
+            if name in baseline and now["score"] / baseline[name]["score"] - 1 > tolerance]
+
+
+def report(results, baseline, tolerance):
+    print(f"{'benchmark':<32} {'baseline ns':>12} {'now ns':>12} {'change':>8}")
+    for name, now in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<32} {'-':>12} {now['ns']:>12.0f} {'new':>8}")
+            continue
+        change = now["score"] / base["score"] - 1
+        flag = "  REGRESSION" if change > tolerance else ""
+        print(f"{name:<32} {base['ns']:>12.0f} {now['ns']:>12.0f} {change:>+7.1%}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="Record the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Allowed slowdown vs the baseline score (default 0.5 = 50%%, above shared-host noise)")
+    parser.add_argument("--only", default="", help="Run benchmarks whose name contains this string")
+    parser.add_argument("--rounds", type=int, default=3,
+                        help="Passes over the suite for --save; passes over suspected regressions otherwise")
+    parser.add_argument("--samples", type=int, default=9, help="Calibration-paired samples per benchmark (default 9)")
+    parser.add_argument("--min-time", type=float, default=0.1, help="Seconds per sample (default 0.1)")
+    args = parser.parse_args()
+
+    benchmarks = [(name, fn) for name, fn in collect() if args.only in name]
+    print(f"{platform.python_implementation()} {platform.python_version()}, {len(benchmarks)} benchmarks")
+    results = run(benchmarks, args.samples, args.min_time)
+
+    if args.save:
+        passes = [results] + [run(benchmarks, args.samples, args.min_time) for _ in range(args.rounds - 1)]
+        results = median_of(passes)
+        saved = {}
+        if args.only and os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                saved = json.load(f)["results"]
+        saved.update(results)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "results": saved}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        for name, now in results.items():
+            print(f"{name:<32} {now['ns']:>12.0f} ns")
+        print(f"[*] Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        sys.exit(f"No baseline at {args.baseline}; record one with --save")
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    # A slowdown has to survive re-measurement before it counts
+    for _ in range(args.rounds - 1):
+        suspects = set(regressions(results, baseline, args.tolerance))
+        if not suspects:
+            break
+        again = run([(n, fn) for n, fn in benchmarks if n in suspects], args.samples, args.min_time)
+        for name, now in again.items():
+            if now["score"] < results[name]["score"]:
+                results[name] = now
+    report(results, baseline, args.tolerance)
+    failed = regressions(results, baseline, args.tolerance)
+    if failed:
+        print(f"[✗] {len(failed)} regression(s) beyond {args.tolerance:.0%}: {', '.join(failed)}")
+        sys.exit(1)
+    print(f"[✓] No regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
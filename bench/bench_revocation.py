@@ -0,0 +1,79 @@
+"""
+Benchmark: Broker revocation list (revocation.py).
+
+Builds a list of N revoked keys/subjects/devices, then measures:
+  * build time and file size
+  * lookup latency for unlisted ids (the common case: Bloom negative)
+    and for listed ids (Bloom hit + bisect over the mmap-ed hashes)
+  * the per-request cost of one RevocationChecker.revoked() call
+  * resident memory added by mmap-ing and querying the list
+
+Usage:
+  python bench/bench_revocation.py [--entries 2000000] [--lookups 200000]
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "ztxb-aws-lab", "app", "lambdas", "ztxp_broker"))
+
+import revocation  # noqa: E402
+
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS"):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def entries(n):
+    for i in range(n):
+        yield revocation.KINDS[i % 3], f"{revocation.KINDS[i % 3]}:{i:08x}-0c1d-4b8e-9a55-3d2f0c1e7b90"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=2_000_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "revocations.bin")
+        started = time.perf_counter()
+        n = revocation.build(entries(args.entries), path)
+        print(f"build: {n:,} entries in {time.perf_counter() - started:.1f}s, "
+              f"{os.path.getsize(path) / 1e6:.1f} MB")
+
+        unlisted = [f"user:{i:08x}-ffff" for i in range(args.lookups)]
+        listed = [value for _, value in entries(min(args.entries, args.lookups))]
+        tams = [{"subject": {"id": u}, "device": {"id": f"device:{u}"}} for u in unlisted]
+        before = rss_kb()
+        checker = revocation.RevocationChecker(path, check_seconds=3600)
+        contains = checker.current.contains
+
+        for name, kind, ids in (("unlisted", "subject", unlisted), ("listed", None, listed)):
+            started = time.perf_counter()
+            found = sum(1 for i, value in enumerate(ids) if contains(kind or revocation.KINDS[i % 3], value))
+            elapsed = time.perf_counter() - started
+            print(f"lookup {name}: {elapsed / len(ids) * 1e9:,.0f} ns/lookup ({found / len(ids):.1%} revoked)")
+
+        started = time.perf_counter()
+        for tam in tams:
+            checker.revoked(tam)
+        print(f"per request (subject + device): {(time.perf_counter() - started) / len(tams) * 1e9:,.0f} ns")
+
+        hash_only = time.perf_counter()
+        for value in unlisted:
+            revocation.entry_hash("subject", value)
+        print(f"  of which hashing: {(time.perf_counter() - hash_only) / len(unlisted) * 1e9:,.0f} ns/id")
+        print(f"rss added by list + lookups: {(rss_kb() - before) / 1024:.1f} MB (page cache touched by the lookups)")
+
+
+if __name__ == "__main__":
+    main()
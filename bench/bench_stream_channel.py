@@ -0,0 +1,173 @@
+"""
+Benchmark: reference broker streaming channel (reference/ztxp_stream.py).
+
+Simulates a PEP sending a stream of near-identical TAMs for one session.
+Per decision, message_id, timestamp and risk score change, and every
+tenth request also changes the resource. It compares:
+  * bytes on the wire: HTTP POST of an embedded / compact TAM vs one
+    stream delta frame
+  * broker-side parse + verify CPU: full TAM (json.loads + canonicalize +
+    Ed25519 verify) vs delta (frame parse + verify + apply_delta)
+  * end-to-end decisions/s over localhost: sequential HTTP POSTs to the
+    Flask broker vs pipelined stream requests on one connection
+
+An ephemeral Ed25519 key is used; nothing is written to ~/.ztxp.
+
+Usage:
+  python bench/bench_stream_channel.py [--number 2000] [--http 300] [--in-flight 32]
+"""
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "reference"))
+
+from cryptography.hazmat.primitives.asymmetric import ed25519  # noqa: E402
+
+import ztxp_stream  # noqa: E402
+
+spec = importlib.util.spec_from_file_location("ztxp_toolkit", os.path.join(ROOT, "reference", "ztxpv0.2.py"))
+toolkit = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(toolkit)
+
+KEY = ed25519.Ed25519PrivateKey.generate()
+toolkit._KEYS.update(private=KEY, public=KEY.public_key())
+
+BASE_TAM = {
+    "ztxp_version": "0.2",
+    "issuer": "ztxp://pep.gateway-eu-1",
+    "subject": {"id": "user:6f1c2a4e-0c1d-4b8e-9a55-3d2f0c1e7b90", "role": "authenticated",
+                "groups": ["writer", "eu-staff", "notes-beta"], "auth_time": "2025-01-01T08:00:00Z"},
+    "source_device": {"id": "device:9d8c7b6a-5f4e-3d2c-1b0a-0f1e2d3c4b5a", "platform": "macOS 14.5",
+                      "posture": {"compliant": True, "disk_encrypted": True, "edr": "running",
+                                  "os_patch_age_days": 6}},
+    "resource": {"id": "app://notes/api/notes", "action": "notes:Read", "tenant": "acme"},
+    "context": {"risk_score": 12, "device_trust": "low-risk", "source_ip": "198.51.100.23",
+                "geo": "DE", "user_agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_5) AppleWebKit/605.1.15"},
+}
+
+
+def tam_at(i):
+    tam = json.loads(json.dumps(BASE_TAM))
+    tam["message_id"] = str(uuid.uuid4())
+    tam["timestamp"] = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    tam["context"]["risk_score"] = 10 + i % 30
+    if i % 10 == 0:
+        tam["resource"]["id"] = f"app://notes/api/notes/{i}"
+    return tam
+
+
+def http_bytes(body):
+    headers = ("POST /ztxp/evaluate HTTP/1.1\r\nHost: broker.internal:8080\r\n"
+               "Content-Type: application/json\r\nContent-Length: %d\r\n\r\n" % len(body))
+    return len(headers) + len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--http", type=int, default=300, help="HTTP requests for the end-to-end baseline")
+    parser.add_argument("--in-flight", type=int, default=32)
+    args = parser.parse_args()
+
+    tams = [tam_at(i) for i in range(args.number)]
+    base = {**tams[0], "message_id": "base"}
+
+    # --- wire size --------------------------------------------------------
+    embedded = [json.dumps(toolkit.sign_message(t)).encode() for t in tams[:200]]
+    compact = [json.dumps({"tam_compact": toolkit.sign_compact(t)}).encode() for t in tams[:200]]
+    base_digest = __import__("hashlib").sha256(toolkit.canonical_json(base)).hexdigest()
+    frames = []
+    for t in tams[:200]:
+        changes, removed = ztxp_stream.diff(base, t)
+        payload = ztxp_stream.canonical_json({"base": base_digest, "set": changes})
+        token = f"{ztxp_stream._b64url(payload)}.{ztxp_stream._b64url(KEY.sign(payload))}"
+        frames.append(json.dumps({"id": 123456, "op": "eval", "session": 1, "delta": token},
+                                 separators=(",", ":")).encode())
+    avg = lambda xs: sum(xs) / len(xs)  # noqa: E731
+    print("bytes per decision (request):")
+    print(f"  HTTP embedded TAM {avg([http_bytes(b) for b in embedded]):>7.0f}")
+    print(f"  HTTP compact TAM  {avg([http_bytes(b) for b in compact]):>7.0f}")
+    print(f"  stream delta      {avg([4 + len(f) for f in frames]):>7.0f}")
+
+    # --- broker-side parse (+ verify) ---------------------------------------
+    verify = ztxp_stream.verify_with(KEY.public_key())
+    public_key = KEY.public_key()
+    reps = args.number // len(embedded)
+
+    def full(check):
+        for body in embedded * reps:
+            tam = json.loads(body)
+            sig = base64.b64decode(tam.pop("signature")["sig"])
+            payload = toolkit.canonical_json(tam)
+            if check:
+                public_key.verify(sig, payload)
+
+    def delta(check):
+        for frame in frames * reps:
+            message = json.loads(frame)
+            payload, sig = ztxp_stream._split_compact(message["delta"])
+            if check:
+                verify(payload, sig)
+            d = json.loads(payload)
+            ztxp_stream.apply_delta(base, d["set"], d.get("unset", []))
+
+    print("broker CPU per decision:          parse     parse+verify")
+    for name, fn in (("full TAM", full), ("delta", delta)):
+        timings = []
+        for check in (False, True):
+            started = time.perf_counter()
+            fn(check)
+            timings.append((time.perf_counter() - started) / (reps * len(embedded)) * 1e6)
+        print(f"  {name:<10}                   {timings[0]:>6.1f} us    {timings[1]:>6.1f} us")
+
+    # --- end to end ------------------------------------------------------------
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        http_port = s.getsockname()[1]
+    threading.Thread(target=toolkit.run_broker, args=("127.0.0.1", http_port), daemon=True).start()
+    server = toolkit.run_stream("127.0.0.1", 0)
+    stream_port = server.server_address[1]
+    time.sleep(1.0)
+
+    url = f"http://127.0.0.1:{http_port}/ztxp/evaluate"
+    started = time.perf_counter()
+    for body in embedded[:args.http] if args.http <= len(embedded) else (embedded * (args.http // len(embedded) + 1))[:args.http]:
+        req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req) as r:
+            assert json.loads(r.read())["decision"] == "allow"
+    http_rate = args.http / (time.perf_counter() - started)
+
+    with ztxp_stream.StreamClient("127.0.0.1", stream_port, KEY.sign) as client:
+        session, first = client.open(base)
+        assert first["decision"] == "allow", first
+        window = threading.BoundedSemaphore(args.in_flight)
+        futures = []
+        started = time.perf_counter()
+        for t in tams:
+            window.acquire()
+            future = client.evaluate(session, t)
+            future.add_done_callback(lambda f: window.release())
+            futures.append(future)
+        decisions = [f.result() for f in futures]
+        stream_rate = len(tams) / (time.perf_counter() - started)
+    assert all(d["decision"] == "allow" for d in decisions)
+    server.shutdown()
+
+    print("end-to-end decisions/s (localhost):")
+    print(f"  HTTP POST, sequential          {http_rate:>8.0f}")
+    print(f"  stream, {args.in_flight} in flight            {stream_rate:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Microbenchmark: PEP TAM construction + canonicalization.
+
+Compares the per-request cost of producing the canonical signing bytes:
+  * canonical_json — sort + serialize the whole nested TAM dict
+  * template       — splice the variable fields into the precompiled
+                     per-issuer fragments (what build_tam() now does)
+
+Usage:
+  python bench/bench_tam_builder.py [--number 20000]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import timeit
+from unittest.mock import patch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PEP_DIR = os.path.join(ROOT, "ztxb-aws-lab", "app", "lambdas", "pep_authorizer")
+
+
+def load_pep():
+    import importlib.util
+
+    sys.path.insert(0, PEP_DIR)
+    with patch.dict(os.environ, {"KMS_KEY_ARN": "arn:aws:kms:bench", "BROKER_URL": "http://broker"}):
+        with patch("boto3.client"):
+            spec = importlib.util.spec_from_file_location("pep_handler", os.path.join(PEP_DIR, "handler.py"))
+            pep = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(pep)
+    return pep
+
+
+def make_event(groups):
+    claims = {"sub": "6f1c2a4e-0c1d-4b8e-9a55-3d2f0c1e7b90", "cognito:groups": groups}
+    payload = base64.b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+    return {
+        "requestContext": {
+            "http": {"method": "PUT", "path": "/notes/2b7e1516-28ae-d2a6", "sourceIp": "203.0.113.7"},
+            "requestId": "Zx1bXjJ2IAMEbXg=",
+        },
+        "headers": {
+            "authorization": f"Bearer eyJhbGciOiJSUzI1NiJ9.{payload}.sig",
+            "x-device-id": "laptop-42",
+            "x-device-compliant": "true",
+            "x-device-trust": "low-risk",
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    pep = load_pep()
+    cases = {
+        "typical": make_event(["writer"]),
+        "wide-groups": make_event([f"group-{i:03d}" for i in range(200)]),
+    }
+
+    print(f"{'case':<12} {'canonical_json us':>18} {'template us':>12} {'speedup':>8}")
+    for name, event in cases.items():
+        tam = pep.build_tam(event)
+        assert tam.payload == pep.canonical_json(dict(tam)), "template output diverged"
+
+        plain = dict(tam)
+        template = pep._tam_template(pep.TAM_ISSUER)
+        values = {}
+        for path in template.order:
+            node = plain
+            for key in path.split("."):
+                node = node[key]
+            values[path] = node
+
+        base = min(timeit.repeat(lambda: pep.canonical_json(plain), number=args.number, repeat=5))
+        tmpl = min(timeit.repeat(lambda: template.render(values), number=args.number, repeat=5))
+        base, tmpl = base / args.number * 1e6, tmpl / args.number * 1e6
+        print(f"{name:<12} {base:>18.2f} {tmpl:>12.2f} {base / tmpl:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Admission control (ztxp_admission.py): rate limits charge all claims or none."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import ztxp_admission  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _tam(subject, device, ip=None):
+    return {"subject": {"id": subject}, "source_device": {"id": device}, "context": {"source_ip": ip} if ip else {}}
+
+
+def test_refused_tam_charges_no_claim():
+    control = ztxp_admission.AdmissionControl(rate=1, burst=1, clock=FakeClock())
+    control.after_verify(_tam("alice", "laptop-1"))
+
+    with pytest.raises(ztxp_admission.Rejected) as exc:
+        control.after_verify(_tam("bob", "laptop-1", "10.0.0.2"))
+    assert exc.value.status == 429 and exc.value.reason == "rate limited (device)"
+
+    control.after_verify(_tam("bob", "laptop-2", "10.0.0.2"))
+    with pytest.raises(ztxp_admission.Rejected, match=r"rate limited \(subject\)"):
+        control.after_verify(_tam("bob", "laptop-3"))
@@ -0,0 +1,127 @@
+"""Signing agent (ztxp_agent.py): key permissions, protocol and bad requests."""
+import importlib.util
+import json
+import os
+import socket
+import stat
+import subprocess
+import sys
+import threading
+
+import pytest
+
+REFERENCE_DIR = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, REFERENCE_DIR)
+
+import ztxp_agent  # noqa: E402
+
+pytest.importorskip("cryptography")
+pytest.importorskip("yaml")
+
+_spec = importlib.util.spec_from_file_location("ztxp_toolkit", os.path.join(REFERENCE_DIR, "ztxpv0.2.py"))
+toolkit = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(toolkit)
+
+TAM_YAML = """
+subject: {id: alice, role: engineer}
+source_device: {id: laptop-1, posture: compliant}
+resource: {id: "app://notes/1", action: notes:Read}
+context: {risk_score: 10}
+"""
+
+
+@pytest.fixture
+def keys(tmp_path, monkeypatch):
+    key_dir = tmp_path / "keys"
+    monkeypatch.setattr(toolkit, "KEY_DIR", key_dir)
+    monkeypatch.setattr(toolkit, "PRIV_KEY_PATH", key_dir / "ed25519_private_key.pem")
+    monkeypatch.setattr(toolkit, "PUB_KEY_PATH", key_dir / "ed25519_public_key.pem")
+    monkeypatch.setattr(toolkit, "_KEYS", {})
+    toolkit.generate_keypair()
+    return key_dir
+
+
+@pytest.fixture
+def agent(keys):
+    path = keys / "agent.sock"
+    server = ztxp_agent.AgentServer(path, toolkit.agent_ops())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def _raw_exchange(path, frame):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        sock.connect(str(path))
+        sock.sendall(frame)
+        return ztxp_agent.read_frame(sock)
+
+
+def test_key_dir_and_private_key_are_owner_only(keys):
+    assert stat.S_IMODE(keys.stat().st_mode) == 0o700
+    assert stat.S_IMODE(toolkit.PRIV_KEY_PATH.stat().st_mode) == 0o600
+
+    keys.chmod(0o755)  # a directory left by an older version
+    toolkit.generate_keypair()
+    assert stat.S_IMODE(keys.stat().st_mode) == 0o700
+
+
+def test_socket_is_owner_only(agent):
+    assert stat.S_IMODE(os.stat(agent).st_mode) == 0o600
+
+
+def test_sign_and_validate_round_trip(agent):
+    with ztxp_agent.AgentClient(agent) as client:
+        signed = client.call("sign", tam_yaml=TAM_YAML)
+        assert signed["subject"]["id"] == "alice" and signed["signature"]["alg"] == "EdDSA"
+        assert client.call("verify", tam=signed) is True
+
+        compact = client.call("sign_compact", tam=json.loads(json.dumps(signed)))
+        assert client.call("verify_compact", token=compact)["subject"]["id"] == "alice"
+
+        signed["context"]["risk_score"] = 0
+        with pytest.raises(ztxp_agent.AgentError, match="Signature verification failed"):
+            client.call("verify", tam=signed)
+
+
+def test_bad_requests_are_answered_and_connection_survives(agent):
+    with ztxp_agent.AgentClient(agent) as client:
+        with pytest.raises(ztxp_agent.AgentError, match="unknown op"):
+            client.call("export_private_key")
+        with pytest.raises(ztxp_agent.AgentError):
+            client.call("sign", document="not a tam")
+        with pytest.raises(ztxp_agent.AgentError, match="mapping"):
+            client.call("sign", tam_yaml="- just\n- a list\n")
+        assert client.call("ping") == "pong"
+
+
+def test_malformed_frames_are_rejected(agent):
+    body = b"not json"
+    response = _raw_exchange(agent, ztxp_agent._LEN.pack(len(body)) + body)
+    assert response["ok"] is False and response["error"].startswith("bad frame")
+
+    response = _raw_exchange(agent, ztxp_agent._LEN.pack(ztxp_agent.MAX_FRAME + 1))
+    assert response == {"ok": False, "error": f"bad frame: frame too large ({ztxp_agent.MAX_FRAME + 1} bytes)"}
+
+    response = _raw_exchange(agent, ztxp_agent._LEN.pack(2) + b"[]")
+    assert response == {"ok": False, "error": "unknown op"}
+
+
+def test_sign_through_agent_never_imports_yaml(agent, tmp_path):
+    tam_path, out_path = tmp_path / "tam.yaml", tmp_path / "signed.json"
+    tam_path.write_text(TAM_YAML, encoding="utf-8")
+    script = (
+        "import runpy, sys\n"
+        "sys.modules['yaml'] = None  # any import of yaml fails\n"
+        f"sys.path.insert(0, {os.path.abspath(REFERENCE_DIR)!r})\n"
+        f"sys.argv = ['ztxpv0.2.py', 'sign', '--agent', '--socket', {str(agent)!r}, {str(tam_path)!r}, {str(out_path)!r}]\n"
+        f"runpy.run_path({os.path.join(os.path.abspath(REFERENCE_DIR), 'ztxpv0.2.py')!r}, run_name='__main__')\n"
+    )
+    subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, timeout=60)
+
+    signed = json.loads(out_path.read_text(encoding="utf-8"))
+    assert toolkit.verify_message(signed) is True
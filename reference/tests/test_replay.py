@@ -0,0 +1,126 @@
+"""Policy replay (ztxp_replay.py): flips, bad records and pruning."""
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import ztxp_replay  # noqa: E402
+
+pytest.importorskip("yaml")
+
+CURRENT = """
+default: {decision: deny}
+rules:
+  - name: low-risk
+    when: {risk_score: {lt: 50}}
+"""
+
+CANDIDATE = """
+default: {decision: deny, reason: too risky}
+rules:
+  - name: very-low-risk
+    when: {risk_score: {lt: 20}}
+"""
+
+
+def _tam(subject, risk, action="notes:Read"):
+    return {"subject": {"id": subject}, "context": {"risk_score": risk}, "resource": {"action": action}}
+
+
+@pytest.fixture
+def policies(tmp_path):
+    current, candidate = tmp_path / "current.yaml", tmp_path / "candidate.yaml"
+    current.write_text(CURRENT)
+    candidate.write_text(CANDIDATE)
+    return str(current), str(candidate)
+
+
+def _archive(tmp_path, lines):
+    path = tmp_path / "tams.jsonl"
+    path.write_text("".join((line if isinstance(line, str) else json.dumps(line)) + "\n" for line in lines))
+    return str(path)
+
+
+def test_flips_grouped_by_subject(tmp_path, policies):
+    archive = _archive(tmp_path, [_tam("alice", 30), _tam("alice", 30), _tam("bob", 10),
+                                  {"tam": _tam("carol", 40)}, _tam("dave", 90)])
+    report = ztxp_replay.replay([archive], *policies, workers=1)
+
+    assert report["records"] == 5 and report["parse_errors"] == 0
+    assert report["allow_before"] == 4 and report["allow_after"] == 1
+    assert report["flipped"] == 3
+    assert [(g["subject"], g["count"], g["transition"], g["reason"]) for g in report["groups"]] == [
+        ("alice", 2, "allow->deny", "too risky"), ("carol", 1, "allow->deny", "too risky")]
+
+
+def test_bad_records_counted_not_fatal(tmp_path, policies):
+    unhashable = _tam("eve", 10)
+    unhashable["context"]["risk_score"] = [1]
+    archive = _archive(tmp_path, ["{not json", unhashable, [1, 2], _tam("bob", 10)])
+    report = ztxp_replay.replay([archive], *policies, workers=1)
+
+    assert report["records"] == 1
+    assert report["parse_errors"] == 3
+
+
+def test_pruned_groups_reported(tmp_path, policies, capsys):
+    archive = _archive(tmp_path, [_tam(f"user-{i}", 30) for i in range(10)] + [_tam("alice", 30)] * 5)
+    report = ztxp_replay.replay([archive], *policies, workers=1, max_groups=4)
+
+    assert report["flipped"] == 15
+    assert report["groups"][0] == {"subject": "alice", "action": "notes:Read", "transition": "allow->deny",
+                                   "reason": "too risky", "count": 5}
+    assert report["pruned_groups"] + len(report["groups"]) == 11
+    assert report["pruned_flips"] == 15 - sum(g["count"] for g in report["groups"])
+    assert "Pruned" in capsys.readouterr().err
+    assert "pruned" in ztxp_replay.format_report(report)
+
+
+def test_group_pruned_twice_counted_once(tmp_path, policies):
+    # One record per block, so bob and carol are pruned, come back, and are pruned again
+    subjects = ["alice", "alice", "alice", "bob", "carol", "bob", "carol"]
+    archive = _archive(tmp_path, [_tam(s, 30) for s in subjects])
+    report = ztxp_replay.replay([archive], *policies, workers=1, block_size=1, max_groups=2)
+
+    assert [g["subject"] for g in report["groups"]] == ["alice"]
+    assert report["pruned_groups"] == 2
+    assert report["pruned_flips"] == 4 and report["flipped"] == 7
+
+
+class _FlakyOpa(BaseHTTPRequestHandler):
+    """Allows low-risk input and answers 500 for anything else."""
+
+    def do_POST(self):
+        opa_input = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["input"]
+        if opa_input["context"]["risk_score"] >= 50:
+            self.send_error(500)
+            return
+        body = json.dumps({"result": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_opa_error_counted_per_record_not_fatal(tmp_path, policies):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FlakyOpa)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/v1/data/authz/allow"
+        archive = _archive(tmp_path, [_tam("alice", 30), _tam("dave", 90), _tam("dave", 90)])
+        report = ztxp_replay.replay([archive], url, policies[1], workers=1)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert report["records"] == 1 and report["policy_errors"] == 2
+    assert report["allow_before"] == 1 and report["flipped"] == 1
+    assert "2 policy errors" in ztxp_replay.format_report(report)
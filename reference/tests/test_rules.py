@@ -0,0 +1,127 @@
+"""Scalar vs batch evaluation of the declarative rule engine (ztxp_rules.py)."""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ztxp_rules import RuleEngine, RuleError, columns_from_tams, compile_rules, evaluate_batch  # noqa: E402
+
+np = pytest.importorskip("numpy")
+
+RULES = """
+default:
+  decision: deny
+rules:
+  - name: admins
+    effect: allow
+    when:
+      role: admin
+  - name: blocked-issuer
+    effect: deny
+    when:
+      issuer: {in: ["ztxp://pep.evil"]}
+  - name: writers-write
+    actions: ["notes:Write"]
+    effect: allow
+    when:
+      groups: {contains: writer}
+      risk_score: {lt: 40}
+  - name: low-risk-compliant
+    effect: allow
+    when:
+      risk_score: {le: 50}
+      compliant: {eq: true}
+      device_trust: {ne: untrusted}
+"""
+
+
+def _tam(rng):
+    return {
+        "issuer": rng.choice(["ztxp://pep.lab", "ztxp://pep.evil"]),
+        "subject": {"id": "user:x", "role": rng.choice(["admin", "authenticated", ""]),
+                    "groups": rng.choice([["writer"], ["reader"], []])},
+        "source_device": {"posture": {"compliant": rng.choice([True, False])}},
+        "context": {"risk_score": rng.randrange(0, 100), "device_trust": rng.choice(["low-risk", "untrusted"])},
+        "resource": {"action": rng.choice(["notes:Read", "notes:Write", "notes:Delete"])},
+    }
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / "rules.yaml"
+    path.write_text(RULES)
+    return RuleEngine(str(path))
+
+
+def _scalar(engine, tams):
+    decisions = [engine.evaluate(t) for t in tams]
+    names = [r.name for r in engine.policy.rules]
+    return ([d["decision"] == "allow" for d in decisions],
+            [names.index(d["rule"]) if d["rule"] else -1 for d in decisions])
+
+
+def test_policy_facts():
+    policy = compile_rules({"rules": [{"when": {"role": "admin", "risk_score": {"lt": 5}}}]})
+    assert policy.facts == {"action", "role", "risk_score"}
+
+
+@pytest.mark.parametrize("facts", [None, "policy"])
+def test_batch_matches_scalar(engine, facts):
+    tams = [_tam(random.Random(i)) for i in range(500)]
+    columns = columns_from_tams(tams, engine.policy.facts if facts == "policy" else None)
+    allow, rule_index = engine.evaluate_batch(columns)
+
+    expected_allow, expected_index = _scalar(engine, tams)
+    assert allow.tolist() == expected_allow
+    assert rule_index.tolist() == expected_index
+
+
+POLICY_YAML = os.path.join(os.path.dirname(__file__), "..", "policy.yaml")
+ODD_COMPLIANT = [True, False, 1, 0, 1.0, 2, "true", "false", "", None]
+ODD_RISK = [10, 75, 30.5, "30", "high", None, True]
+
+
+@pytest.mark.parametrize("rules", ["shipped", "test"])
+def test_batch_matches_scalar_on_non_canonical_facts(engine, rules):
+    engine = RuleEngine(POLICY_YAML) if rules == "shipped" else engine
+    tams = []
+    for i, (compliant, risk) in enumerate((c, r) for c in ODD_COMPLIANT for r in ODD_RISK):
+        tam = _tam(random.Random(i))
+        tam["source_device"]["posture"]["compliant"] = compliant
+        tam["context"]["risk_score"] = risk
+        tams.append(tam)
+
+    allow, rule_index = engine.evaluate_batch(columns_from_tams(tams, engine.policy.facts))
+    expected_allow, expected_index = _scalar(engine, tams)
+    assert allow.tolist() == expected_allow
+    assert rule_index.tolist() == expected_index
+
+
+def test_compliant_one_allowed_on_both_paths():
+    engine = RuleEngine(POLICY_YAML)
+    tam = {"source_device": {"posture": {"compliant": 1}}, "context": {"risk_score": 10},
+           "resource": {"action": "notes:Read"}}
+    assert engine.evaluate(tam)["decision"] == "allow"
+    allow, _ = engine.evaluate_batch(columns_from_tams([tam], engine.policy.facts))
+    assert allow.tolist() == [True]
+
+
+def test_role_rule_matches_in_batch(engine):
+    tam = _tam(random.Random(0))
+    tam["subject"]["role"] = "admin"
+    allow, rule_index = engine.evaluate_batch(columns_from_tams([tam]))
+    assert allow.tolist() == [True] and rule_index.tolist() == [0]
+
+
+def test_missing_referenced_column_raises(engine):
+    columns = columns_from_tams([_tam(random.Random(0))], ["action", "risk_score", "compliant", "device_trust"])
+    with pytest.raises(ValueError, match="groups, issuer, role"):
+        evaluate_batch(engine.policy, columns)
+
+
+def test_invalid_rules_rejected():
+    with pytest.raises(RuleError, match="unknown fact"):
+        compile_rules({"rules": [{"name": "r", "when": {"colour": "red"}}]})
@@ -0,0 +1,135 @@
+"""Streaming channel (ztxp_stream.py): delta round trips and rejected deltas."""
+import hashlib
+import os
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import ztxp_agent  # noqa: E402
+import ztxp_stream  # noqa: E402
+
+ed25519 = pytest.importorskip("cryptography.hazmat.primitives.asymmetric.ed25519")
+
+BASE = {
+    "subject": {"id": "alice", "role": "engineer", "groups": ["dev"]},
+    "source_device": {"id": "laptop-1", "posture": "compliant"},
+    "resource": {"id": "app://notes/1", "action": "notes:Read"},
+    "context": {"risk_score": 10, "geo": "DE"},
+}
+
+
+@pytest.fixture
+def key():
+    return ed25519.Ed25519PrivateKey.generate()
+
+
+@pytest.fixture
+def broker(key):
+    seen = []
+
+    def evaluate(tam, sig):
+        seen.append((tam, sig))
+        return {"decision": "allow" if tam["context"]["risk_score"] < 50 else "deny"}
+
+    server = ztxp_stream.serve_in_background(("127.0.0.1", 0), ztxp_stream.verify_with(key.public_key()), evaluate)
+    yield server, seen
+    server.shutdown()
+    server.server_close()
+
+
+def _signed(key, data):
+    payload = ztxp_stream.canonical_json(data)
+    return f"{ztxp_stream._b64url(payload)}.{ztxp_stream._b64url(key.sign(payload))}"
+
+
+class _Raw:
+    """Hand-built frames, for requests the client would never send."""
+
+    def __init__(self, server):
+        self.sock = socket.create_connection(server.server_address, timeout=5)
+        self.next_id = 0
+
+    def call(self, **message):
+        self.next_id += 1
+        ztxp_agent.write_frame(self.sock, {"id": self.next_id, **message})
+        return ztxp_agent.read_frame(self.sock)
+
+    def open(self, key, tam):
+        response = self.call(op="open", tam_compact=_signed(key, tam))
+        return response["session"], hashlib.sha256(ztxp_stream.canonical_json(tam)).hexdigest()
+
+
+def test_diff_apply_round_trip():
+    new = {**BASE, "context": {"risk_score": 35, "network": {"asn": 64500}},
+           "subject": {**BASE["subject"], "groups": ["dev", "ops"]}}
+    changes, removed = ztxp_stream.diff(BASE, new)
+    assert changes == {"context.risk_score": 35, "context.network": {"asn": 64500}, "subject.groups": ["dev", "ops"]}
+    assert removed == ["context.geo"]
+    assert ztxp_stream.apply_delta(BASE, changes, removed) == new
+    assert BASE["context"] == {"risk_score": 10, "geo": "DE"}  # the base is never modified
+
+
+def test_client_deltas_reach_policy_as_full_tams(broker, key):
+    server, seen = broker
+    with ztxp_stream.StreamClient(*server.server_address, sign=key.sign) as client:
+        session, first = client.open(BASE)
+        risky = {**BASE, "context": {"risk_score": 80}}
+        futures = [client.evaluate(session, risky), client.evaluate(session, BASE)]
+        assert first == {"decision": "allow"}
+        assert [f.result(timeout=5) for f in futures] == [{"decision": "deny"}, {"decision": "allow"}]
+
+    open_sig = seen[0][1]
+    assert key.public_key().verify(open_sig, ztxp_stream.canonical_json(BASE)) is None
+    assert sorted((tam == risky, sig) for tam, sig in seen[1:]) == [(False, open_sig), (True, open_sig)]
+    assert all("signature" not in tam for tam, _ in seen)
+
+
+def test_delta_for_another_base_rejected(broker, key):
+    server, seen = broker
+    raw = _Raw(server)
+    session, _ = raw.open(key, BASE)
+    other = hashlib.sha256(b"another session").hexdigest()
+    response = raw.call(op="eval", session=session,
+                        delta=_signed(key, {"base": other, "seq": 1, "set": {"context.risk_score": 0}}))
+    assert response["ok"] is False and "does not belong" in response["error"]
+    assert len(seen) == 1
+
+
+def test_replayed_or_missing_seq_rejected(broker, key):
+    server, seen = broker
+    raw = _Raw(server)
+    session, digest = raw.open(key, BASE)
+    delta = _signed(key, {"base": digest, "seq": 1, "set": {"context.risk_score": 20}})
+
+    assert raw.call(op="eval", session=session, delta=delta)["seq"] == 1
+    replayed = raw.call(op="eval", session=session, delta=delta)
+    assert replayed["ok"] is False and "replayed" in replayed["error"]
+
+    unnumbered = raw.call(op="eval", session=session, delta=_signed(key, {"base": digest, "set": {}}))
+    assert unnumbered["ok"] is False and "seq" in unnumbered["error"]
+
+    far = ztxp_stream.REPLAY_WINDOW + 5
+    assert raw.call(op="eval", session=session, delta=_signed(key, {"base": digest, "seq": far, "set": {}}))["ok"]
+    stale = raw.call(op="eval", session=session, delta=_signed(key, {"base": digest, "seq": 2, "set": {}}))
+    assert stale["ok"] is False and "replayed" in stale["error"]
+    assert len(seen) == 3
+
+
+def test_tampered_delta_signature_rejected(broker, key):
+    server, seen = broker
+    raw = _Raw(server)
+    session, digest = raw.open(key, BASE)
+    payload, sig = _signed(key, {"base": digest, "seq": 1, "set": {"context.risk_score": 90}}).split(".")
+    forged = ztxp_stream._b64url(ztxp_stream.canonical_json({"base": digest, "seq": 1, "set": {"context.risk_score": 0}}))
+
+    for delta in (f"{forged}.{sig}", f"{payload}.{ztxp_stream._b64url(b'x' * 64)}"):
+        response = raw.call(op="eval", session=session, delta=delta)
+        assert response == {"id": raw.next_id, "ok": False, "error": "signature verification failed"}
+    other_key = ed25519.Ed25519PrivateKey.generate()
+    response = raw.call(op="eval", session=session,
+                        delta=_signed(other_key, {"base": digest, "seq": 1, "set": {}}))
+    assert response["ok"] is False
+    assert len(seen) == 1
@@ -0,0 +1,179 @@
+"""
+ZTXP Admission Control (v0.2 prototype)
+=======================================
+Cheap in-memory checks that run in the reference broker before the
+signature check and the policy evaluation, so abusive bursts are turned
+away for a few dict operations instead of full verify + policy work:
+
+  • concurrency limit: requests beyond `max_concurrency` in flight get
+    503 at once instead of queueing in Flask's thread pool.
+  • negative cache: an exact repeat of a request that was rejected in
+    the last `negative_ttl` seconds is refused without verifying again.
+    The key hashes the whole request body, so a tampered copy of a
+    valid TAM can never get the original blocked.
+  • failure budget: each client address has a token bucket that only
+    rejected requests draw from. An empty bucket means 429 before any
+    verification.
+  • rate limits: verified TAMs draw one token from the buckets of their
+    subject, source device and source IP (429 once empty), all three or
+    none. Claims are only charged after the signature checked out.
+
+Every table is a bounded LRU, so memory stays flat under key floods.
+
+  python ztxpv0.2.py broker --rate 20 --burst 40 --max-concurrency 64
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+
+class Rejected(Exception):
+    """An admission check failed; `status` is the HTTP status to return."""
+
+    def __init__(self, status: int, reason: str, retry_after: Optional[int] = None):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """Per-key token buckets in a bounded LRU of (tokens, updated_at)."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.burst > 0
+
+    def _level(self, key: str, now: float) -> float:
+        state = self._buckets.get(key)
+        if state is None:
+            return self.burst
+        return min(self.burst, state[0] + (now - state[1]) * self.rate)
+
+    def peek(self, key: str) -> bool:
+        if not self.enabled:
+            return True
+        with self._lock:
+            return self._level(key, self.clock()) >= 1.0
+
+    def take(self, key: str) -> bool:
+        if not self.enabled:
+            return True
+        with self._lock:
+            now = self.clock()
+            tokens = self._level(key, now)
+            if tokens < 1.0:
+                return False
+            self._buckets[key] = (tokens - 1.0, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return True
+
+    def take_all(self, keys: Sequence[str]) -> Optional[str]:
+        """Take one token from every key or from none; returns the first short key."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            now = self.clock()
+            levels = {key: self._level(key, now) for key in keys}
+            for key, tokens in levels.items():
+                if tokens < 1.0:
+                    return key
+            for key, tokens in levels.items():
+                self._buckets[key] = (tokens - 1.0, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return None
+
+    def retry_after(self, key: str) -> int:
+        if not self.enabled:
+            return 1
+        with self._lock:
+            missing = 1.0 - self._level(key, self.clock())
+        return max(1, int(missing / self.rate + 0.999))
+
+
+class AdmissionControl:
+    def __init__(self, rate: float = 0.0, burst: float = 0.0, failure_rate: float = 1.0,
+                 failure_burst: float = 20.0, negative_ttl: float = 60.0, max_concurrency: int = 0,
+                 max_keys: int = 10000, clock: Callable[[], float] = time.monotonic):
+        self.rate_limits = TokenBuckets(rate, burst, max_keys, clock)
+        self.failures = TokenBuckets(failure_rate, failure_burst, max_keys, clock)
+        self.negative_ttl = negative_ttl
+        self.max_concurrency = max_concurrency
+        self.max_keys = max_keys
+        self.clock = clock
+        self._negative: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    # --- concurrency ------------------------------------------------------
+
+    def enter(self) -> None:
+        """Claim an in-flight slot or raise Rejected(503)."""
+        with self._lock:
+            if self.max_concurrency > 0 and self._in_flight >= self.max_concurrency:
+                raise Rejected(503, "overloaded", 1)
+            self._in_flight += 1
+
+    def leave(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    # --- rejections -------------------------------------------------------
+
+    @staticmethod
+    def request_key(raw_body: bytes) -> str:
+        return hashlib.sha256(raw_body).hexdigest()
+
+    def before_verify(self, client: str, key: str) -> None:
+        with self._lock:
+            hit = self._negative.get(key)
+            if hit is not None and hit[0] <= self.clock():
+                del self._negative[key]
+                hit = None
+        if hit is not None:
+            raise Rejected(400, f"{hit[1]} (cached)")
+        if client and not self.failures.peek(client):
+            raise Rejected(429, "too many failed requests", self.failures.retry_after(client))
+
+    def rejected(self, client: str, key: str, reason: str) -> None:
+        if self.negative_ttl > 0:
+            with self._lock:
+                self._negative[key] = (self.clock() + self.negative_ttl, reason)
+                self._negative.move_to_end(key)
+                if len(self._negative) > self.max_keys:
+                    self._negative.popitem(last=False)
+        if client:
+            self.failures.take(client)
+
+    # --- rate limits ------------------------------------------------------
+
+    def after_verify(self, tam: Dict[str, Any], client: str = "") -> None:
+        if not self.rate_limits.enabled:
+            return
+        context = tam.get("context") or {}
+        claims = (
+            ("subject", (tam.get("subject") or {}).get("id")),
+            ("device", (tam.get("source_device") or {}).get("id")),
+            ("ip", context.get("source_ip") or client),
+        )
+        # All or nothing: a TAM refused on one claim spends no other claim's token
+        short = self.rate_limits.take_all([f"{kind}:{value}" for kind, value in claims if value])
+        if short is not None:
+            raise Rejected(429, f"rate limited ({short.split(':', 1)[0]})", self.rate_limits.retry_after(short))
@@ -0,0 +1,185 @@
+"""
+ZTXP Signing Agent (v0.2 prototype)
+===================================
+A long-lived local daemon that keeps the signing keys in memory and
+serves sign / verify requests over a Unix domain socket. It lets scripts
+that sign in a loop skip interpreter startup, the `cryptography` import
+and PEM parsing on every message.
+
+Wire protocol (both directions, any number of frames per connection):
+
+    4-byte big-endian length N | N bytes of UTF-8 JSON
+
+Requests are {"op": <name>, ...}. Responses are {"ok": true, "result": ...}
+or {"ok": false, "error": "<message>"}. Ops are registered by the caller;
+ztxpv0.2.py registers ping, sign, sign_compact, verify and verify_compact.
+
+The socket is created mode 0600 inside the (0700) key directory by
+default, so only the owning user can ask the agent to sign.
+
+  python ztxpv0.2.py agent &                   # start the daemon
+  python ztxpv0.2.py sign --agent tam.yaml out.json
+  python ztxpv0.2.py validate --agent out.json
+"""
+from __future__ import annotations
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+MAX_FRAME = 16 * 1024 * 1024
+DEFAULT_SOCKET = Path(os.environ.get("ZTXP_AGENT_SOCK", str(Path.home() / ".ztxp" / "agent.sock")))
+
+_LEN = struct.Struct(">I")
+
+
+class AgentError(Exception):
+    """The agent is unreachable or returned an error."""
+
+
+# ---------------------------
+# Framing
+# ---------------------------
+
+def _recv_exact(sock: socket.socket, n: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            if buf:
+                raise AgentError("connection closed mid-frame")
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def read_frame(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    """Read one frame; None on a clean EOF."""
+    header = _recv_exact(sock, _LEN.size)
+    if header is None:
+        return None
+    (length,) = _LEN.unpack(header)
+    if length > MAX_FRAME:
+        raise AgentError(f"frame too large ({length} bytes)")
+    body = _recv_exact(sock, length)
+    if body is None:
+        raise AgentError("connection closed mid-frame")
+    return json.loads(body)
+
+
+def write_frame(sock: socket.socket, message: Dict[str, Any]) -> None:
+    body = json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    sock.sendall(_LEN.pack(len(body)) + body)
+
+
+# ---------------------------
+# Server
+# ---------------------------
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        ops: Dict[str, Callable[..., Any]] = self.server.ops  # type: ignore[attr-defined]
+        while True:
+            try:
+                request = read_frame(self.request)
+            except (AgentError, ValueError) as e:
+                write_frame(self.request, {"ok": False, "error": f"bad frame: {e}"})
+                return
+            if request is None:
+                return
+            op = ops.get(request.pop("op", None)) if isinstance(request, dict) else None
+            if op is None:
+                write_frame(self.request, {"ok": False, "error": "unknown op"})
+                continue
+            try:
+                write_frame(self.request, {"ok": True, "result": op(**request)})
+            except Exception as e:  # report, keep serving
+                write_frame(self.request, {"ok": False, "error": str(e)})
+
+
+class AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: Path, ops: Dict[str, Callable[..., Any]]):
+        self.ops = ops
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        if path.exists():
+            if _alive(path):
+                raise AgentError(f"an agent is already listening on {path}")
+            path.unlink()  # stale socket from a previous run
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(str(path), _Handler)
+        finally:
+            os.umask(old_umask)
+        self.path = path
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _alive(path: Path) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(str(path))
+        return True
+    except OSError:
+        return False
+
+
+def serve(path: Path, ops: Dict[str, Callable[..., Any]]) -> None:
+    """Serve until interrupted; the socket file is removed on SIGINT/SIGTERM."""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with AgentServer(path, ops) as server:
+        print(f"[*] ZTXP agent listening on {path}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+# ---------------------------
+# Client
+# ---------------------------
+
+class AgentClient:
+    """Thin client; one connection reused for every call."""
+
+    def __init__(self, path: Path = DEFAULT_SOCKET, timeout: float = 10.0):
+        self.path = Path(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(str(self.path))
+        except OSError as e:
+            self.sock.close()
+            raise AgentError(f"no agent at {self.path}: {e}")
+
+    def call(self, op: str, **params: Any) -> Any:
+        write_frame(self.sock, {"op": op, **params})
+        response = read_frame(self.sock)
+        if response is None:
+            raise AgentError("agent closed the connection")
+        if not response.get("ok"):
+            raise AgentError(response.get("error", "agent error"))
+        return response.get("result")
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self) -> "AgentClient":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
@@ -0,0 +1,196 @@
+"""
+ZTXP Broker Profiling (v0.2 prototype)
+======================================
+On-demand sampling profiler for the reference broker. While a profile
+session runs, a background thread wakes `hz` times a second and records
+the Python stack of every request thread that was selected for
+profiling (1 in `every` requests). Stacks are aggregated in collapsed
+form ("outer;inner;leaf count"), which flamegraph.pl, speedscope and
+inferno read as-is.
+
+With `allocations` on, tracemalloc runs for the length of the session.
+Each profiled request then reports its net allocated blocks and its
+traced-memory growth. Both are process-wide counters, so they are exact
+only when one request is in flight at a time.
+
+Outside a session the broker pays one attribute check per request.
+
+  python ztxpv0.2.py broker --profile-endpoint
+  curl -X POST 'http://localhost:8080/debug/profile?seconds=30&every=4' > broker.collapsed
+  flamegraph.pl broker.collapsed > broker.svg
+
+  # or profile from startup and write the file when the window closes
+  python ztxpv0.2.py broker --profile-seconds 60 --profile-out broker.collapsed
+"""
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Set
+
+DEFAULT_HZ = 997  # prime, so sampling does not fall in step with periodic work
+
+_labels: Dict[Any, str] = {}  # code object -> "file.py:qualname"
+
+
+class ProfileBusy(Exception):
+    """A profile session is already running."""
+
+
+def _frame_label(code: Any) -> str:
+    label = _labels.get(code)
+    if label is None:
+        name = getattr(code, "co_qualname", code.co_name)
+        label = _labels[code] = f"{os.path.basename(code.co_filename)}:{name}"
+    return label
+
+
+def collapse(frame: Any, max_depth: int = 128) -> str:
+    """Root-first `a;b;c` label for a frame's stack."""
+    labels: List[str] = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def format_collapsed(counts: Counter) -> str:
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+
+class StackSampler:
+    """Samples the stacks of registered threads on a background thread."""
+
+    def __init__(self, hz: float = DEFAULT_HZ):
+        self.interval = 1.0 / hz
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._threads: Set[int] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ztxp-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def add(self, ident: int) -> None:
+        with self._lock:
+            self._threads.add(ident)
+
+    def discard(self, ident: int) -> None:
+        with self._lock:
+            self._threads.discard(ident)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if not self._threads:
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for ident in self._threads:
+                    frame = frames.get(ident)
+                    if frame is not None and ident != own:
+                        self.counts[collapse(frame)] += 1
+                        self.samples += 1
+
+    def drain(self) -> Counter:
+        """Return and reset the aggregated `{stack: count}`."""
+        with self._lock:
+            counts, self.counts = self.counts, Counter()
+        return counts
+
+
+class Profiler:
+    """Profile sessions over the broker's request handler.
+
+    `active` is the only thing read per request when no session runs.
+    """
+
+    def __init__(self, hz: float = DEFAULT_HZ, clock: Callable[[], float] = time.monotonic):
+        self.hz = hz
+        self.clock = clock
+        self.active = False
+        self._lock = threading.Lock()
+        self._session: Dict[str, Any] = {}
+        self._sampler: Optional[StackSampler] = None
+
+    def begin(self, seconds: float, every: int = 1, allocations: bool = False) -> None:
+        with self._lock:
+            if self.active:
+                raise ProfileBusy("a profile session is already running")
+            self._sampler = StackSampler(self.hz)
+            self._session = {"until": self.clock() + seconds, "every": max(1, every),
+                             "allocations": allocations, "seen": 0, "requests": []}
+            if allocations:
+                tracemalloc.start()
+            self._sampler.start()
+            self.active = True
+
+    def end(self) -> Dict[str, Any]:
+        """Stop the session; return collapsed stacks and per-request stats."""
+        with self._lock:
+            if not self.active:
+                return {"collapsed": "", "samples": 0, "requests": []}
+            self.active = False
+            sampler, session = self._sampler, self._session
+            self._sampler, self._session = None, {}
+        sampler.stop()
+        if session["allocations"]:
+            tracemalloc.stop()
+        return {
+            "collapsed": format_collapsed(sampler.drain()),
+            "samples": sampler.samples,
+            "requests": session["requests"],
+        }
+
+    def expired(self) -> bool:
+        return self.active and self.clock() >= self._session.get("until", 0.0)
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run `fn`, profiling it if the running session selects it."""
+        with self._lock:
+            session, sampler = self._session, self._sampler
+            selected = False
+            if self.active and self.clock() < session["until"]:
+                session["seen"] += 1
+                selected = session["seen"] % session["every"] == 0
+        if not selected:
+            return fn(*args, **kwargs)
+        ident = threading.get_ident()
+        allocations = session["allocations"]
+        if allocations:
+            blocks = sys.getallocatedblocks()
+            traced = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        sampler.add(ident)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sampler.discard(ident)
+            stats = {"ms": round((time.perf_counter() - started) * 1000, 3)}
+            if allocations:
+                stats["blocks"] = sys.getallocatedblocks() - blocks
+                stats["traced_kb"] = round((tracemalloc.get_traced_memory()[0] - traced) / 1024, 1)
+            with self._lock:
+                if session is self._session:
+                    session["requests"].append(stats)
+
+    def run_for(self, seconds: float, every: int = 1, allocations: bool = False) -> Dict[str, Any]:
+        """Blocking session: profile for `seconds`, then return `end()`."""
+        self.begin(seconds, every, allocations)
+        time.sleep(seconds)
+        return self.end()
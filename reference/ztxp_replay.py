@@ -0,0 +1,314 @@
+"""
+ZTXP Policy Replay (v0.2 prototype)
+===================================
+Offline "what-if" analysis: replay an archive of recorded TAMs (or OPA
+input documents) under the current and a candidate policy and report
+which decisions would flip, grouped by subject, action and reason.
+
+Input: one or more JSONL files (optionally .gz). Each line is one of
+  • a TAM                          {"subject": ..., "resource": ..., ...}
+  • a broker request body          {"tam": {...}}
+  • an OPA input document          {"input": {"action": ..., "principal": ...}}
+
+Policies are given as:
+  • a rules file for ztxp_rules    policy.yaml (policy.yaml = built-in policy)
+  • an OPA decision URL            http://localhost:8181/v1/data/authz/allow
+
+The archive is read in fixed-size byte blocks and fanned out to a process
+pool. Each worker parses its block, reduces every record to its decision
+inputs, and evaluates each distinct input only once under both policies
+(per-worker memo, bounded). Only aggregates travel back to the parent,
+so memory stays bounded regardless of archive size.
+
+  python ztxpv0.2.py replay --current policy.yaml --candidate new.yaml traffic/*.jsonl.gz
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import sys
+import time
+from collections import Counter
+from http.client import HTTPException
+from multiprocessing import get_context
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+from ztxp_rules import extract_facts, load_rules
+
+BLOCK_SIZE = 4 * 1024 * 1024
+MEMO_LIMIT = 200_000
+MAX_GROUPS = 100_000
+
+# What a policy backend may raise for one input (OPA down, 5xx, bad JSON)
+POLICY_ERRORS = (OSError, ValueError, HTTPException)
+
+# Fact tuple layout used as the dedupe key
+FACT_KEYS = ("action", "risk_score", "compliant", "device_trust", "role", "groups", "issuer")
+
+
+# ---------------------------
+# Record normalization
+# ---------------------------
+
+def record_facts(record: Dict[str, Any]) -> Tuple[str, Tuple]:
+    """Return (subject_id, decision-input key) for one archived record."""
+    if "tam" in record and isinstance(record["tam"], dict):
+        record = record["tam"]
+    if "input" in record and isinstance(record["input"], dict):
+        opa = record["input"]
+        principal = opa.get("principal", {})
+        ctx = opa.get("context", {})
+        facts = {
+            "action": opa.get("action", ""),
+            "risk_score": ctx.get("risk_score", 100),
+            "compliant": ctx.get("compliant", False),
+            "device_trust": ctx.get("device_trust", "unknown"),
+            "role": principal.get("role", ""),
+            "groups": principal.get("groups", ()),
+            "issuer": opa.get("issuer", ""),
+        }
+        subject = principal.get("id", "")
+    else:
+        facts = extract_facts(record)
+        subject = record.get("subject", {}).get("id", "")
+    facts["groups"] = tuple(sorted(facts["groups"] or ()))
+    return subject, tuple(facts[k] for k in FACT_KEYS)
+
+
+def key_to_facts(key: Tuple) -> Dict[str, Any]:
+    return dict(zip(FACT_KEYS, key))
+
+
+# ---------------------------
+# Policies
+# ---------------------------
+
+class RulesPolicy:
+    def __init__(self, path: str):
+        self.name = path
+        self.policy = load_rules(path)
+
+    def decide(self, facts: Dict[str, Any]) -> Tuple[bool, str]:
+        rule = self.policy.match(facts)
+        if rule is None:
+            return self.policy.default_decision == "allow", self.policy.default_reason
+        return rule.effect == "allow", rule.reason
+
+
+class OpaPolicy:
+    """Evaluate against a running OPA using the authz.rego input schema."""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.name = url
+        self.url = url
+        self.timeout = timeout
+
+    def decide(self, facts: Dict[str, Any]) -> Tuple[bool, str]:
+        from urllib.request import Request, urlopen
+
+        opa_input = {
+            "action": facts["action"],
+            "principal": {"role": facts["role"], "groups": list(facts["groups"])},
+            "context": {
+                "device_trust": facts["device_trust"],
+                "risk_score": facts["risk_score"],
+                "compliant": facts["compliant"],
+            },
+        }
+        body = json.dumps({"input": opa_input}).encode("utf-8")
+        req = Request(self.url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        with urlopen(req, timeout=self.timeout) as resp:
+            allowed = json.loads(resp.read().decode()).get("result", False) is True
+        return allowed, "policy_allow" if allowed else "policy_deny"
+
+
+def load_policy(spec: str):
+    if spec.startswith(("http://", "https://")):
+        return OpaPolicy(spec)
+    return RulesPolicy(spec)
+
+
+# ---------------------------
+# Worker side
+# ---------------------------
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(current_spec: str, candidate_spec: str) -> None:
+    _worker["current"] = load_policy(current_spec)
+    _worker["candidate"] = load_policy(candidate_spec)
+    _worker["memo"] = {}
+
+
+def _decide(key: Tuple) -> Tuple[bool, str, bool, str]:
+    memo = _worker["memo"]
+    hit = memo.get(key)
+    if hit is None:
+        facts = key_to_facts(key)
+        cur_allow, cur_reason = _worker["current"].decide(facts)
+        cand_allow, cand_reason = _worker["candidate"].decide(facts)
+        hit = (cur_allow, cur_reason, cand_allow, cand_reason)
+        if len(memo) >= MEMO_LIMIT:
+            memo.clear()
+        memo[key] = hit
+        _worker["evaluated"] = _worker.get("evaluated", 0) + 1
+    return hit
+
+
+def _replay_block(block: bytes) -> Dict[str, Any]:
+    _worker["evaluated"] = 0
+    records = errors = 0
+    # Group by decision input first so each distinct input is evaluated once
+    by_key: Dict[Tuple, Counter] = {}
+    for line in block.splitlines():
+        if not line.strip():
+            continue
+        try:
+            subject, key = record_facts(json.loads(line))
+            # Unhashable fact values (e.g. a list as risk_score) fail here
+            by_key.setdefault(key, Counter())[subject] += 1
+        except (ValueError, AttributeError, TypeError):
+            errors += 1
+            continue
+        records += 1
+
+    flips: Counter = Counter()
+    allow_before = allow_after = policy_errors = 0
+    for key, subjects in by_key.items():
+        n = sum(subjects.values())
+        try:
+            cur_allow, cur_reason, cand_allow, cand_reason = _decide(key)
+        except POLICY_ERRORS:
+            # Not memoized: the same input in a later block is tried again
+            policy_errors += n
+            records -= n
+            continue
+        allow_before += n if cur_allow else 0
+        allow_after += n if cand_allow else 0
+        if cur_allow == cand_allow:
+            continue
+        transition = "allow->deny" if cur_allow else "deny->allow"
+        reason = cand_reason if cur_allow else cur_reason
+        action = key[0]
+        for subject, count in subjects.items():
+            flips[(subject, action, transition, reason)] += count
+
+    return {
+        "records": records,
+        "errors": errors,
+        "policy_errors": policy_errors,
+        "distinct_in_block": len(by_key),
+        "evaluated": _worker["evaluated"],
+        "allow_before": allow_before,
+        "allow_after": allow_after,
+        "flips": flips,
+    }
+
+
+# ---------------------------
+# Parent side
+# ---------------------------
+
+def iter_blocks(paths: Sequence[str], block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """Yield newline-aligned byte blocks from (optionally gzipped) files."""
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            tail = b""
+            while True:
+                chunk = f.read(block_size)
+                if not chunk:
+                    break
+                chunk = tail + chunk
+                cut = chunk.rfind(b"\n")
+                if cut < 0:
+                    tail = chunk
+                    continue
+                tail = chunk[cut + 1:]
+                yield chunk[:cut + 1]
+            if tail.strip():
+                yield tail
+
+
+def _prune(flips: Counter, limit: int, pruned_keys: set) -> int:
+    """Drop the smallest groups once `limit` is exceeded; returns the flips dropped.
+
+    Dropped group keys are added to `pruned_keys`, so a group pruned again
+    after it grew back is still counted once.
+    """
+    if len(flips) <= limit:
+        return 0
+    ranked = flips.most_common()
+    keep, pruned = ranked[:limit // 2], ranked[limit // 2:]
+    dropped = sum(c for _, c in pruned)
+    (subject, action, transition, reason), count = pruned[0]
+    print(f"[!] Pruned {len(pruned):,} flip groups ({dropped:,} flips) beyond the top {len(keep):,}; "
+          f"largest pruned: {count:,} x {transition} {action} {subject} ({reason})", file=sys.stderr)
+    flips.clear()
+    flips.update(dict(keep))
+    pruned_keys.update(key for key, _ in pruned)
+    return dropped
+
+
+def replay(paths: Sequence[str], current: str, candidate: str,
+           workers: Optional[int] = None, block_size: int = BLOCK_SIZE,
+           max_groups: int = MAX_GROUPS) -> Dict[str, Any]:
+    """Replay `paths` under two policies and return the aggregated report."""
+    workers = workers or os.cpu_count() or 1
+    totals = Counter()
+    flips: Counter = Counter()
+    pruned_keys: set = set()
+    started = time.monotonic()
+
+    ctx = get_context("fork") if sys.platform != "win32" else get_context()
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(current, candidate)) as pool:
+        for result in pool.imap_unordered(_replay_block, iter_blocks(paths, block_size)):
+            for field in ("records", "errors", "policy_errors", "evaluated", "allow_before", "allow_after"):
+                totals[field] += result[field]
+            flips.update(result["flips"])
+            totals["pruned_flips"] += _prune(flips, max_groups, pruned_keys)
+
+    return {
+        "current": current,
+        "candidate": candidate,
+        "records": totals["records"],
+        "parse_errors": totals["errors"],
+        "policy_errors": totals["policy_errors"],
+        "evaluations": totals["evaluated"],
+        "allow_before": totals["allow_before"],
+        "allow_after": totals["allow_after"],
+        "flipped": sum(flips.values()) + totals["pruned_flips"],
+        "pruned_flips": totals["pruned_flips"],
+        "pruned_groups": len(pruned_keys),
+        "elapsed_seconds": round(time.monotonic() - started, 2),
+        "groups": [
+            {"subject": s, "action": a, "transition": t, "reason": r, "count": c}
+            for (s, a, t, r), c in flips.most_common()
+        ],
+    }
+
+
+def format_report(report: Dict[str, Any], top: int = 50) -> str:
+    lines = [
+        f"Replayed {report['records']:,} records in {report['elapsed_seconds']}s "
+        f"({report['evaluations']:,} policy evaluations, {report['parse_errors']:,} unparseable, "
+        f"{report['policy_errors']:,} policy errors)",
+        f"  current:   {report['current']}  -> {report['allow_before']:,} allow",
+        f"  candidate: {report['candidate']}  -> {report['allow_after']:,} allow",
+        f"  flipped:   {report['flipped']:,}",
+    ]
+    if report["pruned_groups"]:
+        lines.append(f"  (groups below the top were pruned: {report['pruned_groups']:,} groups, "
+                     f"{report['pruned_flips']:,} flips not listed)")
+    if report["groups"]:
+        lines.append("")
+        lines.append(f"{'COUNT':>10}  {'TRANSITION':<12} {'ACTION':<16} {'SUBJECT':<40} REASON")
+        for g in report["groups"][:top]:
+            lines.append(
+                f"{g['count']:>10,}  {g['transition']:<12} {g['action']:<16} {g['subject']:<40} {g['reason']}"
+            )
+        if len(report["groups"]) > top:
+            lines.append(f"  ... {len(report['groups']) - top:,} more groups")
+    return "\n".join(lines)
@@ -0,0 +1,373 @@
+"""
+ZTXP Rule Engine (v0.2 prototype)
+=================================
+Declarative policy for the reference broker, replacing the hardcoded
+branch in `evaluate_policy()` when a rules file is configured.
+
+Rules file (YAML):
+
+  default:
+    decision: deny
+    reason: no matching rule
+  rules:
+    - name: low-risk-compliant
+      actions: ["*"]            # resource.action values, "*" = any
+      effect: allow
+      when:
+        risk_score: {lt: 50}
+        compliant: {eq: true}
+      reason: low risk and compliant
+      expires_in: 600
+
+Rules are checked in file order and the first match wins. At load time
+they are compiled into predicate tables indexed by action, so a request
+only walks the rules that can apply to its action. The engine re-reads
+the file when its mtime changes (checked at most every `reload_interval`
+seconds); a file that fails to compile is logged and the previous rules
+stay active.
+
+Facts available to `when` clauses:
+  action, risk_score, compliant, device_trust, role, groups, issuer
+
+Operators: eq, ne, lt, le, gt, ge, in, not_in, contains
+
+Facts are coerced once (`coerce_facts()`) before either path sees them:
+risk_score is a float (NaN when not a number, so every comparison but
+`ne` fails), compliant is true only for true/1, groups is a tuple and
+the other facts are strings. Scalar and batch evaluation therefore
+agree on non-canonical TAMs too.
+
+`evaluate_batch()` evaluates many TAMs at once over NumPy column arrays
+(numpy is optional and only imported for batch evaluation).
+"""
+from __future__ import annotations
+
+import operator
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+ANY_ACTION = "*"
+
+_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "in": lambda value, operand: value in operand,
+    "not_in": lambda value, operand: value not in operand,
+    "contains": lambda value, operand: operand in (value or ()),
+}
+
+# Default fact values mirror the defaults used by evaluate_policy().
+_FACT_DEFAULTS: Dict[str, Any] = {
+    "action": "",
+    "risk_score": 100,
+    "compliant": False,
+    "device_trust": "unknown",
+    "role": "",
+    "groups": (),
+    "issuer": "",
+}
+
+
+def extract_facts(tam: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten the policy-relevant TAM fields into a fact dict."""
+    context = tam.get("context", {})
+    device = tam.get("source_device") or tam.get("device") or {}
+    subject = tam.get("subject", {})
+    return {
+        "action": tam.get("resource", {}).get("action", ""),
+        "risk_score": context.get("risk_score", 100),
+        "compliant": device.get("posture", {}).get("compliant", False),
+        "device_trust": context.get("device_trust", "unknown"),
+        "role": subject.get("role", ""),
+        "groups": subject.get("groups", ()),
+        "issuer": tam.get("issuer", ""),
+    }
+
+
+def _as_number(value: Any) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return float("nan")
+
+
+def _as_groups(value: Any) -> Tuple[Any, ...]:
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(value)
+    return (value,) if value else ()
+
+
+_COERCE: Dict[str, Callable[[Any], Any]] = {
+    "action": str,
+    "risk_score": _as_number,
+    "compliant": lambda value: isinstance(value, (bool, int, float)) and value == 1,
+    "device_trust": str,
+    "role": str,
+    "groups": _as_groups,
+    "issuer": str,
+}
+
+
+def coerce_facts(facts: Dict[str, Any]) -> Dict[str, Any]:
+    """Facts in the types both evaluation paths compare (see module docstring)."""
+    return {fact: _COERCE[fact](value) if fact in _COERCE else value for fact, value in facts.items()}
+
+
+class RuleError(ValueError):
+    """Raised when a rules document cannot be compiled."""
+
+
+class Rule:
+    __slots__ = ("name", "effect", "reason", "expires_in", "predicates", "index")
+
+    def __init__(self, name: str, effect: str, reason: str, expires_in: int,
+                 predicates: List[Tuple[str, str, Any]], index: int):
+        self.name = name
+        self.effect = effect
+        self.reason = reason
+        self.expires_in = expires_in
+        self.predicates = predicates  # [(fact, op, operand)]
+        self.index = index
+
+    def matches(self, facts: Dict[str, Any]) -> bool:
+        for fact, op, operand in self.predicates:
+            try:
+                if not _OPS[op](facts[fact], operand):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+
+class CompiledPolicy:
+    """Rules compiled into per-action predicate tables."""
+
+    def __init__(self, entries: List[Tuple[Rule, frozenset]], default_decision: str,
+                 default_reason: str):
+        self.rules = [rule for rule, _ in entries]
+        # Facts batch evaluation needs columns for
+        self.facts = frozenset(["action"] + [fact for rule in self.rules for fact, _, _ in rule.predicates])
+        self.default_decision = default_decision
+        self.default_reason = default_reason
+        # Rules for actions no rule names explicitly: wildcard rules only
+        self._wildcard = [rule for rule, actions in entries if ANY_ACTION in actions]
+        named = {a for _, actions in entries for a in actions if a != ANY_ACTION}
+        self.tables: Dict[str, List[Rule]] = {
+            action: [rule for rule, actions in entries if action in actions or ANY_ACTION in actions]
+            for action in named
+        }
+
+    def table_for(self, action: str) -> List[Rule]:
+        return self.tables.get(action, self._wildcard)
+
+    def match(self, facts: Dict[str, Any]) -> Optional[Rule]:
+        facts = coerce_facts(facts)
+        for rule in self.table_for(facts["action"]):
+            if rule.matches(facts):
+                return rule
+        return None
+
+
+def compile_rules(doc: Dict[str, Any]) -> CompiledPolicy:
+    """Compile a parsed rules document; raises RuleError on invalid input."""
+    if not isinstance(doc, dict):
+        raise RuleError("rules document must be a mapping")
+    default = doc.get("default", {}) or {}
+    default_decision = default.get("decision", "deny")
+    if default_decision not in ("allow", "deny"):
+        raise RuleError(f"invalid default decision: {default_decision!r}")
+
+    compiled = []
+    for index, raw in enumerate(doc.get("rules", []) or []):
+        name = raw.get("name", f"rule-{index}")
+        effect = raw.get("effect", "allow")
+        if effect not in ("allow", "deny"):
+            raise RuleError(f"{name}: invalid effect {effect!r}")
+        actions = raw.get("actions", [ANY_ACTION])
+        if isinstance(actions, str):
+            actions = [actions]
+
+        predicates = []
+        for fact, cond in (raw.get("when", {}) or {}).items():
+            if fact not in _FACT_DEFAULTS:
+                raise RuleError(f"{name}: unknown fact {fact!r}")
+            if not isinstance(cond, dict):
+                cond = {"eq": cond}
+            for op, operand in cond.items():
+                if op not in _OPS:
+                    raise RuleError(f"{name}: unknown operator {op!r}")
+                if op in ("in", "not_in"):
+                    operand = frozenset(operand)
+                predicates.append((fact, op, operand))
+
+        rule = Rule(
+            name=name,
+            effect=effect,
+            reason=raw.get("reason", name),
+            expires_in=int(raw.get("expires_in", 600 if effect == "allow" else 0)),
+            predicates=predicates,
+            index=index,
+        )
+        compiled.append((rule, frozenset(actions)))
+
+    return CompiledPolicy(compiled, default_decision, default.get("reason", "no matching rule"))
+
+
+def load_rules(path: str) -> CompiledPolicy:
+    import yaml
+
+    with open(path, "r", encoding="utf-8") as f:
+        return compile_rules(yaml.safe_load(f) or {})
+
+
+class RuleEngine:
+    """Hot-reloading rule engine backed by a YAML rules file."""
+
+    def __init__(self, path: str, reload_interval: float = 1.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = os.stat(path).st_mtime_ns
+        self._checked_at = time.monotonic()
+        self.policy = load_rules(path)
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime == self._mtime:
+                    return
+                self._mtime = mtime  # a broken file is reported once, not on every check
+                self.policy = load_rules(self.path)
+                print(f"[*] Reloaded policy rules from {self.path}", file=sys.stderr)
+            except Exception as e:  # keep serving the last good policy
+                print(f"[!] Policy reload failed, keeping previous rules: {e}", file=sys.stderr)
+
+    def evaluate(self, tam: Dict[str, Any]) -> Dict[str, Any]:
+        """Evaluate one TAM; same response shape as `evaluate_policy()`."""
+        self._maybe_reload()
+        policy = self.policy
+        rule = policy.match(extract_facts(tam))
+        if rule is None:
+            decision, reason, expires_in, name = (
+                policy.default_decision, policy.default_reason,
+                600 if policy.default_decision == "allow" else 0, None,
+            )
+        else:
+            decision, reason, expires_in, name = rule.effect, rule.reason, rule.expires_in, rule.name
+        return {
+            "decision": decision,
+            "reason": reason,
+            "rule": name,
+            "evaluated_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            "expires_in": expires_in,
+        }
+
+    def evaluate_batch(self, columns: Dict[str, Sequence[Any]]):
+        self._maybe_reload()
+        return evaluate_batch(self.policy, columns)
+
+
+# ---------------------------
+# Vectorized batch evaluation
+# ---------------------------
+
+def columns_from_tams(tams: Sequence[Dict[str, Any]], facts: Optional[Sequence[str]] = None):
+    """Build NumPy column arrays from TAM dicts for `evaluate_batch()`.
+
+    `facts` defaults to every fact; pass `policy.facts` to build only the
+    columns a compiled policy uses.
+    """
+    import numpy as np
+
+    if facts is None:
+        facts = list(_FACT_DEFAULTS)
+    rows = [coerce_facts(extract_facts(t)) for t in tams]
+    cols = {}
+    for fact in facts:
+        values = [r[fact] for r in rows]
+        if fact == "risk_score":
+            cols[fact] = np.asarray(values, dtype=np.float64)
+        elif fact == "compliant":
+            cols[fact] = np.asarray(values, dtype=bool)
+        elif fact == "groups":
+            cols[fact] = np.asarray(values + [None], dtype=object)[:-1]
+        else:
+            cols[fact] = np.asarray(values, dtype=str)
+    return cols
+
+
+def _predicate_mask(np, column, op: str, operand):
+    if op == "eq":
+        return column == operand
+    if op == "ne":
+        return column != operand
+    if op == "lt":
+        return column < operand
+    if op == "le":
+        return column <= operand
+    if op == "gt":
+        return column > operand
+    if op == "ge":
+        return column >= operand
+    if op == "in":
+        return np.isin(column, list(operand))
+    if op == "not_in":
+        return ~np.isin(column, list(operand))
+    # contains: per-row membership test over an object column of lists
+    return np.fromiter((operand in (v or ()) for v in column), dtype=bool, count=len(column))
+
+
+def evaluate_batch(policy: CompiledPolicy, columns: Dict[str, Sequence[Any]]):
+    """Evaluate N requests given as column arrays.
+
+    `columns` maps fact name -> array of length N and must hold every
+    fact in `policy.facts` (ValueError otherwise: a default would silently
+    disagree with `RuleEngine.evaluate()`). Returns `(allow, rule_index)`:
+    a bool array and an int array holding the index of the matching rule
+    (-1 = default).
+    """
+    import numpy as np
+
+    missing = sorted(policy.facts - set(columns))
+    if missing:
+        raise ValueError(f"missing columns for facts used by the policy: {', '.join(missing)}")
+    cols = {k: np.asarray(v) for k, v in columns.items()}
+    n = len(cols["action"])
+
+    rule_index = np.full(n, -1, dtype=np.int32)
+    action_col = cols["action"]
+    groups = [(a, action_col == a) for a in policy.tables]
+    known = np.zeros(n, dtype=bool)
+    for _, mask in groups:
+        known |= mask
+    groups.append((None, ~known))
+
+    for action, rows in groups:
+        table = policy.table_for(action) if action is not None else policy._wildcard
+        undecided = rows.copy()
+        for rule in table:
+            if not undecided.any():
+                break
+            hit = undecided.copy()
+            for fact, op, operand in rule.predicates:
+                hit &= _predicate_mask(np, cols[fact], op, operand)
+            rule_index[hit] = rule.index
+            undecided &= ~hit
+
+    effects = np.array([r.effect == "allow" for r in policy.rules] + [policy.default_decision == "allow"])
+    allow = effects[rule_index]  # index -1 picks the default slot
+    return allow, rule_index
@@ -0,0 +1,396 @@
+"""
+ZTXP Streaming Channel (v0.2 prototype)
+=======================================
+A persistent TCP channel to the reference broker for high-frequency PEPs
+(gateways, sidecars) that send near-identical TAMs for the same session.
+Instead of one JSON POST per decision, the PEP opens a session with one
+full signed TAM, then sends only signed deltas against it.
+
+Framing is the same as the signing agent (ztxp_agent.py): a 4-byte
+big-endian length followed by UTF-8 JSON. Every request carries an `id`.
+Requests are handled concurrently, and responses come back in completion
+order with the same `id`, so a client can keep many decisions in flight
+on one connection.
+
+  → {"id": 1, "op": "open", "tam_compact": "<b64url payload>.<b64url sig>"}
+  ← {"id": 1, "ok": true, "session": 1, "result": <decision>}
+
+  → {"id": 2, "op": "eval", "session": 1, "delta": "<b64url payload>.<b64url sig>"}
+      payload = canonical JSON {"base": <sha256 hex of the open payload>,
+                                "seq": 1,
+                                "set": {"context.risk_score": 35, ...},
+                                "unset": ["context.geo", ...]}
+  ← {"id": 2, "ok": true, "seq": 1, "result": <decision>}
+
+  → {"id": 3, "op": "close", "session": 1}
+
+Deltas use dotted paths into nested objects and are always relative to
+the session's base TAM, never to the previous delta. They can therefore
+be verified and evaluated in any order. Each delta is signed over its
+own exact bytes, and it names the base digest, so it cannot be applied
+to another session's TAM. Its `seq` (1, 2, ... per session) is accepted
+once: a repeated number, or one more than REPLAY_WINDOW below the
+highest seen, is rejected as a replay. Sessions belong to the connection
+that opened them and end with it.
+
+The policy sees the session TAM with the signature it was opened with
+(`evaluate(tam, sig)` gets the open frame's signature). A delta's
+signature covers only the delta bytes, so it stays in its frame and
+never appears in a TAM.
+
+Per decision the broker hashes, verifies and parses a payload of a few
+hundred bytes. The full TAM is never re-canonicalized.
+
+  python ztxpv0.2.py broker --stream-port 8081
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import socket
+import socketserver
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+from ztxp_agent import AgentError, read_frame, write_frame
+
+MAX_SESSIONS_PER_CONNECTION = 1024
+MAX_IN_FLIGHT = 64
+REPLAY_WINDOW = 1024  # per session; well above the deltas a client keeps in flight
+
+# verify(payload, signature) raises ValueError on a bad signature;
+# evaluate(tam, signature) returns the decision (or raises ValueError),
+# where signature is the open frame's signature over the session TAM
+Verify = Callable[[bytes, bytes], None]
+Evaluate = Callable[[Dict[str, Any], bytes], Dict[str, Any]]
+
+
+def canonical_json(data: Dict[str, Any]) -> bytes:
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _b64url(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _split_compact(token: Any) -> Tuple[bytes, bytes]:
+    try:
+        payload_b64, sig_b64 = token.split(".")
+        return _b64url_decode(payload_b64), _b64url_decode(sig_b64)
+    except (AttributeError, ValueError) as e:
+        raise ValueError(f"malformed compact token: {e}")
+
+
+# ---------------------------
+# Deltas
+# ---------------------------
+
+_MISSING = object()
+
+
+def diff(base: Dict[str, Any], new: Dict[str, Any], prefix: str = "") -> Tuple[Dict[str, Any], List[str]]:
+    """Dotted-path changes turning `base` into `new`: (set, unset).
+
+    Nested objects are diffed recursively. Lists and scalars are replaced
+    whole, and so is an object with a "." in one of its keys.
+    """
+    changes: Dict[str, Any] = {}
+    removed: List[str] = []
+    for key, value in new.items():
+        path = prefix + key
+        old = base.get(key, _MISSING)
+        if old == value:
+            continue
+        if (isinstance(old, dict) and isinstance(value, dict)
+                and "." not in key and not any("." in k for k in (*old, *value))):
+            sub_set, sub_unset = diff(old, value, path + ".")
+            changes.update(sub_set)
+            removed.extend(sub_unset)
+        else:
+            changes[path] = value
+    removed.extend(prefix + key for key in base if key not in new)
+    return changes, removed
+
+
+def apply_delta(base: Dict[str, Any], changes: Dict[str, Any], removed: List[str]) -> Dict[str, Any]:
+    """Return `base` with the delta applied; only the touched objects are copied."""
+    out = dict(base)
+    copied = {id(out)}
+
+    def parent_of(path: str) -> Tuple[Dict[str, Any], str]:
+        node = out
+        *parents, leaf = path.split(".")
+        for part in parents:
+            child = node.get(part)
+            if not isinstance(child, dict) or id(child) not in copied:
+                child = dict(child) if isinstance(child, dict) else {}
+                copied.add(id(child))
+                node[part] = child
+            node = child
+        return node, leaf
+
+    for path, value in changes.items():
+        node, leaf = parent_of(path)
+        node[leaf] = value
+    for path in removed:
+        node, leaf = parent_of(path)
+        node.pop(leaf, None)
+    return out
+
+
+# ---------------------------
+# Server
+# ---------------------------
+
+class _Session:
+    __slots__ = ("tam", "digest", "sig", "highest", "seen")
+
+    def __init__(self, tam: Dict[str, Any], digest: str, sig: bytes):
+        self.tam = tam
+        self.digest = digest
+        self.sig = sig
+        self.highest = 0
+        self.seen: Set[int] = set()
+
+    def accept(self, seq: Any) -> None:
+        """Record a delta's sequence number; ValueError if it was replayed."""
+        if not isinstance(seq, int) or isinstance(seq, bool) or seq < 1:
+            raise ValueError("delta needs a positive integer seq")
+        if seq <= self.highest - REPLAY_WINDOW or seq in self.seen:
+            raise ValueError(f"replayed delta (seq {seq})")
+        self.seen.add(seq)
+        if seq > self.highest:
+            self.highest = seq
+            self.seen = {n for n in self.seen if n > seq - REPLAY_WINDOW}
+
+
+class _Connection(socketserver.BaseRequestHandler):
+    server: "StreamServer"
+
+    def setup(self) -> None:
+        self.sessions: Dict[int, _Session] = {}
+        self.next_session = 1
+        self.write_lock = threading.Lock()
+        self.seq_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.server.max_in_flight)
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self) -> None:
+        while True:
+            try:
+                frame = read_frame(self.request)
+            except (AgentError, ValueError, OSError):
+                return
+            if frame is None:
+                return
+            self.slots.acquire()  # backpressure: stop reading at MAX_IN_FLIGHT
+            if isinstance(frame, dict) and frame.get("op") == "open":
+                self._run(frame)  # later evals may reference the new session
+            else:
+                self.server.pool.submit(self._run, frame)
+
+    def _run(self, frame: Any) -> None:
+        request_id = frame.get("id") if isinstance(frame, dict) else None
+        try:
+            response = {"id": request_id, "ok": True, **self._dispatch(frame)}
+        except ValueError as e:
+            response = {"id": request_id, "ok": False, "error": str(e)}
+        except Exception as e:  # report, keep serving
+            response = {"id": request_id, "ok": False, "error": f"internal error: {e}"}
+        try:
+            with self.write_lock:
+                write_frame(self.request, response)
+        except OSError:
+            pass
+        finally:
+            self.slots.release()
+
+    def _dispatch(self, frame: Any) -> Dict[str, Any]:
+        if not isinstance(frame, dict):
+            raise ValueError("frame must be an object")
+        op = frame.get("op")
+        if op == "open":
+            return self._open(frame)
+        if op == "eval":
+            return self._eval(frame)
+        if op == "close":
+            self.sessions.pop(frame.get("session"), None)
+            return {}
+        raise ValueError(f"unknown op {op!r}")
+
+    def _open(self, frame: Dict[str, Any]) -> Dict[str, Any]:
+        if len(self.sessions) >= MAX_SESSIONS_PER_CONNECTION:
+            raise ValueError("too many sessions on this connection")
+        payload, sig = _split_compact(frame.get("tam_compact"))
+        self.server.verify(payload, sig)
+        tam = json.loads(payload)
+        if not isinstance(tam, dict) or "signature" in tam:
+            raise ValueError("malformed TAM payload")
+        result = self.server.evaluate(tam, sig)
+        session = self.next_session
+        self.next_session += 1
+        self.sessions[session] = _Session(tam, hashlib.sha256(payload).hexdigest(), sig)
+        return {"session": session, "result": result}
+
+    def _eval(self, frame: Dict[str, Any]) -> Dict[str, Any]:
+        state = self.sessions.get(frame.get("session"))
+        if state is None:
+            raise ValueError("unknown session")
+        payload, delta_sig = _split_compact(frame.get("delta"))
+        self.server.verify(payload, delta_sig)
+        delta = json.loads(payload)
+        if not isinstance(delta, dict) or delta.get("base") != state.digest:
+            raise ValueError("delta does not belong to this session")
+        with self.seq_lock:
+            state.accept(delta.get("seq"))
+        tam = apply_delta(state.tam, delta.get("set") or {}, delta.get("unset") or [])
+        return {"seq": delta["seq"], "result": self.server.evaluate(tam, state.sig)}
+
+
+class StreamServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], verify: Verify, evaluate: Evaluate,
+                 workers: int = 8, max_in_flight: int = MAX_IN_FLIGHT):
+        self.verify = verify
+        self.evaluate = evaluate
+        self.max_in_flight = max_in_flight
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ztxp-stream")
+        super().__init__(address, _Connection)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+def serve_in_background(address: Tuple[str, int], verify: Verify, evaluate: Evaluate) -> StreamServer:
+    server = StreamServer(address, verify, evaluate)
+    threading.Thread(target=server.serve_forever, name="ztxp-stream", daemon=True).start()
+    return server
+
+
+# ---------------------------
+# Client
+# ---------------------------
+
+class StreamClient:
+    """Pipelining client: `evaluate()` returns a Future resolved by a reader thread.
+
+    `sign(payload) -> signature` signs with the PEP's key. One client can
+    hold several sessions. `evaluate()` diffs the given full TAM against
+    the session's base, so callers never build deltas by hand.
+    """
+
+    def __init__(self, host: str, port: int, sign: Callable[[bytes], bytes], timeout: float = 10.0):
+        self.sign = sign
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(None)
+        self.bases: Dict[int, Tuple[Dict[str, Any], str]] = {}
+        self._seqs: Dict[int, int] = {}
+        self._pending: Dict[int, Future] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_loop, name="ztxp-stream-client", daemon=True)
+        self._reader.start()
+
+    def _send(self, message: Dict[str, Any]) -> Future:
+        future: Future = Future()
+        with self._lock:
+            self._next_id += 1
+            message["id"] = self._next_id
+            self._pending[self._next_id] = future
+            try:
+                write_frame(self.sock, message)
+            except OSError as e:
+                del self._pending[self._next_id]
+                raise AgentError(f"stream closed: {e}")
+        return future
+
+    def _read_loop(self) -> None:
+        error: Exception = AgentError("stream closed")
+        try:
+            while True:
+                response = read_frame(self.sock)
+                if response is None:
+                    break
+                future = self._pending.pop(response.get("id"), None)
+                if future is None:
+                    continue
+                if response.get("ok"):
+                    future.set_result(response)
+                else:
+                    future.set_exception(AgentError(response.get("error", "stream error")))
+        except (AgentError, OSError, ValueError) as e:
+            error = e
+        for future in list(self._pending.values()):
+            future.set_exception(error)
+        self._pending.clear()
+
+    def _compact(self, data: Dict[str, Any]) -> Tuple[str, bytes]:
+        payload = canonical_json(data)
+        return f"{_b64url(payload)}.{_b64url(self.sign(payload))}", payload
+
+    def open(self, tam: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Open a session with a full TAM; returns (session, first decision)."""
+        tam = {k: v for k, v in tam.items() if k != "signature"}
+        token, payload = self._compact(tam)
+        response = self._send({"op": "open", "tam_compact": token}).result()
+        self.bases[response["session"]] = (tam, hashlib.sha256(payload).hexdigest())
+        return response["session"], response["result"]
+
+    def evaluate(self, session: int, tam: Dict[str, Any]) -> "Future[Dict[str, Any]]":
+        """Send `tam` as a delta against the session base; Future of the decision."""
+        base, base_digest = self.bases[session]
+        changes, removed = diff(base, {k: v for k, v in tam.items() if k != "signature"})
+        with self._lock:
+            seq = self._seqs[session] = self._seqs.get(session, 0) + 1
+        delta: Dict[str, Any] = {"base": base_digest, "seq": seq, "set": changes}
+        if removed:
+            delta["unset"] = removed
+        token, _ = self._compact(delta)
+        outer: Future = Future()
+        inner = self._send({"op": "eval", "session": session, "delta": token})
+        inner.add_done_callback(
+            lambda f: outer.set_exception(f.exception()) if f.exception() else outer.set_result(f.result()["result"])
+        )
+        return outer
+
+    def close_session(self, session: int) -> None:
+        self.bases.pop(session, None)
+        self._seqs.pop(session, None)
+        self._send({"op": "close", "session": session})
+
+    def close(self) -> None:
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def __enter__(self) -> "StreamClient":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def verify_with(public_key: Any) -> Verify:
+    """A `Verify` callable for an Ed25519 public key."""
+
+    def verify(payload: bytes, signature: bytes) -> None:
+        from cryptography.exceptions import InvalidSignature
+
+        try:
+            public_key.verify(signature, payload)
+        except InvalidSignature:
+            raise ValueError("signature verification failed")
+
+    return verify
@@ -0,0 +1,231 @@
+"""
+ZTXP Tenant Policies (v0.2 prototype)
+=====================================
+Multi-tenant policy routing for the reference broker. The TAM issuer
+names the tenant, and each tenant has its own policy. Issuers that are
+not listed are denied before any policy runs.
+
+Tenants file (YAML):
+
+  tenants:
+    ztxp://pep.acme.example:
+      policy: tenants/acme.yaml          # rules file (ztxp_rules.py)
+    ztxp://pep.globex.example:
+      policy: http://localhost:8181/v1/data/tenants/globex/authz/allow
+
+Relative rules paths are resolved against the tenants file. A rules
+policy is compiled the first time its tenant sends a TAM, not at
+startup, so thousands of mostly idle tenants cost nothing until they
+are used. Compiled policies are kept in an LRU capped at `cache_bytes`
+(estimated from the compiled rule tables). When a new policy does not
+fit, the least recently used ones are dropped and compiled again on
+their next request. Concurrent first requests for one tenant compile
+it once; other tenants are not blocked meanwhile. A cached rules policy
+hot-reloads like `--rules` (RuleEngine). An OPA URL is evaluated by OPA,
+so only the URL is cached.
+
+The tenants file is re-read when its mtime changes (checked at most
+every `reload_interval` seconds). Tenants whose policy changed or that
+were removed are dropped from the cache. A file that fails to load is
+logged and the previous tenants stay active.
+
+  python ztxpv0.2.py broker --tenants tenants.yaml --tenant-cache-mb 64
+"""
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from ztxp_rules import RuleEngine, extract_facts
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def load_tenants(path: str) -> Dict[str, str]:
+    """Parse a tenants file into {issuer: policy spec}; raises ValueError."""
+    import yaml
+
+    with open(path, "r", encoding="utf-8") as f:
+        doc = yaml.safe_load(f) or {}
+    tenants = doc.get("tenants") if isinstance(doc, dict) else None
+    if not isinstance(tenants, dict):
+        raise ValueError(f"{path}: expected a 'tenants' mapping of issuer -> settings")
+    base = os.path.dirname(os.path.abspath(path))
+    specs = {}
+    for issuer, settings in tenants.items():
+        policy = (settings or {}).get("policy") if isinstance(settings, dict) else None
+        if not policy:
+            raise ValueError(f"{path}: tenant {issuer!r} has no policy")
+        if not policy.startswith(("http://", "https://")):
+            policy = os.path.join(base, policy)
+        specs[str(issuer)] = policy
+    return specs
+
+
+def estimate_size(obj: Any) -> int:
+    """Approximate bytes held by a compiled policy (shared objects counted once)."""
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, type):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif hasattr(o, "__slots__"):
+            stack.extend(getattr(o, s) for s in o.__slots__ if hasattr(o, s))
+        elif hasattr(o, "__dict__"):
+            stack.append(vars(o))
+    return total
+
+
+def _decision(decision: str, reason: str, rule: Optional[str] = None, expires_in: int = 0) -> Dict[str, Any]:
+    return {
+        "decision": decision,
+        "reason": reason,
+        "rule": rule,
+        "evaluated_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "expires_in": expires_in,
+    }
+
+
+class OpaTenant:
+    """A tenant whose policy lives in OPA; same response shape as RuleEngine."""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        from ztxp_replay import OpaPolicy
+
+        self.opa = OpaPolicy(url, timeout)
+
+    def evaluate(self, tam: Dict[str, Any]) -> Dict[str, Any]:
+        allowed, reason = self.opa.decide(extract_facts(tam))
+        return _decision("allow" if allowed else "deny", reason, expires_in=600 if allowed else 0)
+
+
+class _Cached:
+    __slots__ = ("spec", "engine", "nbytes")
+
+    def __init__(self, spec: str, engine: Any, nbytes: int):
+        self.spec = spec
+        self.engine = engine
+        self.nbytes = nbytes
+
+
+class TenantPolicies:
+    """Issuer allow-list with lazily compiled, LRU-evicted tenant policies."""
+
+    def __init__(self, path: str, cache_bytes: int = DEFAULT_CACHE_BYTES, reload_interval: float = 1.0):
+        self.path = path
+        self.cache_bytes = cache_bytes
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._cache: "OrderedDict[str, _Cached]" = OrderedDict()
+        self.nbytes = 0
+        self.counters = {"hits": 0, "compiles": 0, "evictions": 0, "unknown_issuer": 0, "load_errors": 0}
+        self._mtime = os.stat(path).st_mtime_ns
+        self._checked_at = time.monotonic()
+        self.tenants = load_tenants(path)
+
+    def __len__(self) -> int:
+        return len(self.tenants)
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        with self._reload_lock:
+            if now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime == self._mtime:
+                    return
+                self._mtime = mtime  # a broken file is reported once, not on every check
+                tenants = load_tenants(self.path)
+            except Exception as e:  # keep serving the last good tenants
+                print(f"[!] Tenants reload failed, keeping previous tenants: {e}", file=sys.stderr)
+                return
+            with self._lock:
+                self.tenants = tenants
+                for issuer in [i for i, c in self._cache.items() if tenants.get(i) != c.spec]:
+                    self.nbytes -= self._cache.pop(issuer).nbytes
+            print(f"[*] Reloaded {len(tenants)} tenants from {self.path}", file=sys.stderr)
+
+    def _compile(self, spec: str) -> _Cached:
+        if spec.startswith(("http://", "https://")):
+            engine = OpaTenant(spec)
+            return _Cached(spec, engine, estimate_size(spec))
+        engine = RuleEngine(spec)
+        return _Cached(spec, engine, estimate_size(engine.policy))
+
+    def _insert(self, issuer: str, cached: _Cached) -> None:
+        with self._lock:
+            self.counters["compiles"] += 1
+            if self.tenants.get(issuer) != cached.spec:
+                return  # the tenants file changed while compiling
+            old = self._cache.pop(issuer, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            # Make room, but always keep the policy just compiled
+            while self._cache and self.nbytes + cached.nbytes > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.counters["evictions"] += 1
+            self._cache[issuer] = cached
+            self.nbytes += cached.nbytes
+
+    def engine_for(self, issuer: str) -> Optional[Any]:
+        """The tenant's policy engine, compiling it on first use; None for unknown issuers."""
+        with self._lock:
+            spec = self.tenants.get(issuer)
+            if spec is None:
+                self.counters["unknown_issuer"] += 1
+                return None
+            cached = self._cache.get(issuer)
+            if cached is not None and cached.spec == spec:
+                self._cache.move_to_end(issuer)
+                self.counters["hits"] += 1
+                return cached.engine
+            loading = self._loading.setdefault(issuer, threading.Lock())
+        with loading:  # single flight: one compile per tenant, others wait for it
+            with self._lock:
+                cached = self._cache.get(issuer)
+                if cached is not None and cached.spec == spec:
+                    self._cache.move_to_end(issuer)
+                    self.counters["hits"] += 1
+                    return cached.engine
+            try:
+                cached = self._compile(spec)
+                self._insert(issuer, cached)
+            finally:
+                with self._lock:
+                    self._loading.pop(issuer, None)
+            return cached.engine
+
+    def evaluate(self, tam: Dict[str, Any]) -> Dict[str, Any]:
+        """Evaluate one TAM under its issuer's policy; same shape as `evaluate_policy()`."""
+        self._maybe_reload()
+        issuer = str(tam.get("issuer", ""))
+        try:
+            engine = self.engine_for(issuer)
+        except Exception as e:
+            self.counters["load_errors"] += 1
+            print(f"[!] Policy for tenant {issuer!r} failed to load: {e}", file=sys.stderr)
+            return _decision("deny", "tenant policy unavailable")
+        if engine is None:
+            return _decision("deny", "unknown issuer")
+        return engine.evaluate(tam)
@@ -10,6 +10,7 @@ Dependencies (install via pip):
   cryptography>=42.0.0
   flask>=3.0.0
   pyyaml>=6.0.0
+  numpy>=1.24 (optional, batch policy evaluation in ztxp_rules.py)
 
 Example usage:
   # Generate a keypair (if not present) and sign a TAM
@@ -18,9 +19,42 @@ Example usage:
   # Validate a signed TAM
   python ztxp_toolkit.py validate signed_tam.json
 
+  # Compact mode: emit the exact signed bytes as base64url(payload).base64url(sig)
+  python ztxp_toolkit.py sign --compact tam.yaml signed_tam.jws
+  curl -X POST -H "Content-Type: application/json" \
+       --data "{\"tam_compact\": \"$(cat signed_tam.jws)\"}" http://localhost:8080/ztxp/evaluate
+
   # Run broker on localhost:8080
   python ztxp_toolkit.py broker --host 0.0.0.0 --port 8080
 
+  # Run broker with a declarative, hot-reloaded policy (see policy.yaml)
+  python ztxp_toolkit.py broker --rules policy.yaml
+
+  # One policy per tenant, chosen by TAM issuer; unknown issuers are denied
+  python ztxp_toolkit.py broker --tenants tenants.yaml --tenant-cache-mb 64
+
+  # Rate-limit subjects/devices/IPs and shed load beyond 64 requests in flight
+  python ztxp_toolkit.py broker --rate 20 --max-concurrency 64
+
+  # Also accept a persistent channel of signed TAM deltas (see ztxp_stream.py)
+  python ztxp_toolkit.py broker --stream-port 8081
+
+  # Sample where the broker spends CPU for 30 s and render a flamegraph (see ztxp_profile.py)
+  python ztxp_toolkit.py broker --profile-endpoint
+  curl -X POST 'http://localhost:8080/debug/profile?seconds=30' | flamegraph.pl > broker.svg
+
+  # Deny revoked key ids, subjects and devices (list hot-swapped on change)
+  python ztxp_toolkit.py revocations build revoked.txt revocations.bin
+  python ztxp_toolkit.py broker --revocations revocations.bin
+
+  # What-if: which recorded decisions would flip under a new policy?
+  python ztxp_toolkit.py replay --current policy.yaml --candidate new.yaml tams.jsonl.gz
+
+  # Keep keys in a local agent (Unix socket) and sign/validate through it
+  python ztxp_toolkit.py agent &
+  python ztxp_toolkit.py sign --agent tam.yaml signed_tam.json
+  python ztxp_toolkit.py validate --agent signed_tam.json
+
   # In another terminal, post the signed TAM
   curl -X POST -H "Content-Type: application/json" \
        --data @signed_tam.json http://localhost:8080/ztxp/evaluate
@@ -28,8 +62,17 @@ Example usage:
 Security Notes:
   • Ed25519 is used for compact, high-performance signatures.
   • Messages are canonicalized (sorted keys, UTF-8) prior to signing.
+  • Compact TAMs carry the signed bytes themselves, so verification skips
+    re-canonicalization (hash + signature check, then a single parse).
   • Basic replay protection via message_id (UUID) and timestamp checks.
-  • Policy logic is intentionally simple: adjust in `evaluate_policy()`.
+  • Policy logic is intentionally simple: adjust in `evaluate_policy()`,
+    or pass `--rules` to use the declarative rule engine (ztxp_rules.py),
+    or `--tenants` for per-issuer policies (ztxp_tenants.py).
+  • The signing agent (ztxp_agent.py) listens on a 0600 Unix socket in the
+    key directory; only the owning user can use it.
+
+Heavy dependencies (cryptography, yaml, flask) are imported on first use,
+so agent client calls never load them.
 """
 from __future__ import annotations
 
@@ -43,11 +86,6 @@ from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Any, Dict
 
-import yaml
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import ed25519
-from cryptography.exceptions import InvalidSignature
-
 # ---------------------------
 # Key Management Helpers
 # ---------------------------
@@ -55,13 +93,20 @@ KEY_DIR = Path.home() / ".ztxp"
 PRIV_KEY_PATH = KEY_DIR / "ed25519_private_key.pem"
 PUB_KEY_PATH = KEY_DIR / "ed25519_public_key.pem"
 
+# Parsed keys, kept for the life of the process (the agent signs many messages)
+_KEYS: Dict[str, Any] = {}
+
 
 def generate_keypair() -> None:
-    KEY_DIR.mkdir(parents=True, exist_ok=True)
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519
+
+    KEY_DIR.mkdir(parents=True, exist_ok=True, mode=0o700)
+    KEY_DIR.chmod(0o700)  # also tightens a directory made by an older version
     private_key = ed25519.Ed25519PrivateKey.generate()
     public_key = private_key.public_key()
 
-    with open(PRIV_KEY_PATH, "wb") as f:
+    with os.fdopen(os.open(PRIV_KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
         f.write(
             private_key.private_bytes(
                 encoding=serialization.Encoding.PEM,
@@ -81,17 +126,25 @@ def generate_keypair() -> None:
 
 
 def load_private_key():
-    if not PRIV_KEY_PATH.exists():
-        generate_keypair()
-    with open(PRIV_KEY_PATH, "rb") as f:
-        return serialization.load_pem_private_key(f.read(), password=None)
+    if "private" not in _KEYS:
+        from cryptography.hazmat.primitives import serialization
+
+        if not PRIV_KEY_PATH.exists():
+            generate_keypair()
+        with open(PRIV_KEY_PATH, "rb") as f:
+            _KEYS["private"] = serialization.load_pem_private_key(f.read(), password=None)
+    return _KEYS["private"]
 
 
 def load_public_key():
-    if not PUB_KEY_PATH.exists():
-        raise FileNotFoundError("Public key not found; generate keypair first.")
-    with open(PUB_KEY_PATH, "rb") as f:
-        return serialization.load_pem_public_key(f.read())
+    if "public" not in _KEYS:
+        from cryptography.hazmat.primitives import serialization
+
+        if not PUB_KEY_PATH.exists():
+            raise FileNotFoundError("Public key not found; generate keypair first.")
+        with open(PUB_KEY_PATH, "rb") as f:
+            _KEYS["public"] = serialization.load_pem_public_key(f.read())
+    return _KEYS["public"]
 
 
 # ---------------------------
@@ -152,6 +205,8 @@ def sign_message(tam: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def verify_message(tam: Dict[str, Any]) -> bool:
+    from cryptography.exceptions import InvalidSignature
+
     validate_structure(tam)
     sig_block = tam.pop("signature")
     try:
@@ -165,12 +220,62 @@ def verify_message(tam: Dict[str, Any]) -> bool:
     return True
 
 
+def _b64url(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def sign_compact(tam: Dict[str, Any]) -> str:
+    """Sign a TAM and return `base64url(payload).base64url(signature)`."""
+    signed = sign_message(tam)
+    sig_block = signed.pop("signature")
+    payload = canonical_json(signed)
+    return f"{_b64url(payload)}.{_b64url(base64.b64decode(sig_block['sig']))}"
+
+
+def verify_compact(token: str) -> Dict[str, Any]:
+    """Verify a compact TAM against its exact signed bytes and return it.
+
+    The payload is parsed only after the signature has been checked; a
+    `signature` block is attached so the result looks like an embedded TAM.
+    """
+    from cryptography.exceptions import InvalidSignature
+
+    try:
+        payload_b64, sig_b64 = token.strip().split(".")
+        payload = _b64url_decode(payload_b64)
+        sig_bytes = _b64url_decode(sig_b64)
+    except (AttributeError, ValueError) as e:
+        raise ValueError(f"Malformed compact TAM: {e}")
+    try:
+        load_public_key().verify(sig_bytes, payload)
+    except InvalidSignature as e:
+        raise ValueError(f"Signature verification failed: {e}")
+
+    tam = json.loads(payload)
+    if not isinstance(tam, dict) or "signature" in tam:
+        raise ValueError("Malformed compact TAM payload")
+    tam["signature"] = {
+        "alg": "EdDSA",
+        "key_id": PUB_KEY_PATH.stem,
+        "sig": base64.b64encode(sig_bytes).decode(),
+    }
+    validate_structure(tam)
+    return tam
+
+
 # ---------------------------
 # Broker Implementation
 # ---------------------------
 
-def evaluate_policy(tam: Dict[str, Any]) -> Dict[str, Any]:
-    """Simple policy engine for demo."""
+def evaluate_policy(tam: Dict[str, Any], engine=None) -> Dict[str, Any]:
+    """Simple policy engine for demo; delegates to a RuleEngine or TenantPolicies if given."""
+    if engine is not None:
+        return engine.evaluate(tam)
+
     risk = tam["context"].get("risk_score", 100)
     compliant = tam["source_device"].get("posture", {}).get("compliant", False)
     decision = "allow" if risk < 50 and compliant else "deny"
@@ -188,25 +293,196 @@ def evaluate_policy(tam: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def run_broker(host: str, port: int):
-    from flask import Flask, jsonify, request
+def run_broker(host: str, port: int, rules: str | None = None, admission=None,
+               stream_port: int | None = None, profiler=None, profile_endpoint: bool = False,
+               revocations=None, tenants: str | None = None, tenant_cache_bytes: int | None = None):
+    from flask import Flask, Response, jsonify, request
+    from ztxp_admission import AdmissionControl, Rejected
+    from ztxp_profile import Profiler, ProfileBusy
+
+    engine = None
+    if rules:
+        from ztxp_rules import RuleEngine
+
+        engine = RuleEngine(rules)
+        print(f"[*] Loaded {len(engine.policy.rules)} policy rules from {rules}")
+    elif tenants:
+        from ztxp_tenants import DEFAULT_CACHE_BYTES, TenantPolicies
+
+        engine = TenantPolicies(tenants, tenant_cache_bytes or DEFAULT_CACHE_BYTES)
+        print(f"[*] Loaded {len(engine)} tenants from {tenants} (policies compiled on first use)")
 
     app = Flask(__name__)
+    admission = admission or AdmissionControl()
+    profiler = profiler or Profiler()
+
+    def rejected(e: Rejected):
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else {}
+        return jsonify({"decision": "deny", "error": e.reason}), e.status, headers
 
     @app.route("/ztxp/evaluate", methods=["POST"])
     def evaluate():
         try:
-            tam = request.get_json(force=True)
-            verify_message(tam)
-            decision = evaluate_policy(tam)
+            admission.enter()
+        except Rejected as e:
+            return rejected(e)
+        try:
+            if profiler.active:  # a profile session is running; see ztxp_profile.py
+                return profiler.call(handle_evaluate)
+            return handle_evaluate()
+        finally:
+            admission.leave()
+
+    def handle_evaluate():
+        client = request.remote_addr or ""
+        key = admission.request_key(request.get_data())
+        try:
+            admission.before_verify(client, key)
+            try:
+                tam = request.get_json(force=True)
+                if isinstance(tam, dict) and "tam_compact" in tam:
+                    tam = verify_compact(tam["tam_compact"])
+                else:
+                    verify_message(tam)
+            except Exception as e:
+                admission.rejected(client, key, str(e))
+                raise
+            kind = revocations.revoked(tam) if revocations else None
+            if kind:
+                return jsonify({"decision": "deny", "error": f"{kind} revoked"}), 403
+            admission.after_verify(tam, client)
+            decision = evaluate_policy(tam, engine)
             return jsonify(decision)
+        except Rejected as e:
+            return rejected(e)
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
+    if profile_endpoint:
+        @app.route("/debug/profile", methods=["POST"])
+        def debug_profile():
+            """Profile for ?seconds=N (1 in ?every=K requests) and return collapsed stacks."""
+            try:
+                seconds = min(float(request.args.get("seconds", 10)), 300.0)
+                every = int(request.args.get("every", 1))
+                allocations = request.args.get("allocations", "0").lower() in ("1", "true")
+                report = profiler.run_for(seconds, every, allocations)
+            except ProfileBusy as e:
+                return jsonify({"error": str(e)}), 409
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if request.args.get("format") == "json":
+                return jsonify(report)
+            return Response(report["collapsed"], mimetype="text/plain")
+
+    if stream_port:
+        run_stream(host, stream_port, engine, admission, revocations)
+
     print(f"[*] ZTXP Broker listening on http://{host}:{port}")
     app.run(host=host, port=port, threaded=True)
 
 
+def start_profile(seconds: float, every: int, allocations: bool, out: str):
+    """Profile the broker from startup; write collapsed stacks after `seconds`."""
+    import threading
+
+    from ztxp_profile import Profiler
+
+    profiler = Profiler()
+    profiler.begin(seconds, every, allocations)
+
+    def finish() -> None:
+        report = profiler.end()
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(report["collapsed"])
+        line = f"[*] Profile: {report['samples']} samples over {len(report['requests'])} requests -> {out}"
+        if allocations and report["requests"]:
+            blocks = sorted(r["blocks"] for r in report["requests"])
+            line += f" (median {blocks[len(blocks) // 2]} allocated blocks/request)"
+        print(line)
+
+    timer = threading.Timer(seconds, finish)
+    timer.daemon = True
+    timer.start()
+    return profiler
+
+
+def run_stream(host: str, port: int, engine=None, admission=None, revocations=None):
+    """Serve the streaming channel (ztxp_stream.py) next to the HTTP broker."""
+    from ztxp_admission import Rejected
+    from ztxp_stream import serve_in_background, verify_with
+
+    def evaluate(tam: Dict[str, Any], sig: bytes) -> Dict[str, Any]:
+        # sig is the session's open signature; deltas are verified by the channel
+        tam = {**tam, "signature": {"alg": "EdDSA", "key_id": PUB_KEY_PATH.stem,
+                                    "sig": base64.b64encode(sig).decode()}}
+        validate_structure(tam)
+        kind = revocations.revoked(tam) if revocations else None
+        if kind:
+            raise ValueError(f"{kind} revoked")
+        if admission is not None:
+            try:
+                admission.after_verify(tam)
+            except Rejected as e:
+                raise ValueError(e.reason)
+        return evaluate_policy(tam, engine)
+
+    server = serve_in_background((host, port), verify_with(load_public_key()), evaluate)
+    print(f"[*] ZTXP stream channel listening on tcp://{host}:{port}")
+    return server
+
+
+# ---------------------------
+# Signing Agent
+# ---------------------------
+
+def _tam_op(fn):
+    """Accept the TAM as an object or as YAML text, parsed where the op runs."""
+
+    def op(tam: Dict[str, Any] | None = None, tam_yaml: str | None = None) -> Any:
+        if tam_yaml is not None:
+            import yaml
+
+            tam = yaml.safe_load(tam_yaml)
+        if not isinstance(tam, dict):
+            raise ValueError("TAM must be a mapping")
+        return fn(tam)
+
+    return op
+
+
+def agent_ops() -> Dict[str, Any]:
+    """Operations served by `ztxp_agent` with the keys loaded once."""
+
+    return {
+        "ping": lambda: "pong",
+        "sign": _tam_op(sign_message),
+        "sign_compact": _tam_op(sign_compact),
+        "verify": verify_message,
+        "verify_compact": verify_compact,
+    }
+
+
+def run_agent(socket_path: str) -> None:
+    from ztxp_agent import AgentError, serve
+
+    load_private_key()
+    load_public_key()
+    try:
+        serve(Path(socket_path), agent_ops())
+    except AgentError as e:
+        print(f"[✗] {e}")
+        sys.exit(1)
+
+
+def _tam_params(path: str) -> Dict[str, Any]:
+    """A TAM file as sign op parameters; YAML is sent as text so an agent client never imports yaml."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            return {"tam_yaml": f.read()}
+        return {"tam": json.load(f)}
+
+
 # ---------------------------
 # CLI Interface
 # ---------------------------
@@ -219,43 +495,159 @@ def cli():
     s = sub.add_parser("sign", help="Sign a TAM (YAML/JSON) -> JSON with signature")
     s.add_argument("input", help="Path to TAM YAML/JSON file")
     s.add_argument("output", help="Path to output signed JSON file")
+    s.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write base64url(payload).base64url(sig) instead of JSON with an embedded signature",
+    )
+    s.add_argument("--agent", action="store_true", help="Sign through a running `agent`")
 
     # validate
     v = sub.add_parser("validate", help="Validate a signed TAM JSON file")
-    v.add_argument("input", help="Path to signed TAM JSON file")
+    v.add_argument("input", help="Path to signed TAM JSON file (or compact TAM)")
+    v.add_argument("--agent", action="store_true", help="Validate through a running `agent`")
+
+    # agent
+    a = sub.add_parser("agent", help="Run the signing agent on a Unix socket")
+    for p in (s, v, a):
+        p.add_argument("--socket", default=None, help="Agent socket (default $ZTXP_AGENT_SOCK or ~/.ztxp/agent.sock)")
 
     # broker
     b = sub.add_parser("broker", help="Run the Trust Broker API server")
     b.add_argument("--host", default="127.0.0.1", help="Bind address (default 127.0.0.1)")
     b.add_argument("--port", default=8080, type=int, help="Port (default 8080)")
+    b.add_argument(
+        "--rules",
+        default=os.environ.get("ZTXP_RULES"),
+        help="YAML rules file for the policy engine (default $ZTXP_RULES, else built-in policy)",
+    )
+    b.add_argument("--tenants", default=os.environ.get("ZTXP_TENANTS"),
+                   help="Per-issuer tenant policies (default $ZTXP_TENANTS, see ztxp_tenants.py)")
+    b.add_argument("--tenant-cache-mb", type=float, default=64.0,
+                   help="Memory cap for compiled tenant policies, LRU-evicted (default 64)")
+    b.add_argument("--rate", type=float, default=0.0,
+                   help="Requests/s per subject, device and source IP (default 0 = no rate limit)")
+    b.add_argument("--burst", type=float, default=None, help="Rate limit bucket depth (default 2 x rate)")
+    b.add_argument("--max-concurrency", type=int, default=0,
+                   help="Shed requests with 503 beyond this many in flight (default 0 = unlimited)")
+    b.add_argument("--stream-port", type=int, default=None,
+                   help="Also serve the persistent delta-TAM channel (ztxp_stream.py) on this port")
+    b.add_argument("--negative-ttl", type=float, default=60.0,
+                   help="Seconds an identical rejected request is refused without re-verifying (default 60)")
+    b.add_argument("--revocations", default=os.environ.get("ZTXP_REVOCATIONS"),
+                   help="Revocation list for key ids, subjects and devices (see ztxp_revocation.py)")
+    b.add_argument("--profile-endpoint", action="store_true",
+                   help="Serve POST /debug/profile?seconds=N&every=K[&allocations=1] (collapsed stacks)")
+    b.add_argument("--profile-seconds", type=float, default=0.0,
+                   help="Profile from startup for this many seconds and write --profile-out")
+    b.add_argument("--profile-every", type=int, default=1, help="Profile 1 in K requests (default 1)")
+    b.add_argument("--profile-allocations", action="store_true",
+                   help="Also record per-request allocated blocks (tracemalloc during the session)")
+    b.add_argument("--profile-out", default="broker.collapsed",
+                   help="Collapsed-stack output of --profile-seconds (default broker.collapsed)")
+
+    # revocations
+    rv = sub.add_parser("revocations", help="Compile a revocation list for `broker --revocations`")
+    rv.add_argument("action", choices=["build"])
+    rv.add_argument("input", help='Text file of "<key|subject|device> <id>" lines')
+    rv.add_argument("output", help="Compiled list to write (replaced atomically)")
+
+    # replay
+    r = sub.add_parser("replay", help="Replay recorded TAMs under current vs candidate policy")
+    r.add_argument("inputs", nargs="+", help="JSONL archives of TAMs or OPA inputs (.gz ok)")
+    r.add_argument("--current", required=True, help="Current policy: rules YAML or OPA decision URL")
+    r.add_argument("--candidate", required=True, help="Candidate policy: rules YAML or OPA decision URL")
+    r.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    r.add_argument("--top", type=int, default=50, help="Flip groups to print (default 50)")
+    r.add_argument("--json", dest="json_out", help="Also write the full report as JSON")
 
     args = parser.parse_args()
 
+    if getattr(args, "agent", False):
+        from ztxp_agent import DEFAULT_SOCKET, AgentClient, AgentError
+
+        # Thin client: the agent holds the keys and does the crypto
+        try:
+            call = AgentClient(Path(args.socket) if args.socket else DEFAULT_SOCKET).call
+        except AgentError as e:
+            print(f"[✗] {e}")
+            sys.exit(1)
+    else:
+        def call(op: str, **params: Any) -> Any:
+            return agent_ops()[op](**params)
+
     if args.command == "sign":
-        with open(args.input, "r", encoding="utf-8") as f:
-            if args.input.endswith((".yaml", ".yml")):
-                tam_raw = yaml.safe_load(f)
-            else:
-                tam_raw = json.load(f)
+        params = _tam_params(args.input)
 
         # --- actually sign & save ---------------------------------
-        signed = sign_message(tam_raw)
-        with open(args.output, "w", encoding="utf-8") as out:
-            json.dump(signed, out, indent=2)
+        if args.compact:
+            with open(args.output, "w", encoding="utf-8") as out:
+                out.write(call("sign_compact", **params) + "\n")
+        else:
+            signed = call("sign", **params)
+            with open(args.output, "w", encoding="utf-8") as out:
+                json.dump(signed, out, indent=2)
         print(f"[*] Signed TAM written to {args.output}")
 
     elif args.command == "validate":
         with open(args.input, "r", encoding="utf-8") as f:
-            tam_raw = json.load(f)
+            raw = f.read()
         try:
-            verify_message(tam_raw)
+            if raw.lstrip().startswith("{"):
+                call("verify", tam=json.loads(raw))
+            else:
+                call("verify_compact", token=raw)
             print("[✓] Signature and structure valid")
         except Exception as e:
             print(f"[✗] Validation failed: {e}")
             sys.exit(1)
 
+    elif args.command == "agent":
+        from ztxp_agent import DEFAULT_SOCKET
+
+        run_agent(args.socket or str(DEFAULT_SOCKET))
+
     elif args.command == "broker":
-        run_broker(args.host, args.port)
+        from ztxp_admission import AdmissionControl
+
+        if args.rules and args.tenants:
+            parser.error("--rules and --tenants are mutually exclusive (tenants name their own rules)")
+
+        admission = AdmissionControl(
+            rate=args.rate,
+            burst=args.burst if args.burst is not None else 2 * args.rate,
+            negative_ttl=args.negative_ttl,
+            max_concurrency=args.max_concurrency,
+        )
+        profiler = None
+        if args.profile_seconds > 0:
+            profiler = start_profile(args.profile_seconds, args.profile_every,
+                                     args.profile_allocations, args.profile_out)
+        revocations = None
+        if args.revocations:
+            from ztxp_revocation import Revocations
+
+            revocations = Revocations(args.revocations)
+            print(f"[*] Loaded {len(revocations.current)} revocations from {args.revocations}")
+        run_broker(args.host, args.port, args.rules, admission, args.stream_port,
+                   profiler, args.profile_endpoint, revocations, args.tenants,
+                   int(args.tenant_cache_mb * 1024 * 1024))
+
+    elif args.command == "revocations":
+        from ztxp_revocation import build, parse_entries
+
+        with open(args.input, "r", encoding="utf-8") as f:
+            n = build(parse_entries(f), args.output)
+        print(f"[*] Wrote {n} revocations to {args.output}")
+
+    elif args.command == "replay":
+        from ztxp_replay import format_report, replay
+
+        report = replay(args.inputs, args.current, args.candidate, workers=args.workers)
+        print(format_report(report, top=args.top))
+        if args.json_out:
+            with open(args.json_out, "w", encoding="utf-8") as out:
+                json.dump(report, out, indent=2)
 
 
 if __name__ == "__main__":
@@ -5,6 +5,21 @@ Notes API — a simple CRUD service backed by DynamoDB.
 Only reachable after the PEP authorizer grants access. The
 authorizer injects context (principalId, ztxp_decision) which
 this handler uses to scope queries to the authenticated user.
+A fresh Broker decision token (ztxp_decision_token) is handed back to
+the client in the X-ZTXP-Decision response header so it can present
+it on later requests.
+
+Reads go through a per-user read-through cache (note_cache.py) that
+writes invalidate by bumping the user's version counter. The search
+index (note_search.py) behind GET /notes/search?q=<terms>&k=<n> is kept
+up to date from the table's stream by note_indexer.py, so a write does
+not wait for its postings; a search may miss a note for the second or
+so until its change is indexed. Index items share the table under
+"#idx#<user>" partitions, which no authenticated user id can name.
+
+Large note bodies are stored compressed (note_codec.py) and only
+decompressed when a response includes them; GET /notes?fields=a,b
+limits the listed attributes.
 """
 import json
 import os
@@ -15,12 +30,19 @@ from datetime import datetime, timezone
 import boto3
 from boto3.dynamodb.conditions import Key
 
+import note_cache
+import note_codec
+import note_search
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 TABLE_NAME = os.environ.get("TABLE_NAME", "unknown")
 ddb = boto3.resource("dynamodb")
 table = ddb.Table(TABLE_NAME)
+cache = note_cache.from_env()
+search_index = note_search.SearchIndex(table)
+SEARCH_MAX_RESULTS = 50
 
 
 def _response(status, body):
@@ -37,6 +59,14 @@ def _user_id(event):
     return auth_ctx.get("principalId", "anonymous")
 
 
+def _note_fields(body):
+    """(title, content) from a request body, or None unless both are strings."""
+    title, content = body.get("title", ""), body.get("content", "")
+    if not isinstance(title, str) or not isinstance(content, str):
+        return None
+    return title, content
+
+
 def _note_id_from_path(event):
     """Extract note_id from path parameters (/notes/{note_id})."""
     params = event.get("pathParameters") or {}
@@ -48,48 +78,78 @@ def _note_id_from_path(event):
 # CRUD operations
 # ---------------------------------------------------------------------------
 
-def list_notes(user_id):
-    resp = table.query(KeyConditionExpression=Key("user_id").eq(user_id))
-    return _response(200, {"notes": resp.get("Items", [])})
+def list_notes(user_id, fields=None):
+    items = cache.read_through(
+        user_id, "list",
+        lambda: table.query(KeyConditionExpression=Key("user_id").eq(user_id)).get("Items", []),
+    )
+    return _response(200, {"notes": [note_codec.public_view(i, fields) for i in items]})
 
 
 def get_note(user_id, note_id):
-    resp = table.get_item(Key={"user_id": user_id, "note_id": note_id})
-    item = resp.get("Item")
+    item = cache.read_through(
+        user_id, f"note:{note_id}",
+        lambda: table.get_item(Key={"user_id": user_id, "note_id": note_id}).get("Item"),
+    )
     if not item:
         return _response(404, {"error": "not_found"})
-    return _response(200, item)
+    return _response(200, note_codec.public_view(item))
 
 
 def create_note(user_id, body):
+    fields = _note_fields(body)
+    if fields is None:
+        return _response(400, {"error": "invalid_note"})
+    title, content = fields
     note_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
     item = {
         "user_id": user_id,
         "note_id": note_id,
-        "title": body.get("title", ""),
-        "content": body.get("content", ""),
+        "title": title,
         "created_at": now,
         "updated_at": now,
     }
-    table.put_item(Item=item)
+    table.put_item(Item={**item, **note_codec.pack_content(content)})
+    cache.invalidate(user_id)
+    item["content"] = content
     return _response(201, item)
 
 
 def update_note(user_id, note_id, body):
+    fields = _note_fields(body)
+    if fields is None:
+        return _response(400, {"error": "invalid_note"})
+    title, content = fields
     now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    packed = note_codec.pack_content(content)
+    # created_at is rewritten with its own value so that UPDATED_NEW returns
+    # it; the old item (and its compressed body) is never sent back
+    keep_created = "created_at = if_not_exists(created_at, :u)"
+    if "content" in packed:
+        update = (f"SET title = :t, content = :c, updated_at = :u, {keep_created} "
+                  "REMOVE content_z, content_codec")
+        values = {":t": title, ":c": content, ":u": now}
+    else:
+        update = (f"SET title = :t, content_z = :z, content_codec = :k, updated_at = :u, {keep_created} "
+                  "REMOVE content")
+        values = {":t": title, ":z": packed[note_codec.BLOB_ATTR], ":k": packed[note_codec.CODEC_ATTR], ":u": now}
     resp = table.update_item(
         Key={"user_id": user_id, "note_id": note_id},
-        UpdateExpression="SET title = :t, content = :c, updated_at = :u",
-        ExpressionAttributeValues={
-            ":t": body.get("title", ""),
-            ":c": body.get("content", ""),
-            ":u": now,
-        },
+        UpdateExpression=update,
+        ExpressionAttributeValues=values,
         ConditionExpression="attribute_exists(user_id)",
-        ReturnValues="ALL_NEW",
+        ReturnValues="UPDATED_NEW",
     )
-    return _response(200, resp.get("Attributes", {}))
+    cache.invalidate(user_id)
+    return _response(200, {
+        "user_id": user_id,
+        "note_id": note_id,
+        "title": title,
+        "created_at": resp.get("Attributes", {}).get("created_at", now),
+        "updated_at": now,
+        "content": content,
+    })
 
 
 def delete_note(user_id, note_id):
@@ -97,28 +157,63 @@ def delete_note(user_id, note_id):
         Key={"user_id": user_id, "note_id": note_id},
         ConditionExpression="attribute_exists(user_id)",
     )
+    cache.invalidate(user_id)
     return _response(200, {"deleted": note_id})
 
 
+def search_notes(user_id, params):
+    query = params.get("q", "")
+    try:
+        k = min(max(int(params.get("k", "10")), 1), SEARCH_MAX_RESULTS)
+    except ValueError:
+        return _response(400, {"error": "invalid_k"})
+
+    results = []
+    for note_id, score in search_index.search(user_id, query, k):
+        item = cache.read_through(
+            user_id, f"note:{note_id}",
+            lambda: table.get_item(Key={"user_id": user_id, "note_id": note_id}).get("Item"),
+        )
+        if item:  # skip postings of a note deleted mid-update
+            results.append({"note_id": note_id, "title": item.get("title", ""), "score": round(score, 4)})
+    return _response(200, {"query": query, "results": results})
+
+
 # ---------------------------------------------------------------------------
 # Lambda entry point
 # ---------------------------------------------------------------------------
 
 def lambda_handler(event, context):
+    response = _route(event)
+    auth_ctx = event.get("requestContext", {}).get("authorizer", {}).get("lambda", {})
+    token = auth_ctx.get("ztxp_decision_token")
+    if token:
+        response["headers"]["X-ZTXP-Decision"] = token
+    return response
+
+
+def _route(event):
     logger.info("Notes API invoked")
 
     method = event.get("requestContext", {}).get("http", {}).get("method", "GET")
     user_id = _user_id(event)
     note_id = _note_id_from_path(event)
+    if note_search.is_index_partition(user_id):
+        return _response(403, {"error": "forbidden"})
 
     try:
         body = json.loads(event.get("body") or "{}") if event.get("body") else {}
     except json.JSONDecodeError:
         return _response(400, {"error": "invalid_json"})
+    if not isinstance(body, dict):
+        return _response(400, {"error": "invalid_json"})
 
     try:
-        if method == "GET" and not note_id:
-            return list_notes(user_id)
+        if method == "GET" and note_id == "search":
+            return search_notes(user_id, event.get("queryStringParameters") or {})
+        elif method == "GET" and not note_id:
+            fields = (event.get("queryStringParameters") or {}).get("fields")
+            return list_notes(user_id, set(fields.split(",")) if fields else None)
         elif method == "GET" and note_id:
             return get_note(user_id, note_id)
         elif method == "POST":
@@ -0,0 +1,210 @@
+# app/lambdas/notes_api/note_cache.py
+"""
+Read-through cache for Notes API reads, invalidated per user.
+
+Every user has a version counter. Cached entries (the note list, single
+notes) are stored together with the version they were read at, and an
+entry is only served while it still matches the user's current version.
+create/update/delete bump the counter after the DynamoDB write succeeds,
+so every entry read before the write becomes invisible at once.
+
+Readers fetch the version *before* going to DynamoDB. If a write lands in
+between, the entry is stored under the old version and is never served.
+
+Backends (NOTES_CACHE_BACKEND):
+  local  (default) — in-process LRU with TTL. Versions are per container,
+                     so a write in another container is seen once the
+                     entry's TTL runs out (NOTES_CACHE_TTL_SECONDS).
+                     Version counters share the entries' LRU limit; an
+                     evicted counter raises a floor that missing and new
+                     versions start from, so it can never count back up
+                     to the tag of a stale entry.
+  redis            — shared cache at NOTES_CACHE_URL (needs the ``redis``
+                     package); writes in any container invalidate
+                     everywhere.
+  off              — no caching.
+"""
+import base64
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+# Versions outlive every entry tagged with them, so an expired counter
+# restarting at 0 can never revive a stale entry.
+VERSION_TTL_SECONDS = 86400
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+class LocalBackend:
+    """In-process LRU + TTL. Also the stand-in for a shared backend in tests."""
+
+    def __init__(self, max_entries=10000, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._versions = OrderedDict()  # key -> int, LRU with the same bound
+        self.version_floor = 0          # >= every evicted version
+
+    def get_many(self, keys):
+        now = self.clock()
+        values = []
+        for key in keys:
+            if key in self._versions:
+                self._versions.move_to_end(key)
+                values.append(self._versions[key])
+                continue
+            hit = self._entries.get(key)
+            if hit is None or hit[0] <= now:
+                self._entries.pop(key, None)
+                values.append(None)
+                continue
+            self._entries.move_to_end(key)
+            values.append(hit[1])
+        return values
+
+    def set(self, key, value, ttl):
+        self._entries[key] = (self.clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def incr(self, key):
+        version = self._versions.pop(key, self.version_floor) + 1
+        self._versions[key] = version
+        while len(self._versions) > self.max_entries:
+            _, evicted = self._versions.popitem(last=False)
+            self.version_floor = max(self.version_floor, evicted)
+        return version
+
+    def clear(self):
+        self._entries.clear()
+        self._versions.clear()
+        self.version_floor = 0
+
+
+def _json_default(value):
+    raw = getattr(value, "value", value)  # boto3 Binary (compressed note bodies)
+    if isinstance(raw, (bytes, bytearray)):
+        return {"__b64__": base64.b64encode(bytes(raw)).decode()}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _json_hook(obj):
+    if len(obj) == 1 and "__b64__" in obj:
+        return base64.b64decode(obj["__b64__"])
+    return obj
+
+
+class RedisBackend:
+    """Shared cache (ElastiCache / Redis); values are JSON, binary attributes base64."""
+
+    version_floor = 0  # versions expire after their entries (VERSION_TTL_SECONDS)
+
+    def __init__(self, url, client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url, socket_timeout=0.2)
+        self.client = client
+
+    def get_many(self, keys):
+        return [None if raw is None else json.loads(raw, object_hook=_json_hook)
+                for raw in self.client.mget(keys)]
+
+    def set(self, key, value, ttl):
+        self.client.set(key, json.dumps(value, default=_json_default), ex=max(1, int(ttl)))
+
+    def incr(self, key):
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, VERSION_TTL_SECONDS)
+        return pipe.execute()[0]
+
+    def clear(self):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+
+class NoteCache:
+    def __init__(self, backend=None, ttl=30.0, prefix="notes"):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0, "errors": 0}
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def _version_key(self, user_id):
+        return f"{self.prefix}:{user_id}:v"
+
+    def read_through(self, user_id, name, load):
+        """Return the cached value for (user, name) or ``load()`` it.
+
+        ``None`` results (e.g. a missing note) are not cached. Backend
+        failures fall back to ``load()``.
+        """
+        if not self.enabled:
+            return load()
+        entry_key = f"{self.prefix}:{user_id}:{name}"
+        try:
+            version, entry = self.backend.get_many([self._version_key(user_id), entry_key])
+        except Exception as exc:
+            self.counters["errors"] += 1
+            logger.warning("Note cache read failed: %s", exc)
+            return load()
+
+        if version is None:
+            version = self.backend.version_floor
+        if entry is not None and entry.get("v") == version:
+            self.counters["hits"] += 1
+            return entry["data"]
+
+        self.counters["misses"] += 1
+        value = load()
+        if value is not None:
+            try:
+                self.backend.set(entry_key, {"v": version, "data": value}, self.ttl)
+            except Exception as exc:
+                self.counters["errors"] += 1
+                logger.warning("Note cache write failed: %s", exc)
+        return value
+
+    def invalidate(self, user_id):
+        """Bump the user's version; call after the DynamoDB write succeeded."""
+        if not self.enabled:
+            return
+        try:
+            self.backend.incr(self._version_key(user_id))
+            self.counters["invalidations"] += 1
+        except Exception as exc:
+            self.counters["errors"] += 1
+            logger.error("Note cache invalidation failed for %s: %s", user_id, exc)
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
+
+
+def from_env():
+    kind = os.environ.get("NOTES_CACHE_BACKEND", "local")
+    ttl = float(os.environ.get("NOTES_CACHE_TTL_SECONDS", "30"))
+    if kind == "off":
+        return NoteCache(None)
+    if kind == "redis":
+        return NoteCache(RedisBackend(os.environ["NOTES_CACHE_URL"]), ttl=ttl)
+    if kind != "local":
+        logger.warning("Unknown NOTES_CACHE_BACKEND %r, using local", kind)
+    max_entries = int(os.environ.get("NOTES_CACHE_MAX_ENTRIES", "10000"))
+    return NoteCache(LocalBackend(max_entries=max_entries), ttl=ttl)
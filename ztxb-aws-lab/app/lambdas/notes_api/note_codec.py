@@ -0,0 +1,76 @@
+# app/lambdas/notes_api/note_codec.py
+"""
+Transparent compression of large note bodies.
+
+Notes whose content is at least NOTES_COMPRESS_MIN_BYTES (UTF-8) long are
+stored compressed, with a codec marker, instead of the plain string
+attribute:
+
+    content_z      B   zlib-compressed UTF-8 content
+    content_codec  S   "zlib"
+
+A body is only stored compressed if that saves at least 10 %. Items
+written before this change (plain ``content``) are read unchanged.
+
+Decompression is lazy. Items keep their stored form in the cache and in
+the handler, and ``public_view()`` decodes the content only when a
+response actually includes it. For example, search results and
+``GET /notes?fields=title`` never decompress.
+"""
+import os
+import zlib
+
+CODEC = "zlib"
+BLOB_ATTR = "content_z"
+CODEC_ATTR = "content_codec"
+MIN_SAVING = 0.9  # keep compressed only if <= 90 % of the raw size
+
+COMPRESS_MIN_BYTES = int(os.environ.get("NOTES_COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.environ.get("NOTES_COMPRESS_LEVEL", "6"))
+
+
+def pack_content(content, min_bytes=None):
+    """Storage attributes for ``content``: {"content": str} or the compressed pair."""
+    if not isinstance(content, str):
+        raise TypeError(f"note content must be a string, not {type(content).__name__}")
+    min_bytes = COMPRESS_MIN_BYTES if min_bytes is None else min_bytes
+    raw = content.encode("utf-8")
+    if min_bytes <= 0 or len(raw) < min_bytes:
+        return {"content": content}
+    packed = zlib.compress(raw, COMPRESS_LEVEL)
+    if len(packed) > len(raw) * MIN_SAVING:
+        return {"content": content}
+    return {BLOB_ATTR: packed, CODEC_ATTR: CODEC}
+
+
+def unpack_content(item):
+    """Plain-text content of a stored item (compressed or not)."""
+    if CODEC_ATTR not in item:
+        return item.get("content", "")
+    codec = item[CODEC_ATTR]
+    if codec != CODEC:
+        raise ValueError(f"unknown content codec {codec!r}")
+    blob = item[BLOB_ATTR]
+    blob = getattr(blob, "value", blob)  # boto3 returns Binary
+    return zlib.decompress(bytes(blob)).decode("utf-8")
+
+
+def public_view(item, fields=None):
+    """API representation of a stored item.
+
+    Storage attributes are hidden, and the content is decompressed only
+    when it is part of ``fields`` (all fields when None).
+    """
+    view = {k: v for k, v in item.items() if k not in (BLOB_ATTR, CODEC_ATTR, "content")}
+    if fields is not None:
+        view = {k: v for k, v in view.items() if k in fields or k == "note_id"}
+    if (fields is None or "content" in fields) and ("content" in item or CODEC_ATTR in item):
+        view["content"] = unpack_content(item)
+    return view
+
+
+def plain(item):
+    """Item with plain-text content (e.g. for the search index)."""
+    if not item:
+        return item
+    return {**item, "content": unpack_content(item)}
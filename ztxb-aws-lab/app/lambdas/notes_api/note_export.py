@@ -0,0 +1,365 @@
+# app/lambdas/notes_api/note_export.py
+"""
+Bulk export of the notes table to gzip-compressed JSONL shards.
+
+Runs as a batch job, not in the API Lambda:
+
+    python note_export.py --table <notes table> --out ./export \\
+        --segments 32 --workers 8 --max-rcu 2000
+
+The table is read with a parallel Scan. Each of the ``--segments``
+segments is scanned page by page by one of ``--workers`` threads, and
+each page is written straight into that segment's current shard:
+
+    notes-s0003-00012.jsonl.gz     one note per line, content decompressed
+
+Memory is bounded by one Scan page plus one gzip stream per worker.
+Shards are written under a ``.tmp`` name and renamed once complete.
+A shard closes at the first page boundary after it reaches
+``--shard-items`` notes, or once ``--checkpoint-seconds`` have passed.
+
+checkpoint.json in the output directory records, for each segment, the
+Scan position after its last complete shard. Running the same command
+again resumes there. A segment's half-written shard is discarded and
+its notes are exported again, so every note appears exactly once in
+the finished export. manifest.json lists the shards when all segments
+are done.
+
+Throughput: ``--max-rcu`` caps the combined read rate (consumed
+capacity is reported by every Scan call). When DynamoDB throttles, the
+rate is halved and then recovers gradually, and the throttled worker
+backs off exponentially with jitter. Without ``--max-rcu`` only the
+backoff applies, which suits on-demand tables.
+
+Search index partitions (``#idx#<user>``) are skipped unless
+``--include-index`` is given.
+"""
+import argparse
+import base64
+import glob
+import gzip
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from boto3.dynamodb.types import Binary, TypeDeserializer
+from botocore.exceptions import ClientError
+
+import note_codec
+import note_search
+
+logger = logging.getLogger()
+
+CHECKPOINT_NAME = "checkpoint.json"
+MANIFEST_NAME = "manifest.json"
+THROTTLE_CODES = frozenset({
+    "ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded",
+})
+
+
+class ExportInterrupted(Exception):
+    """The export was stopped; run it again to resume from the checkpoint."""
+
+
+# ---------------------------------------------------------------------------
+# Throughput
+# ---------------------------------------------------------------------------
+
+class ThroughputBudget:
+    """Read capacity shared by all workers: a token bucket with AIMD.
+
+    Scan pages are charged after the fact with the capacity they
+    consumed, so the bucket may go into debt. ``acquire`` waits until
+    the debt is repaid. A throttle halves the refill rate, and every
+    successful page wins back 2% of the configured maximum.
+    """
+
+    def __init__(self, rcu_per_second=0.0, clock=time.monotonic, sleep=time.sleep):
+        self.max_rate = rcu_per_second
+        self.rate = rcu_per_second
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = rcu_per_second  # one second of burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        if not self.max_rate:
+            return
+        with self._lock:
+            self._refill()
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            self.sleep(wait)
+
+    def consumed(self, units):
+        if not self.max_rate:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens -= units
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.02)
+
+    def throttled(self):
+        if not self.max_rate:
+            return
+        with self._lock:
+            self._refill()
+            self.rate = max(self.max_rate * 0.05, self.rate / 2)
+
+
+# ---------------------------------------------------------------------------
+# Checkpoint
+# ---------------------------------------------------------------------------
+
+class Checkpoint:
+    """Per-segment Scan position, rewritten atomically on every commit."""
+
+    def __init__(self, path, params):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved["params"] != params:
+                raise ValueError(f"{path} belongs to a different export ({saved['params']}); "
+                                 "use a new --out directory")
+            self.data = saved
+        else:
+            self.data = {"params": params, "segments": {}}
+
+    def segment(self, segment):
+        with self._lock:
+            return dict(self.data["segments"].get(str(segment)) or
+                        {"last_key": None, "next_shard": 0, "done": False, "shards": []})
+
+    def commit(self, segment, state):
+        with self._lock:
+            self.data["segments"][str(segment)] = state
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f)
+            os.replace(tmp, self.path)
+
+
+# ---------------------------------------------------------------------------
+# Shards
+# ---------------------------------------------------------------------------
+
+_deserializer = TypeDeserializer()
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (Binary, bytes, bytearray)):
+        return base64.b64encode(bytes(getattr(value, "value", value))).decode()
+    if isinstance(value, set):
+        return sorted(value, key=str)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def export_record(raw_item):
+    """JSONL line for a low-level Scan item: plain attributes, content decompressed."""
+    item = {k: _deserializer.deserialize(v) for k, v in raw_item.items()}
+    return json.dumps(note_codec.public_view(item), default=_json_default, ensure_ascii=False) + "\n"
+
+
+class ShardWriter:
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = gzip.open(f"{path}.tmp", "wt", encoding="utf-8", compresslevel=6)
+
+    def write(self, line):
+        self._file.write(line)
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+# ---------------------------------------------------------------------------
+# Export job
+# ---------------------------------------------------------------------------
+
+class NotesExport:
+    def __init__(self, client, table_name, out_dir, segments=16, workers=8, shard_items=250000,
+                 page_limit=0, max_rcu=0.0, checkpoint_seconds=30.0, include_index=False,
+                 max_retries=10, clock=time.monotonic, sleep=time.sleep):
+        self.client = client
+        self.table_name = table_name
+        self.out_dir = out_dir
+        self.segments = segments
+        self.workers = workers
+        self.shard_items = shard_items
+        self.page_limit = page_limit
+        self.checkpoint_seconds = checkpoint_seconds
+        self.include_index = include_index
+        self.max_retries = max_retries
+        self.clock = clock
+        self.sleep = sleep
+        self.budget = ThroughputBudget(max_rcu, clock, sleep)
+        self.stop = threading.Event()
+        self.counters = {"items": 0, "pages": 0, "throttles": 0, "rcu": 0.0}
+        self._counters_lock = threading.Lock()
+        os.makedirs(out_dir, exist_ok=True)
+        self.checkpoint = Checkpoint(os.path.join(out_dir, CHECKPOINT_NAME), {
+            "table": table_name, "segments": segments, "include_index": include_index,
+        })
+
+    def run(self):
+        """Export every segment not finished yet; returns the manifest."""
+        pending = [s for s in range(self.segments) if not self.checkpoint.segment(s)["done"]]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export") as pool:
+            futures = [pool.submit(self._export_segment, s) for s in pending]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # First failure or Ctrl-C: the other workers stop at their next page
+                self.stop.set()
+                raise
+        return self._write_manifest()
+
+    def _count(self, **deltas):
+        with self._counters_lock:
+            for name, delta in deltas.items():
+                self.counters[name] += delta
+
+    def _shard_path(self, segment, seq):
+        return os.path.join(self.out_dir, f"notes-s{segment:04d}-{seq:05d}.jsonl.gz")
+
+    def _discard_partial(self, segment, state):
+        """Remove shards written after the segment's last checkpoint."""
+        for path in glob.glob(os.path.join(self.out_dir, f"notes-s{segment:04d}-*.jsonl.gz*")):
+            seq = int(os.path.basename(path).split("-")[2].split(".")[0])
+            if path.endswith(".tmp") or seq >= state["next_shard"]:
+                os.remove(path)
+
+    def _scan_page(self, segment, start_key):
+        params = {
+            "TableName": self.table_name,
+            "Segment": segment,
+            "TotalSegments": self.segments,
+            "ReturnConsumedCapacity": "TOTAL",
+        }
+        if start_key:
+            params["ExclusiveStartKey"] = start_key
+        if self.page_limit:
+            params["Limit"] = self.page_limit
+        if not self.include_index:
+            params["FilterExpression"] = "NOT begins_with(#u, :idx)"
+            params["ExpressionAttributeNames"] = {"#u": "user_id"}
+            params["ExpressionAttributeValues"] = {":idx": {"S": note_search.INDEX_PREFIX}}
+        for attempt in range(self.max_retries + 1):
+            if self.stop.is_set():
+                raise ExportInterrupted(f"segment {segment} stopped")
+            self.budget.acquire()
+            try:
+                page = self.client.scan(**params)
+            except ClientError as exc:
+                if exc.response.get("Error", {}).get("Code") not in THROTTLE_CODES or attempt == self.max_retries:
+                    raise
+                self._count(throttles=1)
+                self.budget.throttled()
+                self.sleep(random.uniform(0, min(20.0, 0.05 * 2 ** attempt)))
+                continue
+            units = (page.get("ConsumedCapacity") or {}).get("CapacityUnits", 0.0)
+            self.budget.consumed(units)
+            self._count(pages=1, rcu=units)
+            return page
+
+    def _export_segment(self, segment):
+        state = self.checkpoint.segment(segment)
+        self._discard_partial(segment, state)
+        start_key = state["last_key"]
+        writer = None
+        committed_at = self.clock()
+        while True:
+            page = self._scan_page(segment, start_key)
+            for raw in page.get("Items", []):
+                if writer is None:
+                    writer = ShardWriter(self._shard_path(segment, state["next_shard"]))
+                writer.write(export_record(raw))
+            self._count(items=len(page.get("Items", [])))
+            start_key = page.get("LastEvaluatedKey")
+            done = start_key is None
+            due = self.clock() - committed_at >= self.checkpoint_seconds
+            if writer is not None and (done or due or writer.count >= self.shard_items):
+                writer.close()
+                state["shards"].append([os.path.basename(writer.path), writer.count])
+                state["next_shard"] += 1
+                writer = None
+            if writer is None and (done or due):
+                # Nothing unwritten is buffered, so the position is safe to record
+                state.update(last_key=start_key, done=done)
+                self.checkpoint.commit(segment, state)
+                committed_at = self.clock()
+            if done:
+                logger.info("Segment %d done: %d shards", segment, len(state["shards"]))
+                return
+
+    def _write_manifest(self):
+        shards = []
+        for segment in range(self.segments):
+            shards.extend(self.checkpoint.segment(segment)["shards"])
+        manifest = {
+            "table": self.table_name,
+            "segments": self.segments,
+            "items": sum(count for _, count in shards),
+            "shards": [{"file": name, "items": count} for name, count in shards],
+            "completed_at": int(time.time()),
+        }
+        with open(os.path.join(self.out_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the notes table to gzip JSONL shards")
+    parser.add_argument("--table", default=os.environ.get("TABLE_NAME"), required="TABLE_NAME" not in os.environ)
+    parser.add_argument("--out", required=True, help="Output directory (also holds the checkpoint)")
+    parser.add_argument("--segments", type=int, default=16, help="Parallel Scan segments (default 16)")
+    parser.add_argument("--workers", type=int, default=8, help="Worker threads (default 8)")
+    parser.add_argument("--shard-items", type=int, default=250000, help="Notes per shard (default 250000)")
+    parser.add_argument("--page-limit", type=int, default=0, help="Scan Limit per page (default: 1 MB pages)")
+    parser.add_argument("--max-rcu", type=float, default=0.0,
+                        help="Cap on read capacity units/s across workers (default 0 = backoff only)")
+    parser.add_argument("--checkpoint-seconds", type=float, default=30.0,
+                        help="Close shards and record progress at least this often (default 30)")
+    parser.add_argument("--include-index", action="store_true", help="Also export search index items")
+    args = parser.parse_args(argv)
+
+    import boto3
+    from botocore.config import Config
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    client = boto3.client("dynamodb", config=Config(max_pool_connections=max(10, args.workers)))
+    job = NotesExport(client, args.table, args.out, segments=args.segments, workers=args.workers,
+                      shard_items=args.shard_items, page_limit=args.page_limit, max_rcu=args.max_rcu,
+                      checkpoint_seconds=args.checkpoint_seconds, include_index=args.include_index)
+    started = time.monotonic()
+    try:
+        manifest = job.run()
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; run the same command again to resume from %s", CHECKPOINT_NAME)
+        raise SystemExit(130)
+    elapsed = time.monotonic() - started
+    logger.info("Exported %d notes into %d shards in %.0fs (%.0f RCU, %d throttles)",
+                manifest["items"], len(manifest["shards"]), elapsed, job.counters["rcu"], job.counters["throttles"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# app/lambdas/notes_api/note_indexer.py
+"""
+Search index updater, fed by the notes table's DynamoDB stream.
+
+Every note INSERT, MODIFY or REMOVE arrives with its old and new images
+(stream view NEW_AND_OLD_IMAGES). The term diff between them is applied
+with SearchIndex.update_note() (note_search.py). This happens outside
+the Notes API request: a large note can touch hundreds of posting
+items, which would not fit in the API's timeout, and a failed write
+here is retried instead of leaving the index half updated.
+
+Records of the index partitions themselves (the index lives in the same
+table) are skipped. Failures are handled in two ways:
+
+  * transient (throttling, timeouts, any other DynamoDB error) — the
+    batch stops and the record is reported through
+    ReportBatchItemFailures, so Lambda retries from it and the records
+    of one shard stay in order. The event source mapping caps the
+    retries and bisects the batch; what still fails goes to its
+    on-failure destination (api_notes/lambda.tf).
+  * permanent (a record that can never be indexed: undecodable content,
+    a malformed image, a ValidationException) — retrying would only
+    block the shard, so the record is sent to INDEX_DLQ_URL (SQS) with
+    the error and skipped. Without a queue it is logged and skipped.
+"""
+import json
+import logging
+import os
+import zlib
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+import note_codec
+import note_search
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+TABLE_NAME = os.environ.get("TABLE_NAME", "unknown")
+INDEX_DLQ_URL = os.environ.get("INDEX_DLQ_URL", "")
+table = boto3.resource("dynamodb").Table(TABLE_NAME)
+search_index = note_search.SearchIndex(table)
+sqs = boto3.client("sqs") if INDEX_DLQ_URL else None
+
+_deserializer = TypeDeserializer()
+PERMANENT_ERRORS = (ValueError, TypeError, KeyError, UnicodeDecodeError, zlib.error)
+PERMANENT_CODES = frozenset({"ValidationException"})
+counters = {"indexed": 0, "skipped": 0, "dead_lettered": 0, "retried": 0}
+
+
+def _image(record, name):
+    image = record["dynamodb"].get(name)
+    if not image:
+        return None
+    return note_codec.plain({k: _deserializer.deserialize(v) for k, v in image.items()})
+
+
+def apply_record(record):
+    """Apply one stream record to the index; returns False if it was skipped."""
+    keys = record["dynamodb"]["Keys"]
+    user_id, note_id = keys["user_id"]["S"], keys["note_id"]["S"]
+    if note_search.is_index_partition(user_id):
+        return False
+    search_index.update_note(user_id, note_id, _image(record, "OldImage"), _image(record, "NewImage"))
+    return True
+
+
+def _is_permanent(exc):
+    if isinstance(exc, ClientError):
+        return exc.response.get("Error", {}).get("Code") in PERMANENT_CODES
+    return isinstance(exc, PERMANENT_ERRORS)
+
+
+def _dead_letter(record, exc):
+    """Park a record that can never be indexed; False if it could not be parked."""
+    change = record.get("dynamodb", {})
+    logger.error("Skipping unindexable record %s (sequence %s): %s",
+                 change.get("Keys"), change.get("SequenceNumber"), exc)
+    if sqs is None:
+        return True
+    try:
+        sqs.send_message(QueueUrl=INDEX_DLQ_URL, MessageBody=json.dumps({
+            "eventID": record.get("eventID"),
+            "eventName": record.get("eventName"),
+            "keys": change.get("Keys"),
+            "sequenceNumber": change.get("SequenceNumber"),
+            "error": f"{type(exc).__name__}: {exc}",
+        }))
+    except Exception as send_exc:
+        logger.error("Index DLQ send failed: %s", send_exc)
+        return False
+    counters["dead_lettered"] += 1
+    return True
+
+
+def lambda_handler(event, context):
+    indexed = 0
+    for record in event.get("Records", []):
+        try:
+            indexed += apply_record(record)
+        except Exception as exc:
+            if _is_permanent(exc) and _dead_letter(record, exc):
+                counters["skipped"] += 1
+                continue
+            counters["retried"] += 1
+            logger.error("Indexing failed at sequence %s: %s", record["dynamodb"].get("SequenceNumber"), exc)
+            return {"batchItemFailures": [{"itemIdentifier": record["dynamodb"]["SequenceNumber"]}]}
+    counters["indexed"] += indexed
+    logger.info("Indexed %d note changes", indexed)
+    return {"batchItemFailures": []}
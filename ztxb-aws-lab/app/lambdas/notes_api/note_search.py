@@ -0,0 +1,207 @@
+# app/lambdas/notes_api/note_search.py
+"""
+Per-user inverted index for note search, stored in the notes table.
+
+Index items live in a separate partition per user, so list_notes() never
+sees them:
+
+    user_id = "#idx#<user>"   note_id = "<term>"    postings = {note_id: weight}
+    user_id = "#idx#<user>"   note_id = "#stats"    docs = <number of notes>
+
+Authenticated user ids are PEP principal ids ("user:<sub>", or
+"anonymous"), which never start with "#", so no user id can name an
+index partition (the Notes API refuses any that does).
+
+A term's weight in a note is 3 x (occurrences in the title) plus the
+occurrences in the content. Writes are incremental: each changed term is
+a single UpdateItem that SETs or REMOVEs one map entry (``postings.<id>``),
+so notes never need a read-modify-write of the posting list. A posting
+list whose last entry is removed is deleted. Posting writes are
+idempotent, so replaying a diff (a retried stream batch) leaves the same
+postings. Only the document count, used for idf, can drift by a retried
+create or delete. A large note changes up to MAX_TERMS_PER_NOTE items,
+so the diff is applied off the request path, by note_indexer.py from
+the table's stream.
+
+A query reads only the items it needs. An exact term costs one GetItem,
+and a prefix term (``proj*``) costs one Query with begins_with on the
+sort key. Each note is scored by summing weight x idf over the query
+terms, and the top k are kept with a heap. A prefix term that matches
+several index terms counts the best of them for each note.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+TITLE_WEIGHT = 3
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+MAX_TERMS_PER_NOTE = 500
+MAX_PREFIX_EXPANSION = 200
+STATS_KEY = "#stats"
+INDEX_PREFIX = "#idx#"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text):
+    return [
+        t for t in _TOKEN_RE.findall((text or "").lower())
+        if MIN_TERM_LENGTH <= len(t) <= MAX_TERM_LENGTH and t not in _STOPWORDS
+    ]
+
+
+def note_terms(note):
+    """{term: weight} for a note; the heaviest MAX_TERMS_PER_NOTE are kept."""
+    if not note:
+        return {}
+    weights = Counter(tokenize(note.get("content", "")))
+    for term in tokenize(note.get("title", "")):
+        weights[term] += TITLE_WEIGHT
+    if len(weights) > MAX_TERMS_PER_NOTE:
+        weights = dict(weights.most_common(MAX_TERMS_PER_NOTE))
+    return dict(weights)
+
+
+def index_partition(user_id):
+    return f"{INDEX_PREFIX}{user_id}"
+
+
+def is_index_partition(user_id):
+    return user_id.startswith(INDEX_PREFIX)
+
+
+class SearchIndex:
+    def __init__(self, table):
+        self.table = table
+
+    @staticmethod
+    def _partition(user_id):
+        return index_partition(user_id)
+
+    # -- writes -----------------------------------------------------------
+
+    def update_note(self, user_id, note_id, old, new):
+        """Apply the term diff between ``old`` and ``new`` (either may be None)."""
+        before, after = note_terms(old), note_terms(new)
+        partition = self._partition(user_id)
+        for term in before.keys() - after.keys():
+            self._remove_posting(partition, term, note_id)
+        for term, weight in after.items():
+            if before.get(term) != weight:
+                self._set_posting(partition, term, note_id, weight)
+
+        if (old is None) != (new is None):
+            self.table.update_item(
+                Key={"user_id": partition, "note_id": STATS_KEY},
+                UpdateExpression="ADD docs :d",
+                ExpressionAttributeValues={":d": 1 if old is None else -1},
+            )
+
+    def _set_posting(self, partition, term, note_id, weight):
+        key = {"user_id": partition, "note_id": term}
+        set_entry = {
+            "Key": key,
+            "UpdateExpression": "SET postings.#n = :w",
+            "ExpressionAttributeNames": {"#n": note_id},
+            "ExpressionAttributeValues": {":w": weight},
+        }
+        try:
+            self.table.update_item(**set_entry)
+            return
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] != "ValidationException":
+                raise
+        # First posting for this term: the map does not exist yet
+        try:
+            self.table.update_item(
+                Key=key,
+                UpdateExpression="SET postings = :p",
+                ConditionExpression="attribute_not_exists(postings)",
+                ExpressionAttributeValues={":p": {note_id: weight}},
+            )
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            self.table.update_item(**set_entry)  # created concurrently
+
+    def _remove_posting(self, partition, term, note_id):
+        key = {"user_id": partition, "note_id": term}
+        names = {"#n": note_id}
+        try:
+            # The note's posting is the only one left: drop the whole item
+            self.table.delete_item(
+                Key=key,
+                ConditionExpression="attribute_exists(postings.#n) AND size(postings) = :one",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={":one": 1},
+            )
+            return
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+        try:
+            self.table.update_item(
+                Key=key,
+                UpdateExpression="REMOVE postings.#n",
+                ConditionExpression="attribute_exists(postings.#n)",
+                ExpressionAttributeNames=names,
+            )
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            # Already gone (a replayed diff); never create an empty item
+
+    # -- reads ------------------------------------------------------------
+
+    def _postings(self, partition, term):
+        """Postings for a query term; ``term*`` merges every matching term (max weight)."""
+        if not term.endswith("*"):
+            item = self.table.get_item(Key={"user_id": partition, "note_id": term}).get("Item")
+            return {k: int(v) for k, v in (item or {}).get("postings", {}).items()}
+
+        merged = {}
+        resp = self.table.query(
+            KeyConditionExpression=Key("user_id").eq(partition) & Key("note_id").begins_with(term[:-1]),
+            Limit=MAX_PREFIX_EXPANSION,
+        )
+        for item in resp.get("Items", []):
+            if item["note_id"] == STATS_KEY:
+                continue
+            for note_id, weight in item.get("postings", {}).items():
+                merged[note_id] = max(merged.get(note_id, 0), int(weight))
+        return merged
+
+    def search(self, user_id, query, k=10):
+        """Return the top-k [(note_id, score)] for ``query``."""
+        terms = []
+        for raw in (query or "").lower().split():
+            prefix = raw.endswith("*")
+            tokens = tokenize(raw.rstrip("*"))
+            if prefix and len(tokens) == 1:
+                terms.append(tokens[0] + "*")
+            else:
+                terms.extend(tokens)
+        if not terms:
+            return []
+
+        partition = self._partition(user_id)
+        stats = self.table.get_item(Key={"user_id": partition, "note_id": STATS_KEY}).get("Item") or {}
+        docs = max(int(stats.get("docs", 0)), 1)
+
+        scores = Counter()
+        for term in dict.fromkeys(terms):
+            postings = self._postings(partition, term)
+            if not postings:
+                continue
+            idf = math.log(1 + docs / len(postings))
+            for note_id, weight in postings.items():
+                scores[note_id] += weight * idf
+        return heapq.nlargest(k, scores.items(), key=lambda kv: (kv[1], kv[0]))
@@ -0,0 +1,208 @@
+# app/lambdas/pep_authorizer/decision_token.py
+"""
+Local verification of Broker-signed decision tokens.
+
+For an allow, the Broker returns a compact ``decision_token``:
+
+    base64url(claims).base64url(ECDSA_SHA_256 DER signature)
+
+signed with a dedicated KMS key (DECISION_KEY_ARN) that only the Broker
+may use for signing. The claims bind the decision to the subject, the
+device, the action and resource scope, a digest of the policy inputs
+(role, groups, device posture, risk) and an expiry:
+
+    {"iss": "ztxp://broker", "kid": ..., "mid": ..., "sub": ..., "dev": ...,
+     "act": ..., "res": ..., "ctx": ..., "iat": ..., "exp": ...}
+
+Until ``exp`` the PEP can verify such a token against the Broker's public
+key (fetched once per container via kms:GetPublicKey) and allow the
+request without a KMS Sign or a Broker round trip. Tokens are kept per
+container and can also be presented by the client (DECISION_TOKEN_HEADER),
+so any PEP container can reuse a decision, not just the one that
+received it.
+
+A request served from a token never reaches the Broker, so for the
+token's lifetime (DECISION_TTL_SECONDS, 300 s by default) it is not
+charged to the Broker's per-subject, per-device and per-IP rate limits
+(admission.py) and is not seen by its behavioral risk sketches
+(risk_sketch.py). Revocation is still checked by the PEP. Lower
+DECISION_TTL_SECONDS to tighten that window, or leave DECISION_KEY_ARN
+unset to send every request to the Broker.
+
+Verification needs the ``cryptography`` package, which the Terraform
+build bundles into the PEP zip (requirements.txt). Without it tokens
+are ignored and every request goes to the Broker as before.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger()
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, utils
+except ImportError:  # optional: tokens are ignored without it
+    ec = None
+
+ISSUER = "ztxp://broker"
+CLOCK_SKEW_SECONDS = 60
+
+
+def _b64url_decode(segment):
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def policy_context_digest(tam):
+    """SHA-256 over the TAM fields the policy decides on.
+
+    Must match the Broker's computation: a token only applies while the
+    role, groups, device posture and risk are unchanged.
+    """
+    subject = tam.get("subject", {})
+    context = tam.get("context", {})
+    facts = {
+        "role": subject.get("role", ""),
+        "groups": sorted(subject.get("groups") or []),
+        "compliant": tam.get("device", {}).get("posture", {}).get("compliant", False),
+        "device_trust": context.get("device_trust", "unknown"),
+        "risk_score": context.get("risk_score", 100),
+    }
+    return hashlib.sha256(json.dumps(facts, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def scope_matches(scope, resource_id):
+    """``res`` is either an exact resource id or a ``prefix/*`` scope."""
+    if scope.endswith("/*"):
+        return resource_id.startswith(scope[:-1])
+    return scope == resource_id
+
+
+class DecisionTokens:
+    """Verify decision tokens and keep the latest one per binding."""
+
+    def __init__(self, key_arn, kms_client, max_entries=4096, clock=time.time):
+        self.key_arn = key_arn
+        self.kms_client = kms_client
+        self.max_entries = max_entries
+        self.clock = clock
+        self._public_key = None
+        self._verified = {}  # token -> claims
+        self._latest = {}    # (sub, dev, act, ctx) -> claims
+        self.counters = {"hits": 0, "misses": 0, "rejected": 0}
+
+    @property
+    def enabled(self):
+        return bool(self.key_arn) and ec is not None
+
+    def public_key(self):
+        if self._public_key is None:
+            resp = self.kms_client.get_public_key(KeyId=self.key_arn)
+            self._public_key = serialization.load_der_public_key(resp["PublicKey"])
+        return self._public_key
+
+    def verify(self, token):
+        """Return the claims of a valid, unexpired token; raise ValueError otherwise."""
+        claims = self._verified.get(token)
+        if claims is None:
+            try:
+                payload_b64, sig_b64 = token.split(".")
+                payload = _b64url_decode(payload_b64)
+                sig = _b64url_decode(sig_b64)
+            except (AttributeError, ValueError, binascii.Error):
+                raise ValueError("malformed_token")
+            try:
+                digest = hashlib.sha256(payload).digest()
+                self.public_key().verify(sig, digest, ec.ECDSA(utils.Prehashed(hashes.SHA256())))
+            except InvalidSignature:
+                raise ValueError("invalid_token_signature")
+            claims = json.loads(payload)
+            if claims.get("iss") != ISSUER or claims.get("kid") != self.key_arn:
+                raise ValueError("untrusted_token")
+            if len(self._verified) >= self.max_entries:
+                self._verified.clear()
+            self._verified[token] = claims
+
+        now = self.clock()
+        if claims["exp"] <= now:
+            self._verified.pop(token, None)
+            raise ValueError("token_expired")
+        if claims["iat"] > now + CLOCK_SKEW_SECONDS:
+            raise ValueError("token_from_future")
+        return claims
+
+    @staticmethod
+    def matches(claims, tam):
+        resource = tam.get("resource", {})
+        return (
+            claims.get("sub") == tam.get("subject", {}).get("id")
+            and claims.get("dev") == tam.get("device", {}).get("id")
+            and claims.get("act") == resource.get("action")
+            and scope_matches(claims.get("res", ""), resource.get("id", ""))
+            and claims.get("ctx") == policy_context_digest(tam)
+        )
+
+    @staticmethod
+    def _binding(tam):
+        return (
+            tam.get("subject", {}).get("id"),
+            tam.get("device", {}).get("id"),
+            tam.get("resource", {}).get("action"),
+            policy_context_digest(tam),
+        )
+
+    def lookup(self, tam, presented=None):
+        """Claims of a token that allows ``tam``, or None (ask the Broker)."""
+        if not self.enabled:
+            return None
+        candidates = []
+        if presented:
+            candidates.append(presented)
+        cached = self._latest.get(self._binding(tam))
+        if cached is not None:
+            candidates.append(cached["token"])
+        for token in candidates:
+            try:
+                claims = self.verify(token)
+            except ValueError as exc:
+                self.counters["rejected"] += 1
+                logger.info("Decision token not usable: %s", exc)
+                continue
+            except Exception as exc:
+                logger.warning("Decision token verification error: %s", exc)
+                continue
+            if self.matches(claims, tam):
+                self.counters["hits"] += 1
+                return claims
+        self.counters["misses"] += 1
+        return None
+
+    def store(self, tam, token):
+        """Cache a token returned by the Broker for ``tam``; returns its claims or None."""
+        if not self.enabled or not token:
+            return None
+        try:
+            claims = self.verify(token)
+        except Exception as exc:
+            logger.warning("Broker returned an unusable decision token: %s", exc)
+            return None
+        if not self.matches(claims, tam):
+            return None
+        if len(self._latest) >= self.max_entries:
+            self._latest.clear()
+        self._latest[self._binding(tam)] = {**claims, "token": token}
+        return claims
+
+
+def from_env(kms_client):
+    key_arn = os.environ.get("DECISION_KEY_ARN", "")
+    tokens = DecisionTokens(key_arn, kms_client,
+                            max_entries=int(os.environ.get("DECISION_TOKEN_CACHE_SIZE", "4096")))
+    if key_arn and ec is None:
+        logger.warning("DECISION_KEY_ARN set but 'cryptography' is not installed; decision tokens disabled")
+    return tokens
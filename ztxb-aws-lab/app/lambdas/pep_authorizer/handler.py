@@ -9,24 +9,77 @@ Broker for a policy decision.
 
 If the Broker says "allow", the request proceeds to the Notes API.
 Otherwise the request is denied at the gateway.
+
+BROKER_ENVELOPE selects how the signed TAM travels to the Broker:
+  embedded (default) — {"tam": {..., "signature": {...}}}
+  compact            — {"tam_compact": "<payload>.<sig>", ...}, the
+                       exact signed bytes, so the Broker never has to
+                       re-canonicalize the TAM
+
+BROKER_TRANSPORT selects how the Broker is reached:
+  http (default) — POST to BROKER_URL/ztxp/evaluate in the BROKER_ENVELOPE
+                   format
+  inprocess      — the Broker Lambda's handler.py (BROKER_HANDLER_PATH)
+                   is loaded into this process, e.g. a sidecar image with
+                   both, and handed the TAM and its signed bytes directly.
+                   The TAM is still signed with KMS and verified by the
+                   Broker, but there is no HTTP call and no JSON
+                   serialization or parsing on either side.
+
+When DECISION_KEY_ARN is set, an allow from the Broker carries a signed
+decision token. Until it expires, matching requests are allowed locally
+after verifying the token against the Broker's public key, without a
+KMS Sign or Broker call (see decision_token.py). The token is passed on
+in the authorizer context, and a client may present it back in the
+DECISION_TOKEN_HEADER header so that any PEP container can reuse it.
+A token skips the Broker's revocation checks, so with REVOCATION_SOURCE
+set the PEP loads the same revocation list (the Broker's revocation.py,
+packaged with this function) and sends a request whose signing key,
+subject or device is revoked to the Broker instead of honouring its
+token. The Broker then denies it. Token-served requests are not
+counted by the Broker's rate limits or risk sketches until the token
+expires (see decision_token.py).
+
+context.risk_score is the reputation score of the caller's source IP
+from the mmap-ed index at IP_REPUTATION_PATH (see ip_reputation.py);
+without an index every request scores IP_REPUTATION_DEFAULT_SCORE (0).
 """
 import base64
 import hashlib
+import importlib.util
 import json
 import logging
 import os
+import sys
 import uuid
 from datetime import datetime, timezone
 
 import boto3
 
+import decision_token
+import ip_reputation
+import revocation
+from tam_template import CanonicalTam, TamTemplate
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 KMS_KEY_ARN = os.environ.get("KMS_KEY_ARN", "")
 BROKER_URL = os.environ.get("BROKER_URL", "")
+BROKER_ENVELOPE = os.environ.get("BROKER_ENVELOPE", "embedded")
+BROKER_TRANSPORT = os.environ.get("BROKER_TRANSPORT", "http")
+BROKER_HANDLER_PATH = os.environ.get(
+    "BROKER_HANDLER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ztxp_broker", "handler.py"),
+)
+TAM_ISSUER = os.environ.get("TAM_ISSUER", "ztxp://pep.ztxp-aws-lab")
+DECISION_TOKEN_HEADER = os.environ.get("DECISION_TOKEN_HEADER", "x-ztxp-decision")
+IP_REPUTATION_DEFAULT_SCORE = int(os.environ.get("IP_REPUTATION_DEFAULT_SCORE", "0"))
 
 kms_client = boto3.client("kms")
+decision_tokens = decision_token.from_env(kms_client)
+revocations = revocation.from_env()
+reputation = ip_reputation.load(os.environ.get("IP_REPUTATION_PATH", ""), IP_REPUTATION_DEFAULT_SCORE)
 
 # ---------------------------------------------------------------------------
 # TAM helpers
@@ -37,9 +90,45 @@ def canonical_json(data):
     return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
 
 
+# Per-request TAM fields; everything else in the TAM is constant per
+# issuer and pre-serialized once per container (see tam_template.py).
+_TAM_SLOTS = (
+    "message_id",
+    "issued_at",
+    "subject.id",
+    "subject.groups",
+    "device.id",
+    "device.posture.compliant",
+    "context.risk_score",
+    "context.device_trust",
+    "context.source_ip",
+    "context.session_id",
+    "resource.id",
+    "resource.action",
+)
+
+_templates = {}
+
+
+def _tam_template(issuer):
+    template = _templates.get(issuer)
+    if template is None:
+        skeleton = {
+            "version": "0.2",
+            "issuer": issuer,
+            "subject": {"role": "authenticated"},
+        }
+        template = _templates[issuer] = TamTemplate(skeleton, _TAM_SLOTS)
+    return template
+
+
 def build_tam(event):
     """Extract identity / device / resource context from the API Gateway event
-    and assemble a TAM according to the ZTXP v0.2 spec."""
+    and assemble a TAM according to the ZTXP v0.2 spec.
+
+    The returned dict also carries its canonical bytes (``tam.payload``),
+    rendered from the per-issuer template, so signing does not have to
+    re-serialize it."""
 
     request_context = event.get("requestContext", {})
     http_info = request_context.get("http", {})
@@ -71,71 +160,131 @@ def build_tam(event):
     path = http_info.get("path", "/")
     action = "notes:Write" if method in ("POST", "PUT", "DELETE") else "notes:Read"
 
-    tam = {
+    message_id = str(uuid.uuid4())
+    issued_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    subject_id = f"user:{principal_id}"
+    device_ref = f"device:{device_id}"
+    source_ip = http_info.get("sourceIp", "0.0.0.0")
+    risk_score = risk_score_for(source_ip)
+    session_id = request_context.get("requestId", "")
+    resource_id = f"app://notes{path}"
+
+    tam = CanonicalTam({
         "version": "0.2",
-        "message_id": str(uuid.uuid4()),
-        "issued_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
-        "issuer": "ztxp://pep.ztxp-aws-lab",
+        "message_id": message_id,
+        "issued_at": issued_at,
+        "issuer": TAM_ISSUER,
         "subject": {
-            "id": f"user:{principal_id}",
+            "id": subject_id,
             "role": "authenticated",
             "groups": groups,
         },
         "device": {
-            "id": f"device:{device_id}",
+            "id": device_ref,
             "posture": {
                 "compliant": device_compliant,
             },
         },
         "context": {
-            "risk_score": 0,
+            "risk_score": risk_score,
             "device_trust": device_trust,
-            "source_ip": http_info.get("sourceIp", "0.0.0.0"),
-            "session_id": request_context.get("requestId", ""),
+            "source_ip": source_ip,
+            "session_id": session_id,
         },
         "resource": {
-            "id": f"app://notes{path}",
+            "id": resource_id,
             "action": action,
         },
-    }
+    })
+    tam.payload = _tam_template(TAM_ISSUER).render({
+        "message_id": message_id,
+        "issued_at": issued_at,
+        "subject.id": subject_id,
+        "subject.groups": groups,
+        "device.id": device_ref,
+        "device.posture.compliant": device_compliant,
+        "context.risk_score": risk_score,
+        "context.device_trust": device_trust,
+        "context.source_ip": source_ip,
+        "context.session_id": session_id,
+        "resource.id": resource_id,
+        "resource.action": action,
+    })
     return tam
 
 
+def risk_score_for(source_ip):
+    """Risk score (0-100) for the request's source IP."""
+    if reputation is None:
+        return IP_REPUTATION_DEFAULT_SCORE
+    return reputation.score(source_ip)
+
+
+def _payload(tam):
+    """Canonical bytes of an unsigned TAM, using the pre-rendered form if present."""
+    payload = getattr(tam, "payload", None)
+    if payload is not None and "signature" not in tam:
+        return payload
+    return canonical_json(tam)
+
+
 def sign_tam(tam):
     """Sign the TAM with KMS (ECDSA_SHA_256 on P-256 key).
 
     KMS Sign with ECDSA_SHA_256 and MessageType=DIGEST expects us
     to SHA-256 the canonical payload ourselves.
     """
-    payload = canonical_json(tam)
-    digest = hashlib.sha256(payload).digest()
+    sig_bytes = _kms_sign(_payload(tam))
+    tam["signature"] = {
+        "alg": "ECDSA_SHA_256",
+        "key_id": KMS_KEY_ARN,
+        "sig": base64.b64encode(sig_bytes).decode(),
+    }
+    return tam
+
 
+def sign_tam_compact(tam):
+    """Sign the TAM and return a compact Broker request body.
+
+    ``tam_compact`` is ``base64url(payload).base64url(signature)`` where
+    payload is the exact canonical bytes that were signed.
+    """
+    payload = _payload(tam)
+    sig_bytes = _kms_sign(payload)
+    return {
+        "tam_compact": f"{_b64url(payload)}.{_b64url(sig_bytes)}",
+        "alg": "ECDSA_SHA_256",
+        "key_id": KMS_KEY_ARN,
+    }
+
+
+def _kms_sign(payload):
+    digest = hashlib.sha256(payload).digest()
     response = kms_client.sign(
         KeyId=KMS_KEY_ARN,
         Message=digest,
         MessageType="DIGEST",
         SigningAlgorithm="ECDSA_SHA_256",
     )
-    sig_bytes = response["Signature"]
-    tam["signature"] = {
-        "alg": "ECDSA_SHA_256",
-        "key_id": KMS_KEY_ARN,
-        "sig": base64.b64encode(sig_bytes).decode(),
-    }
-    return tam
+    return response["Signature"]
+
+
+def _b64url(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
 
 
 # ---------------------------------------------------------------------------
 # Broker call
 # ---------------------------------------------------------------------------
 
-def call_broker(signed_tam):
-    """POST the signed TAM to the ZTXP Broker and return its decision."""
+def call_broker(request_body):
+    """POST the request body ({"tam": ...} or {"tam_compact": ...}) to the
+    ZTXP Broker and return its decision."""
     from urllib.request import Request, urlopen
     from urllib.error import URLError
 
     url = f"{BROKER_URL}/ztxp/evaluate"
-    body = json.dumps({"tam": signed_tam}).encode("utf-8")
+    body = json.dumps(request_body).encode("utf-8")
     req = Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
 
     try:
@@ -146,6 +295,62 @@ def call_broker(signed_tam):
         return {"decision": "deny", "reason": "broker_unreachable"}
 
 
+class HttpTransport:
+    """The Broker behind BROKER_URL, sent BROKER_ENVELOPE JSON bodies."""
+
+    def sign(self, tam):
+        if BROKER_ENVELOPE == "compact":
+            return sign_tam_compact(tam)
+        return {"tam": sign_tam(tam)}
+
+    def send(self, tam, signed):
+        return call_broker(signed)
+
+
+class InProcessTransport:
+    """A Broker module loaded into this process (BROKER_TRANSPORT=inprocess).
+
+    The canonical bytes are signed as for the compact envelope, then the
+    TAM object, bytes and signature go straight to the Broker's
+    ``evaluate_signed``, which verifies the signature and returns its
+    decision dict.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def sign(self, tam):
+        payload = _payload(tam)
+        return payload, _kms_sign(payload)
+
+    def send(self, tam, signed):
+        payload, sig_bytes = signed
+        return self.broker.evaluate_signed(tam, payload, sig_bytes, KMS_KEY_ARN)
+
+
+def load_broker(path):
+    """Import the Broker Lambda's handler.py, with its sibling modules, from ``path``."""
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory not in sys.path:
+        sys.path.append(directory)
+    spec = importlib.util.spec_from_file_location("ztxp_broker_handler", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _transport_from_env():
+    if BROKER_TRANSPORT == "inprocess":
+        logger.info("Loading in-process Broker from %s", BROKER_HANDLER_PATH)
+        return InProcessTransport(load_broker(BROKER_HANDLER_PATH))
+    if BROKER_TRANSPORT != "http":
+        raise ValueError(f"unknown BROKER_TRANSPORT: {BROKER_TRANSPORT}")
+    return HttpTransport()
+
+
+broker_transport = _transport_from_env()
+
+
 # ---------------------------------------------------------------------------
 # JWT helper (lightweight — no external deps)
 # ---------------------------------------------------------------------------
@@ -168,6 +373,18 @@ def _decode_jwt_claims(auth_header):
         return {}
 
 
+def _token_revoked(tam):
+    """True if a decision token for ``tam`` must not be honoured (revoked or no list)."""
+    if not revocations.enabled:
+        return False
+    if not revocations.available:  # REVOCATION_REQUIRED and no list loaded yet
+        return True
+    kind = revocations.revoked(tam) or ("key" if revocations.key_revoked(KMS_KEY_ARN) else None)
+    if kind:
+        logger.warning("Decision token ignored: %s revoked for message_id=%s", kind, tam.get("message_id"))
+    return kind is not None
+
+
 # ---------------------------------------------------------------------------
 # Lambda entry point
 # ---------------------------------------------------------------------------
@@ -178,26 +395,41 @@ def lambda_handler(event, context):
     # 1. Build the TAM from request context
     tam = build_tam(event)
 
+    # Reuse an unexpired Broker decision if one matches this request
+    presented = (event.get("headers") or {}).get(DECISION_TOKEN_HEADER)
+    claims = decision_tokens.lookup(tam, presented)
+    if claims is not None and not _token_revoked(tam):
+        logger.info("Allowed by decision token message_id=%s", claims.get("mid"))
+        return {
+            "isAuthorized": True,
+            "context": {
+                "principalId": tam["subject"]["id"],
+                "ztxp_decision": "allow",
+                "ztxp_reason": "decision_token",
+                "ztxp_message_id": claims.get("mid", ""),
+            },
+        }
+
     # 2. Sign with KMS
     try:
-        signed_tam = sign_tam(tam)
+        signed = broker_transport.sign(tam)
     except Exception as exc:
         logger.error("KMS signing failed: %s", exc)
         return {"isAuthorized": False, "context": {"reason": "signing_failed"}}
 
     # 3. Forward to the Broker for a policy decision
-    decision = call_broker(signed_tam)
+    decision = broker_transport.send(tam, signed)
     logger.info("Broker decision: %s", json.dumps(decision))
 
     allowed = decision.get("decision") == "allow"
 
     # 4. Return authorizer response to API Gateway
-    return {
-        "isAuthorized": allowed,
-        "context": {
-            "principalId": tam["subject"]["id"],
-            "ztxp_decision": decision.get("decision", "deny"),
-            "ztxp_reason": decision.get("reason", ""),
-            "ztxp_message_id": tam["message_id"],
-        },
+    auth_context = {
+        "principalId": tam["subject"]["id"],
+        "ztxp_decision": decision.get("decision", "deny"),
+        "ztxp_reason": decision.get("reason", ""),
+        "ztxp_message_id": tam["message_id"],
     }
+    if allowed and decision_tokens.store(tam, decision.get("decision_token")) is not None:
+        auth_context["ztxp_decision_token"] = decision["decision_token"]
+    return {"isAuthorized": allowed, "context": auth_context}
@@ -0,0 +1,182 @@
+# app/lambdas/pep_authorizer/ip_reputation.py
+"""
+IP reputation lookup for the PEP risk score.
+
+A reputation feed of CIDR prefixes with scores (0-100) is compiled
+offline into a flat binary index of non-overlapping, sorted address
+intervals:
+
+    header  "ZTXPIPR1" | uint32 n4 | uint32 n6           (little-endian)
+    uint32[n4] v4 starts | uint32[n4] v4 ends
+    uint64[n6] v6 starts | uint64[n6] v6 ends             (upper 64 bits)
+    uint8[n4]  v4 scores | uint8[n6]  v6 scores
+
+Overlapping prefixes are flattened at build time. Each address gets the
+highest score of every prefix that covers it. IPv6 is indexed on the
+upper 64 bits, so prefixes longer than /64 apply to their whole /64.
+
+At runtime the file is mmap-ed once per container and searched with
+``bisect`` directly over ``memoryview`` casts of the mapping. A lookup
+is one C-level binary search, and no per-prefix Python objects ever
+exist. Memory is shared page cache, about 9 bytes per IPv4 interval and
+17 per IPv6 interval.
+
+Build an index from a feed ("<cidr>[,| ]<score>" per line, # comments):
+
+    python ip_reputation.py build feed.csv ip_reputation.bin
+"""
+import heapq
+import ipaddress
+import logging
+import mmap
+import socket
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+logger = logging.getLogger()
+
+MAGIC = b"ZTXPIPR1"
+_HEADER = struct.Struct("<8sII")
+_V6_SHIFT = 64
+
+
+def _to_int(ip):
+    """(family, int) for an address string; IPv6 reduced to its upper 64 bits."""
+    try:
+        if ":" not in ip:
+            return 4, int.from_bytes(socket.inet_aton(ip), "big") if ip.count(".") == 3 else None
+        if ip.startswith("::ffff:") and "." in ip:  # IPv4-mapped
+            return 4, int.from_bytes(socket.inet_aton(ip[7:]), "big")
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big") >> _V6_SHIFT
+    except (OSError, TypeError):
+        return None, None
+
+
+class ReputationIndex:
+    """Read-only view over a compiled index file."""
+
+    def __init__(self, path, default_score=0):
+        self.path = path
+        self.default_score = default_score
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n4, n6 = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not an IP reputation index")
+        if sys.byteorder != "little":
+            raise ValueError("IP reputation index requires a little-endian host")
+
+        view = memoryview(self._mm)
+        sections = []
+        offset = _HEADER.size
+        for typecode, width, count in (("I", 4, n4), ("I", 4, n4), ("Q", 8, n6), ("Q", 8, n6),
+                                       ("B", 1, n4), ("B", 1, n6)):
+            sections.append(view[offset:offset + width * count].cast(typecode))
+            offset += width * count
+        if offset > len(self._mm):
+            raise ValueError(f"{path}: truncated IP reputation index")
+        (self._v4_starts, self._v4_ends, self._v6_starts, self._v6_ends,
+         self._v4_scores, self._v6_scores) = sections
+        self.counts = (n4, n6)
+
+    def score(self, ip):
+        """Reputation score for an address string (default_score if unlisted or invalid)."""
+        family, value = _to_int(ip)
+        if value is None:
+            return self.default_score
+        if family == 4:
+            starts, ends, scores = self._v4_starts, self._v4_ends, self._v4_scores
+        else:
+            starts, ends, scores = self._v6_starts, self._v6_ends, self._v6_scores
+        i = bisect_right(starts, value) - 1
+        if i >= 0 and value <= ends[i]:
+            return scores[i]
+        return self.default_score
+
+
+# ---------------------------------------------------------------------------
+# Offline builder
+# ---------------------------------------------------------------------------
+
+def parse_feed(lines):
+    """Yield (family, start, end, score) from "<cidr>[,| ]<score>" lines."""
+    for lineno, line in enumerate(lines, 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        cidr, _, score = line.replace(",", " ").partition(" ")
+        try:
+            net = ipaddress.ip_network(cidr.strip(), strict=False)
+            score = max(0, min(100, int(score.strip() or 100)))
+        except ValueError as exc:
+            raise ValueError(f"feed line {lineno}: {exc}") from None
+        start, end = int(net.network_address), int(net.broadcast_address)
+        if net.version == 6:
+            start, end = start >> _V6_SHIFT, end >> _V6_SHIFT
+        yield net.version, start, end, score
+
+
+def flatten(ranges):
+    """Non-overlapping (start, end, score) intervals; overlaps take the max score."""
+    ranges = sorted(ranges)
+    bounds = sorted({r[0] for r in ranges} | {r[1] + 1 for r in ranges})
+    out = []
+    active = []  # heap of (-score, end)
+    i = 0
+    for lo, hi in zip(bounds, bounds[1:]):
+        while i < len(ranges) and ranges[i][0] == lo:
+            heapq.heappush(active, (-ranges[i][2], ranges[i][1]))
+            i += 1
+        while active and active[0][1] < lo:
+            heapq.heappop(active)
+        if not active:
+            continue
+        score = -active[0][0]
+        if out and out[-1][1] == lo - 1 and out[-1][2] == score:
+            out[-1][1] = hi - 1
+        else:
+            out.append([lo, hi - 1, score])
+    return out
+
+
+def build(feed_lines, out_path):
+    """Compile a feed into an index file; returns (v4 intervals, v6 intervals)."""
+    v4, v6 = [], []
+    for family, start, end, score in parse_feed(feed_lines):
+        (v4 if family == 4 else v6).append((start, end, score))
+    v4, v6 = flatten(v4), flatten(v6)
+
+    with open(out_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(v4), len(v6)))
+        for typecode, rows in (("I", v4), ("Q", v6)):
+            for column in (0, 1):
+                arr = array(typecode, (r[column] for r in rows))
+                if sys.byteorder != "little":
+                    arr.byteswap()
+                arr.tofile(f)
+        for rows in (v4, v6):
+            f.write(bytes(r[2] for r in rows))
+    return len(v4), len(v6)
+
+
+def load(path, default_score=0):
+    """Open an index, or return None (risk scoring disabled) if it is unusable."""
+    if not path:
+        return None
+    try:
+        index = ReputationIndex(path, default_score)
+    except (OSError, ValueError) as exc:
+        logger.warning("IP reputation index %s not loaded: %s", path, exc)
+        return None
+    logger.info("Loaded IP reputation index %s (%d v4 / %d v6 intervals)", path, *index.counts)
+    return index
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        sys.exit("usage: python ip_reputation.py build <feed> <out.bin>")
+    with open(sys.argv[2], encoding="utf-8") as feed:
+        n4, n6 = build(feed, sys.argv[3])
+    print(f"wrote {sys.argv[3]}: {n4} IPv4 / {n6} IPv6 intervals")
@@ -0,0 +1,96 @@
+# app/lambdas/pep_authorizer/tam_template.py
+"""
+Precompiled canonical TAM templates for the PEP.
+
+The canonical form of a TAM (sorted keys, no whitespace, UTF-8) is
+mostly constant: issuer, version, role and the whole key structure are
+the same for every request from this PEP. ``TamTemplate`` serializes a
+skeleton TAM once, with unique markers in place of the variable fields,
+and splits the result into constant text fragments. Rendering a request
+is then just encoding the variable values, joining the fragments and
+UTF-8 encoding the result once.
+
+The output is byte-identical to ``canonical_json(tam)`` because JSON
+encoding of a value does not depend on where it appears in the document,
+and the key order is fixed by the skeleton.
+"""
+import copy
+import json
+from json.encoder import encode_basestring
+
+_MARKER = "\x00ztxp-slot-{}\x00"
+
+# One shared encoder: json.dumps() with non-default options builds a new
+# JSONEncoder on every call, which costs more than the encoding itself.
+_encode_canonical = json.JSONEncoder(sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode
+
+
+def _encode(value):
+    """Canonical JSON encoding of a single value (as str)."""
+    kind = type(value)
+    if kind is str:
+        return encode_basestring(value)
+    if kind is bool:
+        return "true" if value else "false"
+    if kind is int:
+        return str(value)
+    return _encode_canonical(value)
+
+
+def _set_path(doc, path, value):
+    *parents, leaf = path.split(".")
+    for key in parents:
+        doc = doc.setdefault(key, {})
+    doc[leaf] = value
+
+
+class CanonicalTam(dict):
+    """A TAM dict carrying its canonical bytes, rendered at build time.
+
+    ``payload`` is only valid for the dict as built; code that modifies
+    the TAM afterwards must re-canonicalize instead of using it.
+    """
+
+    payload = None
+
+
+class TamTemplate:
+    """Canonical TAM skeleton with slots for the per-request fields."""
+
+    def __init__(self, skeleton, slots):
+        self.slots = tuple(slots)
+        doc = copy.deepcopy(skeleton)
+        markers = {}
+        for i, path in enumerate(self.slots):
+            marker = _MARKER.format(i)
+            markers[path] = marker
+            _set_path(doc, path, marker)
+
+        text = json.dumps(doc, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+        # Locate every encoded marker, then cut the text into fragments
+        positions = []
+        for path, marker in markers.items():
+            encoded = json.dumps(marker, ensure_ascii=False)
+            start = text.index(encoded)
+            positions.append((start, start + len(encoded), path))
+        positions.sort()
+
+        self.fragments = []
+        self.order = []
+        cursor = 0
+        for start, end, path in positions:
+            self.fragments.append(text[cursor:start])
+            self.order.append(path)
+            cursor = end
+        self.fragments.append(text[cursor:])
+        self.order = tuple(self.order)
+
+    def render(self, values):
+        """Return canonical bytes for the skeleton with ``values`` (path -> value) spliced in."""
+        fragments = self.fragments
+        parts = [fragments[0]]
+        for i, path in enumerate(self.order, 1):
+            parts.append(_encode(values[path]))
+            parts.append(fragments[i])
+        return "".join(parts).encode("utf-8")
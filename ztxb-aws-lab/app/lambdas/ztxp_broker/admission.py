@@ -0,0 +1,260 @@
+# app/lambdas/ztxp_broker/admission.py
+"""
+Admission control for the ZTXP Broker.
+
+Before a request reaches KMS Verify or the PDP, it must pass these
+checks. They are cheap and in-memory, so a rejection costs a few
+dictionary operations instead of a KMS round trip:
+
+  * concurrency limit — past ADMISSION_MAX_CONCURRENCY in-flight
+    requests, new ones are shed with 503 (0 = unlimited). A Lambda
+    container serves one request at a time, so there the function's
+    reserved concurrency is the real limit. This one matters when the
+    handler is hosted in a threaded server.
+  * negative cache — signatures rejected in the last
+    NEGATIVE_CACHE_TTL_SECONDS are rejected again with 403, without
+    another KMS Verify. Replayed floods of the same bad TAM never
+    reach KMS twice.
+  * failure budget — each caller (API Gateway source IP) gets a token
+    bucket that only rejected signatures draw from. A caller that has
+    spent it gets 429 before verification, so rotating garbage
+    signatures cannot force unbounded KMS calls either.
+  * rate limits — verified requests draw one token each from the
+    buckets of their subject, device and TAM source IP
+    (ADMISSION_RATE per second, ADMISSION_BURST deep; 0 disables).
+    These claims are only charged after the signature checks out, so
+    nobody can drain another principal's bucket with forged TAMs.
+
+Every structure is a bounded LRU (ADMISSION_MAX_KEYS), so memory stays
+flat no matter how many distinct keys an attacker sends.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+class TokenBuckets:
+    """Per-key token buckets in a bounded LRU.
+
+    Each key holds ``(tokens, updated_at)``. An evicted key comes back
+    with a full bucket, which is the same as a key that was never seen.
+    """
+
+    def __init__(self, rate, burst, max_keys=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0 and self.burst > 0
+
+    def _level(self, key, now):
+        state = self._buckets.get(key)
+        if state is None:
+            return self.burst
+        tokens, updated_at = state
+        return min(self.burst, tokens + (now - updated_at) * self.rate)
+
+    def peek(self, key):
+        """True if ``key`` has at least one token (nothing is consumed)."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            return self._level(key, self.clock()) >= 1.0
+
+    def take(self, key, cost=1.0):
+        """Consume ``cost`` tokens; False (and nothing consumed) if short."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            now = self.clock()
+            tokens = self._level(key, now)
+            if tokens < cost:
+                return False
+            self._buckets[key] = (tokens - cost, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return True
+
+    def take_all(self, keys, cost=1.0):
+        """Consume ``cost`` from every key, or from none of them.
+
+        Returns None on success, else the first key that is short.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            now = self.clock()
+            levels = {key: self._level(key, now) for key in keys}
+            for key, tokens in levels.items():
+                if tokens < cost:
+                    return key
+            for key, tokens in levels.items():
+                self._buckets[key] = (tokens - cost, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return None
+
+    def retry_after(self, key, cost=1.0):
+        """Seconds until ``key`` can afford ``cost`` again (rounded up)."""
+        with self._lock:
+            missing = cost - self._level(key, self.clock())
+        return max(1, int(missing / self.rate + 0.999)) if self.rate > 0 else 1
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class NegativeCache:
+    """Bounded set of recently rejected keys with a TTL."""
+
+    def __init__(self, ttl=60.0, max_entries=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, reason)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The rejection reason recorded for ``key``, or None."""
+        if self.ttl <= 0 or not key:
+            return None
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is None:
+                return None
+            if hit[0] <= self.clock():
+                del self._entries[key]
+                return None
+            return hit[1]
+
+    def add(self, key, reason):
+        if self.ttl <= 0 or not key:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, reason)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ConcurrencyLimit:
+    """Non-blocking in-flight counter; ``acquire()`` fails instead of waiting."""
+
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.limit > 0 and self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+class Rejected(Exception):
+    """An admission check failed; carries the HTTP status to answer with."""
+
+    def __init__(self, status, reason, retry_after=None):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    def __init__(self, rate_limits=None, failures=None, negative=None, concurrency=None):
+        self.rate_limits = rate_limits or TokenBuckets(0, 0)
+        self.failures = failures or TokenBuckets(0, 0)
+        self.negative = negative or NegativeCache(ttl=0)
+        self.concurrency = concurrency or ConcurrencyLimit(0)
+        self.counters = {"shed": 0, "negative_hits": 0, "caller_blocked": 0, "rate_limited": 0}
+
+    def before_verify(self, caller, signature):
+        """Checks that need no trusted input; raises Rejected."""
+        reason = self.negative.get(signature)
+        if reason is not None:
+            self.counters["negative_hits"] += 1
+            raise Rejected(403, f"signature_rejected: {reason} (cached)")
+        if caller and not self.failures.peek(caller):
+            self.counters["caller_blocked"] += 1
+            raise Rejected(429, "too_many_failures", self.failures.retry_after(caller))
+
+    def rejected(self, caller, signature, reason):
+        """Record a TAM that failed verification."""
+        self.negative.add(signature, reason)
+        if caller:
+            self.failures.take(caller)
+
+    def after_verify(self, tam):
+        """Charge the verified subject, device and source IP; raises Rejected.
+
+        All three are charged or none is: a request refused on its device
+        or IP does not also spend its subject's token.
+        """
+        if not self.rate_limits.enabled:
+            return
+        keys = (
+            "sub:" + str(tam.get("subject", {}).get("id", "")),
+            "dev:" + str(tam.get("device", {}).get("id", "")),
+            "ip:" + str(tam.get("context", {}).get("source_ip", "")),
+        )
+        short = self.rate_limits.take_all([key for key in keys if not key.endswith(":")])
+        if short is not None:
+            self.counters["rate_limited"] += 1
+            raise Rejected(429, f"rate_limited ({short.split(':', 1)[0]})", self.rate_limits.retry_after(short))
+
+    def clear(self):
+        self.rate_limits.clear()
+        self.failures.clear()
+        self.negative.clear()
+
+
+def from_env():
+    clock = time.monotonic
+    max_keys = int(os.environ.get("ADMISSION_MAX_KEYS", "10000"))
+    return AdmissionControl(
+        rate_limits=TokenBuckets(
+            rate=_env_float("ADMISSION_RATE", "50"),
+            burst=_env_float("ADMISSION_BURST", "100"),
+            max_keys=max_keys,
+            clock=clock,
+        ),
+        failures=TokenBuckets(
+            rate=_env_float("ADMISSION_FAILURE_RATE", "1"),
+            burst=_env_float("ADMISSION_FAILURE_BURST", "20"),
+            max_keys=max_keys,
+            clock=clock,
+        ),
+        negative=NegativeCache(
+            ttl=_env_float("NEGATIVE_CACHE_TTL_SECONDS", "60"),
+            max_entries=max_keys,
+            clock=clock,
+        ),
+        concurrency=ConcurrencyLimit(int(os.environ.get("ADMISSION_MAX_CONCURRENCY", "0"))),
+    )
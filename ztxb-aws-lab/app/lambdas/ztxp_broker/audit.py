@@ -0,0 +1,271 @@
+# app/lambdas/ztxp_broker/audit.py
+"""
+Asynchronous, batched audit log for ZTXP decisions (spec §9: brokers
+SHOULD log verification failures and rejected TAMs).
+
+``AuditLog.record()`` never blocks the request path: records go into a
+bounded in-memory queue and a background thread writes them in batches
+to one or more sinks:
+
+  * JsonlSink     — append-only JSON lines file (e.g. /tmp on Lambda)
+  * SqliteSink    — local SQLite database (handy for the lab / tests)
+  * DynamoDBSink  — BatchWriteItem into the decisions table
+
+Every record gets a unique ``event_id`` (time, event, random suffix), the
+decisions table's sort key under ``tam_hash``. Several events for one
+TAM, e.g. a decision and a later timestamp_rejected for its replay, are
+kept side by side instead of overwriting each other.
+
+Under overload (queue above the high-water mark) "allow" records are
+sampled at AUDIT_OVERLOAD_SAMPLE_RATE while denies and rejections are
+always kept; once the queue is full, new records are dropped and
+counted. ``flush_pending()`` is called at the end of each invocation and
+writes whatever is still queued, however young, before Lambda freezes
+the environment: a frozen container may never be thawed, and SIGTERM is
+only delivered to functions with an extension installed, so the
+shutdown drain below is a best effort rather than the safety net. A
+flush that runs past its time limit is counted in ``flush_timeouts``;
+those records go out with the next invocation's flush.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import signal
+import threading
+import time
+import uuid
+
+logger = logging.getLogger()
+
+_FLUSH = object()  # queue marker: write the current batch now
+
+
+# ---------------------------------------------------------------------------
+# Sinks
+# ---------------------------------------------------------------------------
+
+class JsonlSink:
+    def __init__(self, path):
+        self.path = path
+
+    def write_batch(self, records):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records))
+
+
+class SqliteSink:
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS audit ("
+            " ts TEXT, event TEXT, message_id TEXT, subject TEXT,"
+            " decision TEXT, reason TEXT, record TEXT)"
+        )
+        self._conn.commit()
+
+    def write_batch(self, records):
+        self._conn.executemany(
+            "INSERT INTO audit VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (r.get("ts"), r.get("event"), r.get("message_id"), r.get("subject"),
+                 r.get("decision"), r.get("reason"), json.dumps(r))
+                for r in records
+            ],
+        )
+        self._conn.commit()
+
+
+class DynamoDBSink:
+    """Write records to the decisions table (``tam_hash`` + ``event_id``)."""
+
+    MAX_BATCH = 25  # BatchWriteItem limit
+    KEY = ("tam_hash", "event_id")
+
+    def __init__(self, table_name, client=None, max_retries=5):
+        import boto3
+
+        self.table_name = table_name
+        self.client = client or boto3.client("dynamodb")
+        self.max_retries = max_retries
+
+    @staticmethod
+    def _item(record):
+        item = {}
+        for key, value in record.items():
+            if value is None:
+                continue
+            if isinstance(value, bool):
+                item[key] = {"BOOL": value}
+            elif isinstance(value, (int, float)):
+                item[key] = {"N": str(value)}
+            else:
+                item[key] = {"S": str(value)}
+        return item
+
+    def write_batch(self, records):
+        # BatchWriteItem rejects the whole request if two puts share a key
+        unique = {}
+        for r in records:
+            unique[tuple(r.get(k) for k in self.KEY)] = r
+        records = list(unique.values())
+        for start in range(0, len(records), self.MAX_BATCH):
+            requests = [{"PutRequest": {"Item": self._item(r)}} for r in records[start:start + self.MAX_BATCH]]
+            pending = {self.table_name: requests}
+            for attempt in range(self.max_retries + 1):
+                resp = self.client.batch_write_item(RequestItems=pending)
+                pending = resp.get("UnprocessedItems") or {}
+                if not pending:
+                    break
+                time.sleep(min(0.05 * (2 ** attempt), 1.0))
+            else:
+                raise RuntimeError(f"{len(pending[self.table_name])} audit records unprocessed")
+
+
+# ---------------------------------------------------------------------------
+# Pipeline
+# ---------------------------------------------------------------------------
+
+class AuditLog:
+    """Bounded queue + background batch writer."""
+
+    def __init__(self, sinks, max_queue=10000, batch_size=25, max_batch_age=1.0,
+                 high_water=0.8, overload_sample_rate=0.1):
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.max_batch_age = max_batch_age
+        self.high_water = int(max_queue * high_water)
+        self.overload_sample_rate = overload_sample_rate
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._unwritten = 0
+        self._cond = threading.Condition()
+        self._oldest = None
+        self.counters = {"recorded": 0, "written": 0, "dropped": 0, "sampled_out": 0, "sink_errors": 0,
+                         "flush_timeouts": 0}
+        self._thread = None
+        if self.sinks:
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    @property
+    def enabled(self):
+        return bool(self.sinks)
+
+    def record(self, event, **fields):
+        """Enqueue one audit record; never blocks."""
+        if not self.sinks:
+            return
+        ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        rec = {"event": event, "ts": ts, "event_id": f"{ts}#{event}#{uuid.uuid4().hex[:16]}", **fields}
+        if (self._queue.qsize() >= self.high_water and rec.get("decision") == "allow"
+                and random.random() >= self.overload_sample_rate):
+            self.counters["sampled_out"] += 1
+            return
+        with self._cond:
+            try:
+                self._queue.put_nowait(rec)
+            except queue.Full:
+                self.counters["dropped"] += 1
+                return
+            self._unwritten += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+        self.counters["recorded"] += 1
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def flush(self, timeout=2.0):
+        """Block until everything queued so far is written (or timeout)."""
+        if not self.sinks:
+            return True
+        try:
+            self._queue.put_nowait(_FLUSH)
+        except queue.Full:
+            pass  # writer is busy with full batches anyway
+        with self._cond:
+            return self._cond.wait_for(lambda: self._unwritten == 0, timeout)
+
+    def flush_pending(self, timeout=0.5):
+        """Write everything not yet written, waiting at most ``timeout`` seconds."""
+        if self._oldest is None:
+            return True
+        if self.flush(timeout):
+            return True
+        self.counters["flush_timeouts"] += 1
+        return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _FLUSH:
+                continue
+            batch = [item]
+            deadline = time.monotonic() + self.max_batch_age
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _FLUSH:
+                    break
+                batch.append(item)
+            self._write(batch)
+            with self._cond:
+                self._unwritten -= len(batch)
+                if self._unwritten == 0:
+                    self._oldest = None
+                    self._cond.notify_all()
+
+    def _write(self, batch):
+        for sink in self.sinks:
+            try:
+                sink.write_batch(batch)
+            except Exception as exc:
+                self.counters["sink_errors"] += 1
+                logger.error("Audit sink %s failed for %d records: %s", type(sink).__name__, len(batch), exc)
+        self.counters["written"] += len(batch)
+
+
+def from_env():
+    """Build an AuditLog from AUDIT_* environment variables (disabled if no sinks)."""
+    sinks = []
+    for name in [s.strip() for s in os.environ.get("AUDIT_SINKS", "").split(",") if s.strip()]:
+        if name == "jsonl":
+            sinks.append(JsonlSink(os.environ.get("AUDIT_JSONL_PATH", "/tmp/ztxp-audit.jsonl")))
+        elif name == "sqlite":
+            sinks.append(SqliteSink(os.environ.get("AUDIT_SQLITE_PATH", "/tmp/ztxp-audit.db")))
+        elif name == "dynamodb":
+            sinks.append(DynamoDBSink(os.environ["AUDIT_TABLE_NAME"]))
+        else:
+            logger.warning("Unknown audit sink %r ignored", name)
+
+    log = AuditLog(
+        sinks,
+        max_queue=int(os.environ.get("AUDIT_QUEUE_SIZE", "10000")),
+        batch_size=int(os.environ.get("AUDIT_BATCH_SIZE", "25")),
+        max_batch_age=float(os.environ.get("AUDIT_MAX_BATCH_AGE_MS", "1000")) / 1000.0,
+        overload_sample_rate=float(os.environ.get("AUDIT_OVERLOAD_SAMPLE_RATE", "0.1")),
+    )
+    if log.enabled:
+        _drain_on_sigterm(log)
+    return log
+
+
+def _drain_on_sigterm(log):
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handler(signum, frame):
+        log.flush(timeout=1.5)
+        if callable(previous):
+            previous(signum, frame)
+
+    try:
+        signal.signal(signal.SIGTERM, handler)
+    except ValueError:  # not in the main thread
+        pass
@@ -7,27 +7,92 @@ signature via KMS, then forwards the TAM payload to the PDP
 Security flow:
   1. Parse TAM from request body
   2. Verify ECDSA_SHA_256 signature against KMS public key
+     - {"tam": {...}}: signature embedded, payload re-canonicalized
+     - {"tam_compact": "<payload>.<sig>"}: the exact signed bytes are
+       sent (base64url), verified as-is and parsed once
   3. Validate timestamp freshness (reject replay > 600 s)
-  4. POST TAM fields to OPA at PDP_URL for policy evaluation
-  5. Return the allow/deny decision
+  4. POST TAM fields to OPA at PDP_URL / PDP_URLS for policy evaluation
+     (circuit breaker, replica balancing and hedging in pdp_client.py)
+  5. Return the allow/deny decision; an allow carries a decision token
+     signed with DECISION_KEY_ARN (when set) that PEPs can verify
+     locally and reuse until it expires. Requests served from a token
+     bypass admission rate limits and risk sketches until then, so
+     DECISION_TTL_SECONDS bounds how long those signals lag
+
+A PEP running in the same process (BROKER_TRANSPORT=inprocess in the
+PEP) calls evaluate_signed() with the TAM object and its signed bytes.
+The same pipeline runs without the HTTP body.
+
+Every decision and rejection is also handed to the asynchronous audit
+log (audit.py) when AUDIT_SINKS is configured.
+
+Admission control (admission.py) runs ahead of steps 2 and 4. Requests
+over the concurrency limit are shed with 503. Exact repeats of recently
+rejected requests, and callers that keep sending bad signatures, are
+refused before KMS. Verified subjects, devices and source IPs are rate
+limited with 429 before the PDP call.
+
+With REVOCATION_SOURCE set, TAMs signed with a revoked key_id are
+rejected before the KMS call. TAMs for a revoked subject or device are
+rejected after verification. The list is a Bloom filter over an mmap-ed
+sorted hash array and is hot-swapped as new versions are published
+(see revocation.py).
+
+With RISK_WINDOW_SECONDS set, each subject's recent policy denies,
+distinct devices and distinct source IPs are tracked in fixed-size
+count-min / HyperLogLog sketches. The derived score is merged into the
+OPA input (see risk_sketch.py).
+
+With TENANTS_PATH set, only the listed TAM issuers are served, and
+each tenant's decisions go to its own OPA decision path (see
+tenants.py).
+
+Setting PROFILE_SAMPLE_EVERY or PROFILE_SECONDS turns on a sampling
+profiler for the request path. It writes collapsed stacks for
+flamegraphs (see profiler.py).
 """
 import base64
+import binascii
 import hashlib
 import json
 import logging
 import os
+import time
 from datetime import datetime, timezone, timedelta
 
 import boto3
 
+import admission
+import audit
+import pdp_client
+import profiler
+import revocation
+import risk_sketch
+import tenants
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 PDP_URL = os.environ.get("PDP_URL", "")
+# Optional comma-separated list of OPA replicas (host[:port]); falls back to PDP_URL
+PDP_URLS = [u.strip() for u in os.environ.get("PDP_URLS", PDP_URL).split(",") if u.strip()] or [PDP_URL]
 KMS_KEY_ARN = os.environ.get("KMS_KEY_ARN", "")
 TAM_TTL_SECONDS = int(os.environ.get("TAM_TTL_SECONDS", "600"))
+AUDIT_RETENTION_DAYS = int(os.environ.get("AUDIT_RETENTION_DAYS", "30"))
+AUDIT_FLUSH_TIMEOUT_MS = int(os.environ.get("AUDIT_FLUSH_TIMEOUT_MS", "500"))
+DECISION_KEY_ARN = os.environ.get("DECISION_KEY_ARN", "")
+DECISION_TTL_SECONDS = int(os.environ.get("DECISION_TTL_SECONDS", "300"))
+# "resource" binds a token to the exact resource id; "prefix" to app://<root>/*
+DECISION_TOKEN_SCOPE = os.environ.get("DECISION_TOKEN_SCOPE", "resource")
 
 kms_client = boto3.client("kms")
+pdp = pdp_client.from_env([f"http://{u}/v1/data/authz/allow" for u in PDP_URLS])
+audit_log = audit.from_env()
+admission_control = admission.from_env()
+broker_profiler = profiler.from_env()
+revocations = revocation.from_env()
+risk = risk_sketch.from_env()
+tenant_router = tenants.from_env()
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -37,12 +102,71 @@ def canonical_json(data):
     return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
 
 
-def _error(status, message):
-    return {
-        "statusCode": status,
-        "headers": {"Content-Type": "application/json"},
-        "body": json.dumps({"decision": "deny", "reason": message}),
-    }
+def _b64url(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64url_decode(segment):
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _audit(event, tam, tam_hash=None, **fields):
+    """Queue an audit record for ``tam`` (no-op when auditing is disabled).
+
+    ``tam_hash`` is the SHA-256 of the signed payload; it is computed
+    here only if the caller does not already have it. Each record has
+    its own ``event_id`` (see audit.py), so records never collide.
+    """
+    if not audit_log.enabled:
+        return
+    if tam_hash is None:
+        unsigned = {k: v for k, v in tam.items() if k != "signature"}
+        tam_hash = hashlib.sha256(canonical_json(unsigned)).hexdigest()
+    audit_log.record(
+        event,
+        tam_hash=tam_hash,
+        message_id=tam.get("message_id", ""),
+        issuer=tam.get("issuer", ""),
+        subject=tam.get("subject", {}).get("id", ""),
+        device=tam.get("device", {}).get("id", ""),
+        action=tam.get("resource", {}).get("action", ""),
+        resource=tam.get("resource", {}).get("id", ""),
+        key_id=(tam.get("signature") or {}).get("key_id", ""),
+        expires_at=int(time.time()) + AUDIT_RETENTION_DAYS * 86400,
+        **fields,
+    )
+
+
+def _denied(status, message, retry_after=None):
+    return status, {"decision": "deny", "reason": message}, retry_after
+
+
+def _response(status, body, retry_after=None):
+    headers = {"Content-Type": "application/json"}
+    if retry_after is not None:
+        headers["Retry-After"] = str(retry_after)
+    return {"statusCode": status, "headers": headers, "body": json.dumps(body)}
+
+
+def _caller_ip(event):
+    request_context = event.get("requestContext") or {}
+    return (request_context.get("http") or {}).get("sourceIp") or \
+        (request_context.get("identity") or {}).get("sourceIp", "")
+
+
+def _request_key(body, tam, compact):
+    """SHA-256 identifying the exact request: payload, signature and key id.
+
+    Used as the negative-cache key. Because any change to the request
+    changes the key, nobody can get a valid TAM blocked by replaying its
+    signature with a tampered payload or key id.
+    """
+    if compact:
+        raw = f"{body.get('tam_compact')}|{body.get('key_id', '')}|{body.get('alg', '')}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    if not isinstance(tam, dict):
+        return None
+    return hashlib.sha256(canonical_json(tam)).hexdigest()
 
 
 # ---------------------------------------------------------------------------
@@ -66,7 +190,54 @@ def verify_signature(tam):
     digest = hashlib.sha256(payload).digest()
 
     key_id = sig_block.get("key_id", KMS_KEY_ARN)
+    _kms_verify(key_id, digest, sig_bytes)
+    return True
+
 
+def verify_compact(envelope):
+    """Verify a compact ``base64url(payload).base64url(signature)`` TAM.
+
+    The signature covers the payload bytes exactly as received, so no
+    re-canonicalization happens: the cost is one SHA-256 plus the KMS
+    Verify, and the payload is parsed once, after it has been verified.
+
+    Returns ``(tam, payload_sha256_hex)``; the TAM gets a ``signature``
+    block attached so downstream code sees the same shape as the
+    embedded mode. Raises ValueError on malformed input or bad signature.
+    """
+    alg = envelope.get("alg", "ECDSA_SHA_256")
+    try:
+        payload_b64, sig_b64 = envelope["tam_compact"].split(".")
+        payload = _b64url_decode(payload_b64)
+        sig_bytes = _b64url_decode(sig_b64)
+    except (AttributeError, KeyError, ValueError, binascii.Error):
+        raise ValueError("malformed_compact")
+
+    key_id = envelope.get("key_id", KMS_KEY_ARN)
+    digest = verify_payload(payload, sig_bytes, key_id, alg)
+
+    try:
+        tam = json.loads(payload)
+    except ValueError:
+        raise ValueError("malformed_payload")
+    if not isinstance(tam, dict) or "signature" in tam:
+        raise ValueError("malformed_payload")
+    tam["signature"] = {"alg": alg, "key_id": key_id, "sig": base64.b64encode(sig_bytes).decode()}
+    return tam, digest.hex()
+
+
+def verify_payload(payload, sig_bytes, key_id, alg="ECDSA_SHA_256"):
+    """Verify a signature over the exact payload bytes; returns their SHA-256."""
+    if alg != "ECDSA_SHA_256":
+        raise ValueError(f"unsupported_alg: {alg}")
+    digest = hashlib.sha256(payload).digest()
+    _kms_verify(key_id, digest, sig_bytes)
+    return digest
+
+
+def _kms_verify(key_id, digest, sig_bytes):
+    if revocations.enabled and revocations.key_revoked(key_id):
+        raise ValueError("key_revoked")
     response = kms_client.verify(
         KeyId=key_id,
         Message=digest,
@@ -74,12 +245,9 @@ def verify_signature(tam):
         Signature=sig_bytes,
         SigningAlgorithm="ECDSA_SHA_256",
     )
-
     if not response.get("SignatureValid"):
         raise ValueError("invalid_signature")
 
-    return True
-
 
 def verify_timestamp(tam):
     """Reject TAMs whose issued_at is older than TAM_TTL_SECONDS."""
@@ -105,19 +273,14 @@ def verify_timestamp(tam):
 # PDP call (OPA)
 # ---------------------------------------------------------------------------
 
-def call_pdp(tam):
-    """Forward the TAM to OPA for policy evaluation.
+def opa_input(tam, behavior=None):
+    """Map TAM fields to the OPA input schema that authz.rego expects.
 
-    OPA expects:
-      POST /v1/data/authz/allow
-      { "input": { ... } }
-
-    We map TAM fields to the OPA input schema that authz.rego expects.
+    ``behavior`` is the subject's recent activity from risk_sketch.py; its
+    score raises context.risk_score, and the counts go in as
+    context.behavior.
     """
-    from urllib.request import Request, urlopen
-    from urllib.error import URLError
-
-    opa_input = {
+    mapped = {
         "action": tam.get("resource", {}).get("action", ""),
         "principal": {
             "id": tam.get("subject", {}).get("id", ""),
@@ -131,18 +294,88 @@ def call_pdp(tam):
             "compliant": tam.get("device", {}).get("posture", {}).get("compliant", False),
         },
     }
+    if behavior is not None:
+        context = mapped["context"]
+        context["behavior"] = behavior
+        context["risk_score"] = max(context["risk_score"], behavior["score"])
+    return mapped
 
-    url = f"http://{PDP_URL}/v1/data/authz/allow"
-    body = json.dumps({"input": opa_input}).encode("utf-8")
-    req = Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
 
+def call_pdp(tam, behavior=None, tenant=None):
+    """Forward the TAM to OPA for policy evaluation.
+
+    OPA expects:
+      POST /v1/data/authz/allow   (or the tenant's pdp_path)
+      { "input": { ... } }
+
+    Returns ``(allowed, reason)`` (see PdpClient.decide). Failures
+    (including an open circuit breaker) resolve to a ``pdp_unavailable``
+    deny unless the stale-allow fallback applies.
+    """
+    return pdp.decide(opa_input(tam, behavior), tenant.pdp_path if tenant is not None else None)
+
+
+# ---------------------------------------------------------------------------
+# Decision tokens
+# ---------------------------------------------------------------------------
+
+def policy_context_digest(tam):
+    """SHA-256 over the TAM fields the policy decides on (role, groups,
+    device posture, risk); the PEP recomputes it to match a token."""
+    subject = tam.get("subject", {})
+    context = tam.get("context", {})
+    facts = {
+        "role": subject.get("role", ""),
+        "groups": sorted(subject.get("groups") or []),
+        "compliant": tam.get("device", {}).get("posture", {}).get("compliant", False),
+        "device_trust": context.get("device_trust", "unknown"),
+        "risk_score": context.get("risk_score", 100),
+    }
+    return hashlib.sha256(json.dumps(facts, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def _token_scope(resource_id):
+    if DECISION_TOKEN_SCOPE != "prefix" or "://" not in resource_id:
+        return resource_id
+    scheme, rest = resource_id.split("://", 1)
+    return f"{scheme}://{rest.split('/', 1)[0]}/*"
+
+
+def issue_decision_token(tam, expires_in):
+    """Sign a compact decision token for an allow.
+
+    ``base64url(claims).base64url(signature)``, ECDSA_SHA_256 over the
+    claims bytes with DECISION_KEY_ARN. Returns None when tokens are
+    disabled or signing fails; the decision itself is unaffected.
+    """
+    if not DECISION_KEY_ARN or expires_in <= 0:
+        return None
+    now = int(time.time())
+    resource = tam.get("resource", {})
+    claims = {
+        "iss": "ztxp://broker",
+        "kid": DECISION_KEY_ARN,
+        "mid": tam.get("message_id", ""),
+        "sub": tam.get("subject", {}).get("id", ""),
+        "dev": tam.get("device", {}).get("id", ""),
+        "act": resource.get("action", ""),
+        "res": _token_scope(resource.get("id", "")),
+        "ctx": policy_context_digest(tam),
+        "iat": now,
+        "exp": now + expires_in,
+    }
+    payload = canonical_json(claims)
     try:
-        with urlopen(req, timeout=3) as resp:
-            result = json.loads(resp.read().decode())
-            return result.get("result", False)
-    except (URLError, Exception) as exc:
-        logger.error("PDP call failed: %s", exc)
-        return False
+        response = kms_client.sign(
+            KeyId=DECISION_KEY_ARN,
+            Message=hashlib.sha256(payload).digest(),
+            MessageType="DIGEST",
+            SigningAlgorithm="ECDSA_SHA_256",
+        )
+    except Exception as exc:
+        logger.error("Decision token signing failed: %s", exc)
+        return None
+    return f"{_b64url(payload)}.{_b64url(response['Signature'])}"
 
 
 # ---------------------------------------------------------------------------
@@ -150,6 +383,48 @@ def call_pdp(tam):
 # ---------------------------------------------------------------------------
 
 def lambda_handler(event, context):
+    return _response(*_admit(_handle, event, context))
+
+
+def evaluate_signed(tam, payload, sig_bytes, key_id, alg="ECDSA_SHA_256"):
+    """In-process entry point for a PEP running in the same process.
+
+    ``payload`` is the exact canonical bytes the PEP signed and ``tam``
+    the dict it rendered them from. The signature over ``payload`` is
+    verified as for a compact request, but nothing is base64-encoded,
+    serialized or parsed, and the caller's object is trusted to match
+    the bytes. Returns the decision dict that the HTTP endpoint would
+    send as its body.
+    """
+    request_key = hashlib.sha256(b"|".join((payload, sig_bytes, key_id.encode("utf-8")))).hexdigest()
+
+    def verify():
+        if "signature" in tam:
+            raise ValueError("malformed_payload")
+        digest = verify_payload(payload, sig_bytes, key_id, alg)
+        signed = dict(tam)
+        signed["signature"] = {"alg": alg, "key_id": key_id, "sig": base64.b64encode(sig_bytes).decode()}
+        return signed, digest.hex()
+
+    return _admit(_decide, "", request_key, tam, verify)[1]
+
+
+def _admit(fn, *args):
+    """Run one request under the concurrency limit; returns (status, body, retry_after)."""
+    if not admission_control.concurrency.acquire():
+        admission_control.counters["shed"] += 1
+        return _denied(503, "overloaded", retry_after=1)
+    try:
+        if broker_profiler.active:  # PROFILE_* set; see profiler.py
+            return broker_profiler.call(fn, *args)
+        return fn(*args)
+    finally:
+        admission_control.concurrency.release()
+        # Write pending audit records before Lambda freezes the environment
+        audit_log.flush_pending(AUDIT_FLUSH_TIMEOUT_MS / 1000.0)
+
+
+def _handle(event, context):
     logger.info("Broker invoked")
 
     # Parse the TAM from the request body
@@ -158,45 +433,111 @@ def lambda_handler(event, context):
         if isinstance(body, str):
             body = json.loads(body)
         tam = body.get("tam") if isinstance(body, dict) else None
-        if not tam:
-            return _error(400, "missing_tam")
+        compact = isinstance(body, dict) and "tam_compact" in body
+        if not tam and not compact:
+            return _denied(400, "missing_tam")
     except (json.JSONDecodeError, AttributeError):
-        return _error(400, "invalid_json")
+        return _denied(400, "invalid_json")
+
+    if compact:
+        def verify():
+            return verify_compact(body)
+    else:
+        def verify():
+            verify_signature(tam)
+            return tam, None
+
+    return _decide(_caller_ip(event), _request_key(body, tam, compact), tam, verify)
+
+
+def _decide(caller, request_key, tam, verify):
+    """Admission, verification, revocation, rate limits and the PDP call.
+
+    ``verify`` checks the signature and returns the verified TAM and the
+    SHA-256 of its payload (None if not known). Returns
+    ``(status, body, retry_after)``.
+    """
+    # Cheap rejections first: repeats of rejected requests, failing callers
+    try:
+        admission_control.before_verify(caller, request_key)
+    except admission.Rejected as exc:
+        return _denied(exc.status, exc.reason, exc.retry_after)
 
     # 1. Verify signature
     try:
-        verify_signature(tam)
+        tam, tam_hash = verify()
     except ValueError as exc:
         logger.warning("Signature verification failed: %s", exc)
-        return _error(403, f"signature_rejected: {exc}")
+        admission_control.rejected(caller, request_key, str(exc))
+        # A rejected compact TAM was never parsed; identify it by the request
+        _audit("signature_rejected", tam or {}, None if tam else request_key, decision="deny", reason=str(exc))
+        return _denied(403, f"signature_rejected: {exc}")
     except Exception as exc:
         logger.error("KMS verify error: %s", exc)
-        return _error(500, "verification_error")
+        _audit("verification_error", tam or {}, None if tam else request_key, decision="deny", reason=str(exc))
+        return _denied(500, "verification_error")
 
     # 2. Verify timestamp freshness (replay protection)
     try:
         verify_timestamp(tam)
     except ValueError as exc:
         logger.warning("Timestamp check failed: %s", exc)
-        return _error(403, f"timestamp_rejected: {exc}")
-
-    # 3. Forward to PDP for policy decision
-    allowed = call_pdp(tam)
+        if str(exc).startswith("tam_expired"):  # stays expired; a future TAM may not
+            admission_control.negative.add(request_key, str(exc))
+        _audit("timestamp_rejected", tam, tam_hash, decision="deny", reason=str(exc))
+        return _denied(403, f"timestamp_rejected: {exc}")
+
+    # Issuer allow-list; picks the tenant's policy (see tenants.py)
+    tenant = None
+    if tenant_router.enabled:
+        tenant = tenant_router.route(tam.get("issuer", ""))
+        if tenant is None:
+            logger.warning("Unknown issuer %r for message_id=%s", tam.get("issuer"), tam.get("message_id"))
+            admission_control.negative.add(request_key, "unknown_issuer")
+            _audit("unknown_issuer", tam, tam_hash, decision="deny", reason="unknown_issuer")
+            return _denied(403, "unknown_issuer")
+
+    # Revoked subjects and devices (revoked keys were refused before KMS)
+    if revocations.enabled:
+        kind = revocations.revoked(tam)
+        if kind:
+            logger.warning("Revoked %s for message_id=%s", kind, tam.get("message_id"))
+            _audit("revoked", tam, tam_hash, decision="deny", reason=f"{kind}_revoked")
+            return _denied(403, f"{kind}_revoked")
+        if not revocations.available:  # REVOCATION_REQUIRED and no list loaded yet
+            _audit("revocation_unavailable", tam, tam_hash, decision="deny", reason="revocation_list_unavailable")
+            return _denied(503, "revocation_list_unavailable", retry_after=5)
+
+    # Per-subject / device / source IP rate limits (verified claims only)
+    try:
+        admission_control.after_verify(tam)
+    except admission.Rejected as exc:
+        logger.warning("Rate limited message_id=%s: %s", tam.get("message_id"), exc.reason)
+        _audit("rate_limited", tam, tam_hash, decision="deny", reason=exc.reason)
+        return _denied(exc.status, exc.reason, exc.retry_after)
+
+    # 3. Forward to PDP for policy decision, with the subject's recent behavior
+    behavior = risk.observe(tam) if risk.enabled else None
+    allowed, reason = call_pdp(tam, behavior, tenant)
+    if reason == "policy_deny" and risk.enabled:  # not outages: they say nothing about the subject
+        risk.denied(tam)
     now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
     decision = "allow" if allowed else "deny"
-    reason = "policy_allow" if allowed else "policy_deny"
 
     logger.info("Decision for message_id=%s: %s", tam.get("message_id"), decision)
-
-    return {
-        "statusCode": 200,
-        "headers": {"Content-Type": "application/json"},
-        "body": json.dumps({
-            "decision": decision,
-            "reason": reason,
-            "evaluated_at": now,
-            "expires_in": 300 if allowed else 0,
-            "message_id": tam.get("message_id", ""),
-        }),
+    _audit("decision", tam, tam_hash, decision=decision, reason=reason)
+
+    expires_in = DECISION_TTL_SECONDS if allowed else 0
+    result = {
+        "decision": decision,
+        "reason": reason,
+        "evaluated_at": now,
+        "expires_in": expires_in,
+        "message_id": tam.get("message_id", ""),
     }
+    token = issue_decision_token(tam, expires_in) if allowed else None
+    if token:
+        result["decision_token"] = token
+
+    return 200, result, None
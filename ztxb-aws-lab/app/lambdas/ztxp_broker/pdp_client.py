@@ -0,0 +1,558 @@
+# app/lambdas/ztxp_broker/pdp_client.py
+"""
+PDP client for the ZTXP Broker.
+
+Wraps the OPA call in a circuit breaker so that a PDP brownout costs
+each authorization a fast deny instead of a full timeout:
+
+  * the breaker trips OPEN when the recent error rate or the share of
+    slow calls crosses a threshold, and fails fast while open;
+  * after a cooldown a single HALF_OPEN probe decides whether to close;
+  * the per-call timeout follows the observed p99 latency (clamped);
+  * optionally, while OPEN, a recent "allow" for an identical OPA input
+    may be served for a short grace period (stale-allow fallback).
+
+With several OPA replicas (PDP_URLS) the client balances on least
+outstanding requests, hedges slow calls to a second replica after the
+observed p95 latency, and ejects replicas that keep failing until a
+/health probe brings them back.
+
+State transitions are emitted as CloudWatch Embedded Metric Format log
+lines so the breaker state can be graphed without extra API calls.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+logger = logging.getLogger()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+class PdpUnavailable(Exception):
+    """Raised when the PDP call fails or the breaker rejects it."""
+
+
+# ---------------------------------------------------------------------------
+# Latency tracking
+# ---------------------------------------------------------------------------
+
+class LatencyWindow:
+    """Fixed-size window of recent call latencies (seconds)."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p):
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[idx]
+
+
+# ---------------------------------------------------------------------------
+# Circuit breaker
+# ---------------------------------------------------------------------------
+
+class CircuitBreaker:
+    """Error-rate / slow-call circuit breaker over a sliding call window."""
+
+    def __init__(self, error_rate=0.5, slow_call_rate=0.8, slow_call_seconds=1.0,
+                 min_calls=10, window=50, cooldown_seconds=10.0, clock=time.monotonic):
+        self.error_rate = error_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._outcomes = deque(maxlen=window)  # (ok, slow)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.transitions = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def allow_request(self):
+        """Return True if a call may go to the PDP right now."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record(self, ok, latency):
+        with self._lock:
+            slow = latency >= self.slow_call_seconds
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                if ok and not slow:
+                    self._outcomes.clear()
+                    self._transition(CLOSED)
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append((ok, slow))
+            if self._state == CLOSED and len(self._outcomes) >= self.min_calls:
+                total = len(self._outcomes)
+                errors = sum(1 for o, _ in self._outcomes if not o)
+                slows = sum(1 for _, s in self._outcomes if s)
+                if errors / total >= self.error_rate or slows / total >= self.slow_call_rate:
+                    self._open()
+
+    def _open(self):
+        self._opened_at = self._clock()
+        self._transition(OPEN)
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.cooldown_seconds:
+            self._transition(HALF_OPEN)
+
+    def _transition(self, new_state):
+        if new_state == self._state:
+            return
+        logger.warning("PDP circuit breaker %s -> %s", self._state, new_state)
+        self._state = new_state
+        self.transitions += 1
+        _emit_metric("PdpBreakerState", _STATE_VALUE[new_state], "None")
+
+
+# ---------------------------------------------------------------------------
+# Stale-allow cache
+# ---------------------------------------------------------------------------
+
+class StaleAllowCache:
+    """Bounded LRU of recent "allow" results keyed by OPA input digest."""
+
+    def __init__(self, grace_seconds=0.0, max_entries=4096, clock=time.monotonic):
+        self.grace_seconds = grace_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.grace_seconds > 0
+
+    def remember(self, key):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = self._clock()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def lookup(self, key):
+        if not self.enabled:
+            return False
+        with self._lock:
+            stored_at = self._entries.get(key)
+            if stored_at is None:
+                return False
+            if self._clock() - stored_at > self.grace_seconds:
+                del self._entries[key]
+                return False
+            return True
+
+
+def input_digest(opa_input):
+    """Stable digest of an OPA input document."""
+    raw = json.dumps(opa_input, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Transport
+# ---------------------------------------------------------------------------
+
+def http_post(url, body, timeout):
+    """POST ``body`` to ``url`` and return the decoded JSON response."""
+    from urllib.request import Request, urlopen
+
+    req = Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+    with urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode())
+
+
+def http_probe(url, timeout):
+    """Return True if GET ``url`` answers 200 (OPA's /health endpoint)."""
+    from urllib.request import urlopen
+
+    try:
+        with urlopen(url, timeout=timeout) as resp:
+            return resp.status == 200
+    except Exception:
+        return False
+
+
+def health_url(decision_url):
+    """Map an OPA decision URL to the same server's /health URL."""
+    return server_url(decision_url) + "/health"
+
+
+def server_url(decision_url):
+    """``scheme://host[:port]`` of an OPA decision URL."""
+    from urllib.parse import urlsplit, urlunsplit
+
+    parts = urlsplit(decision_url)
+    return urlunsplit((parts.scheme, parts.netloc, "", "", ""))
+
+
+# ---------------------------------------------------------------------------
+# Replica pool
+# ---------------------------------------------------------------------------
+
+class Endpoint:
+    """One OPA replica and its load / health bookkeeping."""
+
+    def __init__(self, url):
+        self.url = url
+        self.server = server_url(url)
+        self.health_url = self.server + "/health"
+        self.outstanding = 0
+        self.ewma_latency = 0.0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.probing = False
+
+    def __repr__(self):
+        return f"Endpoint({self.url!r}, outstanding={self.outstanding})"
+
+
+class ReplicaPool:
+    """Least-outstanding-requests balancer with outlier ejection.
+
+    A replica is ejected after ``eject_after`` consecutive failures. Once
+    ``eject_seconds`` have passed, a background health probe against its
+    /health endpoint decides whether it rejoins the pool. If every
+    replica is ejected the pool routes to all of them rather than none.
+    """
+
+    def __init__(self, urls, probe=http_probe, eject_after=3, eject_seconds=10.0,
+                 probe_timeout=0.5, clock=time.monotonic):
+        if not urls:
+            raise ValueError("at least one PDP endpoint is required")
+        self.endpoints = [Endpoint(u) for u in urls]
+        self.probe = probe
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.probe_timeout = probe_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.ejections = 0
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def healthy(self):
+        now = self._clock()
+        return [ep for ep in self.endpoints if ep.ejected_until <= now and not ep.probing]
+
+    def acquire(self, exclude=()):
+        """Pick the replica with the fewest outstanding requests (None if none left)."""
+        with self._lock:
+            self._schedule_probes()
+            candidates = [ep for ep in self.healthy() if ep not in exclude]
+            if not candidates and not exclude:
+                candidates = list(self.endpoints)  # panic mode
+            if not candidates:
+                return None
+            ep = min(candidates, key=lambda e: (e.outstanding, e.ewma_latency))
+            ep.outstanding += 1
+            return ep
+
+    def release(self, ep, ok, latency):
+        with self._lock:
+            ep.outstanding -= 1
+            if ok:
+                ep.consecutive_failures = 0
+                ep.ewma_latency = latency if not ep.ewma_latency else 0.8 * ep.ewma_latency + 0.2 * latency
+                return
+            ep.consecutive_failures += 1
+            if ep.consecutive_failures >= self.eject_after and ep.ejected_until <= self._clock():
+                self._eject(ep)
+
+    def _eject(self, ep):
+        ep.ejected_until = self._clock() + self.eject_seconds
+        self.ejections += 1
+        logger.warning("Ejecting PDP endpoint %s after %d failures", ep.url, ep.consecutive_failures)
+        _emit_metric("PdpEndpointEjected", 1, "Count")
+
+    def _schedule_probes(self):
+        now = self._clock()
+        for ep in self.endpoints:
+            if ep.consecutive_failures >= self.eject_after and ep.ejected_until <= now and not ep.probing:
+                ep.probing = True
+                threading.Thread(target=self._run_probe, args=(ep,), daemon=True).start()
+
+    def _run_probe(self, ep):
+        ok = self.probe(ep.health_url, self.probe_timeout)
+        with self._lock:
+            ep.probing = False
+            if ok:
+                ep.consecutive_failures = 0
+                logger.info("PDP endpoint %s passed health probe; reinstated", ep.url)
+            else:
+                self._eject(ep)
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+class PdpClient:
+    """OPA client with circuit breaker, adaptive timeout and stale-allow fallback.
+
+    With more than one replica, each request goes to the least-loaded
+    endpoint and, if it has not answered within the observed p95 latency,
+    a hedged duplicate is sent to a second replica; the first answer wins.
+    """
+
+    def __init__(self, urls, breaker=None, stale_cache=None, transport=http_post,
+                 min_timeout=0.25, max_timeout=3.0, timeout_multiplier=3.0,
+                 pool=None, hedge=True, hedge_min_delay=0.01, hedge_default_delay=0.2,
+                 clock=time.monotonic):
+        if isinstance(urls, str):
+            urls = [urls]
+        self.pool = pool or ReplicaPool(urls, clock=clock)
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.stale_cache = stale_cache or StaleAllowCache(clock=clock)
+        self.transport = transport
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.latencies = LatencyWindow()
+        self._clock = clock
+        self._executor = None
+        self.counters = {"calls": 0, "errors": 0, "short_circuited": 0, "stale_served": 0,
+                         "hedged": 0, "hedge_wins": 0}
+
+    def current_timeout(self):
+        """Timeout derived from observed p99 latency, clamped to [min, max]."""
+        if len(self.latencies) < 10:
+            return self.max_timeout
+        p99 = self.latencies.percentile(99)
+        return max(self.min_timeout, min(self.max_timeout, p99 * self.timeout_multiplier))
+
+    def hedge_delay(self):
+        """Delay before sending a hedged request: observed p95 latency."""
+        if len(self.latencies) < 10:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, self.latencies.percentile(95))
+
+    def evaluate(self, opa_input, path=None):
+        """Return the OPA ``allow`` result for ``opa_input`` (False on failure)."""
+        return self.decide(opa_input, path)[0]
+
+    def decide(self, opa_input, path=None):
+        """Return ``(allowed, reason)`` for ``opa_input``.
+
+        ``reason`` tells a policy decision (``policy_allow``,
+        ``policy_deny``) apart from a PDP that could not be asked
+        (``pdp_unavailable``, a deny) and a cached allow served meanwhile
+        (``stale_allow``).
+
+        ``path`` replaces the decision path of the configured URLs, e.g. a
+        tenant's ``/v1/data/tenants/acme/authz/allow``; the replicas,
+        breaker and timeouts are shared by all paths.
+        """
+        key = input_digest(opa_input) if path is None else f"{path}|{input_digest(opa_input)}"
+        try:
+            allowed = self.query(opa_input, path)
+        except PdpUnavailable as exc:
+            if self.breaker.state != CLOSED and self.stale_cache.lookup(key):
+                self.counters["stale_served"] += 1
+                _emit_metric("PdpStaleAllowServed", 1, "Count")
+                logger.warning("PDP unavailable (%s); serving cached allow", exc)
+                return True, "stale_allow"
+            logger.error("PDP call failed: %s", exc)
+            return False, "pdp_unavailable"
+
+        if allowed:
+            self.stale_cache.remember(key)
+            return True, "policy_allow"
+        self.stale_cache.forget(key)
+        return False, "policy_deny"
+
+    def query(self, opa_input, path=None):
+        """Send ``opa_input`` to OPA; raises PdpUnavailable on any failure."""
+        # Serialize first: a bad input must not take (and then hold) the
+        # half-open probe slot, and says nothing about the PDP's health
+        try:
+            body = json.dumps({"input": opa_input}).encode("utf-8")
+        except (TypeError, ValueError) as exc:
+            raise PdpUnavailable(f"invalid_input: {exc}") from exc
+        if not self.breaker.allow_request():
+            self.counters["short_circuited"] += 1
+            raise PdpUnavailable("circuit_open")
+
+        self.counters["calls"] += 1
+        started = self._clock()
+        try:
+            if self.hedge and len(self.pool) > 1:
+                result = self._hedged_call(body, self.current_timeout(), path)
+            else:
+                result = self._call(self.pool.acquire(), body, self.current_timeout(), path)
+        except Exception as exc:
+            elapsed = self._clock() - started
+            self.counters["errors"] += 1
+            self.breaker.record(False, elapsed)
+            raise PdpUnavailable(str(exc)) from exc
+
+        elapsed = self._clock() - started
+        self.latencies.add(elapsed)
+        self.breaker.record(True, elapsed)
+        return result.get("result", False) is True
+
+    def _call(self, ep, body, timeout, path=None):
+        started = self._clock()
+        try:
+            result = self.transport(ep.url if path is None else ep.server + path, body, timeout)
+        except Exception:
+            self.pool.release(ep, False, self._clock() - started)
+            raise
+        self.pool.release(ep, True, self._clock() - started)
+        return result
+
+    def _hedged_call(self, body, timeout, path=None):
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            self._executor = ThreadPoolExecutor(max_workers=2 * len(self.pool) + 2,
+                                                thread_name_prefix="pdp")
+        deadline = self._clock() + timeout
+        primary = self.pool.acquire()
+        pending = {self._executor.submit(self._call, primary, body, timeout, path)}
+        done, pending = wait(pending, timeout=self.hedge_delay())
+
+        first_failed = any(f.exception() is not None for f in done)
+        if not done or first_failed:
+            # Slow primary -> hedge; failed primary -> retry on another replica
+            secondary = self.pool.acquire(exclude=(primary,))
+            if secondary is not None:
+                hedge = self._executor.submit(self._call, secondary, body, timeout, path)
+                pending.add(hedge)
+                if not done:
+                    self.counters["hedged"] += 1
+            else:
+                hedge = None
+        else:
+            hedge = None
+
+        last_exc = None
+        for f in done:
+            if f.exception() is None:
+                return f.result()
+            last_exc = f.exception()
+
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - self._clock()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for f in done:
+                if f.exception() is None:
+                    if f is hedge:
+                        self.counters["hedge_wins"] += 1
+                    return f.result()
+                last_exc = f.exception()
+        raise last_exc or TimeoutError("pdp_timeout")
+
+    def metrics(self):
+        """Snapshot of breaker state and call counters."""
+        p50 = self.latencies.percentile(50)
+        p99 = self.latencies.percentile(99)
+        return {
+            "state": self.breaker.state,
+            "healthy_endpoints": len(self.pool.healthy()),
+            "ejections": self.pool.ejections,
+            "timeout_ms": round(self.current_timeout() * 1000),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+            **self.counters,
+        }
+
+
+def from_env(urls):
+    """Build a PdpClient for ``urls`` configured from PDP_* environment variables."""
+    clock = time.monotonic
+    breaker = CircuitBreaker(
+        error_rate=_env_float("PDP_BREAKER_ERROR_RATE", "0.5"),
+        slow_call_rate=_env_float("PDP_BREAKER_SLOW_CALL_RATE", "0.8"),
+        slow_call_seconds=_env_float("PDP_BREAKER_SLOW_CALL_MS", "1000") / 1000.0,
+        min_calls=int(os.environ.get("PDP_BREAKER_MIN_CALLS", "10")),
+        cooldown_seconds=_env_float("PDP_BREAKER_COOLDOWN_SECONDS", "10"),
+        clock=clock,
+    )
+    stale_cache = StaleAllowCache(grace_seconds=_env_float("PDP_STALE_ALLOW_SECONDS", "0"), clock=clock)
+    pool = ReplicaPool(
+        urls,
+        eject_after=int(os.environ.get("PDP_EJECT_AFTER_FAILURES", "3")),
+        eject_seconds=_env_float("PDP_EJECT_SECONDS", "10"),
+        clock=clock,
+    )
+    return PdpClient(
+        urls,
+        breaker=breaker,
+        stale_cache=stale_cache,
+        pool=pool,
+        hedge=os.environ.get("PDP_HEDGE", "true").lower() == "true",
+        hedge_min_delay=_env_float("PDP_HEDGE_MIN_MS", "10") / 1000.0,
+        min_timeout=_env_float("PDP_TIMEOUT_MIN_MS", "250") / 1000.0,
+        max_timeout=_env_float("PDP_TIMEOUT_MAX_MS", "3000") / 1000.0,
+        clock=clock,
+    )
+
+
+def _emit_metric(name, value, unit):
+    """Log a CloudWatch Embedded Metric Format record."""
+    logger.info(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": "ZTXP/Broker",
+                "Dimensions": [[]],
+                "Metrics": [{"Name": name, "Unit": unit}],
+            }],
+        },
+        name: value,
+    }))
@@ -0,0 +1,234 @@
+# app/lambdas/ztxp_broker/profiler.py
+"""
+On-demand sampling profiler for the Broker's request path.
+
+While a profiled invocation is running, a background thread wakes
+every 1/PROFILE_HZ seconds. It records the Python stack of each thread
+that is inside a profiled invocation, using ``sys._current_frames()``;
+with none registered it blocks on an event instead of polling. Stacks are aggregated in collapsed
+form ("outer;inner;leaf count"), which is what flamegraph.pl,
+speedscope and inferno read directly. Idle time between invocations is
+never sampled.
+
+Enabled by environment variables, all off by default:
+
+  PROFILE_SAMPLE_EVERY=K   profile 1 in K invocations
+  PROFILE_SECONDS=N        profile every invocation during the first N
+                           seconds of the container's life
+  PROFILE_HZ               sampling rate (default 997)
+  PROFILE_ALLOCATIONS      "true": for each profiled invocation, log the
+                           net allocated blocks and the peak traced
+                           memory as EMF metrics (tracemalloc runs only
+                           during that invocation)
+  PROFILE_OUTPUT           "log" (default): one "ZTXP_PROFILE <stack> <n>"
+                           line per stack in CloudWatch Logs; or a
+                           directory to append <dir>/broker-<pid>.collapsed
+  PROFILE_FLUSH_SECONDS    how often aggregated stacks are written
+                           (default 60, and at the end of the window)
+
+Collect the log output with:
+
+  aws logs filter-log-events --log-group-name /aws/lambda/<broker> \\
+      --filter-pattern ZTXP_PROFILE --query 'events[].message' --output text \\
+    | tr '\\t' '\\n' | grep -o 'ZTXP_PROFILE .*' | cut -d' ' -f2- | flamegraph.pl > broker.svg
+
+When profiling is disabled, the handler checks one attribute per
+invocation and does nothing else: no thread is started and
+tracemalloc stays off.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+logger = logging.getLogger()
+
+DEFAULT_HZ = 997  # prime, so sampling does not fall in step with periodic work
+
+
+_labels = {}  # code object -> "file.py:qualname"
+
+
+def _frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        name = getattr(code, "co_qualname", code.co_name)
+        label = _labels[code] = f"{os.path.basename(code.co_filename)}:{name}"
+    return label
+
+
+def collapse(frame, max_depth=128):
+    """Root-first ``a;b;c`` label for a frame's stack."""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """Samples the stacks of registered threads on a background thread."""
+
+    def __init__(self, hz=DEFAULT_HZ):
+        self.interval = 1.0 / hz
+        self.counts = Counter()
+        self.samples = 0
+        self._threads = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._busy = threading.Event()  # set while any thread is registered
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ztxp-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._busy.set()  # wake a sampler parked on an idle wait
+            self._thread.join(timeout=1.0)
+            self._thread = None
+            with self._lock:
+                if not self._threads:
+                    self._busy.clear()
+
+    def add(self, ident):
+        with self._lock:
+            self._threads.add(ident)
+            self._busy.set()
+
+    def discard(self, ident):
+        with self._lock:
+            self._threads.discard(ident)
+            if not self._threads:
+                self._busy.clear()
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            self._busy.wait()
+            if self._stop.wait(self.interval):
+                return
+            frames = sys._current_frames()
+            with self._lock:
+                for ident in self._threads:
+                    frame = frames.get(ident)
+                    if frame is not None and ident != own:
+                        self.counts[collapse(frame)] += 1
+                        self.samples += 1
+
+    def drain(self):
+        """Return and reset the aggregated ``{stack: count}``."""
+        with self._lock:
+            counts, self.counts = self.counts, Counter()
+        return counts
+
+
+def format_collapsed(counts):
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+
+class Profiler:
+    """Decides which invocations are profiled and ships the results."""
+
+    def __init__(self, sample_every=0, window_seconds=0.0, hz=DEFAULT_HZ, allocations=False,
+                 output="log", flush_seconds=60.0, clock=time.monotonic):
+        self.sample_every = sample_every
+        self.allocations = allocations
+        self.output = output
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        self.window_ends = clock() + window_seconds if window_seconds > 0 else 0.0
+        self.sampler = StackSampler(hz)
+        self.invocations = 0
+        self.profiled = 0
+        self._last_flush = clock()
+        # The one attribute the handler checks per invocation
+        self.active = sample_every > 0 or window_seconds > 0
+
+    def _wants(self):
+        self.invocations += 1
+        if self.window_ends:
+            if self.clock() < self.window_ends:
+                return True
+            self.window_ends = 0.0
+            self.flush()
+            self.active = self.sample_every > 0
+            if not self.active:
+                self.sampler.stop()
+        return self.sample_every > 0 and self.invocations % self.sample_every == 0
+
+    def call(self, fn, *args, **kwargs):
+        """Run ``fn`` and profile it if this invocation is selected."""
+        if not self._wants():
+            return fn(*args, **kwargs)
+        self.profiled += 1
+        self.sampler.start()
+        ident = threading.get_ident()
+        if self.allocations:
+            tracemalloc.start()  # only for this invocation; it slows allocation down
+            blocks = sys.getallocatedblocks()
+        started = time.perf_counter()
+        self.sampler.add(ident)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.sampler.discard(ident)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if self.allocations:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                _emit({"DurationMs": (elapsed_ms, "Milliseconds"),
+                       "AllocatedBlocks": (sys.getallocatedblocks() - blocks, "Count"),
+                       "PeakTracedKB": (peak / 1024, "Kilobytes")})
+            if self.clock() - self._last_flush >= self.flush_seconds:
+                self.flush()
+
+    def flush(self):
+        self._last_flush = self.clock()
+        counts = self.sampler.drain()
+        if not counts:
+            return
+        if self.output == "log":
+            for stack, n in counts.most_common():
+                logger.info("ZTXP_PROFILE %s %d", stack, n)
+            return
+        try:
+            os.makedirs(self.output, exist_ok=True)
+            with open(os.path.join(self.output, f"broker-{os.getpid()}.collapsed"), "a", encoding="utf-8") as f:
+                f.write(format_collapsed(counts))
+        except OSError as exc:
+            logger.warning("Profile write to %s failed: %s", self.output, exc)
+
+
+def _emit(metrics):
+    """Log a CloudWatch Embedded Metric Format record."""
+    logger.info(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": "ZTXP/Broker/Profile",
+                "Dimensions": [[]],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in metrics.items()],
+            }],
+        },
+        **{name: value for name, (value, _) in metrics.items()},
+    }))
+
+
+def from_env():
+    return Profiler(
+        sample_every=int(os.environ.get("PROFILE_SAMPLE_EVERY", "0")),
+        window_seconds=float(os.environ.get("PROFILE_SECONDS", "0")),
+        hz=float(os.environ.get("PROFILE_HZ", str(DEFAULT_HZ))),
+        allocations=os.environ.get("PROFILE_ALLOCATIONS", "false").lower() == "true",
+        output=os.environ.get("PROFILE_OUTPUT", "log"),
+        flush_seconds=float(os.environ.get("PROFILE_FLUSH_SECONDS", "60")),
+    )
@@ -0,0 +1,283 @@
+# app/lambdas/ztxp_broker/revocation.py
+"""
+Revocation checks for signing keys, subjects and devices (spec §5).
+
+A revocation list is compiled offline into one flat file:
+
+    header  "ZTXPREV1" | uint32 k | uint32 0 | uint64 words | uint64 n | uint64 created_at
+    uint64[words]  blocked Bloom filter
+    uint64[n]      sorted entry hashes                 (all little-endian)
+
+Each entry ("key", "subject" or "device" plus its id) is hashed once
+with BLAKE2b-128. The high 64 bits are stored in the sorted array. The
+low 64 bits select one 64-bit Bloom word and K = 6 bits inside it, so a
+negative answer costs one hash and one word read. Only Bloom hits (true
+revocations, plus about 0.1% false positives at the default 16 bits
+per entry) go on to a ``bisect`` over the mmap-ed array for exact
+confirmation.
+
+A list of 1M entries is a 2 MiB filter plus 8 MiB of hashes. It lives
+in shared page cache, and a typical request touches one filter page.
+
+Hot swap: REVOCATION_SOURCE is either a local path or ``s3://bucket/key``.
+Every REVOCATION_CHECK_SECONDS the checker looks for a new version
+(stat for files, a conditional GET on the ETag for S3). A new list is
+opened completely before it replaces the old one in a single attribute
+assignment, so a request sees either the old list or the new one.
+Publishers of a local file should write it to a temporary name and
+``os.replace()`` it into place.
+
+Build a list from "<kind> <id>" lines (kind: key, subject, device):
+
+    python revocation.py build revoked.txt revocations.bin
+"""
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+
+logger = logging.getLogger()
+
+MAGIC = b"ZTXPREV1"
+_HEADER = struct.Struct("<8sIIQQQ")
+_HALVES = struct.Struct("<QQ")
+KINDS = ("key", "subject", "device")
+K = 6
+WORD_SHIFT = 6 * K  # Bloom hash bits above the K bit positions pick the word
+DEFAULT_BITS_PER_ENTRY = 16
+
+
+def entry_hash(kind, value):
+    """(array hash, Bloom hash) of one entry."""
+    digest = hashlib.blake2b(f"{kind}\x00{value}".encode("utf-8"), digest_size=16).digest()
+    low, high = _HALVES.unpack(digest)
+    return high, low
+
+
+# Two bit positions per 12-bit chunk of the Bloom hash
+_PAIR_MASKS = [(1 << (i & 63)) | (1 << (i >> 6)) for i in range(4096)]
+
+
+def _bloom_mask(h):
+    """The K = 6 bits an entry sets in its Bloom word (from the low 36 bits)."""
+    return _PAIR_MASKS[h & 4095] | _PAIR_MASKS[h >> 12 & 4095] | _PAIR_MASKS[h >> 24 & 4095]
+
+
+class RevocationList:
+    """Read-only view over a compiled revocation list."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < _HEADER.size:
+            raise ValueError(f"{path}: truncated revocation list")
+        magic, self.k, _, words, n, self.created_at = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a revocation list")
+        if sys.byteorder != "little":
+            raise ValueError("revocation lists require a little-endian host")
+        if self.k != K:
+            raise ValueError(f"{path}: unsupported Bloom parameter k={self.k}")
+        if not words or words & (words - 1):
+            raise ValueError(f"{path}: corrupt revocation list header")
+        end = _HEADER.size + 8 * (words + n)
+        if end > len(self._mm):
+            raise ValueError(f"{path}: truncated revocation list")
+        view = memoryview(self._mm)
+        self._bloom = view[_HEADER.size:_HEADER.size + 8 * words].cast("Q")
+        self._hashes = view[_HEADER.size + 8 * words:end].cast("Q")
+        self._word_mask = words - 1
+        self.count = n
+
+    def __len__(self):
+        return self.count
+
+    def contains(self, kind, value):
+        high, low = entry_hash(kind, value)
+        mask = _bloom_mask(low)
+        if self._bloom[(low >> WORD_SHIFT) & self._word_mask] & mask != mask:
+            return False
+        hashes = self._hashes
+        i = bisect_left(hashes, high)
+        return i < len(hashes) and hashes[i] == high
+
+
+# ---------------------------------------------------------------------------
+# Hot-swapped checker
+# ---------------------------------------------------------------------------
+
+class RevocationChecker:
+    """Holds the current list and swaps in new versions as they are published."""
+
+    def __init__(self, source="", check_seconds=30.0, required=False, s3_client=None,
+                 cache_dir="/tmp", clock=time.monotonic):
+        self.source = source
+        self.check_seconds = check_seconds
+        self.required = required
+        self.s3 = s3_client
+        self.cache_dir = cache_dir
+        self.clock = clock
+        self.current = None
+        self.enabled = bool(source)
+        self.counters = {"reloads": 0, "reload_failures": 0, "revoked": 0}
+        self._version = None
+        self._next_check = 0.0
+        if self.enabled:
+            self.refresh()
+
+    # --- checks -----------------------------------------------------------
+
+    @property
+    def available(self):
+        """False when a required list could not be loaded (fail closed)."""
+        return self.current is not None or not self.required
+
+    def key_revoked(self, key_id):
+        self._maybe_refresh()
+        current = self.current
+        if current is None or not key_id or not current.contains("key", key_id):
+            return False
+        self.counters["revoked"] += 1
+        return True
+
+    def revoked(self, tam):
+        """"subject" or "device" if the TAM's subject or device is revoked, else None."""
+        self._maybe_refresh()
+        current = self.current
+        if current is None:
+            return None
+        for kind, value in (("subject", tam.get("subject", {}).get("id")),
+                            ("device", tam.get("device", {}).get("id"))):
+            if value and current.contains(kind, value):
+                self.counters["revoked"] += 1
+                return kind
+        return None
+
+    # --- hot swap ---------------------------------------------------------
+
+    def _maybe_refresh(self):
+        if self.enabled and self.clock() >= self._next_check:
+            self.refresh()
+
+    def refresh(self):
+        """Load the source if it changed; keep the current list on failure."""
+        self._next_check = self.clock() + self.check_seconds
+        try:
+            if self.source.startswith("s3://"):
+                loaded = self._refresh_s3()
+            else:
+                loaded = self._refresh_file()
+        except Exception as exc:  # unreadable file, bad format, S3 errors
+            self.counters["reload_failures"] += 1
+            logger.warning("Revocation list %s not loaded: %s", self.source, exc)
+            return False
+        if loaded is not None:
+            self.current = loaded
+            self.counters["reloads"] += 1
+            logger.info("Loaded revocation list %s (%d entries)", self.source, len(loaded))
+        return True
+
+    def _refresh_file(self):
+        st = os.stat(self.source)
+        version = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if version == self._version:
+            return None
+        self._version = version  # a broken file is reported once, not on every check
+        return RevocationList(self.source)
+
+    def _refresh_s3(self):
+        bucket, _, key = self.source[len("s3://"):].partition("/")
+        params = {"Bucket": bucket, "Key": key}
+        if self._version:
+            params["IfNoneMatch"] = self._version
+        try:
+            response = self.s3.get_object(**params)
+        except Exception as exc:
+            if getattr(exc, "response", {}).get("Error", {}).get("Code") in ("304", "NotModified"):
+                return None
+            raise
+        path = os.path.join(self.cache_dir, "revocations.bin")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            for chunk in iter(lambda: response["Body"].read(1 << 20), b""):
+                f.write(chunk)
+        # The mapping of the previous list stays valid after its file is replaced
+        os.replace(tmp, path)
+        loaded = RevocationList(path)
+        self._version = response.get("ETag")
+        return loaded
+
+
+def from_env():
+    source = os.environ.get("REVOCATION_SOURCE", "")
+    s3_client = None
+    if source.startswith("s3://"):
+        import boto3
+
+        s3_client = boto3.client("s3")
+    return RevocationChecker(
+        source=source,
+        check_seconds=float(os.environ.get("REVOCATION_CHECK_SECONDS", "30")),
+        required=os.environ.get("REVOCATION_REQUIRED", "false").lower() == "true",
+        s3_client=s3_client,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Offline builder
+# ---------------------------------------------------------------------------
+
+def parse_entries(lines):
+    """Yield (kind, id) from "<kind> <id>" lines (# comments allowed)."""
+    for lineno, line in enumerate(lines, 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        kind, _, value = line.partition(" ")
+        value = value.strip()
+        if kind not in KINDS or not value:
+            raise ValueError(f"line {lineno}: expected '<{'|'.join(KINDS)}> <id>'")
+        yield kind, value
+
+
+def build(entries, out_path, bits_per_entry=DEFAULT_BITS_PER_ENTRY, created_at=None):
+    """Compile (kind, id) entries into a list file; returns the entry count."""
+    highs = array("Q")
+    lows = array("Q")
+    for kind, value in entries:
+        high, low = entry_hash(kind, value)
+        highs.append(high)
+        lows.append(low)
+    words = 1
+    while words * 64 < max(1, len(highs)) * bits_per_entry:
+        words *= 2
+    bloom = array("Q", bytes(8 * words))
+    for low in lows:
+        bloom[(low >> WORD_SHIFT) & (words - 1)] |= _bloom_mask(low)
+    hashes = array("Q", sorted(set(highs)))
+    if sys.byteorder != "little":
+        bloom.byteswap()
+        hashes.byteswap()
+
+    tmp = f"{out_path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, K, 0, words, len(hashes),
+                             int(time.time() if created_at is None else created_at)))
+        bloom.tofile(f)
+        hashes.tofile(f)
+    os.replace(tmp, out_path)
+    return len(hashes)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        sys.exit("usage: python revocation.py build <entries.txt> <out.bin>")
+    with open(sys.argv[2], encoding="utf-8") as entries:
+        n = build(parse_entries(entries), sys.argv[3])
+    print(f"wrote {sys.argv[3]}: {n} revoked entries")
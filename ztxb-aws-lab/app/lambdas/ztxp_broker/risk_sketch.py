@@ -0,0 +1,277 @@
+# app/lambdas/ztxp_broker/risk_sketch.py
+"""
+Behavioral risk signals for the PDP, kept in fixed-size sketches.
+
+The Broker sees every verified TAM, so it can notice what a single TAM
+cannot. For each subject it keeps three counts over a sliding window of
+the last RISK_WINDOW_SECONDS:
+
+  * policy denies            — count-min sketch
+  * distinct device ids      — count-min of HyperLogLogs
+  * distinct TAM source IPs  — count-min of HyperLogLogs
+
+A subject id, qualified by its TAM issuer so tenants never share
+counts, hashes once (BLAKE2b-128) to one column in each of
+RISK_SKETCH_DEPTH rows. In the deny sketch a column is a counter. In the
+distinct sketches it is a small HyperLogLog (RISK_HLL_REGISTERS one-byte
+registers). Subjects that share a column only ever push the estimate
+up, so taking the minimum over the rows bounds the error, as in any
+count-min sketch. Memory is fixed by the sketch dimensions and does not
+depend on how many subjects there are. The defaults (4 x 8192, 16
+registers, 4 slots) take 4.7 MB. They keep the estimates exact for
+nearly every subject while a container sees up to about 2000 active
+subjects per window. Beyond that, collisions start to inflate the
+counts, so raise RISK_SKETCH_WIDTH for busier containers.
+
+The window is RISK_SLOTS ring slots of window/slots seconds each.
+Updates go to the current slot. Queries combine all slots (counters are
+summed, registers max-merged). The slots of a cell are stored next to
+each other, so a query reads one contiguous run per row. When a slot
+comes around again it is zeroed once, so it holds no stale counts. An
+update touches `depth` cells, and a query reads `depth * slots` cells.
+HyperLogLog cells are max-merged as packed integers, a few big-int
+operations per cell. Both cost the same for ten users or ten million.
+
+The derived score is
+
+    min(100, RISK_DENY_POINTS * denies
+             + RISK_DEVICE_POINTS * (devices - 1)
+             + RISK_SOURCE_IP_POINTS * (source_ips - 1))
+
+The Broker raises context.risk_score in the OPA input to at least this
+score, and passes the counts as context.behavior (see opa_input() in
+handler.py). Each Lambda container keeps its own sketches, so it only
+sees the share of traffic routed to it. RISK_WINDOW_SECONDS=0 (the
+default) turns this off.
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from array import array
+
+MAX_DEPTH = 6
+_COLUMN_BITS = 20  # one 20-bit column index per row from a 128-bit hash
+
+# 2**-rank for the HyperLogLog harmonic mean
+_INV_POW2 = [2.0 ** -i for i in range(66)]
+
+
+def subject_columns(subject, depth, width):
+    """Column of ``subject`` in each of ``depth`` rows of ``width`` (a power of two)."""
+    h = int.from_bytes(hashlib.blake2b(subject.encode("utf-8"), digest_size=16).digest(), "little")
+    mask = width - 1
+    return [(h >> (_COLUMN_BITS * row)) & mask for row in range(depth)]
+
+
+def _check_shape(depth, width, slots):
+    if not 1 <= depth <= MAX_DEPTH:
+        raise ValueError(f"depth must be 1..{MAX_DEPTH}")
+    if width < 1 or width & (width - 1) or width > 1 << _COLUMN_BITS:
+        raise ValueError(f"width must be a power of two up to {1 << _COLUMN_BITS}")
+    if slots < 1:
+        raise ValueError("slots must be at least 1")
+
+
+class _SlidingSlots:
+    """Ring of ``slots`` time slots; a slot is cleared when it is reused."""
+
+    def __init__(self, slots, slot_seconds, clock):
+        self.slots = slots
+        self.slot_seconds = slot_seconds
+        self._clock = clock
+        self._tick = int(clock() // slot_seconds)
+
+    def _current_slot(self):
+        tick = int(self._clock() // self.slot_seconds)
+        if tick > self._tick:
+            for t in range(max(self._tick + 1, tick - self.slots + 1), tick + 1):
+                self._clear(t % self.slots)
+            self._tick = tick
+        return self._tick % self.slots
+
+    def _clear(self, slot):
+        raise NotImplementedError
+
+
+class WindowedCountMin(_SlidingSlots):
+    """Count-min sketch of event counts over a sliding window."""
+
+    def __init__(self, depth=4, width=8192, slots=4, slot_seconds=150.0, clock=time.monotonic):
+        _check_shape(depth, width, slots)
+        super().__init__(slots, slot_seconds, clock)
+        self.depth = depth
+        self.width = width
+        self._cells = array("I", bytes(4 * slots * depth * width))
+
+    @property
+    def nbytes(self):
+        return len(self._cells) * self._cells.itemsize
+
+    def _clear(self, slot):
+        self._cells[slot::self.slots] = array("I", bytes(4 * self.depth * self.width))
+
+    def add(self, columns, count=1):
+        slot, slots = self._current_slot(), self.slots
+        cells, width = self._cells, self.width
+        for row, col in enumerate(columns):
+            i = (row * width + col) * slots + slot
+            cells[i] = min(cells[i] + count, 0xFFFFFFFF)
+
+    def estimate(self, columns):
+        self._current_slot()
+        cells, width, slots = self._cells, self.width, self.slots
+        return min(
+            sum(cells[(row * width + col) * slots:(row * width + col + 1) * slots])
+            for row, col in enumerate(columns)
+        )
+
+
+class WindowedDistinct(_SlidingSlots):
+    """Count-min sketch of HyperLogLogs: distinct items per key over a sliding window."""
+
+    def __init__(self, depth=4, width=8192, registers=16, slots=4, slot_seconds=150.0, clock=time.monotonic):
+        _check_shape(depth, width, slots)
+        if registers < 16 or registers & (registers - 1) or registers > 4096:
+            raise ValueError("registers must be a power of two from 16 to 4096")
+        super().__init__(slots, slot_seconds, clock)
+        self.depth = depth
+        self.width = width
+        self.registers = registers
+        self._p = registers.bit_length() - 1
+        self._max_rank = 64 - self._p + 1
+        self._regs = bytearray(slots * depth * width * registers)
+        self._high = int.from_bytes(b"\x80" * registers, "little")
+        self._mask = (1 << 8 * registers) - 1
+        m = registers
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        self._alpha_mm = alpha * m * m
+
+    @property
+    def nbytes(self):
+        return len(self._regs)
+
+    def _clear(self, slot):
+        m, step = self.registers, self.slots * self.registers
+        zeros = bytes(self.depth * self.width)
+        for reg in range(m):
+            self._regs[slot * m + reg::step] = zeros
+
+    def add(self, columns, item):
+        h = int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "little")
+        reg = h & (self.registers - 1)
+        w = h >> self._p
+        rank = (w & -w).bit_length() if w else self._max_rank
+        slot, slots = self._current_slot(), self.slots
+        regs, width, m = self._regs, self.width, self.registers
+        for row, col in enumerate(columns):
+            i = ((row * width + col) * slots + slot) * m + reg
+            if regs[i] < rank:
+                regs[i] = rank
+
+    def estimate(self, columns):
+        self._current_slot()
+        regs, width, m, slots = self._regs, self.width, self.registers, self.slots
+        bits, mask, high = 8 * m, self._mask, self._high
+        best = None
+        for row, col in enumerate(columns):
+            start = (row * width + col) * slots * m
+            packed = int.from_bytes(regs[start:start + slots * m], "little")
+            merged = packed & mask
+            for _ in range(slots - 1):
+                # Byte-wise max of two register sets (ranks are < 0x80)
+                packed >>= bits
+                other = packed & mask
+                ge = (((merged | high) - other) & high) >> 7
+                merged = other ^ ((merged ^ other) & (ge * 0xFF))
+            value = self._cardinality(merged.to_bytes(m, "little"))
+            if best is None or value < best:
+                best = value
+        return best
+
+    def _cardinality(self, registers):
+        m = self.registers
+        zeros = registers.count(0)
+        if zeros == m:
+            return 0
+        if zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small sets
+            if estimate <= 2.5 * m:
+                return int(round(estimate))
+        return int(round(self._alpha_mm / sum(map(_INV_POW2.__getitem__, registers))))
+
+
+class BehaviorRisk:
+    """Per-subject denies, devices and source IPs over a sliding window."""
+
+    def __init__(self, window_seconds=0.0, slots=4, depth=4, width=8192, registers=16,
+                 deny_points=10, device_points=20, source_ip_points=5, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.deny_points = deny_points
+        self.device_points = device_points
+        self.source_ip_points = source_ip_points
+        self.depth = depth
+        self.width = width
+        self._lock = threading.Lock()
+        self.counters = {"observed": 0, "denies": 0}
+        if not self.enabled:
+            return
+        slot_seconds = window_seconds / slots
+        self.denies = WindowedCountMin(depth, width, slots, slot_seconds, clock)
+        self.devices = WindowedDistinct(depth, width, registers, slots, slot_seconds, clock)
+        self.source_ips = WindowedDistinct(depth, width, registers, slots, slot_seconds, clock)
+
+    @property
+    def enabled(self):
+        return self.window_seconds > 0
+
+    @property
+    def nbytes(self):
+        if not self.enabled:
+            return 0
+        return self.denies.nbytes + self.devices.nbytes + self.source_ips.nbytes
+
+    def _columns(self, tam):
+        # Subject ids are only unique within an issuer (tenant)
+        subject = f"{tam.get('issuer', '')}\x00{(tam.get('subject') or {}).get('id', '')}"
+        return subject_columns(subject, self.depth, self.width)
+
+    def observe(self, tam):
+        """Record the TAM's device and source IP; returns the subject's behavior."""
+        columns = self._columns(tam)
+        device = str((tam.get("device") or {}).get("id", ""))
+        source_ip = str((tam.get("context") or {}).get("source_ip", ""))
+        with self._lock:
+            self.counters["observed"] += 1
+            if device:
+                self.devices.add(columns, device)
+            if source_ip:
+                self.source_ips.add(columns, source_ip)
+            denies = self.denies.estimate(columns)
+            devices = self.devices.estimate(columns)
+            source_ips = self.source_ips.estimate(columns)
+        score = (self.deny_points * denies
+                 + self.device_points * max(0, devices - 1)
+                 + self.source_ip_points * max(0, source_ips - 1))
+        return {"denies": denies, "devices": devices, "source_ips": source_ips, "score": min(100, score)}
+
+    def denied(self, tam):
+        """Count a policy deny for the TAM's subject."""
+        columns = self._columns(tam)
+        with self._lock:
+            self.counters["denies"] += 1
+            self.denies.add(columns)
+
+
+def from_env():
+    return BehaviorRisk(
+        window_seconds=float(os.environ.get("RISK_WINDOW_SECONDS", "0")),
+        slots=int(os.environ.get("RISK_SLOTS", "4")),
+        depth=int(os.environ.get("RISK_SKETCH_DEPTH", "4")),
+        width=int(os.environ.get("RISK_SKETCH_WIDTH", "8192")),
+        registers=int(os.environ.get("RISK_HLL_REGISTERS", "16")),
+        deny_points=int(os.environ.get("RISK_DENY_POINTS", "10")),
+        device_points=int(os.environ.get("RISK_DEVICE_POINTS", "20")),
+        source_ip_points=int(os.environ.get("RISK_SOURCE_IP_POINTS", "5")),
+    )
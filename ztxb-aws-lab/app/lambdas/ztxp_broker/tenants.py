@@ -0,0 +1,99 @@
+# app/lambdas/ztxp_broker/tenants.py
+"""
+Issuer-based tenant routing (spec §9 per-domain policy constraints).
+
+TENANTS_PATH names a JSON file, packaged with the function, that maps
+every TAM issuer allowed to use this Broker to its tenant:
+
+    {
+      "ztxp://pep.ztxp-aws-lab": {},
+      "ztxp://pep.acme.example": {"tenant": "acme"},
+      "ztxp://pep.globex.example": {"tenant": "globex",
+                                    "pdp_path": "/v1/data/globex/v2/authz/allow"}
+    }
+
+A TAM from an issuer that is not listed is denied with 403
+unknown_issuer once its signature has been verified. Decisions for a
+tenant go to its ``pdp_path``. Without one, a named tenant uses
+TENANT_PDP_PATH with {tenant} filled in (default
+/v1/data/tenants/{tenant}/authz/allow, the rego package
+``tenants.<tenant>.authz``). An entry with neither uses the global
+PDP_URL policy. Every path is served by the same OPA replicas, circuit
+breaker and timeouts (see PdpClient.evaluate).
+
+OPA keeps the compiled policies, so the Broker holds one small record per
+issuer. Without TENANTS_PATH every issuer is accepted and the global
+policy applies.
+"""
+import json
+import os
+import re
+
+DEFAULT_PDP_PATH_TEMPLATE = "/v1/data/tenants/{tenant}/authz/allow"
+_TENANT_NAME = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+class Tenant:
+    __slots__ = ("issuer", "name", "pdp_path")
+
+    def __init__(self, issuer, name="", pdp_path=None):
+        self.issuer = issuer
+        self.name = name
+        self.pdp_path = pdp_path
+
+    def __repr__(self):
+        return f"Tenant({self.issuer!r}, name={self.name!r}, pdp_path={self.pdp_path!r})"
+
+
+class TenantRouter:
+    """Issuer allow-list; ``tenants=None`` accepts every issuer (single tenant)."""
+
+    def __init__(self, tenants=None):
+        self.tenants = tenants
+        self.counters = {"unknown_issuer": 0}
+
+    @property
+    def enabled(self):
+        return self.tenants is not None
+
+    def __len__(self):
+        return len(self.tenants or ())
+
+    def route(self, issuer):
+        """The Tenant for ``issuer``, or None if it is not allowed."""
+        tenant = self.tenants.get(issuer)
+        if tenant is None:
+            self.counters["unknown_issuer"] += 1
+        return tenant
+
+
+def parse(doc, path_template=DEFAULT_PDP_PATH_TEMPLATE):
+    """Build {issuer: Tenant} from a parsed tenants document; raises ValueError."""
+    if not isinstance(doc, dict):
+        raise ValueError("tenants document must map issuers to tenant settings")
+    tenants = {}
+    for issuer, settings in doc.items():
+        settings = settings or {}
+        if not isinstance(settings, dict):
+            raise ValueError(f"{issuer}: tenant settings must be an object")
+        name = settings.get("tenant", "")
+        if name and not _TENANT_NAME.match(name):
+            raise ValueError(f"{issuer}: tenant name must match {_TENANT_NAME.pattern}")
+        pdp_path = settings.get("pdp_path") or (path_template.format(tenant=name) if name else None)
+        if pdp_path is not None and not pdp_path.startswith("/"):
+            raise ValueError(f"{issuer}: pdp_path must start with /")
+        tenants[issuer] = Tenant(issuer, name, pdp_path)
+    return tenants
+
+
+def load(path, path_template=DEFAULT_PDP_PATH_TEMPLATE):
+    with open(path, "r", encoding="utf-8") as f:
+        return TenantRouter(parse(json.load(f), path_template))
+
+
+def from_env():
+    path = os.environ.get("TENANTS_PATH", "")
+    if not path:
+        return TenantRouter()
+    # A broken tenants file fails the cold start rather than opening the Broker to every issuer
+    return load(path, os.environ.get("TENANT_PDP_PATH", DEFAULT_PDP_PATH_TEMPLATE))
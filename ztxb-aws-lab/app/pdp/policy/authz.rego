@@ -8,7 +8,11 @@
 #   input.principal.role  - e.g. "authenticated"
 #   input.principal.groups - ["writer", "admin", ...]
 #   input.context.device_trust  - "low-risk" | "medium-risk" | "high-risk"
-#   input.context.risk_score    - integer 0-100
+#   input.context.risk_score    - integer 0-100 (raised to the behavior
+#                                 score when the Broker tracks it)
+#   input.context.behavior      - optional {"denies", "devices",
+#                                 "source_ips", "score"} for the subject
+#                                 over the Broker's risk window
 #   input.context.compliant     - boolean
 #   input.resource.id     - "app://notes/..."
 #   input.resource.action - same as input.action
@@ -74,6 +74,11 @@ module "ztxp_broker" {
   project     = var.project
   kms_key_arn = module.kms.signing_key_arn
   pdp_url     = module.pdp_fargate.pdp_url
+
+  decision_key_arn = module.kms.decision_key_arn
+
+  decisions_table_name = module.dynamodb.decisions_table_name
+  decisions_table_arn  = module.dynamodb.decisions_table_arn
 }
 
 ###############################################
@@ -86,7 +91,9 @@ module "api_notes" {
   project           = var.project
   kms_key_arn       = module.kms.signing_key_arn
   broker_invoke_url = module.ztxp_broker.invoke_url
+  decision_key_arn  = module.kms.decision_key_arn
 
-  notes_table_name = module.dynamodb.notes_table_name
-  notes_table_arn  = module.dynamodb.notes_table_arn
+  notes_table_name       = module.dynamodb.notes_table_name
+  notes_table_arn        = module.dynamodb.notes_table_arn
+  notes_table_stream_arn = module.dynamodb.notes_table_stream_arn
 }
@@ -42,6 +42,11 @@ resource "aws_iam_policy" "kms_sign" {
             "kms:SigningAlgorithm" = "ECDSA_SHA_256"
           }
         }
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["kms:GetPublicKey"]
+        Resource = var.decision_key_arn
       }
     ]
   })
@@ -52,6 +57,28 @@ resource "aws_iam_role_policy_attachment" "pep_kms" {
   policy_arn = aws_iam_policy.kms_sign.arn
 }
 
+resource "aws_iam_policy" "pep_revocation_read" {
+  count = startswith(var.revocation_source, "s3://") ? 1 : 0
+  name  = "${var.project}-pep-revocation-read"
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["s3:GetObject"]
+        Resource = "arn:aws:s3:::${trimprefix(var.revocation_source, "s3://")}"
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "pep_revocation" {
+  count      = length(aws_iam_policy.pep_revocation_read)
+  role       = aws_iam_role.pep.name
+  policy_arn = aws_iam_policy.pep_revocation_read[0].arn
+}
+
 ###############################################
 # NOTES LAMBDA ROLE + DDB
 ###############################################
@@ -91,3 +118,55 @@ resource "aws_iam_role_policy_attachment" "notes_ddb" {
   role       = aws_iam_role.notes.name
   policy_arn = aws_iam_policy.notes_dynamo.arn
 }
+
+###############################################
+# SEARCH INDEXER ROLE + STREAM
+###############################################
+
+resource "aws_iam_role" "notes_indexer" {
+  name               = "${var.project}-notes-indexer"
+  assume_role_policy = data.aws_iam_policy_document.notes_assume.json
+}
+
+resource "aws_iam_role_policy_attachment" "notes_indexer_logs" {
+  role       = aws_iam_role.notes_indexer.name
+  policy_arn = "arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole"
+}
+
+resource "aws_iam_policy" "notes_indexer" {
+  name = "${var.project}-notes-indexer"
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:DescribeStream",
+          "dynamodb:GetRecords",
+          "dynamodb:GetShardIterator",
+          "dynamodb:ListStreams",
+        ]
+        Resource = var.notes_table_stream_arn
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:UpdateItem",
+          "dynamodb:DeleteItem",
+        ]
+        Resource = var.notes_table_arn
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["sqs:SendMessage"]
+        Resource = aws_sqs_queue.notes_indexer_dlq.arn
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "notes_indexer" {
+  role       = aws_iam_role.notes_indexer.name
+  policy_arn = aws_iam_policy.notes_indexer.arn
+}
@@ -17,7 +17,58 @@ resource "aws_lambda_function" "notes" {
 
   environment {
     variables = {
-      TABLE_NAME = var.notes_table_name
+      TABLE_NAME              = var.notes_table_name
+      NOTES_CACHE_BACKEND     = var.notes_cache_backend
+      NOTES_CACHE_URL         = var.notes_cache_url
+      NOTES_CACHE_TTL_SECONDS = var.notes_cache_ttl_seconds
+    }
+  }
+}
+
+###############################################
+# SEARCH INDEXER (NOTES TABLE STREAM)
+###############################################
+
+resource "aws_lambda_function" "notes_indexer" {
+  function_name = "${var.project}-notes-indexer"
+  handler       = "note_indexer.lambda_handler"
+  runtime       = "python3.12"
+  role          = aws_iam_role.notes_indexer.arn
+  filename      = data.archive_file.notes_zip.output_path
+  timeout       = 60
+
+  environment {
+    variables = {
+      TABLE_NAME    = var.notes_table_name
+      INDEX_DLQ_URL = aws_sqs_queue.notes_indexer_dlq.url
+    }
+  }
+}
+
+# Records that cannot be indexed: the indexer parks permanent failures
+# here itself, and the mapping sends the batches that still fail after
+# its retries (stream metadata only), so one bad record never blocks a
+# shard until it ages out of the stream.
+resource "aws_sqs_queue" "notes_indexer_dlq" {
+  name                      = "${var.project}-notes-indexer-dlq"
+  message_retention_seconds = 1209600
+  sqs_managed_sse_enabled   = true
+}
+
+resource "aws_lambda_event_source_mapping" "notes_indexer" {
+  event_source_arn        = var.notes_table_stream_arn
+  function_name           = aws_lambda_function.notes_indexer.arn
+  starting_position       = "LATEST"
+  batch_size              = 100
+  function_response_types = ["ReportBatchItemFailures"]
+
+  maximum_retry_attempts         = 5
+  bisect_batch_on_function_error = true
+  maximum_record_age_in_seconds  = 3600
+
+  destination_config {
+    on_failure {
+      destination_arn = aws_sqs_queue.notes_indexer_dlq.arn
     }
   }
 }
@@ -26,10 +77,43 @@ resource "aws_lambda_function" "notes" {
 # PEP LAMBDA (CUSTOM AUTHORIZER)
 ###############################################
 
+locals {
+  pep_dir    = "${path.module}/../../../app/lambdas/pep_authorizer"
+  broker_dir = "${path.module}/../../../app/lambdas/ztxp_broker"
+  pep_build  = "${path.module}/build/pep"
+}
+
+# The PEP bundles its requirements (cryptography, for decision tokens) and
+# the Broker's revocation.py: decision tokens are only honoured after
+# checking the same revocation list. Wheels are fetched for the Lambda
+# platform (python3.12, x86_64), so the build host needs pip but not a
+# matching OS. Rebuilt whenever a source file or the requirements change.
+resource "terraform_data" "pep_build" {
+  triggers_replace = [
+    [for f in sort(fileset(local.pep_dir, "*.{py,txt}")) : filesha1("${local.pep_dir}/${f}")],
+    filesha1("${local.broker_dir}/revocation.py"),
+  ]
+
+  provisioner "local-exec" {
+    interpreter = ["/bin/sh", "-c"]
+    command     = <<-EOT
+      set -e
+      rm -rf "${local.pep_build}"
+      mkdir -p "${local.pep_build}"
+      cp "${local.pep_dir}"/*.py "${local.broker_dir}/revocation.py" "${local.pep_build}/"
+      python3 -m pip install --quiet --no-compile --target "${local.pep_build}" \
+        --platform manylinux2014_x86_64 --implementation cp --python-version 3.12 --only-binary=:all: \
+        -r "${local.pep_dir}/requirements.txt"
+    EOT
+  }
+}
+
 data "archive_file" "pep_zip" {
   type        = "zip"
-  source_dir  = "${path.module}/../../../app/lambdas/pep_authorizer"
+  source_dir  = local.pep_build
   output_path = "${path.module}/pep.zip"
+
+  depends_on = [terraform_data.pep_build]
 }
 
 resource "aws_lambda_function" "pep" {
@@ -39,10 +123,14 @@ resource "aws_lambda_function" "pep" {
   role          = aws_iam_role.pep.arn
   filename      = data.archive_file.pep_zip.output_path
 
+  source_code_hash = data.archive_file.pep_zip.output_base64sha256
+
   environment {
     variables = {
-      KMS_KEY_ARN = var.kms_key_arn
-      BROKER_URL  = var.broker_invoke_url
+      KMS_KEY_ARN       = var.kms_key_arn
+      BROKER_URL        = var.broker_invoke_url
+      DECISION_KEY_ARN  = var.decision_key_arn
+      REVOCATION_SOURCE = var.revocation_source
     }
   }
 }
@@ -6,6 +6,11 @@ variable "kms_key_arn" {
   type = string
 }
 
+variable "decision_key_arn" {
+  description = "Broker decision token key; the PEP only reads its public key"
+  type        = string
+}
+
 variable "notes_table_name" {
   type = string
 }
@@ -14,6 +19,32 @@ variable "notes_table_arn" {
   type = string
 }
 
+variable "notes_table_stream_arn" {
+  type = string
+}
+
 variable "broker_invoke_url" {
   type = string
 }
+
+variable "notes_cache_backend" {
+  description = "Notes read cache: local (per container), redis (shared, needs notes_cache_url) or off"
+  type        = string
+  default     = "local"
+}
+
+variable "notes_cache_url" {
+  type    = string
+  default = ""
+}
+
+variable "notes_cache_ttl_seconds" {
+  type    = number
+  default = 30
+}
+
+variable "revocation_source" {
+  description = "Revocation list checked before honouring decision tokens (same value as the Broker's); empty disables"
+  type        = string
+  default     = ""
+}
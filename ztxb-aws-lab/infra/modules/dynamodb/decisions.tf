@@ -2,13 +2,19 @@ resource "aws_dynamodb_table" "decisions" {
   name         = "${var.project}-ztxp-decisions"
   billing_mode = "PAY_PER_REQUEST"
 
-  hash_key = "tam_hash"
+  hash_key  = "tam_hash"
+  range_key = "event_id"
 
   attribute {
     name = "tam_hash"
     type = "S"
   }
 
+  attribute {
+    name = "event_id"
+    type = "S"
+  }
+
   ttl {
     attribute_name = "expires_at"
     enabled        = true
@@ -18,3 +24,7 @@ resource "aws_dynamodb_table" "decisions" {
 output "decisions_table_name" {
   value = aws_dynamodb_table.decisions.name
 }
+
+output "decisions_table_arn" {
+  value = aws_dynamodb_table.decisions.arn
+}
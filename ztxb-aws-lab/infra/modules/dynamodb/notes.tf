@@ -5,6 +5,10 @@ resource "aws_dynamodb_table" "notes" {
   hash_key  = "user_id"
   range_key = "note_id"
 
+  # Feeds the search indexer (note_indexer.py) with each note's old and new text
+  stream_enabled   = true
+  stream_view_type = "NEW_AND_OLD_IMAGES"
+
   attribute {
     name = "user_id"
     type = "S"
@@ -23,3 +27,7 @@ output "notes_table_name" {
 output "notes_table_arn" {
   value = aws_dynamodb_table.notes.arn
 }
+
+output "notes_table_stream_arn" {
+  value = aws_dynamodb_table.notes.stream_arn
+}
@@ -5,5 +5,14 @@ resource "aws_kms_key" "signing" {
   deletion_window_in_days  = 7
 }
 
+# Broker-only key for signed decision tokens; PEPs may only read its public key
+resource "aws_kms_key" "decision" {
+  description              = "${var.project} decision token signing key"
+  key_usage                = "SIGN_VERIFY"
+  customer_master_key_spec = "ECC_NIST_P256"
+  deletion_window_in_days  = 7
+}
+
 output "signing_key_arn" { value = aws_kms_key.signing.arn }
+output "decision_key_arn" { value = aws_kms_key.decision.arn }
 variable "project" { type = string }
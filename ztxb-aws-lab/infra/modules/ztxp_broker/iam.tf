@@ -50,3 +50,82 @@ resource "aws_iam_role_policy_attachment" "broker_kms" {
   role       = aws_iam_role.broker_lambda.name
   policy_arn = aws_iam_policy.kms_verify.arn
 }
+
+###############################################
+# DECISION TOKEN SIGNING PERMISSIONS
+###############################################
+
+resource "aws_iam_policy" "decision_sign" {
+  name = "${var.project}-broker-decision-sign"
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["kms:Sign"]
+        Resource = var.decision_key_arn
+        Condition = {
+          StringEquals = {
+            "kms:SigningAlgorithm" = "ECDSA_SHA_256"
+          }
+        }
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "broker_decision_sign" {
+  role       = aws_iam_role.broker_lambda.name
+  policy_arn = aws_iam_policy.decision_sign.arn
+}
+
+###############################################
+# AUDIT LOG (DECISIONS TABLE) PERMISSIONS
+###############################################
+
+resource "aws_iam_policy" "audit_write" {
+  name = "${var.project}-broker-audit-write"
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["dynamodb:BatchWriteItem", "dynamodb:PutItem"]
+        Resource = var.decisions_table_arn
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "broker_audit" {
+  role       = aws_iam_role.broker_lambda.name
+  policy_arn = aws_iam_policy.audit_write.arn
+}
+
+###############################################
+# REVOCATION LIST READ PERMISSIONS
+###############################################
+
+resource "aws_iam_policy" "revocation_read" {
+  count = startswith(var.revocation_source, "s3://") ? 1 : 0
+  name  = "${var.project}-broker-revocation-read"
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["s3:GetObject"]
+        Resource = "arn:aws:s3:::${trimprefix(var.revocation_source, "s3://")}"
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "broker_revocation" {
+  count      = length(aws_iam_policy.revocation_read)
+  role       = aws_iam_role.broker_lambda.name
+  policy_arn = aws_iam_policy.revocation_read[0].arn
+}
@@ -17,10 +17,26 @@ resource "aws_lambda_function" "broker" {
 
   timeout = 5
 
+  # Hard cap on concurrent broker executions; API Gateway answers 429
+  # beyond it instead of queueing more KMS/PDP work.
+  reserved_concurrent_executions = var.reserved_concurrency
+
   environment {
     variables = {
-      PDP_URL     = var.pdp_url
-      KMS_KEY_ARN = var.kms_key_arn
+      PDP_URL                 = var.pdp_url
+      PDP_URLS                = join(",", var.pdp_urls)
+      KMS_KEY_ARN             = var.kms_key_arn
+      PDP_STALE_ALLOW_SECONDS = var.pdp_stale_allow_seconds
+      AUDIT_SINKS             = "dynamodb"
+      AUDIT_TABLE_NAME        = var.decisions_table_name
+      DECISION_KEY_ARN        = var.decision_key_arn
+      ADMISSION_RATE          = var.admission_rate
+      ADMISSION_BURST         = var.admission_burst
+      PROFILE_SAMPLE_EVERY    = var.profile_sample_every
+      PROFILE_SECONDS         = var.profile_seconds
+      REVOCATION_SOURCE       = var.revocation_source
+      RISK_WINDOW_SECONDS     = var.risk_window_seconds
+      TENANTS_PATH            = var.tenants_path
     }
   }
 }
@@ -77,6 +93,80 @@ variable "pdp_url" {
   type = string
 }
 
+variable "decision_key_arn" {
+  description = "KMS key the broker signs decision tokens with"
+  type        = string
+}
+
+variable "decisions_table_name" {
+  description = "DynamoDB table receiving the broker's audit/decision log"
+  type        = string
+}
+
+variable "decisions_table_arn" {
+  type = string
+}
+
+variable "pdp_urls" {
+  description = "Optional list of OPA replica addresses (host[:port]); overrides pdp_url when set"
+  type        = list(string)
+  default     = []
+}
+
+variable "pdp_stale_allow_seconds" {
+  description = "Grace period for serving a cached allow while the PDP circuit is open (0 disables)"
+  type        = number
+  default     = 0
+}
+
+variable "reserved_concurrency" {
+  description = "Reserved concurrent executions for the broker (-1 = unreserved)"
+  type        = number
+  default     = -1
+}
+
+variable "admission_rate" {
+  description = "Requests per second allowed per subject, device and source IP (0 disables)"
+  type        = number
+  default     = 50
+}
+
+variable "admission_burst" {
+  description = "Token bucket depth for the per-subject/device/source IP rate limits"
+  type        = number
+  default     = 100
+}
+
+variable "revocation_source" {
+  description = "Revocation list (revocation.py format): s3://bucket/key or a path in the package; empty disables checks"
+  type        = string
+  default     = ""
+}
+
+variable "tenants_path" {
+  description = "Issuer allow-list and per-tenant OPA paths (tenants.py JSON, path in the package); empty = single tenant"
+  type        = string
+  default     = ""
+}
+
+variable "risk_window_seconds" {
+  description = "Sliding window for per-subject deny/device/source IP risk sketches merged into the OPA input (0 disables)"
+  type        = number
+  default     = 0
+}
+
+variable "profile_sample_every" {
+  description = "Profile 1 in K broker invocations; stacks go to CloudWatch Logs as ZTXP_PROFILE lines (0 = off)"
+  type        = number
+  default     = 0
+}
+
+variable "profile_seconds" {
+  description = "Profile every invocation during the first N seconds of each container (0 = off)"
+  type        = number
+  default     = 0
+}
+
 ###############################################
 # OUTPUTS
 ###############################################
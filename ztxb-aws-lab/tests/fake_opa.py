@@ -0,0 +1,121 @@
+# tests/fake_opa.py
+"""Local multi-process stand-in for a pool of OPA replicas.
+
+Each replica is a separate process running a small HTTP server that
+answers ``POST /v1/data/authz/allow`` with the same decision logic as
+``app/pdp/policy/authz.rego`` and ``GET /health`` with 200 (or 503 when
+marked unhealthy). Latency and health can be changed per replica while
+the cluster is running, which makes it usable for hedging / ejection
+tests as well as local load experiments.
+
+    with FakeOpaCluster(replicas=3) as opa:
+        opa.set_latency(0, 0.5)
+        client = pdp_client.PdpClient(opa.urls)
+"""
+import json
+import multiprocessing
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def authz_allow(opa_input):
+    """Python mirror of authz.rego's ``allow`` rule."""
+    action = opa_input.get("action")
+    groups = opa_input.get("principal", {}).get("groups", []) or []
+    ctx = opa_input.get("context", {})
+    high_risk = ctx.get("device_trust") == "high-risk"
+    compliant = ctx.get("compliant") is True
+
+    if action == "notes:Read" and not high_risk:
+        return True
+    if (action == "notes:Write" and "writer" in groups and compliant
+            and not high_risk and ctx.get("risk_score", 100) < 70):
+        return True
+    return "admin" in groups and compliant and not high_risk
+
+
+def _serve(port_queue, latency, healthy, served):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, body):
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            if self.path == "/health" and healthy.value:
+                self._reply(200, {})
+            else:
+                self._reply(503, {})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            doc = json.loads(self.rfile.read(length) or b"{}")
+            with served.get_lock():
+                served.value += 1
+            if latency.value:
+                time.sleep(latency.value)
+            if not healthy.value:
+                self._reply(503, {"code": "unavailable"})
+                return
+            self._reply(200, {"result": authz_allow(doc.get("input", {}))})
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class FakeOpaCluster:
+    """Start ``replicas`` fake OPA processes on ephemeral localhost ports."""
+
+    def __init__(self, replicas=2, latency=0.0, path="/v1/data/authz/allow"):
+        self._ctx = multiprocessing.get_context("fork")
+        self.path = path
+        self._latency = [self._ctx.Value("d", latency) for _ in range(replicas)]
+        self._healthy = [self._ctx.Value("b", True) for _ in range(replicas)]
+        self._served = [self._ctx.Value("i", 0) for _ in range(replicas)]
+        self._procs = []
+        self.ports = []
+
+    def start(self):
+        queue = self._ctx.Queue()
+        for i in range(len(self._latency)):
+            proc = self._ctx.Process(
+                target=_serve,
+                args=(queue, self._latency[i], self._healthy[i], self._served[i]),
+                daemon=True,
+            )
+            proc.start()
+            self._procs.append(proc)
+            self.ports.append(queue.get(timeout=10))
+        return self
+
+    def stop(self):
+        for proc in self._procs:
+            proc.terminate()
+            proc.join(timeout=5)
+        self._procs = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def urls(self):
+        return [f"http://127.0.0.1:{port}{self.path}" for port in self.ports]
+
+    def set_latency(self, replica, seconds):
+        self._latency[replica].value = seconds
+
+    def set_healthy(self, replica, healthy):
+        self._healthy[replica].value = healthy
+
+    def served(self, replica):
+        return self._served[replica].value
@@ -0,0 +1,571 @@
+# tests/stack_harness.py
+"""Local end-to-end harness for the authorization path.
+
+Wires the three Lambdas the way API Gateway does:
+
+    pep_authorizer.lambda_handler
+        -> ztxp_broker.lambda_handler   (in-process, JSON bodies as on the wire;
+                                         transport="inprocess" calls
+                                         evaluate_signed instead)
+            -> OPA                      (FakeOpaCluster, real HTTP)
+    -> notes_api.lambda_handler         (only when the authorizer allows)
+
+AWS services are replaced by local stand-ins, passed in through
+patched ``boto3.client`` / ``boto3.resource``:
+
+  * FakeKms      — Sign / Verify / GetPublicKey with real P-256 keys,
+                   plus a configurable per-call latency
+  * FakeDynamoDB — tables with enough of the expression language for the
+                   Notes API, the search index and the audit sink's
+                   BatchWriteItem, plus a configurable per-call latency
+
+Every request records the time spent in each stage (KMS sign, broker,
+KMS verify, PDP, Notes API, DynamoDB) and end to end, so a change to the
+stack can be measured without deploying it:
+
+    with FakeOpaCluster(replicas=2) as opa:
+        stack = LambdaStack(opa.ports, kms_latency=0.015)
+        report = stack.run(EventMix(users=50), requests=2000)
+        print(report.format())
+
+``bench/bench_lambda_stack.py`` is the command-line front end.
+"""
+import base64
+import copy
+import importlib.util
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, utils
+from cryptography.exceptions import InvalidSignature
+
+_LAMBDAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "lambdas")
+
+TAM_KEY_ARN = "arn:aws:kms:local:000000000000:key/ztxp-tam"
+DECISION_KEY_ARN = "arn:aws:kms:local:000000000000:key/ztxp-decision"
+NOTES_TABLE = "ztxp-notes"
+DECISIONS_TABLE = "ztxp-decisions"
+
+
+# ---------------------------------------------------------------------------
+# Stage timing
+# ---------------------------------------------------------------------------
+
+class StageTimer:
+    """Per-request stage durations; stages may nest and repeat."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self.requests = []
+
+    @contextmanager
+    def request(self):
+        self._local.current = current = defaultdict(float)
+        started = time.perf_counter()
+        try:
+            yield current
+        finally:
+            current["end_to_end"] = time.perf_counter() - started
+            self._local.current = None
+            self.requests.append(dict(current))
+
+    @contextmanager
+    def stage(self, name):
+        current = getattr(self._local, "current", None)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if current is not None:
+                current[name] += time.perf_counter() - started
+
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return timed
+
+
+# ---------------------------------------------------------------------------
+# KMS
+# ---------------------------------------------------------------------------
+
+class FakeKms:
+    """KMS Sign / Verify / GetPublicKey backed by real P-256 keys (one per KeyId)."""
+
+    def __init__(self, latency=0.0, timer=None, sign_stages=None):
+        self.latency = latency
+        self.timer = timer or StageTimer()
+        self.sign_stages = sign_stages or {}  # KeyId -> stage name (default "kms.sign")
+        self.calls = Counter()
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def _key(self, key_id):
+        with self._lock:
+            if key_id not in self._keys:
+                self._keys[key_id] = ec.generate_private_key(ec.SECP256R1())
+            return self._keys[key_id]
+
+    def _call(self, op):
+        self.calls[op] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def sign(self, KeyId, Message, MessageType, SigningAlgorithm):
+        with self.timer.stage(self.sign_stages.get(KeyId, "kms.sign")):
+            self._call("sign")
+            assert MessageType == "DIGEST" and SigningAlgorithm == "ECDSA_SHA_256"
+            return {"KeyId": KeyId, "Signature": self._key(KeyId).sign(Message, ec.ECDSA(utils.Prehashed(hashes.SHA256())))}
+
+    def verify(self, KeyId, Message, MessageType, Signature, SigningAlgorithm):
+        with self.timer.stage("kms.verify"):
+            self._call("verify")
+            try:
+                self._key(KeyId).public_key().verify(Signature, Message, ec.ECDSA(utils.Prehashed(hashes.SHA256())))
+                return {"KeyId": KeyId, "SignatureValid": True}
+            except InvalidSignature:
+                return {"KeyId": KeyId, "SignatureValid": False}
+
+    def get_public_key(self, KeyId):
+        self._call("get_public_key")
+        der = self._key(KeyId).public_key().public_bytes(serialization.Encoding.DER,
+                                                         serialization.PublicFormat.SubjectPublicKeyInfo)
+        return {"KeyId": KeyId, "PublicKey": der}
+
+
+# ---------------------------------------------------------------------------
+# DynamoDB
+# ---------------------------------------------------------------------------
+
+_CLAUSE = re.compile(r"\b(SET|REMOVE|ADD)\b")
+_CONDITION = re.compile(r"^(attribute_exists|attribute_not_exists)\((.+)\)$")
+
+
+def _client_error(code, op):
+    return ClientError({"Error": {"Code": code, "Message": code}}, op)
+
+
+def _path(expr, names):
+    return [names.get(part, part) for part in expr.strip().split(".")]
+
+
+class FakeTable:
+    """One table: items keyed by (hash, range) with a small expression interpreter.
+
+    Supports what the Notes API, its search index and the audit sink use:
+    put/get/delete/update_item (SET / REMOVE / ADD on nested map paths,
+    attribute_exists / attribute_not_exists conditions, ALL_OLD) and
+    query on ``Key(hash).eq(...)`` optionally ``& Key(range).begins_with(...)``.
+    """
+
+    def __init__(self, name, key_names, owner):
+        self.name = name
+        self.key_names = key_names
+        self.owner = owner
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def _key(self, key):
+        return tuple(key[name] for name in self.key_names)
+
+    def _check(self, item, condition, op):
+        if not condition:
+            return
+        match = _CONDITION.match(condition.strip())
+        if match is None:
+            raise NotImplementedError(condition)
+        exists = item is not None and match.group(2) in item
+        if exists != (match.group(1) == "attribute_exists"):
+            raise _client_error("ConditionalCheckFailedException", op)
+
+    def put_item(self, Item, ConditionExpression=None):
+        with self.owner.call("PutItem"), self._lock:
+            key = self._key(Item)
+            self._check(self.items.get(key), ConditionExpression, "PutItem")
+            self.items[key] = copy.deepcopy(Item)
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        with self.owner.call("GetItem"), self._lock:
+            item = self.items.get(self._key(Key))
+            return {"Item": copy.deepcopy(item)} if item is not None else {}
+
+    def delete_item(self, Key, ConditionExpression=None, ReturnValues="NONE"):
+        with self.owner.call("DeleteItem"), self._lock:
+            key = self._key(Key)
+            self._check(self.items.get(key), ConditionExpression, "DeleteItem")
+            old = self.items.pop(key, None)
+        return {"Attributes": old} if ReturnValues == "ALL_OLD" and old is not None else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ConditionExpression=None, ReturnValues="NONE"):
+        names, values = ExpressionAttributeNames or {}, ExpressionAttributeValues or {}
+        with self.owner.call("UpdateItem"), self._lock:
+            key = self._key(Key)
+            old = self.items.get(key)
+            self._check(old, ConditionExpression, "UpdateItem")
+            item = copy.deepcopy(old) if old is not None else dict(Key)
+            parts = _CLAUSE.split(UpdateExpression)
+            for action, body in zip(parts[1::2], parts[2::2]):
+                for clause in filter(None, (c.strip() for c in body.split(","))):
+                    if action == "SET":
+                        target, _, value = clause.partition("=")
+                        *parents, leaf = _path(target, names)
+                        node = item
+                        for part in parents:
+                            node = node.get(part)
+                            if not isinstance(node, dict):
+                                raise _client_error("ValidationException", "UpdateItem")
+                        node[leaf] = copy.deepcopy(values[value.strip()])
+                    elif action == "REMOVE":
+                        *parents, leaf = _path(clause, names)
+                        node = item
+                        for part in parents:
+                            node = node.get(part) if isinstance(node, dict) else None
+                        if isinstance(node, dict):
+                            node.pop(leaf, None)
+                    else:  # ADD <number attribute> :v
+                        target, value = clause.split()
+                        name = _path(target, names)[0]
+                        item[name] = item.get(name, 0) + values[value]
+            self.items[key] = item
+        return {"Attributes": old} if ReturnValues == "ALL_OLD" and old is not None else {}
+
+    def query(self, KeyConditionExpression, Limit=None, **kwargs):
+        with self.owner.call("Query"), self._lock:
+            found = [copy.deepcopy(item) for key, item in sorted(self.items.items(), key=lambda kv: kv[0])
+                     if _matches(KeyConditionExpression, item)]
+        return {"Items": found[:Limit] if Limit else found, "Count": len(found)}
+
+
+def _matches(condition, item):
+    expression = condition.get_expression()
+    operator, values = expression["operator"], expression["values"]
+    if operator == "AND":
+        return all(_matches(c, item) for c in values)
+    key, value = values
+    if operator == "=":
+        return item.get(key.name) == value
+    if operator == "begins_with":
+        return str(item.get(key.name, "")).startswith(value)
+    raise NotImplementedError(operator)
+
+
+def _from_attribute_value(value):
+    (kind, raw), = value.items()
+    if kind == "N":
+        return float(raw) if "." in raw else int(raw)
+    if kind == "M":
+        return {k: _from_attribute_value(v) for k, v in raw.items()}
+    if kind == "L":
+        return [_from_attribute_value(v) for v in raw]
+    return raw
+
+
+class FakeDynamoDB:
+    """``boto3.resource("dynamodb")`` and the client calls the audit sink makes."""
+
+    def __init__(self, tables, latency=0.0, timer=None):
+        self.latency = latency
+        self.timer = timer or StageTimer()
+        self.calls = Counter()
+        self._tables = {name: FakeTable(name, key_names, self) for name, key_names in tables.items()}
+
+    @contextmanager
+    def call(self, op):
+        with self.timer.stage("dynamodb"):
+            self.calls[op] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            yield
+
+    def Table(self, name):
+        return self._tables[name]
+
+    def batch_write_item(self, RequestItems):
+        with self.call("BatchWriteItem"):
+            for name, requests in RequestItems.items():
+                table = self._tables[name]
+                for request in requests:
+                    item = {k: _from_attribute_value(v) for k, v in request["PutRequest"]["Item"].items()}
+                    with table._lock:
+                        table.items[table._key(item)] = item
+        return {"UnprocessedItems": {}}
+
+
+# ---------------------------------------------------------------------------
+# Event mix
+# ---------------------------------------------------------------------------
+
+def _b64(data):
+    return base64.b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+
+WORDS = ("budget roadmap quarterly review meeting action owner deadline release deploy staging "
+         "incident draft proposal design latency cache policy device broker customer").split()
+
+
+class EventMix:
+    """Seeded population of users and a weighted mix of Notes API calls.
+
+    Users get a role (writer / reader / admin) and a device. A few devices
+    are non-compliant or high-risk, so the mix includes policy denies.
+    """
+
+    DEFAULT_WEIGHTS = {"list": 30, "get": 30, "search": 10, "create": 15, "update": 10, "delete": 5}
+
+    def __init__(self, users=50, weights=None, seed=1, noncompliant_share=0.05, high_risk_share=0.03):
+        self.rng = random.Random(seed)
+        self.weights = dict(weights or self.DEFAULT_WEIGHTS)
+        self.users = []
+        for i in range(users):
+            roll = self.rng.random()
+            groups = ["admin"] if roll < 0.05 else ["writer"] if roll < 0.65 else []
+            self.users.append({
+                "sub": str(uuid.UUID(int=self.rng.getrandbits(128))),
+                "groups": groups,
+                "device": f"dev-{i:04d}",
+                "compliant": self.rng.random() >= noncompliant_share,
+                "trust": "high-risk" if self.rng.random() < high_risk_share else "low-risk",
+                "ip": f"198.51.{100 + i // 250}.{i % 250 + 1}",
+                "notes": [],
+                "decision_token": None,
+            })
+
+    def text(self, words):
+        return " ".join(self.rng.choice(WORDS) for _ in range(words))
+
+    def next_request(self):
+        """(user, method, proxy path, query params, body) for the next call."""
+        user = self.rng.choice(self.users)
+        op = self.rng.choices(list(self.weights), weights=list(self.weights.values()))[0]
+        if op in ("get", "update", "delete") and not user["notes"]:
+            op = "create" if user["groups"] else "list"
+        note_id = self.rng.choice(user["notes"]) if user["notes"] else None
+        if op == "list":
+            return user, "GET", None, None, None
+        if op == "get":
+            return user, "GET", note_id, None, None
+        if op == "search":
+            return user, "GET", "search", {"q": self.rng.choice(WORDS)}, None
+        if op == "create":
+            return user, "POST", None, None, {"title": self.text(3), "content": self.text(self.rng.randint(10, 400))}
+        if op == "update":
+            return user, "PUT", note_id, None, {"title": self.text(3), "content": self.text(self.rng.randint(10, 400))}
+        return user, "DELETE", note_id, None, None
+
+    def authorizer_event(self, user, method, proxy):
+        path = "/notes" + (f"/{proxy}" if proxy else "")
+        headers = {
+            "authorization": "Bearer " + ".".join((_b64({"alg": "none"}),
+                                                   _b64({"sub": user["sub"], "cognito:groups": user["groups"]}),
+                                                   "sig")),
+            "x-device-id": user["device"],
+            "x-device-compliant": "true" if user["compliant"] else "false",
+            "x-device-trust": user["trust"],
+        }
+        if user["decision_token"]:
+            headers["x-ztxp-decision"] = user["decision_token"]
+        return {
+            "version": "2.0",
+            "type": "REQUEST",
+            "routeKey": f"{method} /notes/{{proxy+}}",
+            "rawPath": path,
+            "headers": headers,
+            "requestContext": {
+                "requestId": str(uuid.UUID(int=self.rng.getrandbits(128))),
+                "http": {"method": method, "path": path, "sourceIp": user["ip"]},
+            },
+        }
+
+
+# ---------------------------------------------------------------------------
+# Stack
+# ---------------------------------------------------------------------------
+
+def _load(lambda_dir, module_name, packaged_from=()):
+    """Import a Lambda's handler with its directory (and any directory its
+    zip also bundles files from, see api_notes/lambda.tf) on sys.path."""
+    path = os.path.join(_LAMBDAS, lambda_dir)
+    for extra in packaged_from:
+        extra = os.path.join(_LAMBDAS, extra)
+        if extra not in sys.path:
+            sys.path.append(extra)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(path, "handler.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class LambdaStack:
+    """PEP authorizer, Broker and Notes API wired together in one process."""
+
+    def __init__(self, opa_ports, kms_latency=0.0, dynamodb_latency=0.0, envelope="embedded",
+                 transport="http", decision_tokens=False, audit=True, env=None):
+        self.timer = StageTimer()
+        self.kms = FakeKms(kms_latency, self.timer, sign_stages={DECISION_KEY_ARN: "kms.sign_decision"})
+        self.dynamodb = FakeDynamoDB({NOTES_TABLE: ("user_id", "note_id"), DECISIONS_TABLE: ("tam_hash", "event_id")},
+                                     dynamodb_latency, self.timer)
+        environment = {
+            "KMS_KEY_ARN": TAM_KEY_ARN,
+            "BROKER_URL": "http://broker.local",
+            "BROKER_ENVELOPE": envelope,
+            "DECISION_KEY_ARN": DECISION_KEY_ARN if decision_tokens else "",
+            "PDP_URLS": ",".join(f"127.0.0.1:{port}" for port in opa_ports),
+            "AUDIT_SINKS": "dynamodb" if audit else "",
+            "AUDIT_TABLE_NAME": DECISIONS_TABLE,
+            "TABLE_NAME": NOTES_TABLE,
+            **(env or {}),
+        }
+
+        def client(service, *args, **kwargs):
+            return {"kms": self.kms, "dynamodb": self.dynamodb}[service]
+
+        with patch.dict(os.environ, environment), patch("boto3.client", client), \
+                patch("boto3.resource", lambda service, *a, **kw: self.dynamodb):
+            self.pep = _load("pep_authorizer", "stack_pep_handler", packaged_from=["ztxp_broker"])
+            self.broker = _load("ztxp_broker", "stack_broker_handler")
+            self.notes = _load("notes_api", "stack_notes_handler")
+
+        if transport == "inprocess":  # what BROKER_TRANSPORT=inprocess sets up, with this stack's Broker
+            self.pep.broker_transport = self.pep.InProcessTransport(self.broker)
+            self.pep.broker_transport.send = self.timer.wrap("broker", self.pep.broker_transport.send)
+        else:
+            self.pep.call_broker = self._call_broker
+        self.broker.call_pdp = self.timer.wrap("pdp", self.broker.call_pdp)
+        self.outcomes = Counter()
+
+    def _call_broker(self, request_body):
+        """What the PEP's urllib POST does, minus the network."""
+        with self.timer.stage("broker"):
+            event = {
+                "body": json.dumps(request_body),
+                "requestContext": {"http": {"method": "POST", "path": "/ztxp/evaluate", "sourceIp": "10.0.1.10"}},
+            }
+            response = self.broker.lambda_handler(event, None)
+            return json.loads(response["body"])
+
+    def handle(self, mix):
+        """Drive one request from ``mix`` through the stack; returns the final status."""
+        user, method, proxy, params, body = mix.next_request()
+        event = mix.authorizer_event(user, method, proxy)
+        with self.timer.request():
+            with self.timer.stage("authorizer"):
+                auth = self.pep.lambda_handler(event, None)
+            if not auth["isAuthorized"]:
+                self.outcomes["403 " + (auth["context"].get("ztxp_reason") or auth["context"].get("reason", ""))] += 1
+                return 403
+            api_event = {
+                **event,
+                "pathParameters": {"proxy": proxy} if proxy else None,
+                "queryStringParameters": params,
+                "body": json.dumps(body) if body is not None else None,
+                "requestContext": {**event["requestContext"], "authorizer": {"lambda": auth["context"]}},
+            }
+            with self.timer.stage("notes_api"):
+                response = self.notes.lambda_handler(api_event, None)
+
+        status = response["statusCode"]
+        self.outcomes[f"{status} {method}"] += 1
+        user["decision_token"] = response["headers"].get("X-ZTXP-Decision") or user["decision_token"]
+        if method == "POST" and status == 201:
+            user["notes"].append(json.loads(response["body"])["note_id"])
+        elif method == "DELETE" and status == 200:
+            user["notes"].remove(proxy)
+        return status
+
+    def run(self, mix, requests=1000, warmup=50):
+        for _ in range(warmup):
+            self.handle(mix)
+        self.timer.requests.clear()
+        self.outcomes.clear()
+        self.kms.calls.clear()
+        self.dynamodb.calls.clear()
+        started = time.perf_counter()
+        for _ in range(requests):
+            self.handle(mix)
+        elapsed = time.perf_counter() - started
+        self.broker.audit_log.flush(timeout=5.0)
+        return Report(self.timer.requests, elapsed, self.outcomes, self.kms.calls, self.dynamodb.calls)
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+# (label, stage or derived name, indent); "own" rows subtract the nested stages
+_ROWS = (
+    ("end to end", "end_to_end", 0),
+    ("authorizer (PEP Lambda)", "authorizer", 1),
+    ("PEP own work", "pep_own", 2),
+    ("KMS Sign", "kms.sign", 2),
+    ("broker (Lambda)", "broker", 2),
+    ("broker own work", "broker_own", 3),
+    ("KMS Verify", "kms.verify", 3),
+    ("PDP (OPA over HTTP)", "pdp", 3),
+    ("KMS Sign (decision token)", "kms.sign_decision", 3),
+    ("Notes API Lambda", "notes_api", 1),
+    ("DynamoDB (notes + audit)", "dynamodb", 1),
+)
+
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+class Report:
+    def __init__(self, requests, elapsed, outcomes, kms_calls, dynamodb_calls):
+        self.elapsed = elapsed
+        self.outcomes = Counter(outcomes)
+        self.kms_calls = Counter(kms_calls)
+        self.dynamodb_calls = Counter(dynamodb_calls)
+        self.samples = defaultdict(list)
+        for stages in requests:
+            stages = dict(stages)
+            stages["pep_own"] = stages.get("authorizer", 0) - stages.get("kms.sign", 0) - stages.get("broker", 0)
+            if "broker" in stages:
+                stages["broker_own"] = (stages["broker"] - stages.get("kms.verify", 0) - stages.get("pdp", 0)
+                                        - stages.get("kms.sign_decision", 0))
+            for name, seconds in stages.items():
+                self.samples[name].append(seconds)
+        self.count = len(requests)
+
+    def stats(self, name):
+        """{"n", "mean", "p50", "p95", "p99"} in milliseconds for one stage."""
+        ordered = sorted(self.samples.get(name, ()))
+        if not ordered:
+            return None
+        return {
+            "n": len(ordered),
+            "mean": sum(ordered) / len(ordered) * 1000,
+            "p50": _percentile(ordered, 50) * 1000,
+            "p95": _percentile(ordered, 95) * 1000,
+            "p99": _percentile(ordered, 99) * 1000,
+        }
+
+    def format(self):
+        lines = [f"{self.count} requests in {self.elapsed:.2f}s ({self.count / self.elapsed:.0f} req/s)",
+                 f"{'stage (ms)':<32} {'n':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}"]
+        for label, name, indent in _ROWS:
+            s = self.stats(name)
+            if s:
+                lines.append(f"{'  ' * indent + label:<32} {s['n']:>6} {s['mean']:>8.2f} {s['p50']:>8.2f} "
+                             f"{s['p95']:>8.2f} {s['p99']:>8.2f}")
+        lines.append("outcomes:  " + ", ".join(f"{k}: {v}" for k, v in sorted(self.outcomes.items())))
+        lines.append("KMS calls: " + ", ".join(f"{k}: {v}" for k, v in sorted(self.kms_calls.items())))
+        lines.append("DynamoDB:  " + ", ".join(f"{k}: {v}" for k, v in sorted(self.dynamodb_calls.items())))
+        return "\n".join(lines)
@@ -0,0 +1,112 @@
+# tests/test_admission.py
+"""Unit tests for the Broker's admission control (token buckets, negative cache)."""
+import os
+import sys
+
+import pytest
+
+_broker_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "ztxp_broker")
+sys.path.insert(0, _broker_dir)
+
+import admission  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class TestTokenBuckets:
+    def test_burst_then_refill(self):
+        clock = FakeClock()
+        buckets = admission.TokenBuckets(rate=2, burst=3, clock=clock)
+
+        assert [buckets.take("k") for _ in range(4)] == [True, True, True, False]
+        assert buckets.retry_after("k") == 1
+        clock.advance(0.5)
+        assert buckets.take("k")
+        assert not buckets.take("k")
+
+    def test_refill_capped_at_burst(self):
+        clock = FakeClock()
+        buckets = admission.TokenBuckets(rate=10, burst=2, clock=clock)
+        buckets.take("k")
+        clock.advance(60)
+        assert [buckets.take("k") for _ in range(3)] == [True, True, False]
+
+    def test_peek_does_not_consume(self):
+        buckets = admission.TokenBuckets(rate=1, burst=1, clock=FakeClock())
+        assert buckets.peek("k") and buckets.peek("k")
+        assert buckets.take("k")
+        assert not buckets.peek("k")
+
+    def test_keys_are_independent_and_bounded(self):
+        buckets = admission.TokenBuckets(rate=1, burst=1, max_keys=2, clock=FakeClock())
+        assert buckets.take("a") and buckets.take("b") and buckets.take("c")
+        assert len(buckets._buckets) == 2
+        assert buckets.take("a")  # evicted, so it starts full again
+        assert not buckets.take("c")
+
+    def test_disabled(self):
+        buckets = admission.TokenBuckets(rate=0, burst=0)
+        assert all(buckets.take("k") for _ in range(100))
+
+
+class TestNegativeCache:
+    def test_expires(self):
+        clock = FakeClock()
+        cache = admission.NegativeCache(ttl=60, clock=clock)
+        cache.add("sig", "invalid_signature")
+        assert cache.get("sig") == "invalid_signature"
+        clock.advance(61)
+        assert cache.get("sig") is None
+
+    def test_bounded(self):
+        cache = admission.NegativeCache(ttl=60, max_entries=2, clock=FakeClock())
+        for key in ("a", "b", "c"):
+            cache.add(key, "x")
+        assert cache.get("a") is None
+        assert cache.get("c") == "x"
+
+    def test_ignores_empty_keys(self):
+        cache = admission.NegativeCache(ttl=60)
+        cache.add(None, "x")
+        assert cache.get(None) is None
+
+
+class TestAdmissionControl:
+    def test_rate_limits_each_dimension(self):
+        control = admission.AdmissionControl(
+            rate_limits=admission.TokenBuckets(rate=1, burst=1, clock=FakeClock()))
+        tam = {"subject": {"id": "alice"}, "device": {"id": "d1"}, "context": {"source_ip": "10.0.0.1"}}
+        control.after_verify(tam)
+
+        other_device = {"subject": {"id": "bob"}, "device": {"id": "d1"}, "context": {}}
+        with pytest.raises(admission.Rejected) as exc:
+            control.after_verify(other_device)
+        assert exc.value.status == 429
+        assert exc.value.reason == "rate_limited (dev)"
+
+    def test_rejected_request_charges_no_bucket(self):
+        control = admission.AdmissionControl(
+            rate_limits=admission.TokenBuckets(rate=1, burst=1, clock=FakeClock()))
+        control.after_verify({"subject": {"id": "alice"}, "device": {"id": "d1"}, "context": {}})
+
+        bob = {"subject": {"id": "bob"}, "device": {"id": "d1"}, "context": {"source_ip": "10.0.0.2"}}
+        with pytest.raises(admission.Rejected):
+            control.after_verify(bob)
+        # Refused on the device, so bob's and the IP's tokens are still there
+        control.after_verify({**bob, "device": {"id": "d2"}})
+
+    def test_concurrency_limit(self):
+        limit = admission.ConcurrencyLimit(2)
+        assert limit.acquire() and limit.acquire()
+        assert not limit.acquire()
+        limit.release()
+        assert limit.acquire()
@@ -0,0 +1,159 @@
+# tests/test_audit.py
+"""Unit tests for the Broker's asynchronous audit log."""
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+_broker_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "ztxp_broker")
+sys.path.insert(0, _broker_dir)
+
+import audit  # noqa: E402
+
+
+class MemorySink:
+    def __init__(self, gate=None):
+        self.batches = []
+        self.gate = gate
+
+    def write_batch(self, records):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.batches.append(list(records))
+
+    @property
+    def records(self):
+        return [r for b in self.batches for r in b]
+
+
+class FakeDynamoDB:
+    def __init__(self, unprocessed_rounds=0):
+        self.calls = []
+        self.unprocessed_rounds = unprocessed_rounds
+
+    def batch_write_item(self, RequestItems):
+        self.calls.append(RequestItems)
+        for requests in RequestItems.values():
+            keys = [(r["PutRequest"]["Item"]["tam_hash"]["S"], r["PutRequest"]["Item"]["event_id"]["S"])
+                    for r in requests]
+            if len(keys) != len(set(keys)):
+                raise ValueError("Provided list of item keys contains duplicates")
+        if self.unprocessed_rounds:
+            self.unprocessed_rounds -= 1
+            return {"UnprocessedItems": RequestItems}
+        return {"UnprocessedItems": {}}
+
+
+class TestAuditLog:
+    def test_batches_and_flushes(self):
+        sink = MemorySink()
+        log = audit.AuditLog([sink], batch_size=10, max_batch_age=5.0)
+        for i in range(25):
+            log.record("decision", message_id=str(i), decision="deny")
+
+        assert log.flush(timeout=2.0) is True
+        assert len(sink.records) == 25
+        assert max(len(b) for b in sink.batches) <= 10
+        assert log.counters["written"] == 25
+
+    def test_disabled_without_sinks(self):
+        log = audit.AuditLog([])
+        log.record("decision", decision="allow")
+        assert log.enabled is False
+        assert log.flush() is True
+
+    def test_drops_when_full(self):
+        gate = threading.Event()
+        sink = MemorySink(gate=gate)
+        log = audit.AuditLog([sink], max_queue=5, batch_size=1, high_water=1.0)
+        for i in range(20):
+            log.record("signature_rejected", message_id=str(i), decision="deny")
+
+        assert log.counters["dropped"] > 0
+        gate.set()
+        log.flush(timeout=2.0)
+        assert len(sink.records) + log.counters["dropped"] == 20
+
+    def test_samples_allows_under_overload(self):
+        gate = threading.Event()
+        log = audit.AuditLog([MemorySink(gate=gate)], max_queue=100, high_water=0.1,
+                             batch_size=1, overload_sample_rate=0.0)
+        for _ in range(20):
+            log.record("decision", decision="deny")
+        for _ in range(20):
+            log.record("decision", decision="allow")
+
+        assert log.counters["sampled_out"] == 20
+        assert log.counters["dropped"] == 0
+        gate.set()
+
+    def test_flush_pending_writes_young_partial_batch(self):
+        # The last invocation before the container idles must not leave records behind
+        sink = MemorySink()
+        log = audit.AuditLog([sink], batch_size=25, max_batch_age=60.0)
+        log.record("decision", decision="deny")
+        assert log.flush_pending(timeout=2.0) is True
+        assert [r["decision"] for r in sink.records] == ["deny"]
+        assert log.flush_pending(timeout=0.0) is True  # nothing pending: returns at once
+
+    def test_flush_pending_times_out_and_counts(self):
+        gate = threading.Event()
+        sink = MemorySink(gate=gate)
+        log = audit.AuditLog([sink], batch_size=25, max_batch_age=60.0)
+        log.record("decision", decision="deny")
+        assert log.flush_pending(timeout=0.05) is False
+        assert log.counters["flush_timeouts"] == 1
+        gate.set()
+        assert log.flush_pending(timeout=2.0) is True
+        assert len(sink.records) == 1
+
+
+class TestSinks:
+    def test_jsonl_sink(self, tmp_path):
+        path = tmp_path / "audit.jsonl"
+        audit.JsonlSink(str(path)).write_batch([{"event": "decision", "decision": "allow"}])
+        lines = path.read_text().splitlines()
+        assert json.loads(lines[0])["decision"] == "allow"
+
+    def test_sqlite_sink(self, tmp_path):
+        path = str(tmp_path / "audit.db")
+        audit.SqliteSink(path).write_batch([{"event": "decision", "message_id": "m1", "decision": "deny"}])
+        rows = sqlite3.connect(path).execute("SELECT message_id, decision FROM audit").fetchall()
+        assert rows == [("m1", "deny")]
+
+    def test_dynamodb_sink_chunks_and_retries(self):
+        client = FakeDynamoDB(unprocessed_rounds=1)
+        sink = audit.DynamoDBSink("decisions", client=client)
+        records = [{"tam_hash": str(i), "event_id": "e", "decision": "allow", "expires_at": 1, "hedged": False}
+                   for i in range(30)]
+        sink.write_batch(records)
+
+        first = client.calls[0]["decisions"]
+        assert len(first) == 25
+        assert first[0]["PutRequest"]["Item"]["expires_at"] == {"N": "1"}
+        assert first[0]["PutRequest"]["Item"]["hedged"] == {"BOOL": False}
+        assert len(client.calls) == 3  # 25 (unprocessed) + 25 retry + 5
+
+    def test_events_for_same_tam_get_distinct_keys(self):
+        client = FakeDynamoDB()
+        log = audit.AuditLog([audit.DynamoDBSink("decisions", client=client)], batch_size=25, max_batch_age=5.0)
+        # Unparsed rejections and replays of one TAM share a tam_hash
+        log.record("decision", tam_hash="h1", decision="allow")
+        for _ in range(3):
+            log.record("signature_rejected", tam_hash="h0", decision="deny")
+        log.record("timestamp_rejected", tam_hash="h1", decision="deny")
+        log.flush(timeout=2.0)
+
+        assert log.counters["sink_errors"] == 0
+        items = [r["PutRequest"]["Item"] for r in client.calls[0]["decisions"]]
+        assert len(items) == 5
+        assert [i["event"]["S"] for i in items if i["tam_hash"]["S"] == "h1"] == ["decision", "timestamp_rejected"]
+
+    def test_dynamodb_sink_dedupes_keys_within_batch(self):
+        client = FakeDynamoDB()
+        sink = audit.DynamoDBSink("decisions", client=client)
+        record = {"tam_hash": "h", "event_id": "e1", "decision": "deny"}
+        sink.write_batch([record, {"tam_hash": "h", "event_id": "e2", "decision": "allow"}, dict(record)])
+
+        assert len(client.calls[0]["decisions"]) == 2
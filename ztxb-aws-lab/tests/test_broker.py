@@ -1,15 +1,19 @@
 # tests/test_broker.py
 """Unit tests for the ZTXP Broker Lambda handler."""
+import base64
+import hashlib
 import importlib
 import importlib.util
 import json
 import os
-from unittest.mock import patch
+import sys
+from unittest.mock import MagicMock, patch
 from datetime import datetime, timezone, timedelta
 
 import pytest
 
 _broker_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "ztxp_broker")
+sys.path.insert(0, _broker_dir)  # sibling modules (pdp_client, ...)
 
 with patch.dict(os.environ, {"PDP_URL": "pdp.internal", "KMS_KEY_ARN": "arn:aws:kms:us-east-1:123456789012:key/test-key"}):
     with patch("boto3.client"):
@@ -18,6 +22,13 @@ with patch.dict(os.environ, {"PDP_URL": "pdp.internal", "KMS_KEY_ARN": "arn:aws:
         spec.loader.exec_module(broker)
 
 
+@pytest.fixture(autouse=True)
+def _fresh_admission():
+    broker.admission_control.clear()
+    yield
+    broker.admission_control.clear()
+
+
 def _now_iso():
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
@@ -42,6 +53,22 @@ def _apigw_event(body):
     return {"body": json.dumps(body)}
 
 
+def _b64url(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _compact_body(tam=None, sig=b"test-sig"):
+    payload = broker.canonical_json(tam or _make_tam(signature=False))
+    return {"tam_compact": f"{_b64url(payload)}.{_b64url(sig)}", "alg": "ECDSA_SHA_256",
+            "key_id": "arn:aws:kms:test"}, payload
+
+
+def _valid_kms():
+    kms = MagicMock()
+    kms.verify.return_value = {"SignatureValid": True}
+    return kms
+
+
 class TestVerifyTimestamp:
     def test_fresh_timestamp(self):
         tam = _make_tam(signature=False)
@@ -72,8 +99,48 @@ class TestCanonicalJson:
         assert result == b'{"a":2,"z":1}'
 
 
+class TestVerifyCompact:
+    def test_verifies_exact_payload_bytes(self):
+        body, payload = _compact_body()
+        kms = _valid_kms()
+        with patch.object(broker, "kms_client", kms):
+            tam, tam_hash = broker.verify_compact(body)
+
+        kwargs = kms.verify.call_args.kwargs
+        assert kwargs["Message"] == hashlib.sha256(payload).digest()
+        assert kwargs["Signature"] == b"test-sig"
+        assert kwargs["KeyId"] == "arn:aws:kms:test"
+        assert tam_hash == hashlib.sha256(payload).hexdigest()
+        assert tam["subject"]["id"] == "user:alice"
+        assert tam["signature"]["key_id"] == "arn:aws:kms:test"
+
+    def test_invalid_signature(self):
+        body, _ = _compact_body()
+        kms = MagicMock()
+        kms.verify.return_value = {"SignatureValid": False}
+        with patch.object(broker, "kms_client", kms):
+            with pytest.raises(ValueError, match="invalid_signature"):
+                broker.verify_compact(body)
+
+    def test_malformed_token(self):
+        with pytest.raises(ValueError, match="malformed_compact"):
+            broker.verify_compact({"tam_compact": "only-one-part"})
+
+    def test_rejects_unsupported_alg(self):
+        body, _ = _compact_body()
+        body["alg"] = "none"
+        with pytest.raises(ValueError, match="unsupported_alg"):
+            broker.verify_compact(body)
+
+    def test_rejects_signature_inside_payload(self):
+        body, _ = _compact_body(tam=_make_tam(signature=True))
+        with patch.object(broker, "kms_client", _valid_kms()):
+            with pytest.raises(ValueError, match="malformed_payload"):
+                broker.verify_compact(body)
+
+
 class TestLambdaHandler:
-    @patch.object(broker, "call_pdp", return_value=True)
+    @patch.object(broker, "call_pdp", return_value=(True, "policy_allow"))
     @patch.object(broker, "verify_signature")
     def test_allow_flow(self, mock_verify, mock_pdp):
         event = _apigw_event({"tam": _make_tam()})
@@ -85,7 +152,7 @@ class TestLambdaHandler:
         mock_verify.assert_called_once()
         mock_pdp.assert_called_once()
 
-    @patch.object(broker, "call_pdp", return_value=False)
+    @patch.object(broker, "call_pdp", return_value=(False, "policy_deny"))
     @patch.object(broker, "verify_signature")
     def test_deny_flow(self, mock_verify, mock_pdp):
         event = _apigw_event({"tam": _make_tam()})
@@ -95,6 +162,21 @@ class TestLambdaHandler:
         assert body["decision"] == "deny"
         assert body["reason"] == "policy_deny"
 
+    @patch.object(broker, "call_pdp", return_value=(True, "policy_allow"))
+    def test_compact_allow_flow(self, mock_pdp):
+        body, _ = _compact_body()
+        with patch.object(broker, "kms_client", _valid_kms()):
+            result = broker.lambda_handler(_apigw_event(body), None)
+
+        assert result["statusCode"] == 200
+        assert json.loads(result["body"])["message_id"] == "test-msg-001"
+        assert mock_pdp.call_args.args[0]["resource"]["action"] == "notes:Read"
+
+    def test_compact_malformed_rejected(self):
+        result = broker.lambda_handler(_apigw_event({"tam_compact": "garbage"}), None)
+        assert result["statusCode"] == 403
+        assert "malformed_compact" in json.loads(result["body"])["reason"]
+
     def test_missing_tam(self):
         event = _apigw_event({"not_tam": {}})
         result = broker.lambda_handler(event, None)
@@ -119,3 +201,265 @@ class TestLambdaHandler:
         result = broker.lambda_handler(event, None)
         assert result["statusCode"] == 403
         assert "timestamp_rejected" in json.loads(result["body"])["reason"]
+
+
+class TestEvaluateSigned:
+    @patch.object(broker, "call_pdp", return_value=(True, "policy_allow"))
+    def test_allow_verifies_given_bytes(self, mock_pdp):
+        tam = _make_tam(signature=False)
+        payload = broker.canonical_json(tam)
+        kms = _valid_kms()
+        with patch.object(broker, "kms_client", kms):
+            result = broker.evaluate_signed(tam, payload, b"sig", "arn:aws:kms:test")
+
+        assert result["decision"] == "allow"
+        assert result["message_id"] == "test-msg-001"
+        assert kms.verify.call_args.kwargs["Message"] == hashlib.sha256(payload).digest()
+        assert mock_pdp.call_args.args[0]["signature"]["key_id"] == "arn:aws:kms:test"
+        assert "signature" not in tam  # the caller's object is not modified
+
+    @patch.object(broker, "call_pdp")
+    def test_bad_signature_denied_and_cached(self, mock_pdp):
+        tam = _make_tam(signature=False)
+        payload = broker.canonical_json(tam)
+        kms = MagicMock()
+        kms.verify.return_value = {"SignatureValid": False}
+        with patch.object(broker, "kms_client", kms):
+            first = broker.evaluate_signed(tam, payload, b"bad", "arn:aws:kms:test")
+            second = broker.evaluate_signed(tam, payload, b"bad", "arn:aws:kms:test")
+
+        assert first == {"decision": "deny", "reason": "signature_rejected: invalid_signature"}
+        assert second["reason"].endswith("(cached)")
+        kms.verify.assert_called_once()
+        mock_pdp.assert_not_called()
+
+    def test_signed_object_rejected(self):
+        with patch.object(broker, "kms_client") as kms:
+            result = broker.evaluate_signed(_make_tam(), b"{}", b"sig", "arn:aws:kms:test")
+        assert result["reason"] == "signature_rejected: malformed_payload"
+        kms.verify.assert_not_called()
+
+
+class TestAdmission:
+    def _event(self, tam, ip="198.51.100.7"):
+        event = _apigw_event({"tam": tam})
+        event["requestContext"] = {"http": {"sourceIp": ip}}
+        return event
+
+    def _control(self, **kwargs):
+        return patch.object(broker, "admission_control", broker.admission.AdmissionControl(**kwargs))
+
+    @patch.object(broker, "verify_signature", side_effect=ValueError("invalid_signature"))
+    def test_repeated_bad_signature_skips_kms(self, mock_verify):
+        event = self._event(_make_tam())
+        first = broker.lambda_handler(event, None)
+        second = broker.lambda_handler(event, None)
+
+        assert first["statusCode"] == second["statusCode"] == 403
+        assert "(cached)" in json.loads(second["body"])["reason"]
+        mock_verify.assert_called_once()
+
+    @patch.object(broker, "call_pdp", return_value=(True, "policy_allow"))
+    def test_tampered_copy_does_not_poison_original(self, mock_pdp):
+        good, forged = _make_tam(), _make_tam()
+        forged["subject"]["role"] = "admin"
+        with patch.object(broker, "verify_signature", side_effect=ValueError("invalid_signature")):
+            broker.lambda_handler(self._event(forged), None)
+        with patch.object(broker, "verify_signature"):
+            result = broker.lambda_handler(self._event(good), None)
+        assert result["statusCode"] == 200
+
+    @patch.object(broker, "verify_signature", side_effect=ValueError("invalid_signature"))
+    def test_failing_caller_blocked_before_verify(self, mock_verify):
+        failures = broker.admission.TokenBuckets(rate=0.01, burst=3)
+        with self._control(failures=failures):
+            statuses = []
+            for i in range(5):
+                tam = _make_tam()
+                tam["message_id"] = f"flood-{i}"
+                statuses.append(broker.lambda_handler(self._event(tam), None)["statusCode"])
+            other = broker.lambda_handler(self._event(_make_tam(), ip="203.0.113.9"), None)
+
+        assert statuses == [403, 403, 403, 429, 429]
+        assert mock_verify.call_count == 4  # the blocked caller costs no more KMS calls
+        assert other["statusCode"] == 403
+
+    @patch.object(broker, "call_pdp", return_value=(True, "policy_allow"))
+    @patch.object(broker, "verify_signature")
+    def test_subject_rate_limited(self, mock_verify, mock_pdp):
+        with self._control(rate_limits=broker.admission.TokenBuckets(rate=0.5, burst=2)):
+            results = []
+            for i in range(3):
+                tam = _make_tam()
+                tam["message_id"] = f"msg-{i}"
+                results.append(broker.lambda_handler(self._event(tam), None))
+
+        assert [r["statusCode"] for r in results] == [200, 200, 429]
+        assert results[2]["headers"]["Retry-After"] == "2"
+        assert json.loads(results[2]["body"])["reason"] == "rate_limited (sub)"
+        assert mock_pdp.call_count == 2
+
+    @patch.object(broker, "verify_signature")
+    def test_overload_shed_with_503(self, mock_verify):
+        limit = broker.admission.ConcurrencyLimit(1)
+        assert limit.acquire()
+        with self._control(concurrency=limit):
+            result = broker.lambda_handler(self._event(_make_tam()), None)
+
+        assert result["statusCode"] == 503
+        assert result["headers"]["Retry-After"] == "1"
+        mock_verify.assert_not_called()
+
+
+class TestRevocation:
+    @pytest.fixture
+    def revocations(self, tmp_path):
+        path = tmp_path / "revocations.bin"
+        broker.revocation.build([("key", "arn:aws:kms:leaked"), ("subject", "user:mallory")], str(path))
+        with patch.object(broker, "revocations", broker.revocation.RevocationChecker(str(path))):
+            yield broker.revocations
+
+    def test_revoked_key_rejected_before_kms(self, revocations):
+        tam = _make_tam()
+        tam["signature"]["key_id"] = "arn:aws:kms:leaked"
+        with patch.object(broker, "kms_client") as kms:
+            result = broker.lambda_handler(_apigw_event({"tam": tam}), None)
+
+        assert result["statusCode"] == 403
+        assert json.loads(result["body"])["reason"] == "signature_rejected: key_revoked"
+        kms.verify.assert_not_called()
+
+    @patch.object(broker, "call_pdp", return_value=(True, "policy_allow"))
+    def test_revoked_subject_rejected_before_pdp(self, mock_pdp, revocations):
+        tam = _make_tam()
+        tam["subject"]["id"] = "user:mallory"
+        with patch.object(broker, "kms_client", _valid_kms()):
+            result = broker.lambda_handler(_apigw_event({"tam": tam}), None)
+            allowed = broker.lambda_handler(_apigw_event({"tam": _make_tam()}), None)
+
+        assert result["statusCode"] == 403
+        assert json.loads(result["body"])["reason"] == "subject_revoked"
+        assert allowed["statusCode"] == 200
+        mock_pdp.assert_called_once()
+
+    @patch.object(broker, "call_pdp", return_value=(True, "policy_allow"))
+    def test_required_list_unavailable_fails_closed(self, mock_pdp, tmp_path):
+        checker = broker.revocation.RevocationChecker(str(tmp_path / "missing.bin"), required=True)
+        with patch.object(broker, "revocations", checker), patch.object(broker, "kms_client", _valid_kms()):
+            result = broker.lambda_handler(_apigw_event({"tam": _make_tam()}), None)
+
+        assert result["statusCode"] == 503
+        mock_pdp.assert_not_called()
+
+
+class TestBehaviorRisk:
+    def test_opa_input_takes_higher_score(self):
+        behavior = {"denies": 8, "devices": 1, "source_ips": 1, "score": 80}
+        mapped = broker.opa_input(_make_tam(), behavior)
+        assert mapped["context"]["risk_score"] == 80
+        assert mapped["context"]["behavior"] == behavior
+        assert broker.opa_input(_make_tam(), dict(behavior, score=0))["context"]["risk_score"] == 20
+        assert "behavior" not in broker.opa_input(_make_tam())["context"]
+
+    @patch.object(broker, "verify_signature")
+    def test_policy_denies_feed_next_decision(self, mock_verify):
+        risk = broker.risk_sketch.BehaviorRisk(window_seconds=600, width=1024)
+        with patch.object(broker, "risk", risk), patch.object(broker, "call_pdp", return_value=(False, "policy_deny")) as pdp:
+            for i in range(3):
+                tam = _make_tam()
+                tam["message_id"] = f"msg-{i}"
+                broker.lambda_handler(_apigw_event({"tam": tam}), None)
+
+        assert [c.args[1]["denies"] for c in pdp.call_args_list] == [0, 1, 2]
+        assert pdp.call_args.args[1]["score"] == 20
+        assert risk.counters == {"observed": 3, "denies": 3}
+
+    @patch.object(broker, "verify_signature")
+    def test_pdp_outage_not_counted_as_deny(self, mock_verify):
+        risk = broker.risk_sketch.BehaviorRisk(window_seconds=600, width=1024)
+        client = broker.pdp_client.PdpClient(["http://pdp/v1/data/authz/allow"],
+                                             transport=MagicMock(side_effect=OSError("connection refused")))
+        with patch.object(broker, "risk", risk), patch.object(broker, "pdp", client):
+            for i in range(8):
+                tam = _make_tam()
+                tam["message_id"] = f"msg-{i}"
+                result = broker.lambda_handler(_apigw_event({"tam": tam}), None)
+                assert json.loads(result["body"])["reason"] == "pdp_unavailable"
+
+            assert risk.counters["denies"] == 0
+            assert risk.observe(_make_tam())["denies"] == 0
+
+
+class TestTenants:
+    def _router(self):
+        return broker.tenants.TenantRouter(broker.tenants.parse({
+            "ztxp://pep.test": {"tenant": "acme"},
+            "ztxp://pep.lab": {},
+        }))
+
+    @patch.object(broker, "call_pdp", return_value=(True, "policy_allow"))
+    @patch.object(broker, "verify_signature")
+    def test_unknown_issuer_denied(self, mock_verify, mock_pdp):
+        tam = _make_tam()
+        tam["issuer"] = "ztxp://pep.stranger"
+        with patch.object(broker, "tenant_router", self._router()):
+            result = broker.lambda_handler(_apigw_event({"tam": tam}), None)
+
+        assert result["statusCode"] == 403
+        assert json.loads(result["body"])["reason"] == "unknown_issuer"
+        mock_pdp.assert_not_called()
+
+    @patch.object(broker, "call_pdp", return_value=(True, "policy_allow"))
+    @patch.object(broker, "verify_signature")
+    def test_tenant_policy_path(self, mock_verify, mock_pdp):
+        with patch.object(broker, "tenant_router", self._router()):
+            result = broker.lambda_handler(_apigw_event({"tam": _make_tam()}), None)
+
+        assert result["statusCode"] == 200
+        assert mock_pdp.call_args.args[2].pdp_path == "/v1/data/tenants/acme/authz/allow"
+
+    @patch.object(broker, "call_pdp", return_value=(True, "policy_allow"))
+    @patch.object(broker, "verify_signature")
+    def test_single_tenant_by_default(self, mock_verify, mock_pdp):
+        tam = _make_tam()
+        tam["issuer"] = "ztxp://pep.anyone"
+        result = broker.lambda_handler(_apigw_event({"tam": tam}), None)
+
+        assert result["statusCode"] == 200
+        assert mock_pdp.call_args.args[2] is None
+
+
+class TestAudit:
+    class _Sink:
+        def __init__(self):
+            self.records = []
+
+        def write_batch(self, records):
+            self.records.extend(records)
+
+    def _with_audit(self):
+        sink = self._Sink()
+        return sink, patch.object(broker, "audit_log", broker.audit.AuditLog([sink]))
+
+    @patch.object(broker, "call_pdp", return_value=(True, "policy_allow"))
+    @patch.object(broker, "verify_signature")
+    def test_decision_audited(self, mock_verify, mock_pdp):
+        sink, audit_patch = self._with_audit()
+        with audit_patch:
+            broker.lambda_handler(_apigw_event({"tam": _make_tam()}), None)
+            broker.audit_log.flush(timeout=2.0)
+
+        assert sink.records[0]["event"] == "decision"
+        assert sink.records[0]["decision"] == "allow"
+        assert sink.records[0]["subject"] == "user:alice"
+        assert len(sink.records[0]["tam_hash"]) == 64
+
+    @patch.object(broker, "verify_signature", side_effect=ValueError("invalid_signature"))
+    def test_rejection_audited(self, mock_verify):
+        sink, audit_patch = self._with_audit()
+        with audit_patch:
+            broker.lambda_handler(_apigw_event({"tam": _make_tam()}), None)
+            broker.audit_log.flush(timeout=2.0)
+
+        assert sink.records[0]["event"] == "signature_rejected"
+        assert sink.records[0]["reason"] == "invalid_signature"
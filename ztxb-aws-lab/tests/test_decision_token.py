@@ -0,0 +1,203 @@
+# tests/test_decision_token.py
+"""Broker-issued decision tokens, verified locally by the PEP."""
+import importlib.util
+import json
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytest.importorskip("cryptography")
+from cryptography.hazmat.primitives import hashes, serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec, utils  # noqa: E402
+
+_lambdas = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas")
+sys.path.insert(0, os.path.join(_lambdas, "pep_authorizer"))
+sys.path.insert(0, os.path.join(_lambdas, "ztxp_broker"))
+
+import decision_token  # noqa: E402
+import revocation  # noqa: E402
+
+KEY_ARN = "arn:aws:kms:us-east-1:123456789012:key/decision"
+
+with patch.dict(os.environ, {"PDP_URL": "pdp.internal", "DECISION_KEY_ARN": KEY_ARN}):
+    with patch("boto3.client"):
+        spec = importlib.util.spec_from_file_location("broker_handler_tokens",
+                                                      os.path.join(_lambdas, "ztxp_broker", "handler.py"))
+        broker = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(broker)
+
+
+class FakeKms:
+    """KMS Sign / GetPublicKey backed by a real P-256 key."""
+
+    def __init__(self):
+        self.key = ec.generate_private_key(ec.SECP256R1())
+        self.get_public_key_calls = 0
+
+    def sign(self, KeyId, Message, MessageType, SigningAlgorithm):
+        assert MessageType == "DIGEST"
+        return {"Signature": self.key.sign(Message, ec.ECDSA(utils.Prehashed(hashes.SHA256())))}
+
+    def get_public_key(self, KeyId):
+        self.get_public_key_calls += 1
+        der = self.key.public_key().public_bytes(serialization.Encoding.DER,
+                                                 serialization.PublicFormat.SubjectPublicKeyInfo)
+        return {"PublicKey": der}
+
+
+def _tam(**overrides):
+    tam = {
+        "message_id": "msg-1",
+        "subject": {"id": "user:alice", "role": "authenticated", "groups": ["writer"]},
+        "device": {"id": "device:abc", "posture": {"compliant": True}},
+        "context": {"risk_score": 0, "device_trust": "low-risk"},
+        "resource": {"id": "app://notes/n1", "action": "notes:Read"},
+    }
+    for path, value in overrides.items():
+        node = tam
+        *parents, leaf = path.split("__")
+        for key in parents:
+            node = node[key]
+        node[leaf] = value
+    return tam
+
+
+@pytest.fixture
+def kms():
+    fake = FakeKms()
+    with patch.object(broker, "kms_client", fake):
+        yield fake
+
+
+class TestDecisionTokens:
+    def test_broker_token_verifies_at_pep(self, kms):
+        token = broker.issue_decision_token(_tam(), 300)
+        tokens = decision_token.DecisionTokens(KEY_ARN, kms)
+
+        claims = tokens.verify(token)
+        assert claims["sub"] == "user:alice"
+        assert claims["exp"] - claims["iat"] == 300
+        assert tokens.matches(claims, _tam())
+
+    def test_context_digests_agree(self):
+        assert decision_token.policy_context_digest(_tam()) == broker.policy_context_digest(_tam())
+
+    @pytest.mark.parametrize("change", [
+        {"device__id": "device:other"},
+        {"subject__groups": ["admin"]},
+        {"device__posture": {"compliant": False}},
+        {"resource__action": "notes:Write"},
+        {"resource__id": "app://notes/n2"},
+    ])
+    def test_binding_mismatch(self, kms, change):
+        token = broker.issue_decision_token(_tam(), 300)
+        tokens = decision_token.DecisionTokens(KEY_ARN, kms)
+        assert tokens.lookup(_tam(**change), presented=token) is None
+
+    def test_prefix_scope(self, kms):
+        with patch.object(broker, "DECISION_TOKEN_SCOPE", "prefix"):
+            token = broker.issue_decision_token(_tam(), 300)
+        tokens = decision_token.DecisionTokens(KEY_ARN, kms)
+        assert tokens.lookup(_tam(resource__id="app://notes/n2"), presented=token) is not None
+
+    def test_expired_and_tampered(self, kms):
+        token = broker.issue_decision_token(_tam(), 300)
+        later = decision_token.DecisionTokens(KEY_ARN, kms, clock=lambda: 2 ** 40)
+        with pytest.raises(ValueError, match="token_expired"):
+            later.verify(token)
+
+        payload, sig = token.split(".")
+        claims = json.loads(decision_token._b64url_decode(payload))
+        forged = broker._b64url(broker.canonical_json({**claims, "sub": "user:mallory"}))
+        with pytest.raises(ValueError, match="invalid_token_signature"):
+            decision_token.DecisionTokens(KEY_ARN, kms).verify(f"{forged}.{sig}")
+
+    def test_untrusted_key_id(self, kms):
+        token = broker.issue_decision_token(_tam(), 300)
+        tokens = decision_token.DecisionTokens("arn:aws:kms:other", kms)
+        with pytest.raises(ValueError, match="untrusted_token"):
+            tokens.verify(token)
+
+    def test_no_token_for_deny_or_disabled(self, kms):
+        assert broker.issue_decision_token(_tam(), 0) is None
+        with patch.object(broker, "DECISION_KEY_ARN", ""):
+            assert broker.issue_decision_token(_tam(), 300) is None
+
+
+class TestPepReuse:
+    @pytest.fixture
+    def pep(self, kms):
+        with patch.dict(os.environ, {"KMS_KEY_ARN": "arn:aws:kms:pep", "BROKER_URL": "https://broker",
+                                     "DECISION_KEY_ARN": KEY_ARN}):
+            with patch("boto3.client", return_value=kms):
+                spec = importlib.util.spec_from_file_location(
+                    "pep_handler_tokens", os.path.join(_lambdas, "pep_authorizer", "handler.py"))
+                pep = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(pep)
+        return pep
+
+    @staticmethod
+    def _event(headers=None):
+        return {
+            "requestContext": {"http": {"method": "GET", "path": "/n1", "sourceIp": "10.0.0.1"}, "requestId": "r"},
+            "headers": {"x-device-id": "abc", **(headers or {})},
+        }
+
+    @staticmethod
+    def _broker_reply(body):
+        return {"decision": "allow", "reason": "policy_allow",
+                "decision_token": broker.issue_decision_token(body["tam"], 300)}
+
+    def test_second_request_skips_sign_and_broker(self, pep, kms):
+        sign = MagicMock(side_effect=lambda tam: {**tam, "signature": {}})
+        call_broker = MagicMock(side_effect=self._broker_reply)
+        with patch.object(pep, "sign_tam", sign), patch.object(pep, "call_broker", call_broker):
+            first = pep.lambda_handler(self._event(), None)
+            second = pep.lambda_handler(self._event(), None)
+
+        assert first["context"]["ztxp_decision_token"]
+        assert second["isAuthorized"] is True
+        assert second["context"]["ztxp_reason"] == "decision_token"
+        assert sign.call_count == 1 and call_broker.call_count == 1
+        assert kms.get_public_key_calls == 1
+
+    def test_presented_token_reused_by_other_container(self, pep, kms):
+        token = broker.issue_decision_token(pep.build_tam(self._event()), 300)
+        call_broker = MagicMock()
+        with patch.object(pep, "call_broker", call_broker):
+            result = pep.lambda_handler(self._event({"x-ztxp-decision": token}), None)
+
+        assert result["isAuthorized"] is True
+        call_broker.assert_not_called()
+
+    def test_changed_posture_goes_to_broker(self, pep, kms):
+        token = broker.issue_decision_token(pep.build_tam(self._event()), 300)
+        call_broker = MagicMock(return_value={"decision": "deny", "reason": "policy_deny"})
+        headers = {"x-ztxp-decision": token, "x-device-compliant": "false"}
+        with patch.object(pep, "sign_tam", side_effect=lambda tam: tam), \
+                patch.object(pep, "call_broker", call_broker):
+            result = pep.lambda_handler(self._event(headers), None)
+
+        assert result["isAuthorized"] is False
+        call_broker.assert_called_once()
+
+    def test_revoked_subject_with_live_token_goes_to_broker(self, pep, kms, tmp_path):
+        tam = pep.build_tam(self._event())
+        token = broker.issue_decision_token(tam, 300)
+        path = tmp_path / "revocations.bin"
+        revocation.build([("subject", "user:nobody")], str(path))
+        checker = revocation.RevocationChecker(str(path), check_seconds=0)
+        call_broker = MagicMock(return_value={"decision": "deny", "reason": "subject_revoked"})
+        with patch.object(pep, "revocations", checker), \
+                patch.object(pep, "sign_tam", side_effect=lambda tam: tam), \
+                patch.object(pep, "call_broker", call_broker):
+            assert pep.lambda_handler(self._event({"x-ztxp-decision": token}), None)["isAuthorized"] is True
+
+            revocation.build([("subject", tam["subject"]["id"])], str(path))
+            result = pep.lambda_handler(self._event({"x-ztxp-decision": token}), None)
+
+        assert result["isAuthorized"] is False
+        assert result["context"]["ztxp_reason"] == "subject_revoked"
+        call_broker.assert_called_once()
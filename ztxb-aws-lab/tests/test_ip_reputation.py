@@ -0,0 +1,64 @@
+# tests/test_ip_reputation.py
+"""Unit tests for the PEP's mmap-ed IP reputation index."""
+import os
+import sys
+
+import pytest
+
+_pep_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "pep_authorizer")
+sys.path.insert(0, _pep_dir)
+
+import ip_reputation  # noqa: E402
+
+FEED = """\
+# cidr, score
+203.0.113.0/24,80
+203.0.113.128/25 95
+10.0.0.0/8,20
+198.51.100.7,100
+2001:db8::/32,60
+"""
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = tmp_path / "rep.bin"
+    ip_reputation.build(FEED.splitlines(), str(path))
+    return ip_reputation.ReputationIndex(str(path))
+
+
+class TestReputationIndex:
+    @pytest.mark.parametrize("ip,score", [
+        ("203.0.113.5", 80),
+        ("203.0.113.200", 95),      # more specific, higher score wins
+        ("10.255.255.255", 20),
+        ("11.0.0.0", 0),
+        ("198.51.100.7", 100),
+        ("198.51.100.8", 0),
+        ("2001:db8:1::1", 60),
+        ("2001:db9::1", 0),
+        ("::ffff:10.1.2.3", 20),
+        ("not-an-ip", 0),
+        ("0.0.0.0", 0),
+        ("255.255.255.255", 0),
+    ])
+    def test_lookup(self, index, ip, score):
+        assert index.score(ip) == score
+
+    def test_overlaps_take_max_score(self):
+        flat = ip_reputation.flatten([(0, 99, 10), (50, 59, 90), (60, 200, 10)])
+        assert flat == [[0, 49, 10], [50, 59, 90], [60, 200, 10]]
+
+    def test_counts(self, index):
+        assert index.counts == (4, 1)
+
+    def test_load_rejects_bad_file(self, tmp_path):
+        bad = tmp_path / "bad.bin"
+        bad.write_bytes(b"not an index at all")
+        assert ip_reputation.load(str(bad)) is None
+        assert ip_reputation.load("") is None
+
+    def test_bad_feed_line(self):
+        with pytest.raises(ValueError, match="line 1"):
+            list(ip_reputation.parse_feed(["300.1.1.1/8,10"]))
+
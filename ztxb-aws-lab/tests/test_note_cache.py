@@ -0,0 +1,166 @@
+# tests/test_note_cache.py
+"""Unit tests for the Notes API read-through cache."""
+import json
+import os
+import sys
+
+_notes_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "notes_api")
+sys.path.insert(0, _notes_dir)
+
+import note_cache  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Loader:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+class FakeRedis:
+    """The handful of redis-py calls RedisBackend uses."""
+
+    def __init__(self):
+        self.data = {}
+
+    def mget(self, keys):
+        return [self.data.get(k) for k in keys]
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode()
+
+    def pipeline(self):
+        client = self
+
+        class Pipe:
+            def __init__(self):
+                self.ops = []
+
+            def incr(self, key):
+                self.ops.append(key)
+
+            def expire(self, key, ttl):
+                pass
+
+            def execute(self):
+                key = self.ops[0]
+                client.data[key] = str(int(client.data.get(key, 0)) + 1).encode()
+                return [int(client.data[key]), True]
+
+        return Pipe()
+
+
+class TestNoteCache:
+    def test_read_through_and_invalidate(self):
+        cache = note_cache.NoteCache(note_cache.LocalBackend())
+        load = Loader([{"note_id": "1"}])
+        assert cache.read_through("alice", "list", load) == [{"note_id": "1"}]
+        assert cache.read_through("alice", "list", load) == [{"note_id": "1"}]
+        assert load.calls == 1
+
+        cache.invalidate("alice")
+        cache.read_through("alice", "list", load)
+        assert load.calls == 2
+        assert cache.counters == {"hits": 1, "misses": 2, "invalidations": 1, "errors": 0}
+
+    def test_ttl_expiry(self):
+        clock = Clock()
+        cache = note_cache.NoteCache(note_cache.LocalBackend(clock=clock), ttl=30)
+        load = Loader(["x"])
+        cache.read_through("alice", "list", load)
+        clock.now = 31
+        cache.read_through("alice", "list", load)
+        assert load.calls == 2
+
+    def test_lru_bound_keeps_versions(self):
+        backend = note_cache.LocalBackend(max_entries=2)
+        cache = note_cache.NoteCache(backend)
+        cache.invalidate("alice")
+        for i in range(5):
+            cache.read_through("alice", f"note:{i}", Loader({"note_id": str(i)}))
+        assert len(backend._entries) == 2
+        assert backend.get_many(["notes:alice:v"]) == [1]
+
+    def test_versions_share_the_lru_bound(self):
+        backend = note_cache.LocalBackend(max_entries=3)
+        cache = note_cache.NoteCache(backend)
+        for i in range(100):
+            cache.invalidate(f"user-{i}")
+        assert len(backend._versions) == 3
+
+    def test_evicted_version_never_revives_stale_entry(self):
+        backend = note_cache.LocalBackend(max_entries=2)
+        cache = note_cache.NoteCache(backend)
+        cache.read_through("alice", "list", Loader(["v0"]))  # tagged 0
+        cache.invalidate("alice")                            # alice at 1
+        cache.invalidate("bob")
+        cache.invalidate("carol")                            # evicts alice's counter
+        assert "notes:alice:v" not in backend._versions
+
+        # The entry is still cached, but no later version can match its tag
+        assert cache.read_through("alice", "list", Loader(["fresh"])) == ["fresh"]
+        cache.read_through("alice", "note:1", Loader(["n"]))
+        cache.invalidate("alice")
+        assert cache.read_through("alice", "note:1", Loader(["n2"])) == ["n2"]
+        assert cache.read_through("alice", "list", Loader(["fresh2"])) == ["fresh2"]
+
+    def test_shared_backend_invalidates_other_containers(self):
+        shared = note_cache.RedisBackend("redis://unused", client=FakeRedis())
+        a, b = note_cache.NoteCache(shared), note_cache.NoteCache(shared)
+        load = Loader([{"note_id": "1"}])
+        a.read_through("alice", "list", load)
+        b.read_through("alice", "list", load)
+        assert load.calls == 1
+
+        a.invalidate("alice")
+        b.read_through("alice", "list", load)
+        assert load.calls == 2
+
+    def test_write_during_read_is_not_served(self):
+        cache = note_cache.NoteCache(note_cache.LocalBackend())
+
+        def load_racing_a_write():
+            cache.invalidate("alice")  # a write commits while we read DynamoDB
+            return ["stale"]
+
+        cache.read_through("alice", "list", load_racing_a_write)
+        assert cache.read_through("alice", "list", Loader(["fresh"])) == ["fresh"]
+
+    def test_backend_errors_fall_back_to_load(self):
+        class Broken:
+            def get_many(self, keys):
+                raise ConnectionError("down")
+
+        cache = note_cache.NoteCache(Broken())
+        assert cache.read_through("alice", "list", Loader(["x"])) == ["x"]
+        assert cache.counters["errors"] == 1
+
+    def test_disabled(self):
+        cache = note_cache.NoteCache(None)
+        load = Loader(["x"])
+        cache.read_through("alice", "list", load)
+        cache.read_through("alice", "list", load)
+        assert load.calls == 2
+
+
+def test_redis_values_are_json():
+    client = FakeRedis()
+    note_cache.RedisBackend("redis://unused", client=client).set("k", {"v": 1, "data": []}, 30)
+    assert json.loads(client.data["k"]) == {"v": 1, "data": []}
+
+
+def test_redis_binary_attributes_round_trip():
+    backend = note_cache.RedisBackend("redis://unused", client=FakeRedis())
+    backend.set("k", {"v": 0, "data": {"content_z": b"\x78\x9c"}}, 30)
+    assert backend.get_many(["k"]) == [{"v": 0, "data": {"content_z": b"\x78\x9c"}}]
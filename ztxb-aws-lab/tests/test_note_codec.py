@@ -0,0 +1,68 @@
+# tests/test_note_codec.py
+"""Unit tests for transparent note body compression."""
+import base64
+import os
+import sys
+from unittest.mock import patch
+
+from boto3.dynamodb.types import Binary
+
+_notes_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "notes_api")
+sys.path.insert(0, _notes_dir)
+
+import note_codec  # noqa: E402
+
+LARGE = "Meeting notes: discussed the quarterly roadmap and budget. " * 100
+
+
+class TestPackContent:
+    def test_small_content_stays_plain(self):
+        assert note_codec.pack_content("short", min_bytes=1024) == {"content": "short"}
+
+    def test_large_content_compressed(self):
+        packed = note_codec.pack_content(LARGE, min_bytes=1024)
+        assert set(packed) == {"content_z", "content_codec"}
+        assert len(packed["content_z"]) < len(LARGE) // 4
+        assert note_codec.unpack_content({**packed, "content_z": Binary(packed["content_z"])}) == LARGE
+
+    def test_poor_compression_stays_plain(self):
+        noise = base64.b64encode(os.urandom(3000)).decode()  # compresses to ~76 %
+        with patch.object(note_codec, "MIN_SAVING", 0.5):
+            assert note_codec.pack_content(noise, min_bytes=1024) == {"content": noise}
+
+    def test_unicode_round_trip(self):
+        text = "Über café — 東京 " * 200
+        assert note_codec.unpack_content(note_codec.pack_content(text, min_bytes=1)) == text
+
+    def test_non_string_content_rejected(self):
+        for content in (None, 42, ["a"], {"text": "x"}):
+            try:
+                note_codec.pack_content(content)
+            except TypeError as exc:
+                assert type(content).__name__ in str(exc)
+            else:
+                raise AssertionError(f"{content!r} accepted")
+
+
+class TestPublicView:
+    def test_legacy_item_readable(self):
+        item = {"note_id": "n1", "title": "t", "content": "plain"}
+        assert note_codec.public_view(item) == item
+
+    def test_hides_storage_attributes(self):
+        item = {"note_id": "n1", "title": "t", **note_codec.pack_content(LARGE, min_bytes=1)}
+        assert note_codec.public_view(item) == {"note_id": "n1", "title": "t", "content": LARGE}
+
+    def test_decompresses_only_when_returned(self):
+        item = {"note_id": "n1", "title": "t", **note_codec.pack_content(LARGE, min_bytes=1)}
+        with patch.object(note_codec.zlib, "decompress") as decompress:
+            assert note_codec.public_view(item, fields={"title"}) == {"note_id": "n1", "title": "t"}
+        decompress.assert_not_called()
+
+    def test_unknown_codec(self):
+        try:
+            note_codec.unpack_content({"content_z": b"", "content_codec": "lz4"})
+        except ValueError as exc:
+            assert "lz4" in str(exc)
+        else:
+            raise AssertionError("unknown codec accepted")
@@ -0,0 +1,215 @@
+# tests/test_note_export.py
+"""Unit tests for the parallel segmented notes export."""
+import gzip
+import json
+import os
+import sys
+import threading
+import zlib
+
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+_notes_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "notes_api")
+sys.path.insert(0, _notes_dir)
+
+import note_codec  # noqa: E402
+import note_export  # noqa: E402
+
+_serializer = TypeSerializer()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class Crash(Exception):
+    pass
+
+
+class FakeDynamo:
+    """Low-level client with just enough parallel Scan for the export."""
+
+    def __init__(self, items, page_size=3, throttle_every=0, crash_after_pages=None):
+        self.items = sorted(items, key=lambda i: (i["user_id"], i["note_id"]))
+        self.page_size = page_size
+        self.throttle_every = throttle_every
+        self.crash_after_pages = crash_after_pages
+        self.calls = 0
+        self.pages = 0
+        self._lock = threading.Lock()
+
+    def _segment_of(self, item, total):
+        return zlib.crc32(f"{item['user_id']}|{item['note_id']}".encode()) % total
+
+    def scan(self, TableName, Segment, TotalSegments, ReturnConsumedCapacity, ExclusiveStartKey=None,
+             Limit=None, FilterExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None):
+        with self._lock:
+            self.calls += 1
+            if self.throttle_every and self.calls % self.throttle_every == 0:
+                raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "slow"}},
+                                  "Scan")
+            if self.crash_after_pages is not None and self.pages >= self.crash_after_pages:
+                raise Crash()
+            self.pages += 1
+        mine = [i for i in self.items if self._segment_of(i, TotalSegments) == Segment]
+        start = 0
+        if ExclusiveStartKey:
+            key = (ExclusiveStartKey["user_id"]["S"], ExclusiveStartKey["note_id"]["S"])
+            start = next(n for n, i in enumerate(mine) if (i["user_id"], i["note_id"]) == key) + 1
+        page = mine[start:start + (Limit or self.page_size)]
+        scanned = len(page)
+        if FilterExpression:
+            page = [i for i in page if not i["user_id"].startswith("#idx#")]
+        response = {
+            "Items": [{k: _serializer.serialize(v) for k, v in i.items()} for i in page],
+            "ConsumedCapacity": {"TableName": TableName, "CapacityUnits": scanned * 0.5},
+        }
+        if start + scanned < len(mine):
+            last = mine[start + scanned - 1]
+            response["LastEvaluatedKey"] = {"user_id": {"S": last["user_id"]}, "note_id": {"S": last["note_id"]}}
+        return response
+
+
+def _notes(n_users=5, per_user=8):
+    items = []
+    for u in range(n_users):
+        for n in range(per_user):
+            content = f"note {n} of user {u} " * (60 if n % 3 == 0 else 1)
+            items.append({"user_id": f"user-{u}", "note_id": f"n{n:03d}", "title": f"t{n}",
+                          "created_at": "2025-01-01T00:00:00Z", **note_codec.pack_content(content, 256)})
+        items.append({"user_id": f"#idx#user-{u}", "note_id": "note", "postings": {"n000": 1}})
+    return items
+
+
+def _read_export(out_dir):
+    with open(os.path.join(out_dir, note_export.MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    rows = []
+    for shard in manifest["shards"]:
+        with gzip.open(os.path.join(out_dir, shard["file"]), "rt", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == shard["items"]
+        rows.extend(lines)
+    return manifest, rows
+
+
+def _job(client, out_dir, **kwargs):
+    kwargs.setdefault("sleep", lambda s: None)
+    return note_export.NotesExport(client, "notes", str(out_dir), **kwargs)
+
+
+class TestExport:
+    def test_every_note_exported_once(self, tmp_path):
+        items = _notes()
+        _job(FakeDynamo(items), tmp_path, segments=4, workers=3, shard_items=4).run()
+
+        manifest, rows = _read_export(tmp_path)
+        notes = [i for i in items if not i["user_id"].startswith("#idx#")]
+        assert manifest["items"] == len(rows) == len(notes)
+        assert sorted((r["user_id"], r["note_id"]) for r in rows) == sorted(
+            (i["user_id"], i["note_id"]) for i in notes)
+        # Shards rotate at the first page boundary past shard_items
+        assert len(manifest["shards"]) > 4
+        assert all(shard["items"] < 4 + 3 for shard in manifest["shards"])
+        assert not [p for p in os.listdir(tmp_path) if p.endswith(".tmp")]
+
+    def test_content_is_decompressed_and_storage_attrs_hidden(self, tmp_path):
+        items = _notes(n_users=1, per_user=3)
+        assert note_codec.BLOB_ATTR in items[0]
+        _job(FakeDynamo(items), tmp_path, segments=1, workers=1).run()
+
+        _, rows = _read_export(tmp_path)
+        first = next(r for r in rows if r["note_id"] == "n000")
+        assert first["content"] == note_codec.unpack_content(items[0])
+        assert note_codec.BLOB_ATTR not in first and note_codec.CODEC_ATTR not in first
+
+    def test_include_index(self, tmp_path):
+        _job(FakeDynamo(_notes(n_users=2, per_user=1)), tmp_path, segments=2, include_index=True).run()
+        _, rows = _read_export(tmp_path)
+        assert sum(r["user_id"].startswith("#idx#") for r in rows) == 2
+
+    def test_resume_after_crash(self, tmp_path):
+        items = _notes(n_users=6, per_user=10)
+        clock = FakeClock()
+        crashing = FakeDynamo(items, crash_after_pages=9)
+
+        def tick(*args, **kwargs):  # every page advances time past the checkpoint interval
+            clock.advance(10)
+            return FakeDynamo.scan(crashing, *args, **kwargs)
+
+        crashing.scan = tick
+        with pytest.raises(Crash):
+            _job(crashing, tmp_path, segments=3, workers=1, checkpoint_seconds=5, clock=clock).run()
+        assert not os.path.exists(tmp_path / note_export.MANIFEST_NAME)
+        with open(tmp_path / note_export.CHECKPOINT_NAME) as f:
+            assert json.load(f)["segments"]
+
+        resumed = FakeDynamo(items)
+        _job(resumed, tmp_path, segments=3, workers=1, checkpoint_seconds=5, clock=clock).run()
+
+        _, rows = _read_export(tmp_path)
+        keys = [(r["user_id"], r["note_id"]) for r in rows]
+        assert len(keys) == len(set(keys)) == 60
+
+        full = FakeDynamo(items)
+        _job(full, tmp_path / "full", segments=3, workers=1).run()
+        assert resumed.pages < full.pages  # picked up from the checkpoint
+
+    def test_checkpoint_of_other_export_refused(self, tmp_path):
+        _job(FakeDynamo(_notes(1, 1)), tmp_path, segments=2).run()
+        with pytest.raises(ValueError, match="different export"):
+            _job(FakeDynamo(_notes(1, 1)), tmp_path, segments=4)
+
+    def test_throttling_backs_off_and_completes(self, tmp_path):
+        sleeps = []
+        client = FakeDynamo(_notes(n_users=3, per_user=6), throttle_every=4)
+        job = _job(client, tmp_path, segments=2, workers=1, sleep=sleeps.append, max_rcu=100)
+        job.run()
+
+        _, rows = _read_export(tmp_path)
+        assert len(rows) == 18
+        assert job.counters["throttles"] > 0
+        assert len(sleeps) >= job.counters["throttles"]
+        assert job.budget.rate <= 100
+
+    def test_gives_up_after_max_retries(self, tmp_path):
+        client = FakeDynamo(_notes(1, 1), throttle_every=1)
+        with pytest.raises(ClientError):
+            _job(client, tmp_path, segments=1, max_retries=3).run()
+        assert client.calls == 4
+
+
+class TestThroughputBudget:
+    def test_waits_off_debt(self):
+        clock, sleeps = FakeClock(), []
+        budget = note_export.ThroughputBudget(10, clock=clock, sleep=sleeps.append)
+        budget.acquire()
+        budget.consumed(30)  # 10 in the bucket, 20 in debt
+        budget.acquire()
+        assert sleeps == [pytest.approx(2.0)]
+
+    def test_throttle_halves_rate_then_recovers(self):
+        budget = note_export.ThroughputBudget(100, clock=FakeClock(), sleep=lambda s: None)
+        budget.throttled()
+        budget.throttled()
+        assert budget.rate == 25
+        for _ in range(10):
+            budget.consumed(0)
+        assert budget.rate == 45
+
+    def test_unlimited_never_sleeps(self):
+        sleeps = []
+        budget = note_export.ThroughputBudget(0, sleep=sleeps.append)
+        budget.consumed(1e6)
+        budget.throttled()
+        budget.acquire()
+        assert sleeps == []
@@ -0,0 +1,148 @@
+# tests/test_note_search.py
+"""Unit tests for the Notes API per-user inverted index."""
+import os
+import sys
+
+from botocore.exceptions import ClientError
+
+_notes_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "notes_api")
+sys.path.insert(0, _notes_dir)
+
+import note_search  # noqa: E402
+
+
+class FakeTable:
+    """Just enough of a DynamoDB Table for the index's update/get/query calls."""
+
+    def __init__(self):
+        self.items = {}
+        self.reads = 0
+
+    def _error(self, code):
+        return ClientError({"Error": {"Code": code, "Message": code}}, "UpdateItem")
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ConditionExpression=None):
+        key = (Key["user_id"], Key["note_id"])
+        # Work on a copy: a failed update leaves the table unchanged
+        item = {k: dict(v) if k == "postings" else v for k, v in (self.items.get(key) or Key).items()}
+        names, values = ExpressionAttributeNames or {}, ExpressionAttributeValues or {}
+        if ConditionExpression == "attribute_not_exists(postings)" and "postings" in item:
+            raise self._error("ConditionalCheckFailedException")
+        if ConditionExpression == "attribute_exists(postings.#n)" and names["#n"] not in item.get("postings", {}):
+            raise self._error("ConditionalCheckFailedException")
+        if UpdateExpression == "SET postings.#n = :w":
+            if "postings" not in item:
+                raise self._error("ValidationException")
+            item["postings"][names["#n"]] = values[":w"]
+        elif UpdateExpression == "REMOVE postings.#n":
+            item.get("postings", {}).pop(names["#n"], None)
+        elif UpdateExpression == "SET postings = :p":
+            item["postings"] = dict(values[":p"])
+        elif UpdateExpression == "ADD docs :d":
+            item["docs"] = item.get("docs", 0) + values[":d"]
+        else:
+            raise AssertionError(UpdateExpression)
+        self.items[key] = item  # like DynamoDB, an update creates a missing item
+
+    def delete_item(self, Key, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        assert ConditionExpression == "attribute_exists(postings.#n) AND size(postings) = :one"
+        key = (Key["user_id"], Key["note_id"])
+        postings = (self.items.get(key) or {}).get("postings", {})
+        if ExpressionAttributeNames["#n"] not in postings or len(postings) != ExpressionAttributeValues[":one"]:
+            raise self._error("ConditionalCheckFailedException")
+        del self.items[key]
+
+    def get_item(self, Key):
+        self.reads += 1
+        item = self.items.get((Key["user_id"], Key["note_id"]))
+        return {"Item": item} if item else {}
+
+    def query(self, KeyConditionExpression, Limit=None):
+        self.reads += 1
+        eq, begins = KeyConditionExpression.get_expression()["values"]
+        partition = eq.get_expression()["values"][1]
+        prefix = begins.get_expression()["values"][1]
+        items = [v for (p, s), v in sorted(self.items.items()) if p == partition and s.startswith(prefix)]
+        return {"Items": items[:Limit]}
+
+
+def _index_with(*notes):
+    table = FakeTable()
+    index = note_search.SearchIndex(table)
+    for note_id, title, content in notes:
+        index.update_note("alice", note_id, None, {"title": title, "content": content})
+    return table, index
+
+
+class TestTokenize:
+    def test_lowercases_and_drops_stopwords(self):
+        assert note_search.tokenize("The Quarterly PLAN for Q3, and Über-notes") == \
+            ["quarterly", "plan", "q3", "über", "notes"]
+
+    def test_title_weighs_more(self):
+        assert note_search.note_terms({"title": "budget", "content": "budget review"}) == \
+            {"budget": 4, "review": 1}
+
+
+class TestSearchIndex:
+    def test_ranked_top_k(self):
+        _, index = _index_with(
+            ("n1", "Budget 2025", "draft budget numbers"),
+            ("n2", "Groceries", "milk, eggs, budget-friendly"),
+            ("n3", "Trip", "flights and hotels"),
+        )
+        results = index.search("alice", "budget", k=2)
+        assert [note_id for note_id, _ in results] == ["n1", "n2"]
+        assert results[0][1] > results[1][1]
+
+    def test_prefix_query(self):
+        _, index = _index_with(("n1", "Project kickoff", ""), ("n2", "Projection model", ""), ("n3", "Other", ""))
+        assert {n for n, _ in index.search("alice", "proj*")} == {"n1", "n2"}
+
+    def test_update_and_delete_are_incremental(self):
+        table, index = _index_with(("n1", "alpha", "beta"))
+        index.update_note("alice", "n1", {"title": "alpha", "content": "beta"},
+                          {"title": "alpha", "content": "gamma"})
+        assert index.search("alice", "beta") == []
+        assert [n for n, _ in index.search("alice", "gamma")] == ["n1"]
+
+        index.update_note("alice", "n1", {"title": "alpha", "content": "gamma"}, None)
+        assert index.search("alice", "alpha") == []
+        assert table.items[("#idx#alice", "#stats")]["docs"] == 0
+
+    def test_last_posting_deletes_the_item(self):
+        table, index = _index_with(("n1", "alpha", "shared"), ("n2", "beta", "shared"))
+        index.update_note("alice", "n1", {"title": "alpha", "content": "shared"}, None)
+        assert ("#idx#alice", "alpha") not in table.items
+        assert table.items[("#idx#alice", "shared")]["postings"] == {"n2": 1}
+
+        index.update_note("alice", "n2", {"title": "beta", "content": "shared"}, None)
+        assert set(table.items) == {("#idx#alice", "#stats")}
+
+    def test_replayed_removal_creates_no_items(self):
+        table, index = _index_with(("n1", "alpha", ""))
+        old = {"title": "alpha", "content": ""}
+        index.update_note("alice", "n1", old, {"title": "beta", "content": ""})
+        index.update_note("alice", "n1", old, {"title": "beta", "content": ""})  # stream retry
+        assert ("#idx#alice", "alpha") not in table.items
+        assert [n for n, _ in index.search("alice", "beta")] == ["n1"]
+
+    def test_index_partition_cannot_be_a_user(self):
+        assert note_search.index_partition("alice") == "#idx#alice"
+        assert note_search.is_index_partition("#idx#alice")
+        assert not note_search.is_index_partition("user:alice#idx")
+
+    def test_query_reads_only_needed_items(self):
+        table, index = _index_with(*[(f"n{i}", f"note {i}", "common words here") for i in range(50)])
+        table.reads = 0
+        index.search("alice", "common")
+        assert table.reads == 2  # stats + one posting list
+
+    def test_users_are_isolated(self):
+        _, index = _index_with(("n1", "secret", ""))
+        assert index.search("bob", "secret") == []
+
+    def test_empty_query(self):
+        _, index = _index_with(("n1", "a", "b"))
+        assert index.search("alice", "  the  ") == []
@@ -4,11 +4,16 @@ import importlib
 import importlib.util
 import json
 import os
+import sys
 from unittest.mock import patch, MagicMock
 
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
 import pytest
 
 _notes_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "notes_api")
+sys.path.insert(0, _notes_dir)  # sibling modules (note_cache, ...)
 
 mock_table = MagicMock()
 mock_ddb_resource = MagicMock()
@@ -20,6 +25,14 @@ with patch.dict(os.environ, {"TABLE_NAME": "test-notes"}):
         notes = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(notes)
         notes.table = mock_table
+        import note_codec  # noqa: E402
+        import note_indexer  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache():
+    notes.cache.clear()
+    mock_table.reset_mock()
 
 
 def _make_event(method="GET", proxy="", body=None, principal_id="user:alice"):
@@ -71,6 +84,14 @@ class TestLambdaHandler:
         assert result["statusCode"] == 200
         assert json.loads(result["body"])["title"] == "Hello"
 
+    def test_decision_token_returned_to_client(self):
+        mock_table.query.return_value = {"Items": []}
+        event = _make_event(method="GET")
+        event["requestContext"]["authorizer"]["lambda"]["ztxp_decision_token"] = "claims.sig"
+        result = notes.lambda_handler(event, None)
+
+        assert result["headers"]["X-ZTXP-Decision"] == "claims.sig"
+
     def test_get_note_not_found(self):
         mock_table.get_item.return_value = {}
         result = notes.lambda_handler(_make_event(method="GET", proxy="missing"), None)
@@ -90,14 +111,20 @@ class TestLambdaHandler:
         assert "created_at" in body
 
     def test_update_note(self):
-        mock_table.update_item.return_value = {"Attributes": {"title": "Updated"}}
-        result = notes.lambda_handler(
-            _make_event(method="PUT", proxy="abc", body={"title": "Updated", "content": "New body"}),
-            None,
-        )
+        mock_table.update_item.return_value = {
+            "Attributes": {"title": "Updated", "created_at": "2024-01-01T00:00:00Z"}}
+        with patch.object(notes.note_codec, "unpack_content") as unpack:
+            result = notes.lambda_handler(
+                _make_event(method="PUT", proxy="abc", body={"title": "Updated", "content": "New body"}),
+                None,
+            )
+        body = json.loads(result["body"])
 
         assert result["statusCode"] == 200
-        assert json.loads(result["body"])["title"] == "Updated"
+        assert body["title"] == "Updated" and body["content"] == "New body"
+        assert body["note_id"] == "abc" and body["created_at"] == "2024-01-01T00:00:00Z"
+        assert mock_table.update_item.call_args.kwargs["ReturnValues"] == "UPDATED_NEW"
+        unpack.assert_not_called()  # the response never decompresses a stored body
 
     def test_delete_note(self):
         mock_table.delete_item.return_value = {}
@@ -115,3 +142,178 @@ class TestLambdaHandler:
         event["body"] = "not-json"
         result = notes.lambda_handler(event, None)
         assert result["statusCode"] == 400
+
+    @pytest.mark.parametrize("method,proxy,body", [
+        ("POST", "", {"title": "t", "content": 42}),
+        ("POST", "", {"title": ["t"], "content": "c"}),
+        ("PUT", "abc", {"title": "t", "content": {"text": "c"}}),
+        ("PUT", "abc", {"content": None}),
+    ])
+    def test_non_string_fields_rejected(self, method, proxy, body):
+        result = notes.lambda_handler(_make_event(method=method, proxy=proxy, body=body), None)
+        assert result["statusCode"] == 400
+        assert json.loads(result["body"]) == {"error": "invalid_note"}
+        mock_table.put_item.assert_not_called()
+        mock_table.update_item.assert_not_called()
+
+    def test_non_object_body_rejected(self):
+        event = _make_event(method="POST")
+        event["body"] = json.dumps(["content"])
+        result = notes.lambda_handler(event, None)
+        assert result["statusCode"] == 400
+
+
+class TestReadCache:
+    def test_list_served_from_cache(self):
+        mock_table.query.return_value = {"Items": [{"note_id": "1"}]}
+        notes.lambda_handler(_make_event(method="GET"), None)
+        result = notes.lambda_handler(_make_event(method="GET"), None)
+
+        assert json.loads(result["body"])["notes"] == [{"note_id": "1"}]
+        assert mock_table.query.call_count == 1
+
+    def test_writes_invalidate(self):
+        mock_table.query.return_value = {"Items": []}
+        notes.lambda_handler(_make_event(method="GET"), None)
+        notes.lambda_handler(_make_event(method="POST", body={"title": "t"}), None)
+        notes.lambda_handler(_make_event(method="GET"), None)
+
+        assert mock_table.query.call_count == 2
+
+    def test_users_are_isolated(self):
+        mock_table.query.return_value = {"Items": []}
+        notes.lambda_handler(_make_event(method="GET", principal_id="user:alice"), None)
+        notes.lambda_handler(_make_event(method="DELETE", proxy="x", principal_id="user:bob"), None)
+        notes.lambda_handler(_make_event(method="GET", principal_id="user:alice"), None)
+
+        assert mock_table.query.call_count == 1
+
+    def test_missing_note_not_cached(self):
+        mock_table.get_item.return_value = {}
+        notes.lambda_handler(_make_event(method="GET", proxy="missing"), None)
+        notes.lambda_handler(_make_event(method="GET", proxy="missing"), None)
+
+        assert mock_table.get_item.call_count == 2
+
+
+class TestSearch:
+    def test_search_route(self):
+        mock_table.get_item.return_value = {"Item": {"note_id": "abc", "title": "Budget"}}
+        event = _make_event(method="GET", proxy="search")
+        event["queryStringParameters"] = {"q": "budg*", "k": "5"}
+        with patch.object(notes.search_index, "search", return_value=[("abc", 1.23456)]) as search:
+            result = notes.lambda_handler(event, None)
+
+        search.assert_called_once_with("user:alice", "budg*", 5)
+        assert json.loads(result["body"])["results"] == [{"note_id": "abc", "title": "Budget", "score": 1.2346}]
+
+    def test_writes_leave_index_to_stream(self):
+        with patch.object(notes.search_index, "update_note") as update:
+            notes.lambda_handler(_make_event(method="POST", body={"title": "t", "content": "c"}), None)
+        update.assert_not_called()
+
+    def test_index_partition_principal_rejected(self):
+        result = notes.lambda_handler(_make_event(method="GET", principal_id="#idx#user:alice"), None)
+        assert result["statusCode"] == 403
+        mock_table.query.assert_not_called()
+
+
+def _stream_record(seq, keys, old=None, new=None):
+    serialize = TypeSerializer().serialize
+    change = {"Keys": {k: serialize(v) for k, v in keys.items()}, "SequenceNumber": seq}
+    if old is not None:
+        change["OldImage"] = {k: serialize(v) for k, v in old.items()}
+    if new is not None:
+        change["NewImage"] = {k: serialize(v) for k, v in new.items()}
+    return {"eventName": "MODIFY", "dynamodb": change}
+
+
+class TestIndexer:
+    def test_applies_diff_with_plain_content(self):
+        keys = {"user_id": "user:alice", "note_id": "n1"}
+        new = {**keys, "title": "big", **note_codec.pack_content("long text " * 200, 256)}
+        with patch.object(note_indexer.search_index, "update_note") as update:
+            result = note_indexer.lambda_handler({"Records": [_stream_record("1", keys, new=new)]}, None)
+
+        assert result == {"batchItemFailures": []}
+        user_id, note_id, old, indexed = update.call_args.args
+        assert (user_id, note_id, old) == ("user:alice", "n1", None)
+        assert indexed["content"] == "long text " * 200
+
+    def test_index_records_skipped(self):
+        keys = {"user_id": "#idx#user:alice", "note_id": "term"}
+        with patch.object(note_indexer.search_index, "update_note") as update:
+            note_indexer.lambda_handler({"Records": [_stream_record("1", keys, new={**keys, "postings": {}})]}, None)
+        update.assert_not_called()
+
+    def test_failure_reports_first_failed_record(self):
+        records = [_stream_record(str(n), {"user_id": "user:alice", "note_id": f"n{n}"},
+                                  old={"title": "a"}) for n in range(3)]
+        with patch.object(note_indexer.search_index, "update_note", side_effect=[None, RuntimeError("x")]) as update:
+            result = note_indexer.lambda_handler({"Records": records}, None)
+
+        assert result == {"batchItemFailures": [{"itemIdentifier": "1"}]}
+        assert update.call_count == 2
+
+    def _poison_batch(self):
+        poison_keys = {"user_id": "user:alice", "note_id": "bad"}
+        poison = _stream_record("1", poison_keys, new={**poison_keys, "content_z": b"x", "content_codec": "lz4"})
+        good_keys = {"user_id": "user:alice", "note_id": "good"}
+        return [poison, _stream_record("2", good_keys, new={**good_keys, "title": "t", "content": "c"})]
+
+    def test_poison_record_dead_lettered_and_skipped(self):
+        sqs = MagicMock()
+        with patch.object(note_indexer, "sqs", sqs), patch.object(note_indexer, "INDEX_DLQ_URL", "https://sqs/dlq"), \
+                patch.object(note_indexer.search_index, "update_note") as update:
+            result = note_indexer.lambda_handler({"Records": self._poison_batch()}, None)
+
+        assert result == {"batchItemFailures": []}
+        assert update.call_args.args[1] == "good"
+        sent = sqs.send_message.call_args.kwargs
+        assert sent["QueueUrl"] == "https://sqs/dlq"
+        body = json.loads(sent["MessageBody"])
+        assert body["sequenceNumber"] == "1" and "lz4" in body["error"]
+
+    def test_poison_record_retried_when_dlq_unreachable(self):
+        sqs = MagicMock()
+        sqs.send_message.side_effect = OSError("sqs down")
+        with patch.object(note_indexer, "sqs", sqs), patch.object(note_indexer, "INDEX_DLQ_URL", "https://sqs/dlq"), \
+                patch.object(note_indexer.search_index, "update_note") as update:
+            result = note_indexer.lambda_handler({"Records": self._poison_batch()}, None)
+
+        assert result == {"batchItemFailures": [{"itemIdentifier": "1"}]}
+        update.assert_not_called()
+
+    def test_throttling_is_retried_not_dead_lettered(self):
+        throttled = ClientError({"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "slow"}},
+                                "UpdateItem")
+        sqs = MagicMock()
+        records = self._poison_batch()[1:]
+        with patch.object(note_indexer, "sqs", sqs), \
+                patch.object(note_indexer.search_index, "update_note", side_effect=throttled):
+            result = note_indexer.lambda_handler({"Records": records}, None)
+
+        assert result == {"batchItemFailures": [{"itemIdentifier": "2"}]}
+        sqs.send_message.assert_not_called()
+
+
+class TestCompression:
+    def test_large_note_stored_compressed(self):
+        content = "line of a long note\n" * 500
+        with patch.object(notes.note_codec, "COMPRESS_MIN_BYTES", 1024):
+            result = notes.lambda_handler(_make_event(method="POST", body={"title": "big", "content": content}), None)
+
+        stored = mock_table.put_item.call_args.kwargs["Item"]
+        assert "content" not in stored and stored["content_codec"] == "zlib"
+        assert json.loads(result["body"])["content"] == content
+
+        mock_table.get_item.return_value = {"Item": stored}
+        fetched = notes.lambda_handler(_make_event(method="GET", proxy=stored["note_id"]), None)
+        assert json.loads(fetched["body"]) == {k: v for k, v in json.loads(result["body"]).items()}
+
+    def test_list_fields_projection(self):
+        mock_table.query.return_value = {"Items": [{"note_id": "1", "title": "T", "content": "body"}]}
+        event = _make_event(method="GET")
+        event["queryStringParameters"] = {"fields": "title"}
+        result = notes.lambda_handler(event, None)
+        assert json.loads(result["body"])["notes"] == [{"note_id": "1", "title": "T"}]
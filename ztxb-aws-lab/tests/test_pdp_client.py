@@ -0,0 +1,346 @@
+# tests/test_pdp_client.py
+"""Unit tests for the Broker's PDP client (breaker, fallback, replicas, hedging)."""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+_broker_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "ztxp_broker")
+sys.path.insert(0, _broker_dir)
+
+import pdp_client  # noqa: E402
+from fake_opa import FakeOpaCluster  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeOpa:
+    """Transport stand-in: returns ``result`` or raises, advancing the clock."""
+
+    def __init__(self, clock, result=True, latency=0.01):
+        self.clock = clock
+        self.result = result
+        self.latency = latency
+        self.fail = False
+        self.calls = 0
+        self.timeouts = []
+        self.urls = []
+
+    def __call__(self, url, body, timeout):
+        self.calls += 1
+        self.timeouts.append(timeout)
+        self.urls.append(url)
+        self.clock.advance(self.latency)
+        if self.fail:
+            raise OSError("connection refused")
+        return {"result": self.result}
+
+
+OPA_INPUT = {"action": "notes:Read", "principal": {"id": "user:alice"}}
+
+
+def _client(clock, opa, grace=0.0, **breaker_kwargs):
+    breaker_kwargs.setdefault("min_calls", 4)
+    breaker_kwargs.setdefault("cooldown_seconds", 5.0)
+    breaker = pdp_client.CircuitBreaker(clock=clock, **breaker_kwargs)
+    stale = pdp_client.StaleAllowCache(grace_seconds=grace, clock=clock)
+    return pdp_client.PdpClient("http://pdp/v1/data/authz/allow", breaker=breaker,
+                                stale_cache=stale, transport=opa, clock=clock)
+
+
+class TestCircuitBreaker:
+    def test_trips_on_error_rate(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock)
+        client = _client(clock, opa)
+        opa.fail = True
+
+        for _ in range(4):
+            assert client.evaluate(OPA_INPUT) is False
+        assert client.breaker.state == pdp_client.OPEN
+
+        # While open, calls fail fast without touching the PDP
+        assert client.evaluate(OPA_INPUT) is False
+        assert opa.calls == 4
+        assert client.metrics()["short_circuited"] == 1
+
+    def test_trips_on_slow_calls(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock, latency=2.0)
+        client = _client(clock, opa, slow_call_seconds=1.0)
+
+        for _ in range(4):
+            client.evaluate(OPA_INPUT)
+        assert client.breaker.state == pdp_client.OPEN
+
+    def test_half_open_probe_closes_on_success(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock)
+        client = _client(clock, opa)
+        opa.fail = True
+        for _ in range(4):
+            client.evaluate(OPA_INPUT)
+
+        clock.advance(5.0)
+        assert client.breaker.state == pdp_client.HALF_OPEN
+        opa.fail = False
+        assert client.evaluate(OPA_INPUT) is True
+        assert client.breaker.state == pdp_client.CLOSED
+
+    def test_half_open_probe_reopens_on_failure(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock)
+        client = _client(clock, opa)
+        opa.fail = True
+        for _ in range(4):
+            client.evaluate(OPA_INPUT)
+
+        clock.advance(5.0)
+        client.evaluate(OPA_INPUT)
+        assert client.breaker.state == pdp_client.OPEN
+
+    def test_half_open_allows_single_probe(self):
+        clock = FakeClock()
+        breaker = pdp_client.CircuitBreaker(min_calls=1, cooldown_seconds=1.0, clock=clock)
+        breaker.record(False, 0.01)
+        clock.advance(1.0)
+        assert breaker.allow_request() is True
+        assert breaker.allow_request() is False
+
+
+    def test_unserializable_input_leaves_probe_slot_free(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock)
+        client = _client(clock, opa)
+        opa.fail = True
+        for _ in range(4):
+            client.evaluate(OPA_INPUT)
+        clock.advance(5.0)
+        opa.fail = False
+
+        with pytest.raises(pdp_client.PdpUnavailable, match="invalid_input"):
+            client.query({"action": object()})
+        assert client.breaker.state == pdp_client.HALF_OPEN
+        assert client.evaluate(OPA_INPUT) is True
+        assert client.breaker.state == pdp_client.CLOSED
+
+
+class TestAdaptiveTimeout:
+    def test_default_until_enough_samples(self):
+        clock = FakeClock()
+        client = _client(clock, FakeOpa(clock))
+        assert client.current_timeout() == client.max_timeout
+
+    def test_follows_observed_latency(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock, latency=0.1)
+        client = _client(clock, opa)
+        for _ in range(20):
+            client.evaluate(OPA_INPUT)
+        assert client.current_timeout() == pytest.approx(0.3)
+
+    def test_clamped_to_minimum(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock, latency=0.001)
+        client = _client(clock, opa)
+        for _ in range(20):
+            client.evaluate(OPA_INPUT)
+        assert client.current_timeout() == client.min_timeout
+
+
+class TestStaleAllowFallback:
+    def _trip(self, client, opa):
+        opa.fail = True
+        for _ in range(4):
+            client.evaluate({"action": "notes:Write"})
+        assert client.breaker.state == pdp_client.OPEN
+
+    def test_serves_cached_allow_while_open(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock)
+        client = _client(clock, opa, grace=30.0)
+        assert client.evaluate(OPA_INPUT) is True
+
+        self._trip(client, opa)
+        assert client.evaluate(OPA_INPUT) is True
+        assert client.metrics()["stale_served"] == 1
+
+    def test_grace_period_expires(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock)
+        client = _client(clock, opa, grace=30.0)
+        client.evaluate(OPA_INPUT)
+
+        self._trip(client, opa)
+        clock.advance(31.0)
+        assert client.evaluate(OPA_INPUT) is False
+
+    def test_only_identical_inputs(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock)
+        client = _client(clock, opa, grace=30.0)
+        client.evaluate(OPA_INPUT)
+
+        self._trip(client, opa)
+        assert client.evaluate({**OPA_INPUT, "action": "notes:Delete"}) is False
+
+    def test_disabled_by_default(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock)
+        client = _client(clock, opa)
+        client.evaluate(OPA_INPUT)
+
+        self._trip(client, opa)
+        assert client.evaluate(OPA_INPUT) is False
+
+    def test_deny_evicts_cached_allow(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock)
+        client = _client(clock, opa, grace=30.0)
+        client.evaluate(OPA_INPUT)
+        opa.result = False
+        client.evaluate(OPA_INPUT)
+
+        self._trip(client, opa)
+        assert client.evaluate(OPA_INPUT) is False
+
+
+class TestTenantPaths:
+    def test_path_replaces_decision_path(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock)
+        client = _client(clock, opa)
+        client.evaluate(OPA_INPUT, "/v1/data/tenants/acme/authz/allow")
+        client.evaluate(OPA_INPUT)
+        assert opa.urls == ["http://pdp/v1/data/tenants/acme/authz/allow", "http://pdp/v1/data/authz/allow"]
+
+    def test_stale_allow_is_per_path(self):
+        clock = FakeClock()
+        opa = FakeOpa(clock)
+        client = _client(clock, opa, grace=30.0)
+        client.evaluate(OPA_INPUT, "/v1/data/tenants/acme/authz/allow")
+
+        TestStaleAllowFallback._trip(None, client, opa)
+        assert client.evaluate(OPA_INPUT, "/v1/data/tenants/acme/authz/allow") is True
+        assert client.evaluate(OPA_INPUT, "/v1/data/tenants/globex/authz/allow") is False
+        assert client.evaluate(OPA_INPUT) is False
+
+
+class TestReplicaPool:
+    def test_least_outstanding(self):
+        pool = pdp_client.ReplicaPool(["http://a/x", "http://b/x", "http://c/x"])
+        first = pool.acquire()
+        second = pool.acquire()
+        third = pool.acquire()
+        assert len({first.url, second.url, third.url}) == 3
+
+        pool.release(second, True, 0.01)
+        assert pool.acquire() is second
+
+    def test_ejects_after_consecutive_failures(self):
+        clock = FakeClock()
+        pool = pdp_client.ReplicaPool(["http://a/x", "http://b/x"], eject_after=2,
+                                      probe=lambda url, timeout: False, clock=clock)
+        bad = pool.endpoints[0]
+        for _ in range(2):
+            bad.outstanding += 1
+            pool.release(bad, False, 0.01)
+
+        assert bad not in pool.healthy()
+        assert all(pool.acquire() is not bad for _ in range(5))
+
+    def test_panic_mode_when_all_ejected(self):
+        clock = FakeClock()
+        pool = pdp_client.ReplicaPool(["http://a/x"], eject_after=1, clock=clock)
+        ep = pool.acquire()
+        pool.release(ep, False, 0.01)
+        assert pool.healthy() == []
+        assert pool.acquire() is ep
+
+    def test_health_probe_reinstates(self):
+        clock = FakeClock()
+        probed = []
+
+        def probe(url, timeout):
+            probed.append(url)
+            return True
+
+        pool = pdp_client.ReplicaPool(["http://a:8181/v1/data/authz/allow", "http://b/x"],
+                                      eject_after=1, eject_seconds=5.0, probe=probe, clock=clock)
+        bad = pool.acquire()
+        pool.release(bad, False, 0.01)
+        clock.advance(5.0)
+        pool.acquire()  # schedules the probe
+        for _ in range(100):
+            if bad in pool.healthy():
+                break
+            time.sleep(0.01)
+
+        assert probed == ["http://a:8181/health"]
+        assert bad in pool.healthy()
+
+
+class TestHedging:
+    def test_deadline_follows_injected_clock(self):
+        clock = FakeClock()
+        release = threading.Event()
+
+        def hanging(url, body, timeout):
+            clock.advance(timeout + 1.0)  # past the deadline on the client's clock
+            release.wait(5.0)
+            return {"result": True}
+
+        client = pdp_client.PdpClient(["http://a:8181/v1/data/authz/allow", "http://b:8181/v1/data/authz/allow"],
+                                      transport=hanging, hedge_default_delay=0.01, clock=clock)
+        started = time.monotonic()
+        try:
+            with pytest.raises(pdp_client.PdpUnavailable, match="pdp_timeout"):
+                client.query(OPA_INPUT)
+        finally:
+            release.set()
+        assert time.monotonic() - started < client.max_timeout / 2
+
+
+class TestMultiReplicaCluster:
+    @pytest.fixture
+    def opa(self):
+        with FakeOpaCluster(replicas=2) as cluster:
+            yield cluster
+
+    def test_evaluates_against_fake_opa(self, opa):
+        client = pdp_client.PdpClient(opa.urls)
+        assert client.evaluate({"action": "notes:Read", "context": {}}) is True
+        assert client.evaluate({"action": "notes:Write", "principal": {"groups": []}}) is False
+
+    def test_hedges_around_slow_replica(self, opa):
+        client = pdp_client.PdpClient(opa.urls, hedge_default_delay=0.05)
+        opa.set_latency(0, 1.0)
+
+        started = time.monotonic()
+        for _ in range(4):
+            assert client.evaluate({"action": "notes:Read", "context": {}}) is True
+        elapsed = time.monotonic() - started
+
+        assert elapsed < 1.0
+        assert client.metrics()["hedged"] >= 1
+
+    def test_ejects_unhealthy_replica(self, opa):
+        client = pdp_client.PdpClient(opa.urls, hedge=False)
+        opa.set_healthy(1, False)
+
+        for _ in range(10):
+            client.evaluate({"action": "notes:Read", "context": {}})
+
+        assert client.metrics()["ejections"] == 1
+        assert client.metrics()["healthy_endpoints"] == 1
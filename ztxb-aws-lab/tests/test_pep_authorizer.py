@@ -1,6 +1,7 @@
 # tests/test_pep_authorizer.py
 """Unit tests for the PEP Authorizer Lambda handler."""
 import base64
+import hashlib
 import importlib
 import json
 import sys
@@ -12,6 +13,9 @@ import pytest
 
 # Use importlib to avoid module name collisions between handler.py files
 _pep_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "pep_authorizer")
+sys.path.insert(0, _pep_dir)  # sibling modules (tam_template, ...)
+# revocation.py is packaged with the PEP from the Broker (see api_notes/lambda.tf)
+sys.path.insert(1, os.path.join(_pep_dir, "..", "ztxp_broker"))
 
 with patch.dict(os.environ, {"KMS_KEY_ARN": "arn:aws:kms:us-east-1:123456789012:key/test-key", "BROKER_URL": "https://broker.example.com"}):
     with patch("boto3.client"):
@@ -104,6 +108,62 @@ class TestBuildTam:
         assert tam["subject"]["groups"] == []
 
 
+class TestTamTemplate:
+    def _jwt(self, claims):
+        payload = base64.b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+        return f"Bearer header.{payload}.sig"
+
+    @pytest.mark.parametrize("claims, headers, path", [
+        ({}, {}, "/notes"),
+        ({"sub": "abc", "cognito:groups": ["writer", "admin"]}, {}, "/notes/123"),
+        ({"sub": "ünïcødé \"quoted\" \\ back", "cognito:groups": []}, {"x-device-id": "läptop"}, "/nötes/ü"),
+        ({"sub": "x", "cognito:groups": "admin"}, {"x-device-compliant": "false"}, "/notes"),
+        ({"sub": "x\u2028y", "cognito:groups": [{"nested": {"b": 1, "a": 2}}]}, {"x-device-trust": "\ttab"}, "/"),
+    ])
+    def test_payload_matches_canonical_json(self, claims, headers, path):
+        auth = self._jwt(claims) if claims else ""
+        tam = pep.build_tam(_make_event(path=path, auth_header=auth, extra_headers=headers))
+        assert tam.payload == pep.canonical_json(dict(tam))
+
+    def test_template_built_once_per_issuer(self):
+        pep.build_tam(_make_event())
+        template = pep._tam_template(pep.TAM_ISSUER)
+        pep.build_tam(_make_event())
+        assert pep._tam_template(pep.TAM_ISSUER) is template
+
+    def test_signing_uses_prerendered_payload(self):
+        kms = MagicMock()
+        kms.sign.return_value = {"Signature": b"sig"}
+        tam = pep.build_tam(_make_event())
+        with patch.object(pep, "kms_client", kms), patch.object(pep, "canonical_json") as canon:
+            pep.sign_tam(tam)
+        canon.assert_not_called()
+        assert kms.sign.call_args.kwargs["Message"] == hashlib.sha256(tam.payload).digest()
+
+    def test_stale_payload_not_used_after_signing(self):
+        tam = pep.build_tam(_make_event())
+        tam["signature"] = {"sig": "x"}
+        assert pep._payload(tam) == pep.canonical_json(tam)
+
+
+class TestRiskScore:
+    def test_default_without_index(self):
+        assert pep.build_tam(_make_event())["context"]["risk_score"] == 0
+
+    def test_build_tam_uses_reputation(self, tmp_path):
+        import ip_reputation
+
+        path = str(tmp_path / "rep.bin")
+        ip_reputation.build(["203.0.113.0/24,80"], path)
+        event = _make_event()
+        event["requestContext"]["http"]["sourceIp"] = "203.0.113.9"
+        with patch.object(pep, "reputation", ip_reputation.ReputationIndex(path)):
+            tam = pep.build_tam(event)
+
+        assert tam["context"]["risk_score"] == 80
+        assert tam.payload == pep.canonical_json(dict(tam))
+
+
 class TestDecodeJwtClaims:
     def test_decodes_claims(self):
         claims = {"sub": "abc", "cognito:groups": ["writer"]}
@@ -130,6 +190,24 @@ class TestCanonicalJson:
         assert b" " not in result
 
 
+class TestSignTamCompact:
+    def test_compact_carries_signed_bytes(self):
+        kms = MagicMock()
+        kms.sign.return_value = {"Signature": b"der-signature"}
+        tam = pep.build_tam(_make_event())
+
+        with patch.object(pep, "kms_client", kms):
+            body = pep.sign_tam_compact(tam)
+
+        payload_b64, sig_b64 = body["tam_compact"].split(".")
+        payload = base64.urlsafe_b64decode(payload_b64 + "=" * (-len(payload_b64) % 4))
+        sig = base64.urlsafe_b64decode(sig_b64 + "=" * (-len(sig_b64) % 4))
+        assert payload == pep.canonical_json(tam)
+        assert sig == b"der-signature"
+        assert body["alg"] == "ECDSA_SHA_256"
+        assert "signature" not in tam
+
+
 class TestLambdaHandler:
     @patch.object(pep, "call_broker")
     @patch.object(pep, "sign_tam")
@@ -162,3 +240,58 @@ class TestLambdaHandler:
 
         assert result["isAuthorized"] is False
         assert result["context"]["reason"] == "signing_failed"
+
+    @patch.object(pep, "call_broker")
+    @patch.object(pep, "sign_tam_compact")
+    def test_compact_envelope(self, mock_sign, mock_broker):
+        mock_sign.return_value = {"tam_compact": "p.s", "alg": "ECDSA_SHA_256", "key_id": "k"}
+        mock_broker.return_value = {"decision": "allow", "reason": "policy_allow"}
+
+        with patch.object(pep, "BROKER_ENVELOPE", "compact"):
+            result = pep.lambda_handler(_make_event(), None)
+
+        assert result["isAuthorized"] is True
+        mock_broker.assert_called_once_with({"tam_compact": "p.s", "alg": "ECDSA_SHA_256", "key_id": "k"})
+
+
+class TestInProcessTransport:
+    @pytest.fixture
+    def broker(self):
+        path = os.path.join(_pep_dir, "..", "ztxp_broker", "handler.py")
+        with patch.dict(os.environ, {"PDP_URL": "pdp.internal"}), patch("boto3.client"):
+            broker = pep.load_broker(path)
+        broker.kms_client.verify.return_value = {"SignatureValid": True}
+        return broker
+
+    def test_broker_verifies_signed_bytes_without_http(self, broker):
+        kms = MagicMock()
+        kms.sign.return_value = {"Signature": b"der-signature"}
+        transport = pep.InProcessTransport(broker)
+        with patch.object(pep, "kms_client", kms), patch.object(pep, "broker_transport", transport), \
+                patch.object(pep, "call_broker") as http, patch.object(broker, "call_pdp", return_value=(True, "policy_allow")), \
+                patch.object(broker, "canonical_json") as canon:
+            result = pep.lambda_handler(_make_event(), None)
+
+        assert result["isAuthorized"] is True
+        assert result["context"]["ztxp_reason"] == "policy_allow"
+        digest = kms.sign.call_args.kwargs["Message"]
+        verify = broker.kms_client.verify.call_args.kwargs
+        assert verify["Message"] == digest and verify["Signature"] == b"der-signature"
+        assert verify["KeyId"] == pep.KMS_KEY_ARN
+        http.assert_not_called()
+        canon.assert_not_called()
+
+    def test_invalid_signature_denied(self, broker):
+        broker.kms_client.verify.return_value = {"SignatureValid": False}
+        kms = MagicMock()
+        kms.sign.return_value = {"Signature": b"forged"}
+        with patch.object(pep, "kms_client", kms), \
+                patch.object(pep, "broker_transport", pep.InProcessTransport(broker)):
+            result = pep.lambda_handler(_make_event(), None)
+
+        assert result["isAuthorized"] is False
+        assert result["context"]["ztxp_reason"] == "signature_rejected: invalid_signature"
+
+    def test_unknown_transport_rejected(self):
+        with patch.object(pep, "BROKER_TRANSPORT", "grpc"), pytest.raises(ValueError, match="BROKER_TRANSPORT"):
+            pep._transport_from_env()
@@ -0,0 +1,173 @@
+# tests/test_profiler.py
+"""Unit tests for the Broker's on-demand sampling profiler."""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from unittest.mock import patch
+
+_broker_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "ztxp_broker")
+sys.path.insert(0, _broker_dir)
+
+import profiler  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def _spin(seconds):
+    deadline = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+    return n
+
+
+def _outer():
+    return _spin(0.2)
+
+
+class TestCollapse:
+    def test_root_first_labels(self):
+        def inner():
+            return profiler.collapse(sys._getframe())
+
+        stack = inner()
+        frames = stack.split(";")
+        assert frames[-1].startswith("test_profiler.py:") and frames[-1].endswith("inner")
+        assert any("test_root_first_labels" in f for f in frames[:-1])
+
+    def test_depth_is_capped(self):
+        assert len(profiler.collapse(sys._getframe(), max_depth=2).split(";")) == 2
+
+    def test_format_collapsed_orders_by_count(self):
+        text = profiler.format_collapsed(Counter({"a;b": 1, "a;c": 5}))
+        assert text == "a;c 5\na;b 1\n"
+
+
+class TestSelection:
+    def test_disabled_by_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            prof = profiler.from_env()
+        assert not prof.active
+
+    def test_one_in_k(self):
+        prof = profiler.Profiler(sample_every=3, hz=50)
+        try:
+            for _ in range(9):
+                assert prof.call(lambda: "ok") == "ok"
+        finally:
+            prof.sampler.stop()
+        assert prof.invocations == 9
+        assert prof.profiled == 3
+
+    def test_window_expires(self):
+        clock = FakeClock()
+        prof = profiler.Profiler(window_seconds=5, hz=50, clock=clock)
+        assert prof.active
+        prof.call(lambda: None)
+        prof.call(lambda: None)
+        clock.advance(6)
+        prof.call(lambda: None)
+        assert prof.profiled == 2
+        assert not prof.active
+        assert prof.sampler._thread is None
+
+    def test_exception_propagates_and_unregisters(self):
+        prof = profiler.Profiler(sample_every=1, hz=50)
+        try:
+            try:
+                prof.call(lambda: 1 / 0)
+            except ZeroDivisionError:
+                pass
+            else:
+                raise AssertionError("exception swallowed")
+        finally:
+            prof.sampler.stop()
+        assert not prof.sampler._threads
+
+
+class TestSampling:
+    def test_busy_function_is_sampled(self):
+        prof = profiler.Profiler(sample_every=1, hz=200)
+        try:
+            prof.call(_outer)
+        finally:
+            prof.sampler.stop()
+        counts = prof.sampler.drain()
+        assert prof.sampler.samples > 0
+        assert any("test_profiler.py:_outer;test_profiler.py:_spin" in stack for stack in counts)
+
+    def test_idle_sampler_does_not_poll(self):
+        class CountingEvent(threading.Event):
+            waits = 0
+
+            def wait(self, timeout=None):
+                CountingEvent.waits += 1
+                return super().wait(timeout)
+
+        sampler = profiler.StackSampler(hz=1000)
+        sampler._stop = CountingEvent()
+        sampler.start()
+        try:
+            time.sleep(0.1)
+            assert CountingEvent.waits <= 1
+            sampler.add(threading.get_ident())
+            time.sleep(0.05)
+            assert sampler.samples > 0
+            sampler.discard(threading.get_ident())
+        finally:
+            sampler.stop()
+        assert sampler._thread is None
+
+    def test_flush_to_directory(self, tmp_path):
+        prof = profiler.Profiler(sample_every=1, hz=200, output=str(tmp_path))
+        try:
+            prof.call(_outer)
+        finally:
+            prof.sampler.stop()
+        prof.flush()
+        path = tmp_path / f"broker-{os.getpid()}.collapsed"
+        lines = path.read_text().splitlines()
+        assert lines
+        stack, n = lines[0].rsplit(" ", 1)
+        assert int(n) > 0 and ";" in stack
+
+    def test_flush_to_log(self, caplog):
+        prof = profiler.Profiler(sample_every=1, hz=200)
+        try:
+            prof.call(_outer)
+        finally:
+            prof.sampler.stop()
+        with caplog.at_level(logging.INFO):
+            prof.flush()
+        assert any(r.getMessage().startswith("ZTXP_PROFILE ") for r in caplog.records)
+
+
+class TestAllocations:
+    def test_emits_emf_and_stops_tracing(self, caplog):
+        prof = profiler.Profiler(sample_every=1, hz=50, allocations=True)
+        try:
+            with caplog.at_level(logging.INFO):
+                prof.call(lambda: [bytes(1024) for _ in range(100)])
+        finally:
+            prof.sampler.stop()
+        assert not tracemalloc.is_tracing()
+        records = [json.loads(r.getMessage()) for r in caplog.records if r.getMessage().startswith("{")]
+        assert records
+        metrics = records[-1]
+        assert metrics["_aws"]["CloudWatchMetrics"][0]["Namespace"] == "ZTXP/Broker/Profile"
+        assert metrics["PeakTracedKB"] >= 100
+        assert "AllocatedBlocks" in metrics and "DurationMs" in metrics
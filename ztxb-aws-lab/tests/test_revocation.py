@@ -0,0 +1,155 @@
+# tests/test_revocation.py
+"""Unit tests for the Broker's revocation lists (Bloom filter + sorted hashes)."""
+import io
+import os
+import sys
+
+import pytest
+
+_broker_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "ztxp_broker")
+sys.path.insert(0, _broker_dir)
+
+import revocation  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def _build(path, entries):
+    return revocation.build(entries, str(path))
+
+
+def _tam(subject="user:alice", device="device:abc"):
+    return {"subject": {"id": subject}, "device": {"id": device}}
+
+
+class TestRevocationList:
+    def test_members_and_non_members(self, tmp_path):
+        entries = [("key", "arn:aws:kms:old"), ("subject", "user:mallory"), ("device", "device:lost")]
+        assert _build(tmp_path / "r.bin", entries) == 3
+        revoked = revocation.RevocationList(str(tmp_path / "r.bin"))
+
+        for kind, value in entries:
+            assert revoked.contains(kind, value)
+        assert not revoked.contains("subject", "user:alice")
+        # Kinds are separate namespaces
+        assert not revoked.contains("device", "user:mallory")
+
+    def test_large_list_has_no_false_positives(self, tmp_path):
+        _build(tmp_path / "r.bin", (("subject", f"user:{i}") for i in range(50000)))
+        revoked = revocation.RevocationList(str(tmp_path / "r.bin"))
+
+        assert len(revoked) == 50000
+        assert all(revoked.contains("subject", f"user:{i}") for i in range(0, 50000, 101))
+        assert not any(revoked.contains("subject", f"other:{i}") for i in range(20000))
+
+    def test_empty_list(self, tmp_path):
+        _build(tmp_path / "r.bin", [])
+        assert not revocation.RevocationList(str(tmp_path / "r.bin")).contains("key", "k")
+
+    def test_rejects_foreign_and_truncated_files(self, tmp_path):
+        (tmp_path / "junk.bin").write_bytes(b"not a revocation list, just enough bytes to fill a header")
+        with pytest.raises(ValueError, match="not a revocation list"):
+            revocation.RevocationList(str(tmp_path / "junk.bin"))
+
+        _build(tmp_path / "r.bin", [("key", "k")])
+        data = (tmp_path / "r.bin").read_bytes()
+        (tmp_path / "short.bin").write_bytes(data[:-4])
+        with pytest.raises(ValueError, match="truncated"):
+            revocation.RevocationList(str(tmp_path / "short.bin"))
+
+    def test_parse_entries(self):
+        lines = ["# revoked 2025-06-01", "key arn:aws:kms:old", "", "subject user:mallory  # left"]
+        assert list(revocation.parse_entries(lines)) == [("key", "arn:aws:kms:old"), ("subject", "user:mallory")]
+        with pytest.raises(ValueError, match="line 1"):
+            list(revocation.parse_entries(["user user:x"]))
+
+
+class TestRevocationChecker:
+    def test_disabled_without_source(self):
+        checker = revocation.RevocationChecker("")
+        assert not checker.enabled
+        assert checker.available
+        assert checker.revoked(_tam()) is None
+
+    def test_subject_and_device(self, tmp_path):
+        _build(tmp_path / "r.bin", [("subject", "user:mallory"), ("device", "device:lost")])
+        checker = revocation.RevocationChecker(str(tmp_path / "r.bin"))
+
+        assert checker.revoked(_tam()) is None
+        assert checker.revoked(_tam(subject="user:mallory")) == "subject"
+        assert checker.revoked(_tam(device="device:lost")) == "device"
+        assert checker.key_revoked("arn:aws:kms:current") is False
+
+    def test_hot_swap_after_check_interval(self, tmp_path):
+        path = tmp_path / "r.bin"
+        clock = FakeClock()
+        _build(path, [("key", "arn:aws:kms:old")])
+        checker = revocation.RevocationChecker(str(path), check_seconds=30, clock=clock)
+        old = checker.current
+        assert checker.key_revoked("arn:aws:kms:old")
+
+        # Publish a new list the way operators should: write, then rename over
+        _build(tmp_path / "next.bin", [("key", "arn:aws:kms:leaked")])
+        os.replace(tmp_path / "next.bin", path)
+        assert checker.key_revoked("arn:aws:kms:old")  # not due yet
+        clock.advance(31)
+        assert checker.key_revoked("arn:aws:kms:leaked")
+        assert not checker.key_revoked("arn:aws:kms:old")
+        assert checker.counters["reloads"] == 2
+        # The replaced list's mapping is still readable by anyone holding it
+        assert old.contains("key", "arn:aws:kms:old")
+
+    def test_bad_update_keeps_current_list(self, tmp_path):
+        path = tmp_path / "r.bin"
+        clock = FakeClock()
+        _build(path, [("subject", "user:mallory")])
+        checker = revocation.RevocationChecker(str(path), check_seconds=1, clock=clock)
+
+        (tmp_path / "next.bin").write_bytes(b"garbage")
+        os.replace(tmp_path / "next.bin", path)
+        clock.advance(2)
+        assert checker.revoked(_tam(subject="user:mallory")) == "subject"
+        assert checker.counters["reload_failures"] == 1
+
+    def test_required_list_missing_is_unavailable(self, tmp_path):
+        checker = revocation.RevocationChecker(str(tmp_path / "missing.bin"), required=True)
+        assert checker.enabled
+        assert not checker.available
+
+    def test_s3_conditional_refresh(self, tmp_path):
+        _build(tmp_path / "src.bin", [("device", "device:lost")])
+        data = (tmp_path / "src.bin").read_bytes()
+
+        class NotModified(Exception):
+            response = {"Error": {"Code": "304"}}
+
+        class FakeS3:
+            def __init__(self):
+                self.calls = []
+
+            def get_object(self, **params):
+                self.calls.append(params)
+                if params.get("IfNoneMatch") == '"v1"':
+                    raise NotModified()
+                return {"Body": io.BytesIO(data), "ETag": '"v1"'}
+
+        s3 = FakeS3()
+        clock = FakeClock()
+        checker = revocation.RevocationChecker("s3://lists/revocations.bin", check_seconds=10,
+                                               s3_client=s3, cache_dir=str(tmp_path), clock=clock)
+        assert checker.revoked(_tam(device="device:lost")) == "device"
+        clock.advance(11)
+        assert checker.revoked(_tam()) is None
+
+        assert s3.calls == [{"Bucket": "lists", "Key": "revocations.bin"},
+                            {"Bucket": "lists", "Key": "revocations.bin", "IfNoneMatch": '"v1"'}]
+        assert checker.counters == {"reloads": 1, "reload_failures": 0, "revoked": 1}
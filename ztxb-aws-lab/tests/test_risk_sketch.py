@@ -0,0 +1,136 @@
+# tests/test_risk_sketch.py
+"""Unit tests for the Broker's behavioral risk sketches (count-min + HyperLogLog)."""
+import os
+import sys
+
+import pytest
+
+_broker_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "ztxp_broker")
+sys.path.insert(0, _broker_dir)
+
+import risk_sketch  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def _tam(subject="user:alice", device="device:abc", source_ip="10.0.0.1"):
+    return {"subject": {"id": subject}, "device": {"id": device}, "context": {"source_ip": source_ip}}
+
+
+def _columns(subject, sketch):
+    return risk_sketch.subject_columns(subject, sketch.depth, sketch.width)
+
+
+class TestWindowedCountMin:
+    def test_counts_within_window_then_expires(self):
+        clock = FakeClock()
+        sketch = risk_sketch.WindowedCountMin(depth=4, width=256, slots=4, slot_seconds=10, clock=clock)
+        cols = _columns("user:alice", sketch)
+        for _ in range(3):
+            sketch.add(cols)
+            clock.advance(10)
+        assert sketch.estimate(cols) == 3
+
+        clock.advance(15)  # the first add (slot 0) has left the window
+        assert sketch.estimate(cols) == 2
+        clock.advance(1000)
+        assert sketch.estimate(cols) == 0
+
+    def test_never_underestimates_under_collisions(self):
+        sketch = risk_sketch.WindowedCountMin(depth=3, width=16, slots=1, slot_seconds=60, clock=FakeClock())
+        truth = {f"user:{i}": i % 5 for i in range(200)}
+        for subject, n in truth.items():
+            sketch.add(_columns(subject, sketch), n)
+        assert all(sketch.estimate(_columns(s, sketch)) >= n for s, n in truth.items())
+
+    def test_rejects_bad_shape(self):
+        with pytest.raises(ValueError, match="power of two"):
+            risk_sketch.WindowedCountMin(width=1000)
+
+
+class TestWindowedDistinct:
+    def test_small_sets_are_exact(self):
+        sketch = risk_sketch.WindowedDistinct(depth=4, width=1024, registers=16, clock=FakeClock())
+        cols = _columns("user:alice", sketch)
+        assert sketch.estimate(cols) == 0
+        for n in range(1, 4):
+            sketch.add(cols, f"device:{n}")
+            sketch.add(cols, f"device:{n}")  # repeats do not count
+            assert sketch.estimate(cols) == n
+        for n in range(4, 9):
+            sketch.add(cols, f"device:{n}")
+        assert 7 <= sketch.estimate(cols) <= 10
+
+    def test_large_sets_within_hll_error(self):
+        sketch = risk_sketch.WindowedDistinct(depth=2, width=64, registers=256, slots=2, clock=FakeClock())
+        cols = _columns("user:alice", sketch)
+        for n in range(5000):
+            sketch.add(cols, f"10.{n >> 8}.{n & 255}.1")
+        assert sketch.estimate(cols) == pytest.approx(5000, rel=0.2)
+
+    def test_slots_merge_and_expire(self):
+        clock = FakeClock()
+        sketch = risk_sketch.WindowedDistinct(depth=4, width=1024, slots=3, slot_seconds=10, clock=clock)
+        cols = _columns("user:alice", sketch)
+        sketch.add(cols, "device:1")
+        clock.advance(10)
+        sketch.add(cols, "device:2")
+        sketch.add(cols, "device:1")
+        assert sketch.estimate(cols) == 2
+
+        clock.advance(20)  # the slot holding only device:1 is reused
+        sketch.add(cols, "device:3")
+        assert sketch.estimate(cols) == 3  # device:1 also seen in the middle slot
+        clock.advance(10)
+        assert sketch.estimate(cols) == 1
+
+    def test_subjects_are_separate(self):
+        sketch = risk_sketch.WindowedDistinct(depth=4, width=4096, clock=FakeClock())
+        for n in range(10):
+            sketch.add(_columns("user:mallory", sketch), f"device:{n}")
+        assert sketch.estimate(_columns("user:alice", sketch)) == 0
+
+
+class TestBehaviorRisk:
+    def test_disabled_by_default(self):
+        risk = risk_sketch.BehaviorRisk()
+        assert not risk.enabled
+        assert risk.nbytes == 0
+
+    def test_score_from_denies_devices_and_ips(self):
+        risk = risk_sketch.BehaviorRisk(window_seconds=600, width=1024, clock=FakeClock())
+        assert risk.observe(_tam()) == {"denies": 0, "devices": 1, "source_ips": 1, "score": 0}
+
+        risk.denied(_tam())
+        risk.denied(_tam())
+        behavior = risk.observe(_tam(device="device:new", source_ip="198.51.100.7"))
+        assert behavior == {"denies": 2, "devices": 2, "source_ips": 2, "score": 2 * 10 + 20 + 5}
+        # Other subjects are unaffected
+        assert risk.observe(_tam(subject="user:bob"))["score"] == 0
+
+    def test_score_capped_and_window_forgets(self):
+        clock = FakeClock()
+        risk = risk_sketch.BehaviorRisk(window_seconds=60, width=1024, clock=clock)
+        for n in range(8):
+            risk.observe(_tam(device=f"device:{n}"))
+        assert risk.observe(_tam())["score"] == 100
+
+        clock.advance(61)
+        assert risk.observe(_tam())["score"] == 0
+
+    def test_memory_fixed_by_dimensions(self):
+        risk = risk_sketch.BehaviorRisk(window_seconds=60, slots=2, depth=2, width=64, registers=16,
+                                        clock=FakeClock())
+        before = risk.nbytes
+        for n in range(2000):
+            risk.observe(_tam(subject=f"user:{n}"))
+        assert risk.nbytes == before == 2 * 2 * 64 * (4 + 16 + 16)
@@ -0,0 +1,62 @@
+# tests/test_stack_harness.py
+"""Smoke tests for the local end-to-end harness (PEP -> Broker -> OPA -> Notes API)."""
+import logging
+
+import pytest
+
+from fake_opa import FakeOpaCluster
+from stack_harness import DECISIONS_TABLE, NOTES_TABLE, EventMix, LambdaStack
+
+
+@pytest.fixture(scope="module")
+def opa():
+    with FakeOpaCluster(replicas=1) as cluster:
+        yield cluster
+
+
+@pytest.fixture(autouse=True)
+def _quiet():
+    logging.disable(logging.INFO)
+    yield
+    logging.disable(logging.NOTSET)
+
+
+class TestLambdaStack:
+    def test_full_path_with_real_signatures(self, opa):
+        stack = LambdaStack(opa.ports)
+        report = stack.run(EventMix(users=10, seed=3), requests=120, warmup=10)
+
+        assert report.count == 120
+        assert report.kms_calls["sign"] == report.kms_calls["verify"] == 120
+        assert any(k.startswith("201 ") for k in report.outcomes)
+        assert any(k.startswith("403 policy_deny") for k in report.outcomes)
+        for stage in ("end_to_end", "authorizer", "kms.sign", "broker", "kms.verify", "pdp", "notes_api"):
+            assert report.stats(stage)["n"] > 0
+        assert stack.dynamodb.Table(NOTES_TABLE).items
+        assert len(stack.dynamodb.Table(DECISIONS_TABLE).items) >= 120
+        assert "end to end" in report.format()
+
+    def test_compact_envelope_and_decision_tokens(self, opa):
+        stack = LambdaStack(opa.ports, envelope="compact", decision_tokens=True, audit=False)
+        report = stack.run(EventMix(users=5, seed=4, weights={"list": 1}), requests=50, warmup=5)
+
+        assert report.outcomes.get("200 GET", 0) + sum(v for k, v in report.outcomes.items() if k.startswith("403")) == 50
+        assert report.kms_calls["verify"] < 50  # repeat lists are allowed by decision token
+        assert report.stats("kms.sign_decision") is not None
+
+    def test_inprocess_transport(self, opa):
+        stack = LambdaStack(opa.ports, transport="inprocess", audit=False)
+        report = stack.run(EventMix(users=5, seed=5), requests=40, warmup=5)
+
+        assert report.kms_calls["sign"] == report.kms_calls["verify"] == 40
+        assert any(k.startswith("403 policy_deny") for k in report.outcomes)
+        assert report.stats("broker")["n"] == 40
+
+    def test_fake_kms_rejects_tampered_signature(self, opa):
+        stack = LambdaStack(opa.ports, audit=False)
+        signed = stack.kms.sign(KeyId="k", Message=b"\x01" * 32, MessageType="DIGEST",
+                                SigningAlgorithm="ECDSA_SHA_256")["Signature"]
+        verify = lambda message: stack.kms.verify(KeyId="k", Message=message, MessageType="DIGEST",  # noqa: E731
+                                                  Signature=signed, SigningAlgorithm="ECDSA_SHA_256")
+        assert verify(b"\x01" * 32)["SignatureValid"]
+        assert not verify(b"\x02" * 32)["SignatureValid"]
@@ -0,0 +1,55 @@
+# tests/test_tenants.py
+"""Unit tests for the Broker's issuer-based tenant routing."""
+import json
+import os
+import sys
+
+import pytest
+
+_broker_dir = os.path.join(os.path.dirname(__file__), "..", "app", "lambdas", "ztxp_broker")
+sys.path.insert(0, _broker_dir)
+
+import tenants  # noqa: E402
+
+
+class TestParse:
+    def test_paths(self):
+        parsed = tenants.parse({
+            "ztxp://pep.lab": {},
+            "ztxp://pep.acme": {"tenant": "acme"},
+            "ztxp://pep.globex": {"tenant": "globex", "pdp_path": "/v1/data/globex/v2/authz/allow"},
+        })
+        assert parsed["ztxp://pep.lab"].pdp_path is None  # global policy
+        assert parsed["ztxp://pep.acme"].pdp_path == "/v1/data/tenants/acme/authz/allow"
+        assert parsed["ztxp://pep.globex"].pdp_path == "/v1/data/globex/v2/authz/allow"
+
+    def test_custom_template(self):
+        parsed = tenants.parse({"ztxp://pep.acme": {"tenant": "acme"}}, "/v1/data/{tenant}/allow")
+        assert parsed["ztxp://pep.acme"].pdp_path == "/v1/data/acme/allow"
+
+    @pytest.mark.parametrize("doc, message", [
+        (["ztxp://pep.acme"], "must map issuers"),
+        ({"ztxp://pep.acme": {"tenant": "../admin"}}, "tenant name"),
+        ({"ztxp://pep.acme": {"pdp_path": "v1/data/x"}}, "must start with /"),
+    ])
+    def test_rejects_bad_documents(self, doc, message):
+        with pytest.raises(ValueError, match=message):
+            tenants.parse(doc)
+
+
+class TestRouter:
+    def test_single_tenant_without_config(self, monkeypatch):
+        monkeypatch.delenv("TENANTS_PATH", raising=False)
+        router = tenants.from_env()
+        assert not router.enabled
+
+    def test_allow_list(self, tmp_path, monkeypatch):
+        path = tmp_path / "tenants.json"
+        path.write_text(json.dumps({"ztxp://pep.acme": {"tenant": "acme"}}))
+        monkeypatch.setenv("TENANTS_PATH", str(path))
+        router = tenants.from_env()
+
+        assert router.enabled and len(router) == 1
+        assert router.route("ztxp://pep.acme").name == "acme"
+        assert router.route("ztxp://pep.unknown") is None
+        assert router.counters["unknown_issuer"] == 1